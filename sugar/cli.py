@@ -167,17 +167,19 @@ Other:
             description=__("Sugar Master, used to control Sugar Clients"),
             formatter_class=CapitalisedHelpFormatter)
 
+        self.component_cli_parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
         SugarCLI.add_common_params(self.component_cli_parser)
 
         self.setup()
-        self.log.info('Starting Master')
+        self.log.info('Starting Master' if self.component_args.worker is None
+                      else 'Starting Master worker {}'.format(self.component_args.worker))
 
         # Import order is very important here, since configuration
         # should be read before. Otherwise logging will be initialised
         # before default configuration is adjusted
 
         from sugar.components.server import SugarServer
-        self.run(SugarServer())
+        self.run(SugarServer(worker=self.component_args.worker))
 
     def client(self):
         """
@@ -213,6 +215,15 @@ Other:
             formatter_class=CapitalisedHelpFormatter)
         self.component_cli_parser.add_argument('query', nargs="+", help=__("Query"))
         self.component_cli_parser.add_argument('-f', "--offline", action="store_true", help="Include offline clients")
+        self.component_cli_parser.add_argument('-w', "--watch", action="store_true",
+                                               help=__("Stay connected and display results as they arrive"))
+        self.component_cli_parser.add_argument('-t', "--timeout", type=int, default=300,
+                                               help=__("Seconds to watch the results of the online clients. "
+                                                       "0 waits until all of them return. Default: 300"))
+        self.component_cli_parser.add_argument('-p', "--priority", choices=["low", "normal", "high"], default="normal",
+                                               help=__("Priority of the task on the clients. Applies only to the clients, "
+                                                       "that are online. Jobs, fired later from the job store, "
+                                                       "are of normal priority. Default: normal"))
         SugarCLI.add_common_params(self.component_cli_parser)
 
         self.setup()
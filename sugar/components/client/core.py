@@ -4,7 +4,6 @@ Core client operations.
 import os
 
 from twisted.internet import reactor
-from twisted.internet import task as twisted_task
 import twisted.internet.error
 
 import sugar.lib.pki.utils
@@ -21,6 +20,8 @@ from sugar.lib.pki.keystore import KeyStore
 from sugar.lib.exceptions import SugarClientException
 from sugar.lib.traits import Traits
 from sugar.lib.taskproc import TaskProcessor
+from sugar.lib.perq.notify import NotifyReader
+from sugar.lib.metrics import StatsReporter
 from sugar.utils.objects import Singleton
 from sugar.utils.cli import get_current_component
 from sugar.transport.serialisable import Serialisable
@@ -130,6 +131,7 @@ class TaskPool:
         self.worker = sugar.utils.process.SignalHandlingMultiprocessingProcess(target=self.processor.run)
         self.worker.daemon = True
         self._response_looper_marker = True
+        self.stats = StatsReporter().add("task pool", self.get_stats)
         self.log = get_logger(self)
 
     def start(self) -> None:
@@ -139,7 +141,9 @@ class TaskPool:
         :return: None
         """
         self.worker.start()
-        twisted_task.LoopingCall(self.next_response).start(0.02)
+        reactor.addReader(NotifyReader(self.processor.response_notifier, self.next_response))
+        self.next_response()  # Responses, left from the previous run
+        self.stats.start()
 
     def stop(self) -> None:
         """
@@ -147,6 +151,7 @@ class TaskPool:
 
         :return: None
         """
+        self.stats.stop()
         self.processor.deferred_stop()
 
         # TODO: wait for actually deferred stop. Now we just killing it.
@@ -166,20 +171,33 @@ class TaskPool:
 
         self.processor.schedule_task(task)
 
+    def get_stats(self) -> dict:
+        """
+        Get task pool metrics.
+
+        :return: dictionary of the worker state, task lanes depths and metrics of the task and response queues
+        """
+        stats = self.processor.get_stats()
+        stats["worker"] = self.worker.is_alive()
+        return stats
+
     def next_response(self) -> None:
         """
-        Get a response from the queue.
+        Get all pending responses from the queue.
+        Called by the reactor, once responses are put.
 
         :return: None
         """
-        resp = None
-        try:
-            resp = self.processor.get_response(self._response_looper_marker)
-            self._response_looper_marker = False
-        except Exception as exc:
-            self.log.error("Error fetching next response: {}", str(exc))
-        if resp is not None:
-            self.core.broadcast_message(resp)
+        responses = True
+        while responses:
+            try:
+                responses = self.processor.get_responses(self._response_looper_marker)
+                self._response_looper_marker = False
+            except Exception as exc:
+                self.log.error("Error fetching next response: {}", str(exc))
+                break
+            for resp in responses:
+                self.core.broadcast_message(resp)
 
 
 @Singleton
@@ -114,6 +114,7 @@ class SugarClientProtocol(WebSocketClientProtocol):
                         task.module, task.function = msg.internal.get("function").rsplit(".", 1)
                         task.args, task.kwargs = msg.internal.get("arguments")
                         task.jid = msg.jid
+                        task.priority = msg.__dict__.get("priority")  # Not sent by the older masters
                         self.factory.core.system.task_pool.add_task(task)
         else:
             self.log.debug("non-binary message: {}".format(payload))
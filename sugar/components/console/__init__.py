@@ -13,7 +13,7 @@ from twisted.internet import reactor, ssl
 from autobahn.twisted.websocket import connectWS
 
 from sugar.components.console.protocols import SugarClientFactory
-from sugar.transport import ConsoleMsgFactory
+from sugar.transport import ConsoleMsgFactory, ServerMsgFactory
 from sugar.config import get_config
 from sugar.lib.logger.manager import get_logger
 from sugar.lib import six
@@ -98,7 +98,14 @@ class SugarConsoleCore(object):
         if self.args.offline:
             cnt.offline = True
 
-        self.log.debug("query: {}, function: {}, args: {}, offline: {}", cnt.tgt, cnt.fun, cnt.arg, cnt.offline)
+        if self.args.watch:
+            cnt.watch = True
+            cnt.timeout = max(0, self.args.timeout)
+
+        cnt.priority = getattr(ServerMsgFactory, "PRIORITY_{}".format(self.args.priority.upper()))
+
+        self.log.debug("query: {}, function: {}, args: {}, offline: {}, watch: {}, timeout: {}, priority: {}",
+                       cnt.tgt, cnt.fun, cnt.arg, cnt.offline, cnt.watch, cnt.timeout, cnt.priority)
 
         return cnt
 
@@ -3,10 +3,14 @@
 Console app core
 """
 
+import sys
+import time
+
 from sugar.utils.objects import Singleton
 from sugar.config import get_config
 from sugar.lib.outputters import console
 from sugar.transport import any_binary
+import sugar.utils.exitcodes
 
 
 @Singleton
@@ -14,10 +18,16 @@ class ConsoleCore:
     """
     Console core.
     """
+    REDRAW_INTERVAL = 0.2  # Minimal seconds between progress line redraws
+
     def __init__(self):
         self.config = get_config()
         self.console_messages = console.ConsoleMessages(colors=self.config.terminal.colors,
                                                         encoding=self.config.terminal.config)
+        self.map_output = console.MappingOutput(colors=self.config.terminal.colors,
+                                                encoding=self.config.terminal.encoding)
+        self._progress_drawn = 0
+        self._progress_line = False
 
     def display_response(self, event) -> None:
         """
@@ -30,3 +40,54 @@ class ConsoleCore:
         msg_template = event.get("ret", {}).get("msg_template", "")
         msg_args = event.get("ret", {}).get("msg_args", [])
         self.console_messages.info(msg_template, *msg_args)
+
+    def display_return(self, response) -> None:
+        """
+        Display result of one host of the watched job.
+
+        :param response: Serialisable message
+        :return: None
+        """
+        self._clear_progress()
+        ret = response.internal
+        if ret["errcode"] == sugar.utils.exitcodes.EX_OK and not ret["errmsg"]:
+            self.console_messages.info("*{}*: {}", ret["host"], ret["uri"])
+        else:
+            self.console_messages.error("*{}*: {} ({})", ret["host"], ret["uri"], ret["errmsg"] or ret["errcode"])
+        if ret["return_data"]:
+            console.otty.puts(self.map_output.paint(ret["return_data"], offset="  "))
+
+    def display_progress(self, response) -> None:
+        """
+        Redraw progress line of the watched job.
+        Redraws are rate-limited, except the final one.
+
+        :param response: Serialisable message
+        :return: None
+        """
+        progress = response.internal
+        now = time.time()
+        if not progress["finished"] and now - self._progress_drawn < self.REDRAW_INTERVAL:
+            return
+        self._progress_drawn = now
+        self._clear_progress()
+        self.console_messages.input("Done: *{}* of *{}*, failed: *{}*", progress["done"],
+                                    progress["total"], progress["failed"])
+        sys.stdout.flush()
+        self._progress_line = True
+        if progress["finished"]:
+            console.otty.puts("")
+            self._progress_line = False
+            if progress.get("expired"):  # Not sent by the older Master
+                self.console_messages.warning("Timed out: *{}* machines did not return yet",
+                                              progress["total"] - progress["done"])
+
+    def _clear_progress(self) -> None:
+        """
+        Clear current progress line, if any.
+
+        :return: None
+        """
+        if self._progress_line:
+            console.otty.write("\r\x1b[K")
+            self._progress_line = False
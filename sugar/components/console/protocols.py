@@ -28,15 +28,25 @@ class SugarConsoleProtocol(WebSocketClientProtocol):
         self.sendMessage(ConsoleMsgFactory.pack(msg_obj), isBinary=True)
 
     def onMessage(self, payload, binary):
+        finished = True
         if binary:
             response = ServerMsgFactory.unpack(payload)
-            self.log.debug('reply: {}'.format(response.ret.message))
-            self.factory.core.display_response(payload)
+            if response.kind == ServerMsgFactory.CONSOLE_JOB_RETURN:
+                self.factory.core.display_return(response)
+                finished = False
+            elif response.kind == ServerMsgFactory.CONSOLE_JOB_PROGRESS:
+                self.factory.core.display_progress(response)
+                finished = response.internal["finished"]
+            else:
+                self.log.debug('reply: {}'.format(response.ret.message))
+                self.factory.core.display_response(payload)
+                finished = not (self.factory.console.args.watch and response.jid)
         else:
             self.log.error("Non-binary message: {}".format(payload))
 
-        self.log.debug('response from the master accepted. Stopping.')
-        self.factory.reactor.stop()
+        if finished:
+            self.log.debug('response from the master accepted. Stopping.')
+            self.factory.reactor.stop()
 
     def onClose(self, wasClean, code, reason):
         self.log.debug("socket closed: {0}".format(reason))
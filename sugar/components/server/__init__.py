@@ -15,20 +15,28 @@ from sugarapi.service import APIService
 
 from sugar.components.server.protocols import (SugarServerProtocol, SugarServerFactory,
                                                SugarConsoleServerProtocol, SugarConsoleServerFactory)
+from sugar.components.server.outqueue import OutboundQueue
+from sugar.components.server.workers import WorkerPool, WorkerHandle, RoutedJobStore, listen_sharded
 from sugar.config import get_config
 from sugar.lib.logger.manager import get_logger
+from sugar.lib.metrics import StatsReporter
 
 
 class SugarServer(object):
     """
     Sugar Server.
     """
-    def __init__(self):
+    def __init__(self, worker: int = None):
         """
         Initialise Sugar Server class
+
+        :param worker: index of the worker process. None for the primary Master process.
         """
         self.config = get_config()
         self.log = get_logger(self)
+        self.worker = worker
+        self.pool = None
+        self.stats = StatsReporter()
 
         self.factory = SugarServerFactory("wss://*:5505")
         self.factory.protocol = SugarServerProtocol
@@ -44,8 +52,16 @@ class SugarServer(object):
 
         :return: None
         """
-        self.factory.core.master_local_token.cleanup()
-        self.api.stop()
+        self.stats.stop()
+        workers = self.factory.core.peer_registry.workers
+        if workers is not None:
+            workers.stop()
+        if workers is None or workers.primary:
+            self.factory.core.master_local_token.cleanup()
+            self.api.stop()
+        if self.pool is not None:
+            self.pool.stop()
+        self.factory.core.jobstore.close()
 
     def run(self):
         """
@@ -53,17 +69,41 @@ class SugarServer(object):
 
         :return: None
         """
-        self.factory.core.system.on_startup()
-        self.api.start()
-        deferToThread(self.api.queue_loop, self.factory)
+        workers = None
+        if self.worker is not None:
+            workers = WorkerHandle.connect(self.worker)
+            self.factory.core.jobstore = RoutedJobStore(workers)
+        else:
+            OutboundQueue.remove_stale(self.factory.spool_path)  # Left by the crashed Master, before workers start
+            if self.config.workers > 1:
+                self.pool = WorkerPool(self.config.workers, os.path.join(self.config.cache.path, "master"))
+                workers = self.pool.start()
+
+        if workers is None or workers.primary:
+            self.factory.core.system.on_startup()
+            self.factory.core.jobstore.start_retention()
+            self.stats.add("job store", self.factory.core.jobstore.get_stats)
+            self.api.start()
+            deferToThread(self.api.queue_loop, self.factory)
 
         context_factory = ssl.DefaultOpenSSLContextFactory(
             os.path.join(self.config.config_path, "ssl", self.config.crypto.ssl.private),
             os.path.join(self.config.config_path, "ssl", self.config.crypto.ssl.certificate),
         )
 
-        listenWS(self.factory, context_factory)
-        listenWS(self.console_factory, context_factory)
+        if workers is None:
+            listenWS(self.factory, context_factory)
+        else:
+            self.factory.core.peer_registry.workers = workers
+            deferToThread(workers.channel_loop, self.factory.core)
+            listen_sharded(self.factory, context_factory)
+            self.log.info("Master worker {} is listening", workers.index)
+
+        if workers is None or workers.primary:
+            listenWS(self.console_factory, context_factory)
 
+        self.stats.add("router", self.factory.router.get_stats)
+        self.stats.add("outbound", self.factory.core.peer_registry.get_outbound_depths)
+        self.stats.start()
         reactor.addSystemEventTrigger("before", "shutdown", self.on_shutdown)
         reactor.run()
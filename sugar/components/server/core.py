@@ -9,6 +9,7 @@ import json
 import random
 from multiprocessing import Queue
 from twisted.internet import threads, reactor
+from twisted.python.threadable import isInIOThread
 
 from sugar.config import get_config
 from sugar.lib.logger.manager import get_logger
@@ -19,7 +20,8 @@ from sugar.lib.pki import Crypto
 from sugar.lib.pki.keystore import KeyStore
 from sugar.components.server.registry import RuntimeRegistry
 from sugar.components.server.pdatastore import PDataContainer
-from sugar.lib.jobstore import JobStorage
+from sugar.components.server.subscriptions import JobSubscriptions
+from sugar.lib.jobstore import get_jobstore
 
 import sugar.transport
 import sugar.lib.pki.utils
@@ -46,9 +48,31 @@ class ServerCore:
         self.master_local_token = MasterLocalToken()
         self.peer_registry = RuntimeRegistry()
         self.peer_registry.keystore = self.keystore
-        self.jobstore = JobStorage(get_config())
+        self.subscriptions = JobSubscriptions()
+        self.__jobstore = None
         self.__retry_calls = {}
 
+    @property
+    def jobstore(self):
+        """
+        Job store, opened on the first use.
+
+        :return: job store
+        """
+        if self.__jobstore is None:
+            self.__jobstore = get_jobstore(get_config())
+        return self.__jobstore
+
+    @jobstore.setter
+    def jobstore(self, jobstore) -> None:
+        """
+        Set job store (e.g. routed job store of the secondary Master worker).
+
+        :param jobstore: job store
+        :return: None
+        """
+        self.__jobstore = jobstore
+
     def verify_local_token(self, token):
         """
         Verify local token if local client is authorised to connect.
@@ -68,13 +92,18 @@ class ServerCore:
         """
         self.log.debug("Sending event '{}({})' to host '{}' ({})", event.fun, event.arg, target.host, target.id)
 
-        task_message = ServerMsgFactory().create(jid=event.jid)
+        # Events from the jobs store and from the older consoles have no priority
+        priority = event.__dict__.get("priority", ServerMsgFactory.PRIORITY_NORMAL)
+        task_message = ServerMsgFactory().create(jid=event.jid, priority=priority)
         task_message.ret.message = "ping"
         task_message.internal = {
             "function": event.fun,
             "arguments": event.arg,
         }
         proto = self.get_client_protocol(target.id)  # This might be None due to the network issues (unregister fired)
+        if proto is None and self.route_event(event, target):
+            return
+
         if proto is None and self.__retry_calls.get(target.id) != 0:
             self.__retry_calls.setdefault(target.id, 3)
             self.__retry_calls[target.id] -= 1
@@ -92,6 +121,44 @@ class ServerCore:
             else:
                 self.log.debug("Job '{}' temporarily cannot be fired to the client {}.", event.jid, target.id)
 
+    def route_event(self, event, target) -> bool:
+        """
+        Route an event to another Master worker, if it owns the target peer.
+
+        :param event: An event to route
+        :param target: Selected target
+        :return: True if event has been routed
+        """
+        workers = self.peer_registry.workers
+        owner = workers.owner(target.id) if workers is not None else None
+        routed = owner is not None and owner != workers.index
+        if routed:
+            self.log.debug("Routing job '{}' for peer {} to the worker {}", event.jid, target.id, owner)
+            workers.route(owner, workers.EVT_FIRE, event.jid, event.fun, event.arg, target.id, target.host,
+                          event.__dict__.get("priority", ServerMsgFactory.PRIORITY_NORMAL))
+
+        return routed
+
+    def fire_routed_event(self, jid: str, fun: str, arg, machine_id: str, host: str,
+                          priority: int = ServerMsgFactory.PRIORITY_NORMAL) -> None:
+        """
+        Fire an event, routed from another Master worker.
+
+        :param jid: Job ID
+        :param fun: function to call
+        :param arg: function arguments
+        :param machine_id: machine ID of the target
+        :param host: hostname of the target
+        :param priority: priority of the task
+        :return: None
+        """
+        event = type("event", (), {})
+        event.jid = jid
+        event.fun = fun
+        event.arg = arg
+        event.priority = priority
+        self.fire_event(event=event, target=PDataContainer(id=machine_id, host=host))
+
     def on_broadcast_tasks(self, evt, proto) -> None:
         """
         Send task to clients.
@@ -114,12 +181,55 @@ class ServerCore:
                 threads.deferToThread(self.fire_event, event=evt, target=target)
             self.log.debug("Created a new job: '{}' for {} online and {} offline machines",
                            evt.jid, len(clientlist), len(offline_clientlist))
+            msg.jid = evt.jid
             msg.ret.msg_template = "Targeted {} machines. JID: {}"
             msg.ret.msg_args = [len(clientlist + offline_clientlist), evt.jid]
         else:
             self.log.error("No targets found for function '{}' on query '{}'.", evt.fun, evt.tgt)
             msg.ret.message = "No targets found"
-        proto.sendMessage(ServerMsgFactory.pack(msg), isBinary=True)
+        reactor.callFromThread(proto.sendMessage, ServerMsgFactory.pack(msg), isBinary=True)
+
+        if msg.jid and evt.watch is True:
+            # Offline machines get the job later. Consoles of the older versions send no timeout.
+            reactor.callFromThread(self.subscriptions.subscribe, evt.jid, proto, len(clientlist),
+                                   evt.__dict__.get("timeout"))
+
+    def on_job_return(self, msg) -> None:
+        """
+        Push job return to the watching consoles.
+        In multi-worker mode consoles are connected to the primary worker.
+        Large returns are decoded in a thread, so they are passed to the reactor thread.
+
+        :param msg: RunnerModulesMsgFactory message
+        :return: None
+        """
+        workers = self.peer_registry.workers
+        args = (msg.jid, msg.machine_id, msg.uri, msg.errcode, msg.errmsg, msg.return_data)
+        if workers is not None and not workers.primary:
+            push, args = workers.route, (0, workers.EVT_RETURN) + args
+        else:
+            push = self.push_job_return
+
+        if isInIOThread():
+            push(*args)
+        else:
+            reactor.callFromThread(push, *args)
+
+    def push_job_return(self, jid: str, machine_id: str, uri: str, errcode: int, errmsg: str, return_data) -> None:
+        """
+        Push job return to the subscriptions. Should be called in the reactor thread.
+
+        :param jid: Job ID
+        :param machine_id: machine ID of the returned host
+        :param uri: called function
+        :param errcode: error code of the call
+        :param errmsg: error message of the call
+        :param return_data: returned data
+        :return: None
+        """
+        if self.subscriptions.is_subscribed(jid):
+            self.subscriptions.on_return(jid=jid, machine_id=machine_id, host=self.peer_registry.get_hostname(machine_id),
+                                         uri=uri, errcode=errcode, errmsg=errmsg, return_data=return_data)
 
     def fire_pending_jobs(self, mid: str) -> None:
         """
@@ -128,9 +238,15 @@ class ServerCore:
         :param mid: machine ID
         :return: None
         """
-        self.log.debug("Checking for pending jobs on {}", mid)
+        workers = self.peer_registry.workers
         target = PDataContainer(id=mid, host="")  # TODO: get a proper target with the hostname
-        if self.get_client_protocol(mid) is not None:
+        if workers is not None and not workers.primary:
+            # Jobs are created by the primary worker, which keeps the index of the pending work
+            workers.route(0, workers.EVT_PENDING, mid)
+        elif not self.jobstore.has_pending(target):
+            pass
+        elif self.get_client_protocol(mid) is not None or (workers is not None and workers.owner(mid) is not None):
+            self.log.debug("Checking for pending jobs on {}", mid)
             for job in self.jobstore.get_scheduled(target):
                 event = type("event", (), {})
                 event.jid = job.jid
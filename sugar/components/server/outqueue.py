@@ -0,0 +1,315 @@
+# coding: utf-8
+"""
+Outbound queue of the peer.
+
+Messages to the peer are not written straight to the transport.
+Queue is registered as a streaming producer of the peer transport,
+so the transport pauses it when its write buffer is full (slow client)
+and resumes when it is flushed. While paused, messages are deferred
+in memory up to the high watermark and spilled to the disk beyond it.
+Spilled messages are loaded back, once memory queue is drained below
+the low watermark. Spool is written and read by a thread, one batch
+at a time, so the reactor never waits for the disk.
+If the spool is full, the queue is dropped and the owner is told to
+drop the connection.
+"""
+import os
+import shutil
+import tempfile
+import collections
+
+from zope.interface import implementer
+from twisted.internet import threads
+from twisted.internet.interfaces import IPushProducer
+
+from sugar.lib.perq import QueueFactory, Durability
+from sugar.lib.perq.qexc import QueueEmpty
+
+
+@implementer(IPushProducer)
+class OutboundQueue:
+    """
+    Per-peer outbound queue with backpressure.
+    """
+    HIGH_WATERMARK = 0x800000  # 8 MiB of deferred messages in memory
+    LOW_WATERMARK = 0x200000   # 2 MiB
+    SPOOL_SIZE = 0xffff        # Max messages spilled to the disk
+    SPOOL_PREFIX = "peer-"     # Prefix of the spool directory
+
+    def __init__(self, writer, spool_path: str, high: int = HIGH_WATERMARK, low: int = LOW_WATERMARK,
+                 on_overflow=None):
+        """
+        Constructor.
+
+        :param writer: callable, writing message to the transport
+        :param spool_path: directory where spools of congested peers are created
+        :param high: high watermark (bytes)
+        :param low: low watermark (bytes)
+        :param on_overflow: callable (reason), called when the queue is dropped, because spool is full or failed
+        """
+        self.__writer = writer
+        self.__spool_path = spool_path
+        self.__high = high
+        self.__low = low
+        self.__on_overflow = on_overflow
+        self.__messages = collections.deque()
+        self.__size = 0
+        self.__paused = False
+        self.__stopped = False
+        self.__spill = collections.deque()  # Messages to spill, that are not yet passed to the thread
+        self.__spilling = 0                 # Messages, that are being written to the spool by the thread
+        self.__unspilling = False           # Spool is being read by the thread
+        self.__spool = None
+        self.__spool_dir = None
+        self.__spooled = 0
+
+    @staticmethod
+    def remove_stale(spool_path: str) -> None:
+        """
+        Remove spools, left by the previous run (e.g. crashed Master).
+        Should be called on startup, before any peer is connected.
+
+        :param spool_path: directory where spools of congested peers are created
+        :return: None
+        """
+        if os.path.isdir(spool_path):
+            for name in os.listdir(spool_path):
+                if name.startswith(OutboundQueue.SPOOL_PREFIX):
+                    shutil.rmtree(os.path.join(spool_path, name), ignore_errors=True)
+
+    @property
+    def depth(self) -> dict:
+        """
+        Current depth of the queue.
+
+        :return: dictionary of deferred messages, bytes in memory, spilled messages and congestion status.
+        """
+        return {
+            "messages": len(self.__messages) + self._backlog,
+            "bytes": self.__size,
+            "spooled": self._backlog,
+            "paused": self.__paused,
+        }
+
+    @property
+    def _backlog(self) -> int:
+        """
+        Amount of messages, spilled to the disk or being spilled.
+
+        :return: int
+        """
+        return self.__spooled + self.__spilling + len(self.__spill)
+
+    def put(self, payload: bytes, **kwargs) -> None:
+        """
+        Send a message or defer it if the peer is congested.
+
+        :param payload: message payload
+        :param kwargs: keywords for the writer
+        :return: None
+        """
+        if self.__stopped:
+            return
+        if not self.__paused and not self.__messages and not self._backlog:
+            self.__writer(payload, **kwargs)
+        elif self._backlog or self.__size >= self.__high:
+            self._spill(payload, kwargs)
+        else:
+            self.__messages.append((payload, kwargs))
+            self.__size += len(payload)
+            self.drain()
+
+    def drain(self) -> None:
+        """
+        Write deferred messages, until the transport pauses the queue.
+
+        :return: None
+        """
+        while not self.__paused:
+            if self.__size < self.__low and self.__spooled:
+                self._unspill()
+            if not self.__messages:
+                break
+            payload, kwargs = self.__messages.popleft()
+            self.__size -= len(payload)
+            self.__writer(payload, **kwargs)
+
+    def _spill(self, payload: bytes, kwargs: dict) -> None:
+        """
+        Spill message to the disk.
+
+        :param payload: message payload
+        :param kwargs: keywords for the writer
+        :return: None
+        """
+        if self._backlog >= self.SPOOL_SIZE:
+            self._overflow("spool is full ({} messages)".format(self.SPOOL_SIZE))
+        else:
+            self.__spill.append((payload, kwargs))
+            self._flush()
+
+    def _flush(self) -> None:
+        """
+        Pass messages to spill to the thread, unless it still writes the previous batch.
+
+        :return: None
+        """
+        if self.__spill and not self.__spilling and not self.__unspilling:
+            batch = list(self.__spill)
+            self.__spill.clear()
+            self.__spilling = len(batch)
+            threads.deferToThread(self._write_spool, batch).addCallbacks(self._on_spooled, self._on_spool_error)
+
+    def _write_spool(self, batch: list) -> None:
+        """
+        Write messages to the spool. Called in a thread.
+
+        :param batch: list of (payload, kwargs)
+        :return: None
+        """
+        if self.__spool is None:
+            os.makedirs(self.__spool_path, exist_ok=True)
+            self.__spool_dir = tempfile.mkdtemp(prefix=self.SPOOL_PREFIX, dir=self.__spool_path)
+            self.__spool = QueueFactory.seg_queue(self.__spool_dir, maxsize=self.SPOOL_SIZE,
+                                                  durability=Durability.BATCH)  # Spool is dropped with the connection
+        self.__spool.put_many(batch)
+
+    def _on_spooled(self, _) -> None:
+        """
+        Batch is written to the spool.
+
+        :param _: None
+        :return: None
+        """
+        spooled, self.__spilling = self.__spilling, 0
+        if self.__stopped:
+            self._remove_spool()
+        else:
+            self.__spooled += spooled
+            self._flush()
+            self.drain()
+
+    def _on_spool_error(self, failure) -> None:
+        """
+        Batch is not written to or read from the spool.
+
+        :param failure: Failure of the write or read
+        :return: None
+        """
+        self.__spilling = 0
+        self.__unspilling = False
+        if self.__stopped:
+            self._remove_spool()
+        else:
+            self._overflow("unable to spill messages: {}".format(failure.getErrorMessage()))
+
+    def _overflow(self, reason: str) -> None:
+        """
+        Drop the queue, as messages cannot be kept in order anymore.
+
+        :param reason: reason of the overflow
+        :return: None
+        """
+        self.stopProducing()
+        if self.__on_overflow is not None:
+            self.__on_overflow(reason)
+
+    def _unspill(self) -> None:
+        """
+        Pass loading of the spilled messages up to the low watermark to the thread,
+        unless the spool is being written or read.
+
+        :return: None
+        """
+        if self.__spooled and not self.__spilling and not self.__unspilling:
+            self.__unspilling = True
+            threads.deferToThread(self._read_spool, self.__spooled, self.__low - self.__size).addCallbacks(
+                self._on_unspooled, self._on_spool_error)
+
+    def _read_spool(self, count: int, size: int) -> tuple:
+        """
+        Read messages from the spool. Called in a thread.
+
+        :param count: max amount of messages to read
+        :param size: bytes to read, the last message may exceed it
+        :return: list of (payload, kwargs) and a flag, if spool is drained
+        """
+        batch = []
+        drained = False
+        while len(batch) < count and size > 0:
+            try:
+                payload, kwargs = self.__spool.get_nowait()
+            except QueueEmpty:
+                drained = True
+                break
+            batch.append((payload, kwargs))
+            size -= len(payload)
+
+        return batch, drained
+
+    def _on_unspooled(self, result: tuple) -> None:
+        """
+        Batch is read from the spool.
+
+        :param result: list of (payload, kwargs) and a flag, if spool is drained
+        :return: None
+        """
+        batch, drained = result
+        self.__unspilling = False
+        if self.__stopped:
+            self._remove_spool()
+        else:
+            self.__spooled = 0 if drained else self.__spooled - len(batch)
+            for payload, kwargs in batch:
+                self.__messages.append((payload, kwargs))
+                self.__size += len(payload)
+            self._flush()
+            self.drain()
+
+    def _remove_spool(self) -> None:
+        """
+        Close and remove the spool.
+
+        :return: None
+        """
+        self.__spooled = 0
+        if self.__spool is not None:
+            self.__spool.close()
+            self.__spool = None
+        if self.__spool_dir is not None:
+            shutil.rmtree(self.__spool_dir, ignore_errors=True)
+            self.__spool_dir = None
+
+    def pauseProducing(self) -> None:  # pylint: disable=C0103
+        """
+        Transport buffer is full: defer messages.
+
+        :return: None
+        """
+        self.__paused = True
+
+    def resumeProducing(self) -> None:  # pylint: disable=C0103
+        """
+        Transport buffer is flushed: write deferred messages.
+
+        :return: None
+        """
+        if not self.__stopped:
+            self.__paused = False
+            self.drain()
+
+    def stopProducing(self) -> None:  # pylint: disable=C0103
+        """
+        Connection is gone: drop deferred messages and the spool.
+        Spool, that is being written or read, is removed once the thread is done.
+
+        :return: None
+        """
+        self.__paused = True
+        self.__stopped = True
+        self.__messages.clear()
+        self.__spill.clear()
+        self.__size = 0
+        self.__spooled = 0
+        if not self.__spilling and not self.__unspilling:
+            self._remove_spool()
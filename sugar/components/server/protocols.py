@@ -3,14 +3,20 @@
 """
 Server protocols
 """
+import os
+import json
 import time
 from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory
+from twisted.internet import reactor
+from twisted.python.threadable import isInIOThread
 
 from sugar.transport import (ObjectGate, ServerMsgFactory, ClientMsgFactory, KeymanagerMsgFactory,
                              ConsoleMsgFactory, RunnerModulesMsgFactory)
 from sugar.utils import exitcodes
 from sugar.components.server.core import get_server_core
 from sugar.components.server.pdatastore import PDataContainer
+from sugar.components.server.outqueue import OutboundQueue
+from sugar.components.server.router import MessageRouter
 import sugar.utils.timeutils
 
 
@@ -87,6 +93,7 @@ class SugarConsoleServerFactory(WebSocketServerFactory):
         if client in self.consoles:
             self.log.debug("unregistering console: {}".format(client))
             self.consoles.remove(client)
+        self.core.subscriptions.unsubscribe(client)
 
 
 class SugarServerProtocol(WebSocketServerProtocol):
@@ -96,12 +103,15 @@ class SugarServerProtocol(WebSocketServerProtocol):
     def __init__(self, *args, **kwargs):
         WebSocketServerProtocol.__init__(self, *args, **kwargs)
         self.accepted = False
+        self.outbound = None
 
     def onConnect(self, request):
         self.log.debug("client connected: {0}".format(request.peer))
 
     def onOpen(self):
         self.factory.register(self)
+        self.outbound = OutboundQueue(self._write, spool_path=self.factory.spool_path, on_overflow=self.on_outbound_overflow)
+        self.registerProducer(self.outbound, True)
         self.log.debug("client has opened a connection")
 
     def sendMessage(self,
@@ -110,8 +120,45 @@ class SugarServerProtocol(WebSocketServerProtocol):
                     fragmentSize=None,
                     sync=False,
                     doNotCompress=False):
-        super(SugarServerProtocol, self).sendMessage(payload=payload, isBinary=isBinary, fragmentSize=fragmentSize,
-                                                     sync=sync, doNotCompress=doNotCompress)
+        """
+        Send message to the peer via its outbound queue.
+        Can be called from any thread.
+
+        :param payload: Message data
+        :param isBinary: bool
+        :param fragmentSize: Size of the fragment
+        :param sync: bool
+        :param doNotCompress: bool
+        :return: None
+        """
+        if not isInIOThread():
+            reactor.callFromThread(self.sendMessage, payload, isBinary=isBinary, fragmentSize=fragmentSize,
+                                   sync=sync, doNotCompress=doNotCompress)
+        elif self.outbound is None:
+            self._write(payload, isBinary=isBinary, fragmentSize=fragmentSize, sync=sync, doNotCompress=doNotCompress)
+        else:
+            self.outbound.put(payload, isBinary=isBinary, fragmentSize=fragmentSize, sync=sync,
+                              doNotCompress=doNotCompress)
+
+    def _write(self, payload, **kwargs) -> None:
+        """
+        Write message to the transport.
+
+        :param payload: Message data
+        :param kwargs: keywords of the sendMessage
+        :return: None
+        """
+        super(SugarServerProtocol, self).sendMessage(payload=payload, **kwargs)
+
+    def on_outbound_overflow(self, reason: str) -> None:
+        """
+        Outbound queue is dropped: drop the connection, so the peer reconnects.
+
+        :param reason: reason of the overflow
+        :return: None
+        """
+        self.log.error("Dropping connection of the peer {0}: {1}".format(self.get_machine_id() or self.peer, reason))
+        self.dropConnection(abort=True)
 
     def onMessage(self, payload: bytes, binary: bool) -> None:
         """
@@ -122,39 +169,78 @@ class SugarServerProtocol(WebSocketServerProtocol):
         :return: None
         """
         if binary:
-            msg = ObjectGate().load(payload, binary)
-            if self.get_machine_id() is None:
-                self.set_machine_id(msg.machine_id)
-                self.factory.core.peer_registry.register(machine_id=msg.machine_id, peer=self)
-
-            if msg.kind == ClientMsgFactory.KIND_HANDSHAKE_PKEY_REQ:
-                self.log.debug("handshake: public key request")
-                self.sendMessage(ObjectGate(self.factory.core.system.on_pub_rsa_request()).pack(binary), binary)
-
-            elif msg.kind == ClientMsgFactory.KIND_HANDSHAKE_TKEN_REQ:
-                self.log.debug("handshake: signed token request")
-                self.sendMessage(ObjectGate(self.factory.core.system.on_token_request(msg)).pack(binary), binary)
-
-            elif msg.kind == ClientMsgFactory.KIND_HANDSHAKE_PKEY_REG_REQ:
-                self.log.debug("handshake: new RSA key registration accepted")
-                self.sendMessage(ObjectGate(self.factory.core.system.on_add_new_rsa_key(msg)).pack(binary), binary)
-
-            elif msg.kind == ClientMsgFactory.KIND_TRAITS:
-                self.log.debug("Traits update on client connect")
-                self.factory.core.refresh_client_pdata(self.machine_id, traits=msg.internal)
-
-            elif msg.component == RunnerModulesMsgFactory.COMPONENT:
-                self.factory.core.jobstore.report_job(jid=msg.jid, target=PDataContainer(id=msg.machine_id, host=""),
-                                                      finished=sugar.utils.timeutils.from_iso(msg.finished),
-                                                      src=msg.src, return_data=msg.return_data, uri=msg.uri,
-                                                      log_info=msg.infos, log_warn=msg.warnings, log_err=msg.errors)
-                self.factory.core.jobstore.report_job_finished(jid=msg.jid)
-            else:
-                self.log.error("CAUTION: unknown message type")
+            self.factory.router.dispatch(self, payload, binary)
+
+    def on_decoded(self, msg) -> None:
+        """
+        Bind the peer to its machine ID on the first message.
+
+        :param msg: decoded message
+        :return: None
+        """
+        if self.get_machine_id() is None:
+            self.set_machine_id(msg.machine_id)
+            self.factory.core.peer_registry.register(machine_id=msg.machine_id, peer=self)
+
+    def on_pkey_request(self, _) -> None:
+        """
+        Handshake: public key request.
+
+        :param _: decoded message
+        :return: None
+        """
+        self.log.debug("handshake: public key request")
+        self.sendMessage(ObjectGate(self.factory.core.system.on_pub_rsa_request()).pack(True), True)
+
+    def on_token_request(self, msg) -> None:
+        """
+        Handshake: signed token request.
+
+        :param msg: decoded message
+        :return: None
+        """
+        self.log.debug("handshake: signed token request")
+        self.sendMessage(ObjectGate(self.factory.core.system.on_token_request(msg)).pack(True), True)
+
+    def on_pkey_registration(self, msg) -> None:
+        """
+        Handshake: new RSA key registration.
+
+        :param msg: decoded message
+        :return: None
+        """
+        self.log.debug("handshake: new RSA key registration accepted")
+        self.sendMessage(ObjectGate(self.factory.core.system.on_add_new_rsa_key(msg)).pack(True), True)
+
+    def on_traits(self, msg) -> None:
+        """
+        Traits update on client connect.
+
+        :param msg: decoded message
+        :return: None
+        """
+        self.log.debug("Traits update on client connect")
+        self.factory.core.refresh_client_pdata(self.machine_id, traits=msg.internal)
+
+    def on_job_return(self, msg) -> None:
+        """
+        Results of the job, returned by the client.
+
+        :param msg: decoded message
+        :return: None
+        """
+        self.factory.core.jobstore.report_job(jid=msg.jid, target=PDataContainer(id=msg.machine_id, host=""),
+                                              finished=sugar.utils.timeutils.from_iso(msg.finished),
+                                              src=msg.src, return_data=json.dumps(msg.return_data), uri=msg.uri,
+                                              log_info=json.dumps(msg.infos), log_warn=json.dumps(msg.warnings),
+                                              log_err=json.dumps(msg.errors), errcode=msg.errcode)
+        self.factory.core.on_job_return(msg)
 
     def onClose(self, wasClean, code, reason):
         tstamp = time.time()
         self.log.debug("client's connection has been closed: {0}".format(reason))
+        if self.outbound is not None:
+            self.outbound.stopProducing()
         self.transport.loseConnection()
         self.factory.unregister(self)
         self.factory.core.remove_client_protocol(self, tstamp)
@@ -195,6 +281,18 @@ class SugarServerFactory(WebSocketServerFactory):
         WebSocketServerFactory.__init__(self, url)
         self.clients = []  # More smarter stuff here to select clients
         self.core = get_server_core()
+        self.spool_path = os.path.join(self.core.config.cache.path, "master", "spool")
+        self.router = MessageRouter(on_decode=SugarServerProtocol.on_decoded)
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_HANDSHAKE_PKEY_REQ,
+                             SugarServerProtocol.on_pkey_request, name="handshake.pkey")
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_HANDSHAKE_TKEN_REQ,
+                             SugarServerProtocol.on_token_request, name="handshake.token")
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_HANDSHAKE_PKEY_REG_REQ,
+                             SugarServerProtocol.on_pkey_registration, name="handshake.registration")
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_TRAITS,
+                             SugarServerProtocol.on_traits, name="client.traits")
+        self.router.register(RunnerModulesMsgFactory.COMPONENT, MessageRouter.ANY,
+                             SugarServerProtocol.on_job_return, name="runner.return")
 
     def register(self, client):
         """
@@ -70,6 +70,7 @@ class RuntimeRegistry:
         self.pdata_store = PDataStore(get_config().cache.path)
         self.log = get_logger(self)
         self.__keystore = None
+        self.__workers = None
 
     @property
     def keystore(self):
@@ -91,6 +92,26 @@ class RuntimeRegistry:
         if self.keystore is None:
             self.__keystore = keystore
 
+    @property
+    def workers(self):
+        """
+        Get handle of the shared workers registry.
+
+        :return: WorkerHandle or None, if Master runs in a single process.
+        """
+        return self.__workers
+
+    @workers.setter
+    def workers(self, workers):
+        """
+        Set handle of the shared workers registry.
+
+        :param workers: WorkerHandle instance
+        :return: None
+        """
+        if self.workers is None:
+            self.__workers = workers
+
     @property
     def peers(self) -> ImmutableDict:
         """
@@ -110,6 +131,8 @@ class RuntimeRegistry:
         """
         if machine_id:
             self.__peers.setdefault(machine_id, Peer(peer=peer, mid=machine_id))
+            if self.workers is not None:
+                self.workers.publish(machine_id)
             self.log.debug("Registered peer with the ID: {}", machine_id)
         else:
             self.log.error("Machine ID should be specified, '{}' is passed instead", repr(machine_id))
@@ -126,12 +149,38 @@ class RuntimeRegistry:
             peer = self.__peers[machine_id]
             if peer.timestamp < timestamp:
                 del self.__peers[machine_id]
+                if self.workers is not None:
+                    self.workers.withdraw(machine_id)
                 self.log.debug("Unregistered peer with the ID: {}", machine_id)
             else:
                 self.log.debug("Peer already reconnected with the ID: {}", machine_id)
         except KeyError:
             self.log.error("Peer ID {} was not found to be unregistered.", repr(machine_id))
 
+    def get_online(self) -> set:
+        """
+        Get machine IDs of the online peers. In multi-worker mode
+        these are peers, connected to any of the workers.
+
+        :return: set of machine IDs
+        """
+        return set(self.workers.online() if self.workers is not None else self.__peers.keys())
+
+    def get_outbound_depths(self) -> dict:
+        """
+        Get outbound queue depths of the congested peers, connected to the current worker.
+
+        :return: dictionary of machine ID to the queue depth
+        """
+        depths = {}
+        for machine_id, peer in self.__peers.items():
+            outbound = getattr(peer.peer, "outbound", None)
+            if outbound is not None:
+                depth = outbound.depth
+                if depth["messages"] or depth["paused"]:
+                    depths[machine_id] = depth
+        return depths
+
     def get_hostname(self, machine_id: str) -> str:
         """
         Get hostname by the machine ID.
@@ -149,7 +198,7 @@ class RuntimeRegistry:
         :param query: query string from the caller
         :return: list of machine-id to which target the messages by the query
         """
-        return Query(query).filter(list(self.pdata_store.clients(active=self.__peers.keys())))
+        return Query(query).filter(list(self.pdata_store.clients(active=self.get_online())))
 
     def get_offline_targets(self) -> typing.List[PDataStore]:
         """
@@ -157,7 +206,7 @@ class RuntimeRegistry:
 
         :return: list of PDataContainer targets to which target the messages by the query
         """
-        return list(self.pdata_store.offline_clients(active=self.__peers.keys()))
+        return list(self.pdata_store.offline_clients(active=self.get_online()))
 
     def get_status(self):
         """
@@ -166,10 +215,11 @@ class RuntimeRegistry:
         :return: list of machines with their statuses.
         """
         systems = {}
+        online = self.get_online()
         for pd_container in self.pdata_store.clients():
             del pd_container.pdata
             del pd_container.traits
-            pd_container.online = pd_container.id in self.__peers.keys()
+            pd_container.online = pd_container.id in online
             systems[pd_container.id] = pd_container
 
         return systems
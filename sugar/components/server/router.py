@@ -0,0 +1,172 @@
+# coding: utf-8
+"""
+Router of the inbound messages.
+
+Handlers are registered per (component, kind) of the message
+and are always called in the reactor thread. Small frames
+(handshakes, traits etc) are decoded inline. Large frames
+(e.g. returned data of the jobs) are decoded in a thread of the
+reactor pool, so one big return does not block the other connections.
+
+NOTE: handlers of the large frames are called once they are decoded,
+      and therefore may be called after handlers of the smaller
+      frames, received later.
+"""
+import time
+import typing
+
+from twisted.internet import threads
+
+from sugar.lib.logger.manager import get_logger
+from sugar.lib.metrics import Counter, Histogram
+from sugar.transport import ObjectGate
+
+
+class RouteStats:
+    """
+    Statistics of the route.
+    """
+    def __init__(self):
+        self.inline = Counter()
+        self.deferred = Counter()
+        self.errors = Counter()
+        self.latency = Histogram()
+
+    def to_dict(self) -> dict:
+        """
+        Export statistics.
+
+        :return: dict
+        """
+        return {
+            "inline": self.inline.value,
+            "deferred": self.deferred.value,
+            "errors": self.errors.value,
+            "latency": self.latency.to_dict(),
+        }
+
+
+class MessageRouter:
+    """
+    Dispatches inbound messages to the registered handlers.
+    """
+    INLINE_SIZE = 0x10000  # Frames up to 64 KiB are decoded inline
+    ANY = None             # Any kind of the component
+
+    def __init__(self, inline_size: int = INLINE_SIZE, on_decode: typing.Callable = None):
+        """
+        Constructor.
+
+        :param inline_size: max size of the frame (bytes), decoded in the reactor thread
+        :param on_decode: callable (proto, msg), called after each message is decoded, before its handler
+        """
+        self.log = get_logger(self)
+        self.inline_size = inline_size
+        self.__on_decode = on_decode
+        self.__routes = {}
+        self.__stats = {}
+        self.__unknown = Counter()
+
+    def register(self, component: int, kind: typing.Optional[int], handler: typing.Callable, name: str = None) -> None:
+        """
+        Register handler of the message.
+
+        :param component: component of the message
+        :param kind: kind of the message or MessageRouter.ANY for every kind of the component
+        :param handler: callable (proto, msg)
+        :param name: name of the route in the statistics
+        :return: None
+        """
+        name = name or "{}:{}".format(component, kind)
+        self.__routes[(component, kind)] = (name, handler)
+        self.__stats.setdefault(name, RouteStats())
+
+    def get_route(self, msg) -> tuple:
+        """
+        Find route of the message.
+
+        :param msg: decoded message
+        :return: tuple (name, handler) or (None, None) if message is unknown.
+        """
+        # Serialisable creates missing attributes on access
+        component = msg.__dict__.get("component")
+        route = self.__routes.get((component, msg.__dict__.get("kind")))
+        if route is None:
+            route = self.__routes.get((component, self.ANY), (None, None))
+
+        return route
+
+    def dispatch(self, proto, payload: bytes, binary: bool):
+        """
+        Dispatch inbound frame.
+
+        :param proto: protocol of the peer
+        :param payload: frame data
+        :param binary: True if frame is binary
+        :return: Deferred, if frame is decoded in a thread, otherwise None
+        """
+        started = time.time()
+        if len(payload) <= self.inline_size:
+            result = self._handle(proto, self._decode(payload, binary), started, inline=True)
+        else:
+            result = threads.deferToThread(self._decode, payload, binary).addCallback(
+                lambda msg: self._handle(proto, msg, started, inline=False))
+
+        return result
+
+    def _decode(self, payload: bytes, binary: bool):
+        """
+        Decode frame.
+
+        :param payload: frame data
+        :param binary: True if frame is binary
+        :return: decoded message or None, if frame cannot be decoded
+        """
+        msg = None
+        try:
+            msg = ObjectGate().load(payload, binary)
+        except Exception as exc:
+            self.__unknown.inc()
+            self.log.error("Unable to decode message: {}", exc)
+
+        return msg
+
+    def _handle(self, proto, msg, started: float, inline: bool) -> None:
+        """
+        Call handler of the decoded message (reactor thread).
+
+        :param proto: protocol of the peer
+        :param msg: decoded message or None, if frame cannot be decoded
+        :param started: time when frame was received
+        :param inline: True if frame was decoded in the reactor thread
+        :return: None
+        """
+        if msg is not None:
+            if self.__on_decode is not None:
+                self.__on_decode(proto, msg)
+
+            name, handler = self.get_route(msg)
+            if handler is None:
+                self.__unknown.inc()
+                self.log.error("CAUTION: unknown message type")
+            else:
+                stats = self.__stats[name]
+                (stats.inline if inline else stats.deferred).inc()
+                try:
+                    handler(proto, msg)
+                except Exception as exc:
+                    stats.errors.inc()
+                    self.log.error("Error handling message '{}': {}", name, exc)
+                finally:
+                    stats.latency.observe(time.time() - started)
+
+    def get_stats(self) -> dict:
+        """
+        Get statistics of the routes.
+
+        :return: dictionary of the route name to its statistics
+        """
+        stats = {name: route_stats.to_dict() for name, route_stats in self.__stats.items()}
+        stats["unknown"] = self.__unknown.value
+
+        return stats
@@ -0,0 +1,207 @@
+# coding: utf-8
+"""
+Job subscriptions of the consoles.
+
+Console that requested a job can stay connected and watch it:
+Master pushes per-host results as they arrive and an aggregated
+progress (done/total/failed). Progress messages are coalesced, so
+the console is redrawn not more often than once per interval.
+Only the machines, the job is fired to, are counted. Watch is finished
+with the final progress once all of them returned or on timeout.
+"""
+import typing
+from twisted.internet import reactor
+
+from sugar.lib.logger.manager import get_logger
+from sugar.transport import ServerMsgFactory
+import sugar.utils.exitcodes
+
+
+class JobSubscription:
+    """
+    Subscription to a particular job.
+    """
+    def __init__(self, jid: str, total: int):
+        """
+        Constructor.
+
+        :param jid: Job ID
+        :param total: amount of machines, the job is fired to
+        """
+        self.jid = jid
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.expired = False
+        self.consoles = []
+        self.progress_call = None
+        self.timeout_call = None
+
+    @property
+    def finished(self) -> bool:
+        """
+        Flag: all machines returned or the watch is timed out.
+
+        :return: bool
+        """
+        return self.done >= self.total or self.expired
+
+
+class JobSubscriptions:
+    """
+    Registry of the job subscriptions.
+    All methods should be called from the reactor thread.
+    """
+    PROGRESS_INTERVAL = 0.5  # Seconds between progress updates
+
+    def __init__(self):
+        self.log = get_logger(self)
+        self.__jobs = {}
+
+    def subscribe(self, jid: str, proto, total: int, timeout: float = None) -> None:
+        """
+        Subscribe console to the job returns.
+        If there is nothing to wait for, the final progress is pushed at once.
+
+        :param jid: Job ID
+        :param proto: console protocol
+        :param total: amount of machines, the job is fired to
+        :param timeout: seconds to wait for the returns. None or 0 to wait until all returned.
+        :return: None
+        """
+        subscription = self.__jobs.setdefault(jid, JobSubscription(jid=jid, total=total))
+        if proto not in subscription.consoles:
+            subscription.consoles.append(proto)
+        self.log.debug("Console subscribed to the job '{}' ({} machines)", jid, total)
+
+        if subscription.finished:
+            self._push_progress(subscription)
+        elif timeout and subscription.timeout_call is None:
+            subscription.timeout_call = reactor.callLater(timeout, self._expire, subscription)
+
+    def _expire(self, subscription: JobSubscription) -> None:
+        """
+        Finish the watch of the machines, that did not return in time.
+
+        :param subscription: JobSubscription
+        :return: None
+        """
+        subscription.timeout_call = None
+        subscription.expired = True
+        self.log.debug("Watch of the job '{}' is timed out: {} of {} machines returned",
+                       subscription.jid, subscription.done, subscription.total)
+        self._push_progress(subscription)
+
+    def unsubscribe(self, proto) -> None:
+        """
+        Unsubscribe console from all the jobs (e.g. when it is disconnected).
+
+        :param proto: console protocol
+        :return: None
+        """
+        for jid in list(self.__jobs):
+            subscription = self.__jobs[jid]
+            if proto in subscription.consoles:
+                subscription.consoles.remove(proto)
+            if not subscription.consoles:
+                self._drop(subscription)
+
+    def is_subscribed(self, jid: str) -> bool:
+        """
+        Check if any console is watching the job.
+
+        :param jid: Job ID
+        :return: bool
+        """
+        return jid in self.__jobs
+
+    def on_return(self, jid: str, machine_id: str, host: str, uri: str,
+                  errcode: int, errmsg: str, return_data: typing.Any) -> None:
+        """
+        Push returned result of the host to the subscribed consoles.
+
+        :param jid: Job ID
+        :param machine_id: machine ID of the returned host
+        :param host: hostname
+        :param uri: called function
+        :param errcode: error code of the call
+        :param errmsg: error message of the call
+        :param return_data: returned data
+        :return: None
+        """
+        subscription = self.__jobs.get(jid)
+        if subscription is None:
+            return
+
+        subscription.done += 1
+        if errcode != sugar.utils.exitcodes.EX_OK or errmsg:
+            subscription.failed += 1
+
+        msg = ServerMsgFactory.create_console_msg()
+        msg.kind = ServerMsgFactory.CONSOLE_JOB_RETURN
+        msg.jid = jid
+        msg.internal = {
+            "machine_id": machine_id,
+            "host": host or machine_id,
+            "uri": uri,
+            "errcode": errcode,
+            "errmsg": errmsg,
+            "return_data": return_data,
+        }
+        self._send(subscription, msg)
+
+        if subscription.finished:
+            self._push_progress(subscription)
+        elif subscription.progress_call is None:
+            subscription.progress_call = reactor.callLater(self.PROGRESS_INTERVAL, self._push_progress, subscription)
+
+    def _push_progress(self, subscription: JobSubscription) -> None:
+        """
+        Push aggregated progress of the job.
+
+        :param subscription: JobSubscription
+        :return: None
+        """
+        if subscription.progress_call is not None and subscription.progress_call.active():
+            subscription.progress_call.cancel()
+        subscription.progress_call = None
+
+        msg = ServerMsgFactory.create_console_msg()
+        msg.kind = ServerMsgFactory.CONSOLE_JOB_PROGRESS
+        msg.jid = subscription.jid
+        msg.internal = {
+            "done": subscription.done,
+            "total": subscription.total,
+            "failed": subscription.failed,
+            "finished": subscription.finished,
+            "expired": subscription.expired,
+        }
+        self._send(subscription, msg)
+
+        if subscription.finished:
+            self._drop(subscription)
+
+    def _send(self, subscription: JobSubscription, msg) -> None:
+        """
+        Send message to all consoles of the subscription.
+
+        :param subscription: JobSubscription
+        :param msg: Serialisable message
+        :return: None
+        """
+        payload = ServerMsgFactory.pack(msg)
+        for proto in subscription.consoles:
+            proto.sendMessage(payload, isBinary=True)
+
+    def _drop(self, subscription: JobSubscription) -> None:
+        """
+        Remove subscription.
+
+        :param subscription: JobSubscription
+        :return: None
+        """
+        for call in [subscription.progress_call, subscription.timeout_call]:
+            if call is not None and call.active():
+                call.cancel()
+        self.__jobs.pop(subscription.jid, None)
+        self.log.debug("Subscription to the job '{}' is finished", subscription.jid)
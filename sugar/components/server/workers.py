@@ -0,0 +1,459 @@
+# coding: utf-8
+"""
+Multi-process Master workers.
+
+Master can run several worker processes, sharing the client port
+via SO_REUSEPORT, so the kernel balances incoming connections between them.
+Each worker owns connections of its peers. Peer membership is published
+to the shared registry (machine ID -> worker index), which lives in the
+manager process of the primary worker (index 0). Events for peers,
+owned by another worker, are routed to its channel. Job store is
+opened only by the primary worker, other workers route their updates.
+
+Workers are not forked: Twisted reactor is already installed at that point
+and its poller would be shared between the processes. Instead, Master is
+re-executed with the "--worker" option and connects to the registry by
+its address and an authentication key from the environment.
+"""
+import os
+import sys
+import socket
+import binascii
+import threading
+import subprocess
+from multiprocessing.managers import BaseManager, DictProxy
+from queue import Queue
+
+from twisted.internet import reactor
+from twisted.protocols.tls import TLSMemoryBIOFactory
+
+from sugar.lib.logger.manager import get_logger
+
+
+class _Owners(dict):
+    """
+    Peer owners mapping (lives in the manager process).
+    Manager serves each worker in its own thread, so read-modify-write is done under the lock.
+    """
+    def __init__(self):
+        super().__init__()
+        self.__lock = threading.Lock()
+
+    def publish(self, machine_id: str, index: int) -> None:
+        """
+        Set owner of the peer.
+
+        :param machine_id: machine ID
+        :param index: worker index
+        :return: None
+        """
+        with self.__lock:
+            self[machine_id] = index
+
+    def withdraw(self, machine_id: str, index: int) -> bool:
+        """
+        Remove owner of the peer, if it is still the same worker.
+
+        :param machine_id: machine ID
+        :param index: worker index
+        :return: True if removed
+        """
+        with self.__lock:
+            owned = self.get(machine_id) == index
+            if owned:
+                del self[machine_id]
+
+        return owned
+
+
+class OwnersProxy(DictProxy):  # pylint: disable=R0903
+    """
+    Proxy of the peer owners mapping.
+    """
+    _exposed_ = DictProxy._exposed_ + ("publish", "withdraw")
+
+    def publish(self, machine_id: str, index: int) -> None:
+        """
+        Set owner of the peer.
+
+        :param machine_id: machine ID
+        :param index: worker index
+        :return: None
+        """
+        return self._callmethod("publish", (machine_id, index))
+
+    def withdraw(self, machine_id: str, index: int) -> bool:
+        """
+        Remove owner of the peer, if it is still the same worker.
+
+        :param machine_id: machine ID
+        :param index: worker index
+        :return: True if removed
+        """
+        return self._callmethod("withdraw", (machine_id, index))
+
+
+_OWNERS = _Owners()
+_CHANNELS = {}
+
+
+def _get_owners() -> dict:
+    """
+    Get peer owners mapping (runs in the manager process).
+
+    :return: dictionary of machine ID to a worker index
+    """
+    return _OWNERS
+
+
+def _get_channel(index: int) -> Queue:
+    """
+    Get events channel of the worker (runs in the manager process).
+
+    :param index: worker index
+    :return: Queue
+    """
+    return _CHANNELS.setdefault(index, Queue())
+
+
+class WorkerRegistryManager(BaseManager):
+    """
+    Manager of the shared workers registry.
+    """
+
+
+WorkerRegistryManager.register("owners", callable=_get_owners, proxytype=OwnersProxy)
+WorkerRegistryManager.register("channel", callable=_get_channel)
+
+
+def sharded_socket(port: int, interface: str = "") -> socket.socket:
+    """
+    Create listening TCP socket with SO_REUSEPORT option,
+    so the same port can be bound by several processes.
+
+    :param port: port to listen to
+    :param interface: interface to bind to. Default: all.
+    :return: socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((interface, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.setblocking(False)
+
+    return sock
+
+
+def listen_sharded(factory, context_factory=None, port: int = None, interface: str = ""):
+    """
+    Listen on the port, shared with the other workers.
+
+    :param factory: protocol factory (usually WebSocketServerFactory)
+    :param context_factory: SSL context factory. If None, TLS is not used.
+    :param port: port to listen to. Default is the port of the factory.
+    :param interface: interface to bind to. Default: all.
+    :return: IListeningPort
+    """
+    sock = sharded_socket(port or factory.port, interface=interface)
+    if context_factory is not None:
+        factory = TLSMemoryBIOFactory(context_factory, False, factory)
+    try:
+        port = reactor.adoptStreamPort(sock.fileno(), socket.AF_INET, factory)
+    finally:
+        sock.close()  # Reactor keeps its own duplicate of the descriptor
+
+    return port
+
+
+class WorkerHandle:
+    """
+    Worker side of the shared registry.
+    """
+    ENV_ADDRESS = "SUGAR_WORKERS_ADDRESS"
+    ENV_AUTHKEY = "SUGAR_WORKERS_AUTHKEY"
+
+    EVT_FIRE = "fire"
+    EVT_RETURN = "return"
+    EVT_PENDING = "pending"
+    EVT_STORE = "store"
+    EVT_STOP = "stop"
+
+    def __init__(self, index: int, manager: WorkerRegistryManager):
+        """
+        Constructor.
+
+        :param index: index of the current worker
+        :param manager: connected or started registry manager
+        """
+        self.index = index
+        self.log = get_logger(self)
+        self.__manager = manager
+        self.__owners = manager.owners()
+        self.__channels = {}
+
+    @classmethod
+    def connect(cls, index: int) -> "WorkerHandle":
+        """
+        Connect to the registry of the primary worker.
+
+        :param index: index of the current worker
+        :return: WorkerHandle
+        """
+        manager = WorkerRegistryManager(address=os.environ[cls.ENV_ADDRESS],
+                                        authkey=binascii.unhexlify(os.environ[cls.ENV_AUTHKEY]))
+        manager.connect()
+        return cls(index, manager)
+
+    @property
+    def primary(self) -> bool:
+        """
+        Flag: is this worker a primary one (serves console and API).
+
+        :return: bool
+        """
+        return not self.index
+
+    def channel(self, index: int):
+        """
+        Get events channel of the worker.
+
+        :param index: worker index
+        :return: Queue proxy
+        """
+        if index not in self.__channels:
+            self.__channels[index] = self.__manager.channel(index)
+        return self.__channels[index]
+
+    def publish(self, machine_id: str) -> None:
+        """
+        Publish that the peer is owned by the current worker.
+
+        :param machine_id: machine ID
+        :return: None
+        """
+        self.__owners.publish(machine_id, self.index)
+
+    def withdraw(self, machine_id: str) -> None:
+        """
+        Remove peer membership, if it is still owned by the current worker.
+        Peer might already reconnect to another worker.
+
+        :param machine_id: machine ID
+        :return: None
+        """
+        self.__owners.withdraw(machine_id, self.index)
+
+    def owner(self, machine_id: str):
+        """
+        Get index of the worker that owns the peer.
+
+        :param machine_id: machine ID
+        :return: worker index or None, if peer is offline.
+        """
+        return self.__owners.get(machine_id)
+
+    def online(self) -> list:
+        """
+        Get machine IDs of the peers across all workers.
+
+        :return: list of machine IDs
+        """
+        return self.__owners.keys()
+
+    def route(self, index: int, event: str, *args) -> None:
+        """
+        Route an event to the worker.
+
+        :param index: index of the target worker
+        :param event: event type
+        :param args: event arguments (should be picklable)
+        :return: None
+        """
+        self.channel(index).put((event, args))
+
+    def channel_loop(self, core) -> None:
+        """
+        Receive events, routed to the current worker.
+        This is blocking and should run in a thread.
+
+        :param core: ServerCore instance
+        :return: None
+        """
+        channel = self.channel(self.index)
+        while True:
+            event, args = channel.get()
+            if event == self.EVT_STOP:
+                break
+            try:
+                if event == self.EVT_FIRE:
+                    core.fire_routed_event(*args)
+                elif event == self.EVT_RETURN:
+                    reactor.callFromThread(core.push_job_return, *args)
+                elif event == self.EVT_PENDING:
+                    reactor.callFromThread(core.fire_pending_jobs, *args)
+                elif event == self.EVT_STORE:
+                    RoutedJobStore.apply(core.jobstore, *args)
+                else:
+                    self.log.error("Unknown routed event: {}", event)
+            except Exception as exc:
+                self.log.error("Error processing routed event '{}': {}", event, exc)
+
+    def stop(self) -> None:
+        """
+        Stop channel loop of the current worker.
+
+        :return: None
+        """
+        self.route(self.index, self.EVT_STOP)
+
+
+class RoutedJobStore:
+    """
+    Job store of the secondary worker.
+
+    Only the primary worker opens the job store, so it has one writer
+    and its index of the pending work sees all the updates. Secondary
+    workers route the updates to the primary worker. Reads are served
+    by the primary worker only (consoles, API and pending jobs).
+    """
+    ROUTED = ("add_host", "set_as_fired", "report_job", "report_call")
+
+    def __init__(self, workers: WorkerHandle):
+        """
+        Constructor.
+
+        :param workers: handle of the secondary worker
+        """
+        self.workers = workers
+
+    @classmethod
+    def apply(cls, jobstore, name: str, kwargs: dict) -> None:
+        """
+        Apply routed update to the job store of the primary worker.
+
+        :param jobstore: job store
+        :param name: name of the update method
+        :param kwargs: keywords of the update
+        :raises ValueError: if method is not an update
+        :return: None
+        """
+        if name not in cls.ROUTED:
+            raise ValueError("Job store update '{}' cannot be routed".format(name))
+        getattr(jobstore, name)(**kwargs)
+
+    def _route(self, name: str, **kwargs) -> None:
+        """
+        Route update to the primary worker.
+
+        :param name: name of the update method
+        :param kwargs: keywords of the update
+        :return: None
+        """
+        self.workers.route(0, WorkerHandle.EVT_STORE, name, kwargs)
+
+    def add_host(self, fqdn: str, osid: str, ipv4: str, ipv6: str) -> None:
+        """
+        Add host to the cache or update if it changes.
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :return: None
+        """
+        self._route("add_host", fqdn=fqdn, osid=osid, ipv4=ipv4, ipv6=ipv6)
+
+    def set_as_fired(self, jid: str, target) -> None:
+        """
+        Mark job as "fired".
+
+        :param jid: Job ID
+        :param target: client target
+        :return: None
+        """
+        self._route("set_as_fired", jid=jid, target=target)
+
+    def report_job(self, jid: str, target, **kwargs) -> None:
+        """
+        Report compiled job source on the client.
+
+        :param jid: Job ID
+        :param target: target machine
+        :param kwargs: keywords of the report (see JobStoreInterface.report_job)
+        :return: None
+        """
+        self._route("report_job", jid=jid, target=target, **kwargs)
+
+    def report_call(self, jid: str, target, **kwargs) -> None:
+        """
+        Report job progress.
+
+        :param jid: Job ID
+        :param target: machine that reports this call
+        :param kwargs: keywords of the report (see JobStoreInterface.report_call)
+        :return: None
+        """
+        self._route("report_call", jid=jid, target=target, **kwargs)
+
+    def close(self) -> None:
+        """
+        Nothing to close: the job store is owned by the primary worker.
+
+        :return: None
+        """
+
+
+class WorkerPool:
+    """
+    Pool of the Master workers, started by the primary worker.
+    """
+    def __init__(self, workers: int, sockdir: str):
+        """
+        Constructor.
+
+        :param workers: total amount of workers, including primary
+        :param sockdir: directory for the registry socket
+        """
+        self.log = get_logger(self)
+        self.workers = workers
+        self.__sockdir = sockdir
+        self.__processes = []
+        self.__manager = None
+
+    def start(self) -> WorkerHandle:
+        """
+        Start registry and secondary workers.
+
+        :return: WorkerHandle of the primary worker.
+        """
+        os.makedirs(self.__sockdir, exist_ok=True)
+        address = os.path.join(self.__sockdir, "workers.{}.sock".format(os.getpid()))
+        authkey = os.urandom(0x20)
+        self.__manager = WorkerRegistryManager(address=address, authkey=authkey)
+        self.__manager.start()
+
+        env = dict(os.environ)
+        env[WorkerHandle.ENV_ADDRESS] = address
+        env[WorkerHandle.ENV_AUTHKEY] = binascii.hexlify(authkey).decode("ascii")
+        for index in range(1, self.workers):
+            self.__processes.append(subprocess.Popen([sys.executable] + sys.argv + ["--worker", str(index)], env=env))
+            self.log.info("Started Master worker {} (PID: {})", index, self.__processes[-1].pid)
+
+        return WorkerHandle(0, self.__manager)
+
+    def stop(self) -> None:
+        """
+        Stop secondary workers and the registry.
+
+        :return: None
+        """
+        for process in self.__processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.__processes:
+            process.wait()
+        self.__processes = []
+        if self.__manager is not None:
+            self.__manager.shutdown()
+            self.__manager = None
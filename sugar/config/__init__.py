@@ -55,7 +55,14 @@ class _DefaultConfigurations(object):
         'terminal': {
             'colors': 16,
             'encoding': 'ascii',
-        }
+        },
+        'workers': 1,
+        'jobs': {
+            'backend': 'sqlite',  # Job store: "sqlite" or "log" (append-only log)
+            'max_age': 0,       # Days of the jobs history. 0 is unlimited.
+            'max_count': 0,
+            'max_size_mb': 0,
+        },
     }
 
 # Default client configuration.
@@ -8,7 +8,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 import copy
 
 from sugar.utils.structs import merge_dicts
-from sugar.lib.schemelib import Schema, And, Optional
+from sugar.lib.schemelib import Schema, And, Or, Optional
 
 
 class SchemeBuilder(object):
@@ -58,7 +58,14 @@ class SchemeBuilder(object):
         Optional('terminal'): {
             Optional('colors'): int,
             Optional('encoding'): str,
-        }
+        },
+        Optional('workers'): int,
+        Optional('jobs'): {
+            Optional('backend'): Or('sqlite', 'log'),
+            Optional('max_age'): int,
+            Optional('max_count'): int,
+            Optional('max_size_mb'): int,
+        },
     }
 
     def get_master_scheme(self):
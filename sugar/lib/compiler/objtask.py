@@ -48,6 +48,7 @@ class FunctionObject:
     kwargs = []        # Keywords to the function
     type = TYPE_STATE  # Type of the function (state, runner or custom)
     jid = None         # Job ID
+    priority = None    # Priority of the task, set by the master
 
     def __repr__(self):
         return "<{name} at {mem} Module: {mdl}, Function: {fnc}, Args: {arg}, Keywords: {kwr}>".format(
@@ -79,6 +80,29 @@ class FunctionObject:
         """
         return "{m}.{f}".format(m=self.module, f=self.function)
 
+    def to_dict(self) -> dict:
+        """
+        Get function object as a plain dictionary, e.g. to queue it.
+
+        :return: dict
+        """
+        return {"module": self.module, "function": self.function, "args": self.args,
+                "kwargs": self.kwargs, "type": self.type, "jid": self.jid, "priority": self.priority}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FunctionObject":
+        """
+        Create function object from the plain dictionary.
+
+        :param data: dictionary, made by to_dict()
+        :return: FunctionObject
+        """
+        obj = cls()
+        for attr in ["module", "function", "args", "kwargs", "type", "jid"]:
+            setattr(obj, attr, data[attr])
+        obj.priority = data.get("priority")  # Not queued by the older versions
+        return obj
+
 
 class StateTask:
     """
@@ -19,4 +19,28 @@ This serves to manage jobs:
 
 # flake8: noqa
 
+import sugar.lib.exceptions
+from sugar.lib.jobstore.interface import JobStoreInterface
 from sugar.lib.jobstore.storage import JobStorage
+from sugar.lib.jobstore.logstore import LogJobStorage
+
+BACKENDS = {
+    "sqlite": JobStorage,
+    "log": LogJobStorage,
+}
+
+
+def get_jobstore(config, path=None) -> JobStoreInterface:
+    """
+    Get job store of the configured backend.
+
+    :param config: configuration of the master
+    :param path: directory of the job store. Default: cache path.
+    :raises SugarJobStoreException: if backend is unknown
+    :return: job store
+    """
+    backend = (config.jobs.backend if config.jobs else None) or "sqlite"
+    if backend not in BACKENDS:
+        raise sugar.lib.exceptions.SugarJobStoreException("Unknown job store backend: {}".format(backend))
+
+    return BACKENDS[backend](config, path=path)
@@ -0,0 +1,253 @@
+# coding: utf-8
+"""
+Streaming tar archive of the exported jobs.
+
+Members are written to the archive one by one as they come, so
+memory does not depend on the size of the job. Compression can run
+in a separate process, which receives the tar stream over a pipe.
+"""
+import io
+import os
+import bz2
+import gzip
+import lzma
+import time
+import tarfile
+import typing
+import datetime
+import multiprocessing
+
+import sugar.lib.exceptions
+from sugar.lib.jobstore.components import ResultDict
+from sugar.lib.jobstore.interface import _to_iso
+from sugar.lib.compat import yaml
+
+# Compression: archive file extension
+COMPRESSIONS = {
+    None: "",
+    "gz": ".gz",
+    "bz2": ".bz2",
+    "xz": ".xz",
+}
+
+_OPENERS = {
+    "gz": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+
+def get_path(path: str, jid: str, compression: str) -> str:
+    """
+    Get path to the new archive of the job.
+
+    :param path: directory of the archive
+    :param jid: job ID
+    :param compression: compression type
+    :raises SugarJobStoreException: if an archive file already exists
+    :return: path to the archive
+    """
+    os.makedirs(path, exist_ok=True)
+    path = "{}/sugar-job-{}.tar{}".format(path, jid, COMPRESSIONS.get(compression, ""))
+
+    # This should not happen, but still.
+    if os.path.exists(path):
+        raise sugar.lib.exceptions.SugarJobStoreException("File '{}' already exists".format(path))
+
+    return path
+
+
+def get_job_info(jid: str, created: datetime.datetime, finished: typing.Optional[datetime.datetime],
+                 status: str, query: str, uri: str, tag: typing.Optional[str]) -> str:
+    """
+    Get description of the job in the archive.
+
+    :param jid: job ID
+    :param created: when job was created (UTC)
+    :param finished: when job was finished (UTC)
+    :param status: status of the job
+    :param query: target query
+    :param uri: URI of the job
+    :param tag: tag of the job
+    :return: YAML
+    """
+    job_data = ResultDict()
+    job_data["jid"] = jid
+    job_data["created"] = _to_iso(created)
+    job_data["finished"] = _to_iso(finished)
+    job_data["status"] = status
+    job_data["query"] = query
+    job_data["identifier"] = uri
+    job_data["tag"] = tag
+
+    return yaml.dump(job_data.to_dict(), default_flow_style=False)
+
+
+def _get_task_data(files: list, idn: str, finished: typing.Optional[datetime.datetime], return_data: str, src: str,
+                   calls: typing.Iterable[tuple]) -> ResultDict:
+    """
+    Get data of the task in the result file.
+
+    :param files: list of (file name, content), where files of the task are added
+    :param idn: IDN of the task
+    :param finished: when task was finished (UTC)
+    :param return_data: returned data
+    :param src: source of the task
+    :param calls: (finished, uri, src, errcode, output) per call
+    :return: ResultDict
+    """
+    task_data = ResultDict()
+    task_data["identifier"] = idn
+    task_data["finished"] = _to_iso(finished)
+    task_data["return_data"] = return_data
+    task_data["src"] = src
+    task_data["calls"] = []
+    if return_data:
+        files.append(("{}-return.yaml".format(idn), return_data))
+    for call_finished, call_uri, call_src, errcode, output in calls:
+        call_data = ResultDict()
+        call_data["finished"] = _to_iso(call_finished)
+        call_data["URI"] = call_uri
+        call_data["src"] = call_src
+        call_data["errcode"] = errcode
+        call_data["output"] = output
+        task_data["calls"].append(call_data)
+        if call_src:
+            files.append(("src-{}.{}.yaml".format(idn, call_uri), call_src))
+
+    return task_data
+
+
+def get_result_files(status: int, fired: typing.Optional[datetime.datetime], src: str,
+                     tasks: typing.Iterable[tuple]) -> typing.List[tuple]:
+    """
+    Get files of the result of one host in the archive.
+
+    :param status: status of the result
+    :param fired: when job was fired to the host (UTC)
+    :param src: source of the result
+    :param tasks: (idn, finished, return_data, src, calls) per task,
+                  where calls are (finished, uri, src, errcode, output)
+    :return: list of (file name, content)
+    """
+    files = []
+    result_data = ResultDict()
+    result_data["status"] = status
+    result_data["fired"] = _to_iso(fired)
+    result_data["src"] = src
+    result_data["tasks"] = []
+    for task in tasks:
+        result_data["tasks"].append(_get_task_data(files, *task))
+    files.append(("result.yaml", yaml.dump(result_data.to_dict(), default_flow_style=False)))
+    files.append(("source.yaml", src))
+
+    return files
+
+
+def _compress(connection, path: str, compression: str) -> None:
+    """
+    Compress tar stream from the pipe into the file (compressor process).
+
+    :param connection: receiving end of the pipe
+    :param path: path to the archive
+    :param compression: compression type
+    :return: None
+    """
+    with _OPENERS[compression](path, "wb") as archive_fh:
+        while True:
+            chunk = connection.recv_bytes()
+            if not chunk:
+                break
+            archive_fh.write(chunk)
+    connection.close()
+
+
+class _PipeWriter:
+    """
+    Write-only file object over the pipe.
+    """
+    def __init__(self, connection):
+        """
+        Constructor.
+
+        :param connection: sending end of the pipe
+        """
+        self.connection = connection
+
+    def write(self, data: bytes) -> int:
+        """
+        Send data.
+
+        :param data: bytes
+        :return: amount of written bytes
+        """
+        self.connection.send_bytes(data)
+        return len(data)
+
+
+class ArchiveWriter:
+    """
+    Streaming tar archive writer.
+    """
+    def __init__(self, path: str, compression: str = "gz", process: bool = False):
+        """
+        Constructor.
+
+        :param path: path to the archive file
+        :param compression: None, "gz", "bz2" or "xz"
+        :param process: compress in a separate process
+        :raises SugarJobStoreException: if compression is not supported
+        """
+        if compression not in COMPRESSIONS:
+            raise sugar.lib.exceptions.SugarJobStoreException("Unsupported compression: {}".format(compression))
+        self.path = path
+        self._process = None
+        self._sender = None
+        if process and compression:
+            receiver, self._sender = multiprocessing.Pipe(duplex=False)
+            self._process = multiprocessing.Process(target=_compress, args=(receiver, path, compression),
+                                                    name="jobstore-export", daemon=True)
+            self._process.start()
+            receiver.close()
+            self._archive = tarfile.open(fileobj=_PipeWriter(self._sender), mode="w|")
+        else:
+            self._archive = tarfile.open(path, mode="w|{}".format(compression or ""))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add(self, name: str, body: str) -> None:
+        """
+        Add text file to the archive.
+
+        :param name: name of the file in the archive
+        :param body: content of the file
+        :return: None
+        """
+        data = body.encode("utf-8")
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self._archive.addfile(info, io.BytesIO(data))
+        self._archive.members.clear()  # Written members are not needed, but tarfile keeps them all
+
+    def close(self) -> None:
+        """
+        Finish the archive.
+
+        :raises SugarJobStoreException: if compressor process has failed
+        :return: None
+        """
+        self._archive.close()
+        if self._process is not None:
+            self._sender.send_bytes(b"")
+            self._sender.close()
+            self._process.join()
+            if self._process.exitcode:
+                raise sugar.lib.exceptions.SugarJobStoreException(
+                    "Compression of '{}' failed with exit code {}".format(self.path, self._process.exitcode))
+            self._process = None
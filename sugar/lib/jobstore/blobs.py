@@ -0,0 +1,136 @@
+# coding: utf-8
+"""
+Content-addressed blob storage of the job outputs.
+
+Large text payloads (return data, sources, call outputs) are kept
+compressed in files, named by SHA-256 of the content, and the database
+keeps only the reference "blob:<sha256>". Identical outputs of many
+hosts are therefore stored once. Blobs are not reference-counted:
+the ones that are no longer referenced from the database are removed
+by the garbage collection on job expiry.
+"""
+import os
+import time
+import zlib
+import typing
+import hashlib
+import tempfile
+
+from sugar.lib.logger.manager import get_logger
+from sugar.lib.metrics import Counter
+
+
+class BlobStore:
+    """
+    Compressed content-addressed blob storage.
+    """
+    PREFIX = "blob:"
+    THRESHOLD = 0x400   # Payloads shorter than this (characters) are kept inline
+    LEVEL = 6           # zlib compression level
+    GRACE = 3600        # Seconds, during which a new blob is not collected (its reference is not committed yet)
+
+    def __init__(self, path: str, threshold: int = THRESHOLD, level: int = LEVEL):
+        """
+        Constructor.
+
+        :param path: directory of the blobs
+        :param threshold: min length of the payload to be stored as a blob
+        :param level: compression level
+        """
+        self.log = get_logger(self)
+        self.path = path
+        self.threshold = threshold
+        self.level = level
+        self.stored = Counter()
+        self.deduplicated = Counter()
+        os.makedirs(self.path, exist_ok=True)
+
+    def is_ref(self, value: typing.Any) -> bool:
+        """
+        Value is a blob reference.
+
+        :param value: stored value
+        :return: bool
+        """
+        return isinstance(value, str) and value.startswith(self.PREFIX)
+
+    def _get_path(self, digest: str) -> str:
+        """
+        Get path of the blob.
+
+        :param digest: SHA-256 hex digest
+        :return: path
+        """
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def put(self, value: typing.Optional[str]) -> typing.Optional[str]:
+        """
+        Store the payload. Short payloads are returned as is.
+
+        :param value: text payload
+        :return: reference to the blob or the payload itself
+        """
+        if value is not None and (len(value) >= self.threshold or self.is_ref(value)):
+            data = value.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()
+            path = self._get_path(digest)
+            if os.path.exists(path):
+                os.utime(path)  # Refresh, so the blob is not collected before referenced again
+                self.deduplicated.inc()
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                with os.fdopen(fd, "wb") as blob_fh:
+                    blob_fh.write(zlib.compress(data, self.level))
+                os.replace(temp, path)
+                self.stored.inc()
+            value = self.PREFIX + digest
+
+        return value
+
+    def get(self, value: typing.Optional[str]) -> typing.Optional[str]:
+        """
+        Resolve the stored value. Values that are not references are returned as is.
+
+        :param value: reference to the blob or the payload itself
+        :return: text payload
+        """
+        if self.is_ref(value):
+            with open(self._get_path(value[len(self.PREFIX):]), "rb") as blob_fh:
+                value = zlib.decompress(blob_fh.read()).decode("utf-8")
+
+        return value
+
+    def gc(self, refs: typing.Iterable[str], grace: int = None) -> int:
+        """
+        Remove blobs that are not referenced.
+
+        :param refs: all references in the database
+        :param grace: seconds, during which recently stored blobs are kept. Default: GRACE
+        :return: amount of removed blobs
+        """
+        digests = {ref[len(self.PREFIX):] for ref in refs if self.is_ref(ref)}
+        threshold = time.time() - (self.GRACE if grace is None else grace)
+        removed = 0
+        for prefix in os.listdir(self.path):
+            directory = os.path.join(self.path, prefix)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if prefix + name not in digests and os.stat(path).st_mtime < threshold:
+                    os.unlink(path)
+                    removed += 1
+        if removed:
+            self.log.debug("Removed {} unreferenced blobs", removed)
+
+        return removed
+
+    def get_stats(self) -> dict:
+        """
+        Get blob metrics.
+
+        :return: dictionary of stored and deduplicated payloads
+        """
+        return {
+            "stored": self.stored.value,
+            "deduplicated": self.deduplicated.value,
+        }
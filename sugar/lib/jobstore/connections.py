@@ -0,0 +1,141 @@
+# coding: utf-8
+"""
+SQLite connections of the job store.
+
+Database is in WAL mode: readers do not block the writer and vice versa.
+Raw read-only connections are pooled for the queries that do not need
+ORM entities (counters, indexes etc).
+"""
+import queue
+import sqlite3
+import threading
+import contextlib
+
+from sugar.utils.db import database
+
+# Pragmas of every connection
+SQLITE_PRAGMAS = (
+    ("busy_timeout", 10000),   # Milliseconds to wait for a lock, instead of "database is locked"
+    ("cache_size", -0x4000),   # 16 MiB page cache
+    ("temp_store", "MEMORY"),
+    ("mmap_size", 0x10000000),  # 256 MiB
+)
+
+# Pragmas of the read-write connections
+SQLITE_WRITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),  # WAL is still consistent, fsync happens on checkpoints
+)
+
+
+def set_pragmas(connection, readonly: bool = False) -> None:
+    """
+    Tune SQLite connection.
+
+    :param connection: sqlite3 connection
+    :param readonly: connection is read-only
+    :return: None
+    """
+    cursor = connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS + (() if readonly else SQLITE_WRITE_PRAGMAS):
+        cursor.execute("PRAGMA {} = {}".format(pragma, value))
+    if readonly:
+        cursor.execute("PRAGMA query_only = 1")
+    cursor.close()
+
+
+@database.on_connect(provider="sqlite")
+def _on_connect(db, connection) -> None:  # pylint: disable=W0613
+    """
+    Tune ORM connections.
+
+    :param db: database
+    :param connection: sqlite3 connection
+    :return: None
+    """
+    set_pragmas(connection)
+
+
+class ReadOnlyPool:
+    """
+    Pool of read-only connections.
+    """
+    SIZE = 4
+
+    def __init__(self, path: str, size: int = SIZE):
+        """
+        Constructor.
+
+        :param path: path to the database file
+        :param size: max amount of connections
+        """
+        self.path = path
+        self.size = size
+        self.__idle = queue.LifoQueue()
+        self.__opened = 0
+        self.__lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        """
+        Open read-only connection.
+
+        :return: sqlite3 connection
+        """
+        connection = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True, check_same_thread=False)
+        set_pragmas(connection, readonly=True)
+
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Get connection from the pool. Blocks, if all connections are busy.
+
+        :return: sqlite3 connection
+        """
+        try:
+            connection = self.__idle.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                opened = self.__opened < self.size
+                if opened:
+                    self.__opened += 1
+            if opened:
+                try:
+                    connection = self._open()
+                except Exception:
+                    with self.__lock:
+                        self.__opened -= 1
+                    raise
+            else:
+                connection = self.__idle.get()
+        try:
+            yield connection
+        finally:
+            connection.rollback()  # End read transaction, so WAL can be checkpointed
+            self.__idle.put(connection)
+
+    def execute(self, sql: str, params: tuple = ()) -> list:
+        """
+        Execute query and fetch all rows.
+
+        :param sql: SQL query
+        :param params: parameters of the query
+        :return: list of rows
+        """
+        with self.connection() as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        """
+        Close idle connections.
+
+        :return: None
+        """
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.__lock:
+                self.__opened -= 1
@@ -1,6 +1,9 @@
 # coding: utf-8
 """
 Entities to be saved in the database.
+
+Indexes are not declared here: they are versioned
+along with the other schema changes in migrations.
 """
 import datetime
 from pony import orm
@@ -72,3 +75,17 @@ class Call(database.Entity, SerialisableEntity):
     src = orm.Optional(str)                       # Source of the call in YAML (params etc)
     errcode = orm.Optional(int)                   # Error code
     output = orm.Optional(str)                    # JSON results
+
+
+class Summary(database.Entity, SerialisableEntity):
+    """
+    Summary counters of the job, updated along with the results.
+    """
+    jid = orm.PrimaryKey(str)
+    targets = orm.Required(int, default=0)        # Amount of targeted machines
+    fired = orm.Required(int, default=0)          # Results, fired to the machines
+    returned = orm.Required(int, default=0)       # Results, returned by the machines
+    failed = orm.Required(int, default=0)         # Returned results with an error
+    tasks = orm.Required(int, default=0)          # Max amount of tasks per result
+    calls = orm.Required(int, default=0)          # Finished calls
+    finished = orm.Optional(datetime.datetime, nullable=True, default=None)  # When all results are returned
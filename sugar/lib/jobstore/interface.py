@@ -0,0 +1,446 @@
+# coding: utf-8
+"""
+Job store interface.
+
+Backends of the job store implement the same public methods,
+so the master does not depend on how the jobs history is kept.
+"""
+import abc
+import datetime
+import itertools
+import typing
+
+import pytz
+from pony.utils import timestamp2datetime
+
+import sugar.utils.timeutils
+from sugar.lib.compiler.objtask import StateTask
+from sugar.lib.jobstore.partitions import RetentionPolicy, Retention
+from sugar.lib.jobstore.stats import JobStats
+from sugar.transport.serialisable import Serialisable
+from sugar.components.server.pdatastore import PDataContainer
+
+
+def _db_time(dtm: datetime.datetime = None) -> datetime.datetime:
+    """
+    Get date/time to store. Database keeps it without the timezone,
+    so values are written as naive UTC, the same as they are read back.
+
+    :param dtm: date/time. Default: now.
+    :return: naive UTC date/time
+    """
+    if dtm is None:
+        dtm = datetime.datetime.now(tz=pytz.UTC)
+    if dtm.tzinfo is not None:
+        dtm = dtm.astimezone(pytz.UTC).replace(tzinfo=None)
+    return dtm
+
+
+def _from_db_time(value: typing.Optional[str]) -> typing.Optional[datetime.datetime]:
+    """
+    Get date/time from the raw database value.
+
+    :param value: timestamp, as stored by Pony ORM
+    :return: UTC date/time
+    """
+    if value is not None:
+        value = timestamp2datetime(value).replace(tzinfo=pytz.UTC)
+    return value
+
+
+def _to_iso(dtm: typing.Optional[datetime.datetime]) -> typing.Optional[str]:
+    """
+    Get date/time in ISO format, if any.
+
+    :param dtm: date/time
+    :return: ISO string or None
+    """
+    return sugar.utils.timeutils.to_iso(dtm) if dtm is not None else None
+
+
+class JobStoreInterface(abc.ABC):  # pylint: disable=R0904
+    """
+    Job store.
+    """
+    LISTING_FIELDS = ("jid", "created", "finished", "status", "query", "tag", "uri", "type", "args")
+    SUMMARY_FIELDS = ("targets", "fired", "returned", "failed")
+
+    def __init__(self, config, path=None):
+        """
+        Constructor.
+
+        :param config: configuration of the master
+        :param path: directory of the job store. Default: cache path.
+        """
+        self._config = config
+        self._path = config.cache.path if path is None else path
+        self._retention = None
+
+    @abc.abstractmethod
+    def get_stats(self) -> dict:
+        """
+        Get metrics of the job store.
+
+        :return: dict
+        """
+
+    @abc.abstractmethod
+    def add_host(self, fqdn: str, osid: str, ipv4: str, ipv6: str) -> None:
+        """
+        Add host to the cache or update if it changes.
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def get_host(self, fqdn: str = None, osid: str = None, ipv4: str = None, ipv6: str = None,
+                 noid: bool = True) -> typing.Optional[Serialisable]:
+        """
+        Get host by any of the criteria.
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :param noid: Remove record ID of the host
+        :return: host or None
+        """
+
+    @abc.abstractmethod
+    def new(self, query: str, clientslist: typing.List[PDataContainer],
+            uri: str, args: str, job_type: str, tag: str = None, jid: str = None) -> str:
+        """
+        Register a new job.
+
+        :param query: Issued matcher expression during the job state or runner.
+        :param clientslist: Result of the matcher query, list of PDataContainer class.
+        :param uri: URI of the state or function etc.
+        :param args: Arguments of the job (usually for the "runner")
+        :param job_type: one of the "runner", "state"
+        :param tag: Tag (label) of the job.
+        :param jid: reuse passed in JID.
+        :return: jid (new job id)
+        """
+
+    @abc.abstractmethod
+    def set_as_fired(self, jid: str, target: PDataContainer) -> None:
+        """
+        Mark job as "fired" over the network for the target.
+
+        :param jid: Job ID
+        :param target: client target
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def add_tasks(self, jid: str, *tasks: StateTask, target: PDataContainer = None, src: str = None) -> None:
+        """
+        Add compiled tasks to the job per a target.
+
+        :param jid: job id
+        :param tasks: list of tasks
+        :param target: machine to add tasks for
+        :param src: source of the compiled task on the machine
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def report_job(self, jid: str, target: PDataContainer, src: str, return_data: str,  # pylint: disable=R0913
+                   finished: str, uri: str = None, log_info: str = None,
+                   log_warn: str = None, log_err: str = None, errcode: int = None) -> None:
+        """
+        Report result of the job on the client.
+        Once all targets returned, job is finished.
+
+        :param jid: Job id
+        :param target: target machine
+        :param src: source of the job (YAML)
+        :param return_data: JSON data what module/task is returning
+        :param finished: when particular task has been finished
+        :param uri: URI from the state. Otherwise None, which is a fallback of job.uri
+        :param log_info: JSON data of the information log
+        :param log_warn: JSON data of the warning log
+        :param log_err: JSON data of the error log
+        :param errcode: error code of the returned result, if any
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def report_job_finished(self, jid: str) -> None:
+        """
+        Report job finished completely, regardless of the returned results.
+
+        :param jid: Job ID
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def report_call(self, jid: str, target: PDataContainer, idn: str,
+                    uri: str, errcode: int, output: str, finished: datetime.datetime) -> None:
+        """
+        Report a finished call of the task.
+
+        :param jid: Job ID
+        :param target: machine that reports this call
+        :param idn: Identificator of the task
+        :param uri: URI of the called function
+        :param errcode: return code of the performed function
+        :param output: output of the function (JSON string)
+        :param finished: date/time when call has been finished
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def get_unpicked(self, target: PDataContainer = None) -> list:
+        """
+        Get jobs, that are not fired yet.
+
+        :param target: client. Default: any.
+        :return: list of jobs
+        """
+
+    @abc.abstractmethod
+    def has_pending(self, target: PDataContainer) -> bool:
+        """
+        Check if there are scheduled jobs for the target.
+
+        :param target: target client
+        :return: bool
+        """
+
+    @abc.abstractmethod
+    def get_scheduled(self, target: PDataContainer, mark: bool = False) -> list:
+        """
+        Get scheduled jobs for the target.
+
+        :param target: target client
+        :param mark: Mark all found scheduled jobs of the target as fired.
+        :return: list of jobs
+        """
+
+    @abc.abstractmethod
+    def get_done_stats(self, jid: str) -> JobStats:
+        """
+        Get status of done.
+
+        :param jid: Job ID.
+        :return: stats object
+        """
+
+    @abc.abstractmethod
+    def get_by_jid(self, jid: str, noid: bool = True) -> typing.Optional[Serialisable]:
+        """
+        Get a job by jid with all its results and their hosts.
+
+        :param jid: job id.
+        :param noid: remove record IDs
+        :return: job or None
+        """
+
+    @abc.abstractmethod
+    def get_later_then(self, dtm: datetime.datetime) -> list:
+        """
+        Get jobs, created later than specified date/time.
+
+        :param dtm: datetime threshold.
+        :return: list of jobs
+        """
+
+    @abc.abstractmethod
+    def get_not_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get headers of the jobs, where calls are not yet reported.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of job headers, newest first
+        """
+
+    @abc.abstractmethod
+    def get_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get headers of the jobs, where calls are reported already.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of job headers, newest first
+        """
+
+    @abc.abstractmethod
+    def get_failed(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get headers of the jobs, that have at least one failed call.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of job headers, newest first
+        """
+
+    @abc.abstractmethod
+    def get_suceeded(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get headers of the jobs, that have no single failure inside.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of job headers, newest first
+        """
+
+    @abc.abstractmethod
+    def get_by_tag(self, tag: str) -> list:
+        """
+        Get jobs by a tag.
+
+        :param tag: Tag in the job, if job has been tagged.
+        :return: list of jobs
+        """
+
+    @abc.abstractmethod
+    def get_all(self, limit: int = 25, offset: int = 0) -> list:
+        """
+        Get all existing jobs with their results.
+
+        :param limit: limit of amount of the returned objects.
+        :param offset: offset in the history.
+        :return: list of jobs
+        """
+
+    @abc.abstractmethod
+    def iter_jobs(self, fields: typing.Sequence[str] = None, cursor: tuple = None,
+                  limit: int = None) -> typing.Iterator[dict]:
+        """
+        Stream listing of the jobs, newest first, without their results.
+
+        :param fields: columns of the job or summary counters. Default: all job columns.
+        :param cursor: (created, jid) of the last seen job. Default: start from the newest.
+        :param limit: max amount of jobs. Default: all.
+        :return: generator of dictionaries
+        """
+
+    def get_all_overview(self, limit: int = 25, offset: int = 0) -> list:
+        """
+        Get all existing jobs, without an actual results (count only).
+        Jobs are listed newest first.
+
+        :param limit: limit of amount of the returned objects.
+        :param offset: offset in the history.
+        :return: list of job objects
+        """
+        jobs = self.iter_jobs(fields=self.LISTING_FIELDS + ("targets",))
+        result = []
+        for row in itertools.islice(jobs, offset or 0, (offset or 0) + limit if limit else None):
+            job = Serialisable()
+            job.__dict__.update(row)
+            job.results = job.__dict__.pop("targets")
+            result.append(job)
+        jobs.close()
+
+        return result
+
+    @abc.abstractmethod
+    def expire(self, dtm: datetime.datetime = None) -> None:
+        """
+        Remove jobs, created before the date/time.
+
+        :param dtm: date/time threshold
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def expire_to_count(self, cnt: int = 30) -> None:
+        """
+        Remove jobs that are older than specific amount of jobs.
+
+        :param cnt: count of jobs still be preserved (last)
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def delete_by_jid(self, jid: str) -> None:
+        """
+        Delete a particular job by JID.
+
+        :param jid: job id
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def delete_by_tag(self, tag: str) -> None:
+        """
+        Delete jobs by tag.
+
+        :param tag: tag
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def apply_retention(self, policy: RetentionPolicy) -> list:
+        """
+        Remove the history, that is out of the retention policy.
+
+        :param policy: retention policy
+        :return: list of removed parts of the history
+        """
+
+    def start_retention(self, policy: RetentionPolicy = None, interval: float = Retention.INTERVAL) -> None:
+        """
+        Start background retention of the jobs history.
+        Without the policy the history is unlimited and retention is not started.
+
+        :param policy: retention policy. Default: from the "jobs" configuration.
+        :param interval: seconds between the runs
+        :return: None
+        """
+        if policy is None:
+            config = self._config.jobs
+            policy = RetentionPolicy(max_age=config.max_age or 0, max_count=config.max_count or 0,
+                                     max_size=(config.max_size_mb or 0) * 0x100000) if config else RetentionPolicy()
+        if self._retention is None and policy:
+            self._retention = Retention(lambda: self.apply_retention(policy), interval=interval)
+            self._retention.start()
+
+    def stop_retention(self) -> None:
+        """
+        Stop background retention of the jobs history.
+
+        :return: None
+        """
+        if self._retention is not None:
+            self._retention.stop()
+            self._retention = None
+
+    @abc.abstractmethod
+    def export(self, jid: str, path: str, compression: str = "gz", process: bool = False) -> str:
+        """
+        Export job to a tar archive.
+
+        :param jid: job id
+        :param path: directory on the server to write the archive into.
+        :param compression: None, "gz", "bz2" or "xz"
+        :param process: compress in a separate process
+        :return: path to the archive
+        """
+
+    @abc.abstractmethod
+    def flush(self) -> None:
+        """
+        Remove the entire jobs history, state and progress.
+
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """
+        Close the job store.
+
+        :return: None
+        """
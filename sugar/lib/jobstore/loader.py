@@ -0,0 +1,238 @@
+# coding: utf-8
+"""
+Loader of the complete jobs.
+
+Jobs are loaded with all their results, tasks, calls and hosts
+in a fixed amount of queries (one per table), regardless of how many
+machines were targeted. Payloads (blobs, JSON) are decoded only
+when they are accessed.
+"""
+import json
+import typing
+
+from pony.utils import timestamp2datetime
+
+from sugar.lib.jobstore.blobs import BlobStore
+from sugar.lib.jobstore.connections import ReadOnlyPool
+from sugar.transport.serialisable import Serialisable, LazySerialisable
+
+
+def _get_json(value: typing.Optional[str], default: typing.Any = None) -> typing.Any:
+    """
+    Decode JSON, stored as a string.
+
+    :param value: JSON string
+    :param default: value, if nothing is stored
+    :return: data structure
+    """
+    return json.loads(value) if value else default
+
+
+class JobLoader:
+    """
+    Fixed-query loader of the jobs.
+    """
+    DATETIMES = ("created", "finished", "fired")
+    HOSTS_CHUNK = 0x1F0     # Machine IDs per query, below the SQLite limit of the query parameters
+
+    def __init__(self, blobs: BlobStore = None, hosts: ReadOnlyPool = None):
+        """
+        Constructor.
+
+        :param blobs: blob storage of the payloads
+        :param hosts: read-only connections to the database of the hosts
+        """
+        self.blobs = blobs
+        self.hosts = hosts
+
+    def load(self, readers: ReadOnlyPool, where: str, params: tuple = (), noid: bool = True,
+             raw: bool = False) -> typing.List[Serialisable]:
+        """
+        Load jobs.
+
+        :param readers: read-only connections to the database of the jobs
+        :param where: condition on the "Job" table
+        :param params: parameters of the condition
+        :param noid: remove database record IDs
+        :param raw: keep stored values as they are, the same as cloned entities. Hosts are not resolved,
+                    blobs are.
+        :return: list of jobs
+        """
+        jobs_ids = 'SELECT "id" FROM "Job" WHERE {}'.format(where)
+        results_ids = 'SELECT "id" FROM "Result" WHERE "job" IN ({})'.format(jobs_ids)
+        with readers.connection() as connection:
+            connection.execute("BEGIN")  # Same snapshot for all the queries
+            jobs = self._select(connection, 'SELECT * FROM "Job" WHERE {} ORDER BY "id"'.format(where), params)
+            results = self._select(connection, 'SELECT * FROM "Result" WHERE "job" IN ({}) ORDER BY "id"'.format(
+                jobs_ids), params)
+            tasks = self._select(connection, 'SELECT * FROM "Task" WHERE "job" IN ({}) ORDER BY "id"'.format(
+                results_ids), params)
+            calls = self._select(connection, 'SELECT * FROM "Call" WHERE "task" IN (SELECT "id" FROM "Task" WHERE "job" IN ({})) '
+                                             'ORDER BY "id"'.format(results_ids), params)
+            hosts = {}
+            if not raw and results:
+                if readers is self.hosts:
+                    hosts = self._get_hosts(connection, 'SELECT "osid", "fqdn", "ipv4", "ipv6", "id" FROM "Host" '
+                                                        'WHERE "osid" IN (SELECT "machineid" FROM "Result" '
+                                                        'WHERE "job" IN ({}))'.format(jobs_ids), params)
+        if not raw and results and readers is not self.hosts and self.hosts is not None:
+            hosts = self._get_remote_hosts({result["machineid"] for result in results})
+
+        return self.assemble(jobs, results, tasks, calls, hosts, noid=noid, raw=raw)
+
+    def _select(self, connection, sql: str, params: tuple) -> typing.List[dict]:
+        """
+        Select rows as dictionaries.
+
+        :param connection: sqlite3 connection
+        :param sql: SQL query
+        :param params: parameters of the query
+        :return: list of rows
+        """
+        cursor = connection.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = []
+        for row in cursor:
+            row = dict(zip(columns, row))
+            for column in self.DATETIMES:
+                if row.get(column) is not None:
+                    row[column] = timestamp2datetime(row[column])
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _get_hosts(connection, sql: str, params: tuple) -> typing.Dict[str, dict]:
+        """
+        Select hosts by machine ID.
+
+        :param connection: sqlite3 connection
+        :param sql: SQL query of osid, fqdn, ipv4, ipv6 and id columns
+        :param params: parameters of the query
+        :return: hosts by machine ID
+        """
+        return {osid: {"osid": osid, "fqdn": fqdn, "ipv4": ipv4, "ipv6": ipv6, "id": host_id}
+                for osid, fqdn, ipv4, ipv6, host_id in connection.execute(sql, params)}
+
+    def _get_remote_hosts(self, machineids: typing.Set[str]) -> typing.Dict[str, dict]:
+        """
+        Select hosts of the sealed jobs from the live database.
+
+        :param machineids: machine IDs
+        :return: hosts by machine ID
+        """
+        machineids = sorted(machineids)
+        hosts = {}
+        with self.hosts.connection() as connection:
+            for offset in range(0, len(machineids), self.HOSTS_CHUNK):
+                chunk = tuple(machineids[offset:offset + self.HOSTS_CHUNK])
+                hosts.update(self._get_hosts(connection, 'SELECT "osid", "fqdn", "ipv4", "ipv6", "id" FROM "Host" '
+                                                         'WHERE "osid" IN ({})'.format(", ".join("?" * len(chunk))), chunk))
+        return hosts
+
+    def _to_object(self, row: dict, noid: bool, lazy: typing.Dict[str, typing.Callable] = None,
+                   skip: tuple = ()) -> Serialisable:
+        """
+        Convert row to the serialisable object.
+
+        :param row: row
+        :param noid: remove database record ID
+        :param lazy: decoders of the fields, applied on the first access
+        :param skip: fields to omit
+        :return: Serialisable
+        """
+        obj = LazySerialisable() if lazy else Serialisable()
+        for key, value in row.items():
+            if key in skip or (noid and key == "id"):
+                continue
+            if lazy and key in lazy:
+                obj.set_lazy(key, lazy[key], value)
+            else:
+                setattr(obj, key, value)
+        return obj
+
+    def assemble(self, jobs: list, results: list, tasks: list, calls: list, hosts: dict,
+                 noid: bool, raw: bool) -> typing.List[Serialisable]:
+        """
+        Assemble jobs from the rows.
+
+        :param jobs: rows of the jobs
+        :param results: rows of the results
+        :param tasks: rows of the tasks
+        :param calls: rows of the calls
+        :param hosts: hosts by machine ID
+        :param noid: remove database record IDs
+        :param raw: keep stored values as they are, except blobs
+        :return: list of jobs
+        """
+        noid = noid and not raw
+        skip = () if raw else ("job", "task", "machineid")  # References to the parents are in the structure already
+        result_tasks = self._assemble_tasks(tasks, calls, noid, raw, skip)
+        job_results = self._assemble_results(results, result_tasks, hosts, noid, raw, skip)
+
+        out = []
+        for row in jobs:
+            job = self._to_object(row, noid)
+            job.results = job_results.get(row["id"], [])
+            out.append(job)
+
+        return out
+
+    def _assemble_tasks(self, tasks: list, calls: list, noid: bool, raw: bool, skip: tuple) -> dict:
+        """
+        Assemble tasks with their calls.
+
+        :param tasks: rows of the tasks
+        :param calls: rows of the calls
+        :param noid: remove database record IDs
+        :param raw: keep stored values as they are, except blobs
+        :param skip: fields to omit
+        :return: result ID to the list of tasks
+        """
+        blob = self.blobs.get if self.blobs is not None else None
+        task_calls, result_tasks = {}, {}
+        for row in calls:
+            task_calls.setdefault(row["task"], []).append(
+                self._to_object(row, noid, lazy={"output": blob} if blob else None, skip=skip))
+
+        task_lazy = None
+        if not raw:
+            task_lazy = {
+                "return_data": lambda value: _get_json(blob(value) if blob else value, value),
+                "log_info": lambda value: _get_json(value, []),
+                "log_warn": lambda value: _get_json(value, []),
+                "log_err": lambda value: _get_json(value, []),
+            }
+            if blob:
+                task_lazy["src"] = blob
+        elif blob:
+            task_lazy = {"return_data": blob, "src": blob}
+        for row in tasks:
+            task = self._to_object(row, noid, lazy=task_lazy, skip=skip)
+            task.calls = task_calls.get(row["id"], [])
+            result_tasks.setdefault(row["job"], []).append(task)
+
+        return result_tasks
+
+    def _assemble_results(self, results: list, result_tasks: dict, hosts: dict, noid: bool, raw: bool,
+                          skip: tuple) -> dict:
+        """
+        Assemble results with their tasks.
+
+        :param results: rows of the results
+        :param result_tasks: result ID to the list of tasks
+        :param hosts: hosts by machine ID
+        :param noid: remove database record IDs
+        :param raw: keep stored values as they are, except blobs
+        :param skip: fields to omit
+        :return: job ID to the list of results
+        """
+        lazy = {"src": self.blobs.get} if self.blobs is not None else None
+        job_results = {}
+        for row in results:
+            result = self._to_object(row, noid, lazy=lazy, skip=skip)
+            result.tasks = result_tasks.get(row["id"], [])
+            if not raw and row["machineid"] in hosts:
+                result.host = self._to_object(hosts[row["machineid"]], noid)
+            job_results.setdefault(row["job"], []).append(result)
+
+        return job_results
@@ -0,0 +1,1076 @@
+# coding: utf-8
+"""
+Append-only log job store.
+
+Every mutation of the jobs history is appended to a single log file
+as one JSON line, so ingestion of the results is a sequential write,
+without transactions or indexes to update on disk. Indexes are kept
+in memory: jobs by JID with their counters and the offsets of their
+records, and jobs with unfired results by machine ID. They are rebuilt
+by replaying the log on start. Complete jobs are read by folding their
+records. Records of the deleted jobs are garbage, which is reclaimed
+by rewriting the log, once it takes most of the file.
+
+Records are written to the OS on every mutation and synced to the disk
+on compaction and close: a crash of the master loses nothing, a crash
+of the machine may lose the last records.
+
+Indexes and compaction assume a single writer, so the log is locked
+by the process that opens it. Master workers route their updates to
+the primary worker, which owns the job store.
+"""
+import os
+import json
+import datetime
+import threading
+import collections
+import typing
+
+import pytz
+from pony.utils import datetime2timestamp, timestamp2datetime
+
+import sugar.lib.exceptions
+import sugar.utils.exitcodes
+import sugar.utils.files
+from sugar.lib.compiler.objtask import StateTask
+from sugar.lib.jobstore import archive
+from sugar.lib.jobstore.const import JobTypes
+from sugar.lib.jobstore.interface import JobStoreInterface, _db_time
+from sugar.lib.jobstore.loader import JobLoader
+from sugar.lib.jobstore.partitions import RetentionPolicy
+from sugar.lib.jobstore.pending import PendingIndex
+from sugar.lib.jobstore.stats import JobStats
+from sugar.lib.logger.manager import get_logger
+from sugar.transport.serialisable import Serialisable
+from sugar.utils.db import JobDefaults, ResultDefault
+from sugar.utils.jid import jidstore
+from sugar.utils.sanitisers import join_path
+from sugar.components.server.pdatastore import PDataContainer
+# pylint: disable=R0904
+
+
+def _to_ts(dtm: typing.Optional[datetime.datetime]) -> typing.Optional[str]:
+    """
+    Get timestamp of the date/time to write to the log.
+
+    :param dtm: date/time
+    :return: timestamp (naive UTC)
+    """
+    return datetime2timestamp(_db_time(dtm)) if dtm is not None else None
+
+
+def _to_utc(dtm: typing.Optional[datetime.datetime]) -> typing.Optional[datetime.datetime]:
+    """
+    Get timezone-aware date/time from the naive UTC one.
+
+    :param dtm: naive UTC date/time
+    :return: UTC date/time
+    """
+    return dtm.replace(tzinfo=pytz.UTC) if dtm is not None else None
+
+
+def _from_ts(value: typing.Optional[str]) -> typing.Optional[datetime.datetime]:
+    """
+    Get date/time from the timestamp of the log.
+
+    :param value: timestamp
+    :return: naive UTC date/time
+    """
+    return timestamp2datetime(value) if value is not None else None
+
+
+class _Job:
+    """
+    In-memory index entry of the job: header, counters and the log records.
+    Payloads are not kept in memory.
+    """
+    __slots__ = ("header", "summary", "records", "unfired", "returned", "tasks", "calls", "counters")
+
+    def __init__(self, header: dict, machine_ids: typing.List[str]):
+        """
+        Constructor.
+
+        :param header: columns of the job
+        :param machine_ids: machine IDs of the targets
+        """
+        self.header = header
+        self.summary = {"targets": len(machine_ids), "fired": 0, "returned": 0, "failed": 0, "tasks": 0, "calls": 0,
+                        "finished": None}
+        self.records = []                                   # (offset, length) of the records in the log
+        self.unfired = collections.Counter(machine_ids)     # Machine ID: amount of unfired results
+        self.returned = set()                               # Machine IDs, that returned results
+        self.tasks = {machine_id: [] for machine_id in machine_ids}  # Machine ID: task IDNs
+        self.calls = {}                                     # (machine ID, IDN, URI): [amount, finished, errcode]
+        self.counters = collections.Counter()               # Calls: total, done, failed, succeeded
+
+    @property
+    def size(self) -> int:
+        """
+        Size of the records in the log.
+
+        :return: bytes
+        """
+        return sum(length for _, length in self.records)
+
+    def update_call(self, key: tuple, finished: bool, errcode: typing.Optional[int]) -> int:
+        """
+        Update state of the calls.
+
+        :param key: (machine ID, IDN, URI)
+        :param finished: call is finished
+        :param errcode: error code of the call
+        :return: amount of calls, finished by the update
+        """
+        state = self.calls.get(key)
+        finished_calls = 0
+        if state is not None:
+            amount, was_finished, was_errcode = state
+            for done, code, sign in ((was_finished, was_errcode, -1), (finished, errcode, 1)):
+                self.counters["done"] += sign * amount * done
+                self.counters["failed"] += sign * amount * (code not in (None, sugar.utils.exitcodes.EX_OK))
+                self.counters["succeeded"] += sign * amount * (code == sugar.utils.exitcodes.EX_OK)
+            self.calls[key] = [amount, finished, errcode]
+            if not was_finished:
+                finished_calls = amount
+
+        return finished_calls
+
+
+class _Rows:
+    """
+    Rows of the job results, tasks and calls, folded from the records of the job.
+    """
+    def __init__(self, job_row: dict):
+        """
+        Constructor.
+
+        :param job_row: row of the job
+        """
+        self.job_row = job_row
+        self.results = collections.OrderedDict()    # Machine ID: result row
+        self.tasks = []
+        self.calls = []
+        self.task_index = {}                        # (machine ID, IDN): task rows
+        self.call_index = {}                        # Task ID: call rows
+
+    def apply(self, op: str, _: typing.Optional[str], data: dict) -> None:
+        """
+        Fold the record into the rows.
+
+        :param op: operation
+        :param _: job ID
+        :param data: operation data
+        :return: None
+        """
+        if op == "new":
+            for machine_id in data["machineids"]:
+                self.results[machine_id] = {"id": len(self.results) + 1, "job": 1, "machineid": machine_id,
+                                            "status": ResultDefault.R_NOT_SET, "fired": None, "src": ""}
+        elif data.get("machineid") in self.results:  # Records of the job itself, like "finished", are in the job row
+            getattr(self, "_apply_{}".format(op))(self.results[data["machineid"]], data)
+
+    def new_task(self, result: dict, idn: str) -> dict:
+        """
+        Add task row to the result.
+
+        :param result: result row
+        :param idn: IDN of the task
+        :return: task row
+        """
+        task = {"id": len(self.tasks) + 1, "job": result["id"], "idn": idn, "finished": None, "return_data": "",
+                "src": "", "log_info": "", "log_warn": "", "log_err": ""}
+        self.tasks.append(task)
+        self.task_index.setdefault((result["machineid"], idn), []).append(task)
+
+        return task
+
+    @staticmethod
+    def _apply_fired(result: dict, data: dict) -> None:
+        """
+        Mark result as fired.
+
+        :param result: result row
+        :param data: when it was fired
+        :return: None
+        """
+        result["fired"] = _from_ts(data["fired"])
+
+    def _apply_tasks(self, result: dict, data: dict) -> None:
+        """
+        Add tasks with their calls to the result.
+
+        :param result: result row
+        :param data: source and tasks
+        :return: None
+        """
+        result["src"] = data["src"]
+        for idn, task_calls in data["tasks"]:
+            task = self.new_task(result, idn)
+            for uri, src in task_calls:
+                call = {"id": len(self.calls) + 1, "task": task["id"], "finished": None, "uri": uri, "src": src,
+                        "errcode": None, "output": ""}
+                self.calls.append(call)
+                self.call_index.setdefault(task["id"], []).append(call)
+
+    def _apply_report(self, result: dict, data: dict) -> None:
+        """
+        Report task of the result.
+
+        :param result: result row
+        :param data: report of the task
+        :return: None
+        """
+        idn = data["uri"] or self.job_row["uri"]
+        task = next(iter(self.task_index.get((data["machineid"], idn), [])), None)
+        if task is None:
+            task = self.new_task(result, idn)
+        task["finished"] = _from_ts(data["finished"])
+        for key in ("log_info", "log_warn", "log_err", "src", "return_data"):
+            if data[key] is not None and (data[key] or not key.startswith("log_")):
+                task[key] = data[key]
+
+    def _apply_call(self, result: dict, data: dict) -> None:
+        """
+        Report call of the result tasks.
+
+        :param result: result row
+        :param data: report of the call
+        :return: None
+        """
+        for task in self.task_index.get((result["machineid"], data["idn"]), []):
+            for call in self.call_index.get(task["id"], []):
+                if call["uri"] == data["uri"]:
+                    call.update(output=data["output"], errcode=data["errcode"], finished=_from_ts(data["finished"]))
+
+
+class LogJobStorage(JobStoreInterface):
+    """
+    Store data in the append-only log.
+    """
+    COMPACT_MIN = 0x100000      # Bytes of garbage, before the log is compacted
+    COMPACT_RATIO = 0.5         # Part of the log, that is garbage, before the log is compacted
+
+    def __init__(self, config, path=None):
+        super().__init__(config, path=path)
+        self.log = get_logger(self)
+        self._log_path = join_path(self._path, "/master/jobs.log")
+        self._pending = PendingIndex()
+        self._jobs = collections.OrderedDict()   # JID: _Job, in order of registration
+        self._machines = {}                      # Machine ID: JIDs with the unfired results
+        self._hosts = {}                         # Machine ID: host
+        self._fd = None
+        self._flock = sugar.utils.files.FileLock(self._log_path + ".lock", timeout=0)
+        self._size = 0
+        self._garbage = 0
+        self.__lock = threading.RLock()
+        self.init()
+
+    def init(self) -> None:
+        """
+        Open the log and replay it into the indexes.
+
+        :raises SugarJobStoreException: if the log is opened by another process
+        :return: None
+        """
+        os.makedirs(os.path.dirname(self._log_path), exist_ok=True)
+        with self.__lock:
+            if not self._flock.locked:
+                try:
+                    self._flock.acquire()
+                except sugar.lib.exceptions.SugarFileLockException as exc:
+                    raise sugar.lib.exceptions.SugarJobStoreException(
+                        "Jobs log {} is opened by another process (PID {})".format(
+                            self._log_path, self._flock.holder())) from exc
+            self._jobs.clear()
+            self._machines.clear()
+            self._hosts.clear()
+            self._size = self._garbage = 0
+            self._fd = os.open(self._log_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+            self._replay()
+            self._pending.rebuild(self._get_unfired())
+
+    def _replay(self) -> None:
+        """
+        Apply records of the log. Incomplete record at the end (interrupted write) is cut off.
+
+        :return: None
+        """
+        offset = 0
+        with open(self._log_path, "rb") as log_fh:
+            for line in log_fh:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Incomplete record")
+                    op, jid, data = json.loads(line.decode("utf-8"))
+                except ValueError as exc:
+                    self.log.error("Jobs log is truncated at {} bytes: {}", offset, exc)
+                    os.ftruncate(self._fd, offset)
+                    break
+                self._apply(op, jid, data, offset, len(line))
+                offset += len(line)
+        self._size = offset
+
+    def _get_unfired(self) -> typing.Iterator[tuple]:
+        """
+        Get amount of unfired results per machine.
+
+        :return: pairs of machine ID and amount of unfired results
+        """
+        unfired = collections.Counter()
+        for job in self._jobs.values():
+            unfired.update(job.unfired)
+        return unfired.items()
+
+    def _append(self, op: str, jid: typing.Optional[str], data: dict) -> None:
+        """
+        Append record to the log and apply it to the indexes.
+
+        :param op: operation
+        :param jid: job ID
+        :param data: operation data
+        :return: None
+        """
+        line = (json.dumps([op, jid, data], separators=(",", ":")) + "\n").encode("utf-8")
+        with self.__lock:
+            os.write(self._fd, line)
+            offset = self._size
+            self._size += len(line)
+            self._apply(op, jid, data, offset, len(line))
+
+    def _apply(self, op: str, jid: typing.Optional[str], data: dict, offset: int, length: int) -> None:
+        """
+        Apply record to the indexes.
+
+        :param op: operation
+        :param jid: job ID
+        :param data: operation data
+        :param offset: offset of the record in the log
+        :param length: length of the record
+        :return: None
+        """
+        job = self._jobs.get(jid)
+        if op == "host":
+            if data["osid"] in self._hosts:
+                self._garbage += length  # Roughly the size of the replaced record
+            self._hosts[data["osid"]] = data
+        elif op == "new":
+            self._apply_new(jid, data).records.append((offset, length))
+        elif job is None or op == "delete":
+            if job is not None:
+                self._delete(job)
+            self._garbage += length
+        else:
+            getattr(self, "_apply_{}".format(op))(job, data)
+            job.records.append((offset, length))
+
+    def _apply_new(self, jid: str, data: dict) -> _Job:
+        """
+        Add new job, replacing the one with the same JID.
+
+        :param jid: job ID
+        :param data: columns of the job and machine IDs of the targets
+        :return: job entry
+        """
+        job = self._jobs.get(jid)
+        if job is not None:
+            self._delete(job)
+        job = self._jobs[jid] = _Job({"jid": jid, "created": _from_ts(data["created"]), "finished": None,
+                                      "status": JobDefaults.S_ISSUED, "query": data["query"], "tag": data["tag"],
+                                      "uri": data["uri"], "type": data["type"], "args": data["args"]},
+                                     data["machineids"])
+        for machine_id in job.unfired:
+            self._machines.setdefault(machine_id, set()).add(jid)
+        self._pending.add(data["machineids"])
+
+        return job
+
+    def _apply_fired(self, job: _Job, data: dict) -> None:
+        """
+        Mark result of the machine as fired.
+
+        :param job: job entry
+        :param data: machine ID and when it was fired
+        :return: None
+        """
+        job.header["status"] = JobDefaults.S_ISSUED
+        discarded = job.unfired.pop(data["machineid"], 0)
+        if discarded:
+            job.summary["fired"] += discarded
+            self._machines[data["machineid"]].discard(job.header["jid"])
+            self._pending.discard(data["machineid"], discarded)
+
+    def _apply_tasks(self, job: _Job, data: dict) -> None:
+        """
+        Add compiled tasks of the machine.
+
+        :param job: job entry
+        :param data: machine ID, source and tasks as (IDN, [(URI, source)])
+        :return: None
+        """
+        job.summary["tasks"] = max(job.summary["tasks"], len(data["tasks"]))
+        for idn, calls in data["tasks"]:
+            job.tasks.setdefault(data["machineid"], []).append(idn)
+            for uri, _ in calls:
+                key = (data["machineid"], idn, uri)
+                job.calls.setdefault(key, [0, False, None])[0] += 1
+                job.counters["total"] += 1
+
+    def _apply_report(self, job: _Job, data: dict) -> None:
+        """
+        Apply returned result of the machine.
+
+        :param job: job entry
+        :param data: report of the result
+        :return: None
+        """
+        tasks = job.tasks.setdefault(data["machineid"], [])
+        idn = data["uri"] or job.header["uri"]
+        if idn not in tasks:
+            tasks.append(idn)
+            job.summary["tasks"] = max(job.summary["tasks"], len(tasks))
+
+        if data["return_data"] is not None and data["machineid"] not in job.returned:
+            job.returned.add(data["machineid"])
+            job.summary["returned"] += 1
+            if data["errcode"] not in (None, sugar.utils.exitcodes.EX_OK):
+                job.summary["failed"] += 1
+            if job.summary["returned"] >= job.summary["targets"]:
+                job.summary["finished"] = job.header["finished"] = _from_ts(data["finished"] or data["time"])
+                job.header["status"] = JobDefaults.S_FINISHED
+            else:
+                job.header["status"] = JobDefaults.S_IN_PROGRESS
+
+    def _apply_finished(self, job: _Job, data: dict) -> None:
+        """
+        Finish the job.
+
+        :param job: job entry
+        :param data: when job was finished
+        :return: None
+        """
+        job.summary["finished"] = job.header["finished"] = _from_ts(data["finished"])
+        job.header["status"] = JobDefaults.S_FINISHED
+
+    def _apply_call(self, job: _Job, data: dict) -> None:
+        """
+        Apply reported call.
+
+        :param job: job entry
+        :param data: report of the call
+        :return: None
+        """
+        job.header["status"] = JobDefaults.S_IN_PROGRESS
+        job.summary["calls"] += job.update_call((data["machineid"], data["idn"], data["uri"]),
+                                                data["finished"] is not None, data["errcode"])
+
+    def _delete(self, job: _Job) -> None:
+        """
+        Remove job from the indexes. Its records become garbage.
+
+        :param job: job entry
+        :return: None
+        """
+        jid = job.header["jid"]
+        del self._jobs[jid]
+        for machine_id, count in job.unfired.items():
+            self._machines[machine_id].discard(jid)
+            self._pending.discard(machine_id, count)
+        self._garbage += job.size
+
+    def _fold(self, job: _Job) -> tuple:
+        """
+        Read the records of the job and fold them into the rows of the job, results, tasks and calls.
+
+        :param job: job entry
+        :return: job, results, tasks and calls rows
+        """
+        with self.__lock:
+            lines = [os.pread(self._fd, length, offset) for offset, length in job.records]
+            job_row = dict(job.header, id=1)
+
+        rows = _Rows(job_row)
+        for line in lines:
+            rows.apply(*json.loads(line.decode("utf-8")))
+
+        return job_row, list(rows.results.values()), rows.tasks, rows.calls
+
+    def _load(self, jobs: typing.Iterable[_Job], noid: bool = True, raw: bool = True) -> typing.List[Serialisable]:
+        """
+        Load complete jobs.
+
+        :param jobs: job entries
+        :param noid: remove record IDs
+        :param raw: keep stored values as they are, without hosts
+        :return: list of jobs
+        """
+        out = []
+        loader = JobLoader()
+        for job in jobs:
+            job_row, results, tasks, calls = self._fold(job)
+            hosts = {} if raw else {result["machineid"]: self._hosts[result["machineid"]]
+                                    for result in results if result["machineid"] in self._hosts}
+            out.extend(loader.assemble([job_row], results, tasks, calls, hosts, noid=noid, raw=raw))
+        return out
+
+    @staticmethod
+    def _to_object(row: dict) -> Serialisable:
+        """
+        Convert row to the serialisable object.
+
+        :param row: row
+        :return: Serialisable
+        """
+        obj = Serialisable()
+        obj.__dict__.update(row)
+        return obj
+
+    def _select(self, predicate: typing.Callable = None) -> typing.List[_Job]:
+        """
+        Select job entries.
+
+        :param predicate: filter of the entries. Default: all.
+        :return: list of job entries, in order of registration
+        """
+        with self.__lock:
+            return [job for job in self._jobs.values() if predicate is None or predicate(job)]
+
+    def get_stats(self) -> dict:
+        """
+        Get metrics of the job store.
+
+        :return: dict
+        """
+        return {
+            "pending": len(self._pending),
+            "jobs": len(self._jobs),
+            "log": {"size": self._size, "garbage": self._garbage},
+        }
+
+    def add_host(self, fqdn: str, osid: str, ipv4: str, ipv6: str) -> None:
+        """
+        Add host to the cache or update if it changes.
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :return: None
+        """
+        host = self._hosts.get(osid)
+        if host is None or (host["fqdn"], host["ipv4"], host["ipv6"]) != (fqdn, ipv4, ipv6):
+            self._append("host", None, {"osid": osid, "fqdn": fqdn, "ipv4": ipv4, "ipv6": ipv6,
+                                        "id": host["id"] if host else len(self._hosts) + 1})
+
+    def get_host(self, fqdn: str = None, osid: str = None, ipv4: str = None, ipv6: str = None, noid: bool = True):
+        """
+        Get host by any of the criteria.
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :param noid: Remove record ID of the host
+        :return: host or None
+        """
+        host = None
+        for argk, argv in [("fqdn", fqdn), ("osid", osid), ("ipv4", ipv4), ("ipv6", ipv6)]:
+            if argv:
+                host = self._hosts.get(argv) if argk == "osid" else next(
+                    (host for host in list(self._hosts.values()) if host[argk] == argv), None)
+        if host is not None:
+            host = self._to_object({key: value for key, value in host.items() if not noid or key != "id"})
+        return host
+
+    def new(self, query: str, clientslist: typing.List[PDataContainer],
+            uri: str, args: str, job_type: str, tag: str = None, jid: str = None) -> str:
+        """
+        Register a new job.
+
+        :param query: Issued matcher expression during the job state or runner.
+        :param clientslist: Result of the matcher query, list of PDataContainer class.
+        :param uri: URI of the state or function etc.
+        :param args: Arguments of the job (usually for the "runner")
+        :param job_type: one of the "runner", "state"
+        :param tag: Tag (label) of the job.
+        :param jid: reuse passed in JID.
+        :raises SugarJobStoreException: if job is attempted to be registered without target clients.
+        :return: jid (new job id)
+        """
+        JobTypes.validate(job_type=job_type)
+        if not clientslist:
+            raise sugar.lib.exceptions.SugarJobStoreException("Registering job with no target clients?")
+
+        if jid is None or not jidstore.is_jid(jid):
+            jid = jidstore.create()
+        self._append("new", jid, {"created": _to_ts(_db_time()), "query": query, "tag": tag, "uri": uri, "type": job_type,
+                                  "args": args, "machineids": [target.id for target in clientslist]})
+        return jid
+
+    def set_as_fired(self, jid: str, target: PDataContainer) -> None:
+        """
+        Mark job as "fired". Which means job is not necessary was picked up and accepted.
+        But it means that the master fired it over the network.
+
+        :param jid: Job ID
+        :param target: client target
+        :return: None
+        """
+        self._append("fired", jid, {"machineid": target.id, "fired": _to_ts(_db_time())})
+
+    def add_tasks(self, jid: str, *tasks: StateTask, target: PDataContainer = None, src: str = None) -> None:
+        """
+        Adds a completed tasks to te job per a target (system ID).
+
+        :param jid: job id
+        :param tasks: list of tasks
+        :param target: machine to add tasks for
+        :param src: source of the compiled task on the machine
+        :raises SugarJobStoreException: if hostname or machine ID was not specified.
+        :return: None
+        """
+        if target is None:
+            raise sugar.lib.exceptions.SugarJobStoreException("Hostname or machine ID is required")
+
+        self._append("tasks", jid, {"machineid": target.id, "src": src,
+                                    "tasks": [[task.idn, [[call.uri, call.src] for call in task.calls]] for task in tasks]})
+
+    def report_job(self, jid: str, target: PDataContainer, src: str, return_data: str,  # pylint: disable=R0913
+                   finished: str, uri: str = None, log_info: str = None,
+                   log_warn: str = None, log_err: str = None, errcode: int = None) -> None:
+        """
+        Report compiled job source on the client.
+        Once all targets returned, job is finished.
+
+        :param jid: Job id
+        :param target: target machine
+        :param src: source of the job (YAML)
+        :param finished: when particular task has been finished
+        :param return_data: JSON data what module/task is returning
+        :param log_info: JSON data of the information log
+        :param log_warn: JSON data of the warning log
+        :param log_err: JSON data of the error log
+        :param uri: URI from the state. Otherwise None, which is a fallback of job.uri
+        :param errcode: error code of the returned result, if any
+        :return: None
+        """
+        if src is not None or return_data is not None:
+            self._append("report", jid, {"machineid": target.id, "src": src, "return_data": return_data,
+                                         "finished": _to_ts(finished) if finished else None, "time": _to_ts(_db_time()),
+                                         "uri": uri, "log_info": log_info, "log_warn": log_warn, "log_err": log_err,
+                                         "errcode": errcode})
+
+    def report_job_finished(self, jid: str) -> None:
+        """
+        Report job finished completely, regardless of the returned results.
+
+        :param jid: Job ID
+        :return: None
+        """
+        self._append("finished", jid, {"finished": _to_ts(_db_time())})
+
+    def report_call(self, jid: str, target: PDataContainer, idn: str,
+                    uri: str, errcode: int, output: str, finished: datetime.datetime) -> None:
+        """
+        Report job progress. Each time task is completed with any kind of result,
+        this should update current status of it.
+
+        :param jid: Job ID
+        :param target: machine that reports this call
+        :param idn: Identificator of the task
+        :param uri: URI of the called function
+        :param errcode: return code of the performed function
+        :param output: output of the function
+        :param finished: date/time when call has been finished
+        :raises SugarJobStoreException: if 'output' parameter is not a JSON string
+        :return: None
+        """
+        if not isinstance(output, str):
+            raise sugar.lib.exceptions.SugarJobStoreException("output expected to be a JSON string")
+        try:
+            json.loads(output)
+        except Exception as exc:
+            raise sugar.lib.exceptions.SugarJobStoreException(exc)
+
+        self._append("call", jid, {"machineid": target.id, "idn": idn, "uri": uri, "errcode": errcode, "output": output,
+                                   "finished": _to_ts(finished) if finished else None})
+
+    def get_unpicked(self, target: PDataContainer = None) -> list:
+        """
+        Get unpicked jobs.
+
+        :param target: client
+        :return: list of unpicked jobs or an empty list
+        """
+        if target is None or not target.id:
+            jobs = self._select(lambda job: job.unfired)
+        else:
+            jobs = self._select(lambda job: target.id in job.unfired)
+        return self._load(jobs)
+
+    def has_pending(self, target: PDataContainer) -> bool:
+        """
+        Check if there are scheduled jobs for the target, without reading the log.
+
+        :param target: target client
+        :return: bool
+        """
+        return self._pending.has(target.id)
+
+    def get_scheduled(self, target: PDataContainer, mark: bool = False) -> list:
+        """
+        Get scheduled jobs for the hostname.
+
+        :param target: target client
+        :param mark: Mark all found scheduled jobs of the target as fired.
+        :raises SugarJobStoreException: if no hostname has been specified.
+        :return: list of jobs
+        """
+        if target is None or not target.id:
+            raise sugar.lib.exceptions.SugarJobStoreException("No hostname specified")
+
+        with self.__lock:
+            jobs = [self._jobs[jid] for jid in sorted(self._machines.get(target.id, ()))]
+            if mark:
+                for job in jobs:
+                    self.set_as_fired(job.header["jid"], target)
+        return self._load(jobs)
+
+    def get_done_stats(self, jid: str) -> JobStats:
+        """
+        Get status of done.
+
+        :param jid: Job ID.
+        :raises SugarJobStoreException: if job is not found
+        :return: stats object
+        """
+        job = self._jobs.get(jid)
+        if job is None:
+            raise sugar.lib.exceptions.SugarJobStoreException("Job '{}' not found".format(jid))
+        summary = dict(job.summary)
+
+        return JobStats(jid=jid, tasks=summary["tasks"] * summary["targets"], finished=summary["calls"],
+                        targets=summary["targets"], fired=summary["fired"], returned=summary["returned"],
+                        failed=summary["failed"], completed=_to_utc(summary["finished"]))
+
+    def get_by_jid(self, jid: str, noid: bool = True) -> Serialisable:
+        """
+        Get a job by jid with all its results and their hosts.
+        Stored payloads are decoded on the first access.
+
+        :param jid: job id.
+        :param noid: remove record IDs
+        :return: Job object.
+        """
+        job = self._jobs.get(jid)
+        return self._load([job], noid=noid, raw=False)[0] if job is not None else None
+
+    def get_later_then(self, dtm: datetime.datetime) -> list:
+        """
+        Get a jobs that are later than specified datetime.
+
+        :param dtm: datetime threshold.
+        :return: list of Job objects
+        """
+        dtm = _db_time(dtm)
+        return self._load(self._select(lambda job: job.header["created"] > dtm))
+
+    def get_not_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get unfinished jobs.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of unfinished jobs, where calls are not yet reported
+        """
+        return self._get_headers(lambda job: job.counters["total"] > job.counters["done"], since=since, until=until, tag=tag)
+
+    def get_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get finished jobs.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of finished jobs, where calls are reported already
+        """
+        return self._get_headers(lambda job: job.counters["done"] > 0, since=since, until=until, tag=tag)
+
+    def get_failed(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get any job that has at least one failed call.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of failed jobs
+        """
+        return self._get_headers(lambda job: job.counters["failed"] > 0, since=since, until=until, tag=tag)
+
+    def get_suceeded(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
+        """
+        Get jobs that has no single failure inside.
+
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
+        :return: list of succeeded jobs
+        """
+        return self._get_headers(lambda job: job.counters["succeeded"] > 0 and not job.counters["failed"],
+                                 since=since, until=until, tag=tag)
+
+    def _get_headers(self, predicate: typing.Callable, since: datetime.datetime = None, until: datetime.datetime = None,
+                     tag: str = None) -> list:
+        """
+        Get job headers (job columns only, without results), newest first.
+
+        :param predicate: filter of the job entries
+        :param since: created at or after
+        :param until: created before
+        :param tag: tag of the jobs
+        :return: list of job objects
+        """
+        since = _db_time(since) if since is not None else None
+        until = _db_time(until) if until is not None else None
+        jobs = self._select(lambda job: ((since is None or job.header["created"] >= since)
+                                         and (until is None or job.header["created"] < until)
+                                         and (tag is None or job.header["tag"] == tag) and predicate(job)))
+        return [self._to_object(row) for row in self._get_rows(jobs, self.LISTING_FIELDS)]
+
+    def _get_rows(self, jobs: typing.List[_Job], fields: typing.Sequence[str]) -> typing.List[dict]:
+        """
+        Get listing rows of the jobs, newest first.
+
+        :param jobs: job entries
+        :param fields: columns of the job or summary counters
+        :return: list of dictionaries
+        """
+        with self.__lock:
+            rows = [{field: job.summary[field] if field in self.SUMMARY_FIELDS else job.header[field] for field in fields}
+                    for job in jobs]
+        for row in rows:
+            for field in ("created", "finished"):
+                if row.get(field) is not None:
+                    row[field] = _to_utc(row[field])
+        rows.sort(key=lambda row: (row["created"], row["jid"]), reverse=True)
+
+        return rows
+
+    def get_by_tag(self, tag) -> list:
+        """
+        Get a job by a tag.
+
+        :param tag: Tag in the job, if job has been tagged.
+        :return: Job object.
+        """
+        return self._load(self._select(lambda job: job.header["tag"] == tag))
+
+    def get_all(self, limit=25, offset=0) -> list:
+        """
+        Get all existing jobs.
+        WARNING: This dumps literally everything!!
+
+        :param limit: limit of amount of the returned objects.
+        :param offset: offset in the history.
+        :return: List of job objects.
+        """
+        jobs = self._select()[offset or 0:]
+        return self._load(jobs[:limit] if limit else jobs)
+
+    def iter_jobs(self, fields: typing.Sequence[str] = None, cursor: tuple = None,
+                  limit: int = None) -> typing.Iterator[dict]:
+        """
+        Stream listing of the jobs, newest first, without reading the log.
+
+        :param fields: columns of the job or summary counters. Default: all job columns.
+        :param cursor: (created, jid) of the last seen job. Default: start from the newest.
+        :param limit: max amount of jobs. Default: all.
+        :raises SugarJobStoreException: if field is unknown
+        :return: generator of dictionaries
+        """
+        fields = tuple(fields or self.LISTING_FIELDS)
+        unknown = set(fields) - set(self.LISTING_FIELDS + self.SUMMARY_FIELDS)
+        if unknown:
+            raise sugar.lib.exceptions.SugarJobStoreException("Unknown fields: {}".format(", ".join(sorted(unknown))))
+        rows = self._get_rows(self._select(), ("created", "jid") + tuple(field for field in fields if field not in ("created", "jid")))
+        if cursor is not None:
+            rows = [row for row in rows if (row["created"], row["jid"]) < tuple(cursor)]
+        for row in rows[:limit]:
+            yield row
+
+    def expire(self, dtm=None) -> None:
+        """
+        Swipe over jobs and remove those that already outdated.
+
+        :param dtm: date/time threshold
+        :raises SugarJobStoreException: if date/time is None
+        :return: None
+        """
+        if dtm is None:
+            raise sugar.lib.exceptions.SugarJobStoreException("Date/time should not be None")
+        dtm = _db_time(dtm)
+        self._delete_jobs(self._select(lambda job: job.header["created"] < dtm))
+
+    def expire_to_count(self, cnt=30) -> None:
+        """
+        Remove jobs that are older than specific amount of jobs.
+
+        :param cnt: count of jobs still be preserved (last)
+        :return: None
+        """
+        jobs = sorted(self._select(), key=lambda job: (job.header["created"], job.header["jid"]), reverse=True)
+        self._delete_jobs(jobs[cnt:])
+
+    def delete_by_jid(self, jid: str) -> None:
+        """
+        Delete a particular job by JID.
+
+        :param jid: string job id
+        :return: None
+        """
+        if jid is not None:
+            self._delete_jobs(self._select(lambda job: job.header["jid"] == jid))
+
+    def delete_by_tag(self, tag: str) -> None:
+        """
+        Delete a particular job by tag
+
+        :param tag: string tag
+        :return: None
+        """
+        if tag is not None:
+            self._delete_jobs(self._select(lambda job: job.header["tag"] == tag))
+
+    def _delete_jobs(self, jobs: typing.List[_Job]) -> None:
+        """
+        Delete jobs and compact the log, if it is mostly garbage.
+
+        :param jobs: job entries
+        :return: None
+        """
+        for job in jobs:
+            self._append("delete", job.header["jid"], {})
+        if self._garbage >= self.COMPACT_MIN and self._garbage >= self._size * self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        Rewrite the log with the records of the existing jobs and hosts only.
+
+        :return: None
+        """
+        path = self._log_path + ".compact"
+        with self.__lock:
+            offset = 0
+            with open(path, "wb") as log_fh:
+                for host in self._hosts.values():
+                    offset += log_fh.write((json.dumps(["host", None, host], separators=(",", ":")) + "\n").encode("utf-8"))
+                for job in self._jobs.values():
+                    records = []
+                    for record_offset, length in job.records:
+                        records.append((offset, length))
+                        offset += log_fh.write(os.pread(self._fd, length, record_offset))
+                    job.records = records
+                log_fh.flush()
+                os.fsync(log_fh.fileno())
+            os.replace(path, self._log_path)
+            os.close(self._fd)
+            self._fd = os.open(self._log_path, os.O_RDWR | os.O_APPEND)
+            self.log.debug("Jobs log is compacted from {} to {} bytes", self._size, offset)
+            self._size, self._garbage = offset, 0
+
+    def apply_retention(self, policy: RetentionPolicy) -> typing.List[str]:
+        """
+        Delete the oldest jobs, that are out of the retention policy.
+
+        :param policy: retention policy
+        :return: list of the deleted job IDs
+        """
+        expired = []
+        if policy:
+            oldest = _db_time() - datetime.timedelta(days=policy.max_age) if policy.max_age else None
+            count = size = 0
+            for job in sorted(self._select(), key=lambda job: (job.header["created"], job.header["jid"]), reverse=True):
+                count += 1
+                size += job.size
+                too_old = oldest is not None and job.header["created"] < oldest
+                too_many = bool(policy.max_count) and count > policy.max_count
+                too_large = bool(policy.max_size) and size > policy.max_size
+                if too_old or too_many or too_large:
+                    expired.append(job)
+            self._delete_jobs(expired)
+
+        return [job.header["jid"] for job in expired]
+
+    def export(self, jid: str, path: str, compression: str = "gz", process: bool = False) -> str:
+        """
+        Export job to some tar archive.
+
+        :param jid: job id
+        :param path: path on the server to dump all the job data into an archive.
+        :param compression: None, "gz", "bz2" or "xz"
+        :param process: compress in a separate process
+        :raises SugarJobStoreException: if an archive file already exists or job is not found
+        :return: path to the archive
+        """
+        if jid not in self._jobs:
+            raise sugar.lib.exceptions.SugarJobStoreException("Job '{}' not found".format(jid))
+        job_row, results, tasks, calls = self._fold(self._jobs[jid])
+        result_tasks = self._get_result_tasks(tasks, calls)
+
+        path = archive.get_path(path, jid, compression)
+        with archive.ArchiveWriter(path, compression=compression, process=process) as writer:
+            writer.add("job-info.yaml", archive.get_job_info(jid, _to_utc(job_row["created"]),
+                                                             _to_utc(job_row["finished"]), job_row["status"],
+                                                             job_row["query"], job_row["uri"], job_row["tag"]))
+            for result in results:
+                host = self._hosts.get(result["machineid"], {}).get("fqdn") or result["machineid"]
+                for name, body in archive.get_result_files(result["status"], _to_utc(result["fired"]),
+                                                           result["src"] or "", result_tasks.get(result["id"], [])):
+                    writer.add("{}/{}".format(host, name), body)
+
+        return path
+
+    @staticmethod
+    def _get_result_tasks(tasks: typing.List[dict], calls: typing.List[dict]) -> dict:
+        """
+        Get tasks with their calls for the archive.
+
+        :param tasks: task rows
+        :param calls: call rows
+        :return: result ID to the list of tasks
+        """
+        task_calls, result_tasks = {}, {}
+        for call in calls:
+            task_calls.setdefault(call["task"], []).append((_to_utc(call["finished"]), call["uri"],
+                                                            call["src"], call["errcode"], call["output"]))
+        for task in tasks:
+            result_tasks.setdefault(task["job"], []).append((task["idn"], _to_utc(task["finished"]),
+                                                             task["return_data"], task["src"],
+                                                             task_calls.get(task["id"], [])))
+        return result_tasks
+
+    def flush(self) -> None:
+        """
+        Flush the entire jobs history, state and progress.
+
+        :return: None
+        """
+        with self.__lock:
+            os.close(self._fd)
+            os.unlink(self._log_path)
+            self.init()
+
+    def close(self) -> None:
+        """
+        Sync and close the log.
+
+        :return: None
+        """
+        self.stop_retention()
+        with self.__lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+            self._flock.release()
@@ -0,0 +1,127 @@
+# coding: utf-8
+"""
+Schema migrations of the jobs database.
+
+Tables are created by Pony ORM from the entities. Everything else
+(indexes, derived data) is versioned here: schema version is kept in
+"PRAGMA user_version" and migrations above it are applied in order,
+each in the same transaction as the version bump. New databases are
+migrated right after creation the same way as existing ones.
+"""
+import sqlite3
+
+from sugar.lib.logger.manager import get_logger
+
+log = get_logger(__name__)  # pylint: disable=C0103
+
+
+# Indexes, matched to the queries of the job storage
+V1_INDEXES = [
+    ("idx_job__created", '"Job" ("created")'),                       # expire, later than
+    ("idx_job__tag", '"Job" ("tag")'),                               # by tag
+    ("idx_result__machineid_fired", '"Result" ("machineid", "fired")'),  # scheduled, unpicked
+    ("idx_result__job_machineid", '"Result" ("job", "machineid")'),      # fired, reports
+    ("idx_task__job_idn", '"Task" ("job", "idn")'),
+    ("idx_call__task_uri", '"Call" ("task", "uri")'),
+]
+
+
+def _v1_indexes(cursor) -> None:
+    """
+    Unique JID and indexes of the queries.
+
+    :param cursor: sqlite3 cursor
+    :return: None
+    """
+    try:
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS "unq_job__jid" ON "Job" ("jid")')
+    except sqlite3.IntegrityError:
+        log.warning("Jobs database contains duplicate JIDs, JID index is not unique")
+        cursor.execute('CREATE INDEX IF NOT EXISTS "idx_job__jid" ON "Job" ("jid")')
+
+    for name, columns in V1_INDEXES:
+        cursor.execute('CREATE INDEX IF NOT EXISTS "{}" ON {}'.format(name, columns))
+
+
+def _v2_summary(cursor) -> None:
+    """
+    Summary counters of the existing jobs.
+    Failed result is the one, returned with an error code. Error codes of the
+    returned results were not stored before, so failed results of the existing
+    jobs are not known and not counted.
+
+    :param cursor: sqlite3 cursor
+    :return: None
+    """
+    cursor.execute('''
+        INSERT OR REPLACE INTO "Summary" ("jid", "targets", "fired", "returned", "failed", "tasks", "calls", "finished")
+        SELECT "j"."jid",
+               (SELECT COUNT(*) FROM "Result" "r" WHERE "r"."job" = "j"."id"),
+               (SELECT COUNT(*) FROM "Result" "r" WHERE "r"."job" = "j"."id" AND "r"."fired" IS NOT NULL),
+               (SELECT COUNT(*) FROM "Result" "r" WHERE "r"."job" = "j"."id" AND EXISTS (
+                   SELECT 1 FROM "Task" "t" WHERE "t"."job" = "r"."id" AND "t"."return_data" != '')),
+               0,
+               (SELECT IFNULL(MAX("n"), 0) FROM (SELECT COUNT(*) AS "n" FROM "Result" "r", "Task" "t"
+                                                 WHERE "r"."job" = "j"."id" AND "t"."job" = "r"."id" GROUP BY "r"."id")),
+               (SELECT COUNT(*) FROM "Result" "r", "Task" "t", "Call" "c" WHERE "r"."job" = "j"."id"
+                AND "t"."job" = "r"."id" AND "c"."task" = "t"."id" AND "c"."finished" IS NOT NULL),
+               "j"."finished"
+        FROM "Job" "j"
+    ''')
+    # Job used to be marked finished on the first return
+    cursor.execute('UPDATE "Summary" SET "finished" = NULL WHERE "returned" < "targets"')
+
+
+# Index of the keyset-paginated listing
+V3_INDEXES = [
+    ("idx_job__created_jid", '"Job" ("created", "jid")'),
+]
+
+
+def _v3_listing(cursor) -> None:
+    """
+    Listing index. It supersedes the index of the job creation time.
+
+    :param cursor: sqlite3 cursor
+    :return: None
+    """
+    for name, columns in V3_INDEXES:
+        cursor.execute('CREATE INDEX IF NOT EXISTS "{}" ON {}'.format(name, columns))
+    cursor.execute('DROP INDEX IF EXISTS "idx_job__created"')
+
+
+# Migration per version, starting from 1
+MIGRATIONS = [
+    _v1_indexes,
+    _v2_summary,
+    _v3_listing,
+]
+
+
+def get_version(connection) -> int:
+    """
+    Get schema version of the database.
+
+    :param connection: sqlite3 connection
+    :return: int
+    """
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection) -> int:
+    """
+    Apply pending migrations. Should be called within a transaction,
+    which is committed by the caller.
+
+    :param connection: sqlite3 connection
+    :return: schema version
+    """
+    version = get_version(connection)
+    cursor = connection.cursor()
+    for target, migration in enumerate(MIGRATIONS[version:], version + 1):
+        log.info("Migrating jobs database to the version {}", target)
+        migration(cursor)
+        cursor.execute("PRAGMA user_version = {}".format(target))
+    cursor.close()
+
+    return max(version, len(MIGRATIONS))
@@ -0,0 +1,368 @@
+# coding: utf-8
+"""
+Time partitions of the jobs history.
+
+Live jobs are kept in the main database. Once their day is over and
+they are finished, jobs are sealed into a partition: a separate
+database file per day, which is only read afterwards. Day of the job
+is known from its JID, so a job is found without searching.
+Retention of the history is then removing whole partition files.
+"""
+import os
+import glob
+import sqlite3
+import datetime
+import threading
+import typing
+
+from sugar.lib.logger.manager import get_logger
+from sugar.lib.jobstore.connections import ReadOnlyPool, set_pragmas
+from sugar.lib.jobstore.blobs import BlobStore
+from sugar.lib.jobstore.loader import JobLoader
+from sugar.transport.serialisable import Serialisable
+
+
+def get_day(jid: str) -> str:
+    """
+    Get day of the job (YYYYMMDD) from the JID.
+
+    :param jid: job ID
+    :return: day
+    """
+    return jid[:8]
+
+
+class Partition:
+    """
+    Sealed jobs of one day.
+    """
+    def __init__(self, path: str, day: str):
+        """
+        Constructor.
+
+        :param path: path to the database file
+        :param day: day of the jobs (YYYYMMDD)
+        """
+        self.path = path
+        self.day = day
+        self._readers = None
+        self._count = None
+        self.__lock = threading.Lock()
+
+    @property
+    def readers(self) -> ReadOnlyPool:
+        """
+        Read-only connections of the partition.
+
+        :return: ReadOnlyPool
+        """
+        with self.__lock:
+            if self._readers is None:
+                self._readers = ReadOnlyPool(self.path, size=2)
+            return self._readers
+
+    def execute(self, sql: str, params: tuple = ()) -> list:
+        """
+        Execute query and fetch all rows.
+
+        :param sql: SQL query
+        :param params: parameters of the query
+        :return: list of rows
+        """
+        return self.readers.execute(sql, params)
+
+    @property
+    def count(self) -> int:
+        """
+        Amount of jobs in the partition.
+
+        :return: int
+        """
+        if self._count is None:
+            self._count = self.execute('SELECT COUNT(*) FROM "Job"')[0][0]
+        return self._count
+
+    @property
+    def size(self) -> int:
+        """
+        Size of the partition files in bytes.
+
+        :return: int
+        """
+        return sum(os.path.getsize(path) for path in glob.glob(self.path + "*"))
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open read-write connection to the partition.
+
+        :return: sqlite3 connection
+        """
+        connection = sqlite3.connect(self.path, uri=True, check_same_thread=False)
+        set_pragmas(connection)
+        connection.execute("PRAGMA foreign_keys = ON")
+        self._count = None
+
+        return connection
+
+    def load_jobs(self, where: str, params: tuple = (), blobs: BlobStore = None) -> typing.List[Serialisable]:
+        """
+        Load jobs with all their results, tasks and calls, the same way as entities are cloned.
+
+        :param where: condition on the "Job" table
+        :param params: parameters of the condition
+        :param blobs: blob storage to resolve the stored payloads
+        :return: list of jobs
+        """
+        return JobLoader(blobs=blobs).load(self.readers, where, params, raw=True)
+
+    def close(self) -> None:
+        """
+        Close connections.
+
+        :return: None
+        """
+        with self.__lock:
+            if self._readers is not None:
+                self._readers.close()
+                self._readers = None
+
+
+class PartitionSet:
+    """
+    Partitions of the jobs history.
+    """
+    NAME = "jobs-{}.data"
+
+    def __init__(self, path: str):
+        """
+        Constructor.
+
+        :param path: directory of the partitions
+        """
+        self.log = get_logger(self)
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.__partitions = {}
+        self.__lock = threading.Lock()
+        for db_path in glob.glob(os.path.join(self.path, self.NAME.format("*"))):
+            day = os.path.basename(db_path)[len(self.NAME.split("{")[0]):-len(self.NAME.split("}")[-1])]
+            self.__partitions[day] = Partition(db_path, day)
+
+    def __iter__(self) -> typing.Iterator[Partition]:
+        """
+        Iterate over partitions, newest first.
+
+        :return: iterator of Partition
+        """
+        with self.__lock:
+            partitions = sorted(self.__partitions.values(), key=lambda partition: partition.day, reverse=True)
+        return iter(partitions)
+
+    def __len__(self) -> int:
+        return len(self.__partitions)
+
+    def get(self, day: str) -> typing.Optional[Partition]:
+        """
+        Get partition of the day.
+
+        :param day: day (YYYYMMDD)
+        :return: Partition or None
+        """
+        return self.__partitions.get(day)
+
+    def get_by_jid(self, jid: str) -> typing.Optional[Partition]:
+        """
+        Get partition, where the job may be sealed.
+
+        :param jid: job ID
+        :return: Partition or None
+        """
+        return self.get(get_day(jid))
+
+    def seal(self, day: str, jids: typing.List[str], live_path: str) -> None:
+        """
+        Copy jobs from the live database into the partition of the day.
+        Copy is idempotent: jobs, already in the partition, are replaced.
+
+        :param day: day of the jobs (YYYYMMDD)
+        :param jids: job IDs
+        :param live_path: path to the live database
+        :return: None
+        """
+        with self.__lock:
+            partition = self.__partitions.get(day)
+            if partition is None:
+                partition = Partition(os.path.join(self.path, self.NAME.format(day)), day)
+
+        connection = partition.connect()
+        try:
+            connection.execute("ATTACH DATABASE ? AS live", ("file:{}?mode=ro".format(live_path),))
+            with connection:
+                if not connection.execute('SELECT COUNT(*) FROM "main"."sqlite_master"').fetchone()[0]:
+                    for sql, in connection.execute('SELECT "sql" FROM "live"."sqlite_master" WHERE "sql" IS NOT NULL '
+                                                   'AND "name" NOT LIKE \'sqlite_%\' ORDER BY "type" DESC').fetchall():
+                        connection.execute(sql)
+                    connection.execute("PRAGMA user_version = {}".format(
+                        connection.execute("PRAGMA live.user_version").fetchone()[0]))
+
+                connection.execute('CREATE TEMP TABLE "seal" ("jid" TEXT PRIMARY KEY)')
+                connection.executemany('INSERT INTO "temp"."seal" VALUES (?)', [(jid,) for jid in jids])
+                connection.execute('DELETE FROM "main"."Job" WHERE "jid" IN (SELECT "jid" FROM "temp"."seal")')
+                jobs = 'SELECT "id" FROM "live"."Job" WHERE "jid" IN (SELECT "jid" FROM "temp"."seal")'
+                results = 'SELECT "id" FROM "live"."Result" WHERE "job" IN ({})'.format(jobs)
+                tasks = 'SELECT "id" FROM "live"."Task" WHERE "job" IN ({})'.format(results)
+                for table, where in [("Job", '"jid" IN (SELECT "jid" FROM "temp"."seal")'),
+                                     ("Summary", '"jid" IN (SELECT "jid" FROM "temp"."seal")'),
+                                     ("Result", '"job" IN ({})'.format(jobs)),
+                                     ("Task", '"job" IN ({})'.format(results)),
+                                     ("Call", '"task" IN ({})'.format(tasks))]:
+                    connection.execute('INSERT OR REPLACE INTO "main"."{0}" SELECT * FROM "live"."{0}" WHERE {1}'.format(
+                        table, where))
+                connection.execute('DROP TABLE "temp"."seal"')
+        finally:
+            connection.close()
+
+        with self.__lock:
+            self.__partitions[day] = partition
+
+    def delete(self, where: str, params: tuple = (), days: typing.Iterable[str] = None) -> int:
+        """
+        Delete jobs from the partitions. Emptied partitions are dropped.
+
+        :param where: condition on the "Job" table
+        :param params: parameters of the condition
+        :param days: days of the partitions. Default: all.
+        :return: amount of deleted jobs
+        """
+        deleted = 0
+        for partition in list(self):
+            if days is not None and partition.day not in days:
+                continue
+            connection = partition.connect()
+            try:
+                with connection:
+                    removed = connection.execute('DELETE FROM "Job" WHERE {}'.format(where), params).rowcount
+                    if removed:
+                        connection.execute('DELETE FROM "Summary" WHERE "jid" NOT IN (SELECT "jid" FROM "Job")')
+                    left = connection.execute('SELECT COUNT(*) FROM "Job"').fetchone()[0]
+            finally:
+                connection.close()
+            deleted += removed
+            if not left:
+                self.drop(partition.day)
+
+        return deleted
+
+    def drop(self, day: str) -> None:
+        """
+        Remove partition of the day.
+
+        :param day: day (YYYYMMDD)
+        :return: None
+        """
+        with self.__lock:
+            partition = self.__partitions.pop(day, None)
+        if partition is not None:
+            partition.close()
+            for path in glob.glob(partition.path + "*"):
+                os.unlink(path)
+            self.log.info("Dropped jobs partition of {}", day)
+
+    def close(self) -> None:
+        """
+        Close connections of all partitions.
+
+        :return: None
+        """
+        for partition in self:
+            partition.close()
+
+
+class RetentionPolicy:
+    """
+    Retention of the jobs history. Zero means no limit.
+    Limits are applied to the whole partitions: partitions are dropped
+    from the oldest, until the history fits into all the limits.
+    """
+    def __init__(self, max_age: int = 0, max_count: int = 0, max_size: int = 0):
+        """
+        Constructor.
+
+        :param max_age: days to keep
+        :param max_count: max amount of jobs
+        :param max_size: max size of the history in bytes
+        """
+        self.max_age = max_age
+        self.max_count = max_count
+        self.max_size = max_size
+
+    def __bool__(self) -> bool:
+        return bool(self.max_age or self.max_count or self.max_size)
+
+    def select(self, partitions: typing.List[Partition], live_count: int = 0, live_size: int = 0,
+               today: datetime.date = None) -> typing.List[str]:
+        """
+        Select partitions to drop.
+
+        :param partitions: partitions, newest first
+        :param live_count: amount of jobs in the live database
+        :param live_size: size of the live database in bytes
+        :param today: current day. Default: today.
+        :return: list of days
+        """
+        today = today or datetime.date.today()
+        oldest = (today - datetime.timedelta(days=self.max_age)).strftime("%Y%m%d") if self.max_age else None
+        count, size = live_count, live_size
+        expired = []
+        for partition in partitions:
+            count += partition.count
+            size += partition.size
+            too_old = oldest is not None and partition.day < oldest
+            too_many = bool(self.max_count) and count > self.max_count
+            too_large = bool(self.max_size) and size > self.max_size
+            if too_old or too_many or too_large:
+                expired.append(partition.day)
+
+        return expired
+
+
+class Retention(threading.Thread):
+    """
+    Background retention of the jobs history.
+    """
+    INTERVAL = 600  # Seconds between the runs
+
+    def __init__(self, apply: typing.Callable, interval: float = INTERVAL):
+        """
+        Constructor.
+
+        :param apply: callable, applying retention
+        :param interval: seconds between the runs
+        """
+        super().__init__(name="jobstore-retention", daemon=True)
+        self.log = get_logger(self)
+        self.apply = apply
+        self.interval = interval
+        self.__stop = threading.Event()
+
+    def run(self) -> None:
+        """
+        Apply retention until stopped.
+
+        :return: None
+        """
+        while not self.__stop.wait(self.interval):
+            try:
+                self.apply()
+            except Exception as exc:
+                self.log.error("Jobs retention failed: {}", exc)
+
+    def stop(self) -> None:
+        """
+        Stop retention.
+
+        :return: None
+        """
+        self.__stop.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
@@ -0,0 +1,125 @@
+# coding: utf-8
+"""
+Index of the pending work.
+
+Keeps amount of not yet fired results per machine ID in memory,
+so hosts without pending jobs do not hit the database on (re)connect.
+Index may overestimate (then the database is queried and the index
+is corrected), but should never underestimate.
+
+Results are queued to the index before they are written and added
+once committed. Queued results are counted as pending, and are not
+touched by set or rebuild, which only know the committed ones.
+"""
+import threading
+import collections
+import typing
+
+
+class PendingIndex:
+    """
+    Machine ID to amount of unfired results.
+    """
+    def __init__(self):
+        self.__pending = collections.Counter()
+        self.__queued = collections.Counter()
+        self.__added = collections.Counter()  # Committed results ever added, per machine
+        self.__lock = threading.Lock()
+
+    def queue(self, machine_ids: typing.Iterable[str]) -> None:
+        """
+        Queue unfired results, that are not yet committed.
+
+        :param machine_ids: machine IDs, one per result
+        :return: None
+        """
+        with self.__lock:
+            self.__queued.update(machine_ids)
+
+    def release(self, machine_ids: typing.Iterable[str]) -> None:
+        """
+        Remove queued results, that failed to commit.
+
+        :param machine_ids: machine IDs, one per result
+        :return: None
+        """
+        with self.__lock:
+            self.__queued -= collections.Counter(machine_ids)
+
+    def add(self, machine_ids: typing.Iterable[str]) -> None:
+        """
+        Add committed unfired results. Queued results of the machines are taken.
+
+        :param machine_ids: machine IDs, one per result
+        :return: None
+        """
+        added = collections.Counter(machine_ids)
+        with self.__lock:
+            self.__pending.update(added)
+            self.__added.update(added)
+            self.__queued -= added
+
+    def discard(self, machine_id: str, count: int = 1) -> None:
+        """
+        Remove fired results.
+
+        :param machine_id: machine ID
+        :param count: amount of fired results
+        :return: None
+        """
+        with self.__lock:
+            if self.__pending[machine_id] > count:
+                self.__pending[machine_id] -= count
+            else:
+                del self.__pending[machine_id]
+
+    def get_stamp(self, machine_id: str) -> int:
+        """
+        Get stamp of the committed results of the machine, taken before reading them from the database.
+
+        :param machine_id: machine ID
+        :return: stamp to pass to set
+        """
+        with self.__lock:
+            return self.__added[machine_id]
+
+    def set(self, machine_id: str, count: int, stamp: int = None) -> None:
+        """
+        Set actual amount of unfired results of the machine.
+
+        :param machine_id: machine ID
+        :param count: amount of unfired results
+        :param stamp: stamp, taken before the amount was read. Results, added since then, are kept.
+                      Default: amount is read in order with the commits (writer thread).
+        :return: None
+        """
+        with self.__lock:
+            if stamp is not None:
+                count += self.__added[machine_id] - stamp
+            if count > 0:
+                self.__pending[machine_id] = count
+            else:
+                self.__pending.pop(machine_id, None)
+
+    def has(self, machine_id: str) -> bool:
+        """
+        Check if machine has unfired results.
+
+        :param machine_id: machine ID
+        :return: bool
+        """
+        return self.__pending.get(machine_id, 0) + self.__queued.get(machine_id, 0) > 0
+
+    def rebuild(self, counts: typing.Iterable[typing.Tuple[str, int]]) -> None:
+        """
+        Replace the index of the committed results.
+        Should be read in order with the commits (writer thread or startup).
+
+        :param counts: pairs of machine ID and amount of unfired results
+        :return: None
+        """
+        with self.__lock:
+            self.__pending = collections.Counter({machine_id: count for machine_id, count in counts if count})
+
+    def __len__(self) -> int:
+        return len(set(self.__pending) | set(self.__queued))
@@ -12,6 +12,20 @@ class JobStats:
         self.jid = kwargs.get("jid")
         self.tasks = kwargs.get("tasks", 0)
         self.finished = kwargs.get("finished", 0)
+        self.targets = kwargs.get("targets", 0)
+        self.fired = kwargs.get("fired", 0)
+        self.returned = kwargs.get("returned", 0)
+        self.failed = kwargs.get("failed", 0)
+        self.completed = kwargs.get("completed")
+
+    @property
+    def done(self) -> bool:
+        """
+        All targets returned their results.
+
+        :return: bool
+        """
+        return self.completed is not None
 
     @property
     def percent(self) -> int:
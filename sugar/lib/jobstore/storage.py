@@ -7,40 +7,76 @@ import errno
 import json
 import datetime
 import typing
-import tarfile
-import io
+import glob
+import heapq
+import shutil
+import itertools
 import pytz
 
 from pony import orm
+from pony.utils import datetime2timestamp
 
 from sugar.lib.compiler.objtask import StateTask
-from sugar.lib.jobstore.entities import Job, Host
+from sugar.lib.jobstore.entities import Job, Host, Result, Summary
+from sugar.lib.jobstore.pending import PendingIndex
+from sugar.lib.jobstore.writer import DatabaseWriter, OnCommit
+from sugar.lib.jobstore.connections import ReadOnlyPool
+from sugar.lib.jobstore.blobs import BlobStore
+from sugar.lib.jobstore.loader import JobLoader
+from sugar.lib.jobstore.partitions import PartitionSet, RetentionPolicy, get_day
+from sugar.lib.jobstore.interface import JobStoreInterface, _db_time, _from_db_time
+from sugar.lib.jobstore import migrations, archive
 from sugar.lib.jobstore.stats import JobStats
-from sugar.lib.jobstore.components import ResultDict
 from sugar.lib.jobstore.const import JobTypes
-from sugar.utils.db import database, JobDefaults
+from sugar.utils.db import database, JobDefaults, ResultDefault
+from sugar.transport.serialisable import Serialisable
 from sugar.utils.sanitisers import join_path
 from sugar.utils.jid import jidstore
-from sugar.lib.compat import yaml
 import sugar.utils.exitcodes
-import sugar.utils.timeutils
 import sugar.lib.exceptions
+from sugar.lib.logger.manager import get_logger
 from sugar.components.server.pdatastore import PDataContainer
 # pylint: disable=R0201,R0904
 
 
-class JobStorage:
+class JobStorage(JobStoreInterface):
     """
-    Store data in the database.
+    Store data in the SQLite database.
     """
+    BULK_CHUNK = 0x1000  # Rows per bulk insert statement
+    PAGE_SIZE = 0x100    # Rows per page of the listings
+    SEAL_CHUNK = 0x40    # Jobs per sealing transaction
+
+    FAILED_CALL = '"c"."errcode" IS NOT NULL AND "c"."errcode" != {}'.format(sugar.utils.exitcodes.EX_OK)
+
     def __init__(self, config, path=None):
-        self._config = config
-        self._db_path = self._config.cache.path if path is None else path
+        super().__init__(config, path=path)
+        self._db_path = self._path
+        self._pending = PendingIndex()
+        self._writer = DatabaseWriter(database)
+        self._readers = None
+        self._blobs = None
+        self._partitions = None
+        self.log = get_logger(self)
         self.init()
 
+    def get_stats(self) -> dict:
+        """
+        Get metrics of the job store.
+
+        :return: dict
+        """
+        return {
+            "writer": self._writer.get_stats(),
+            "pending": len(self._pending),
+            "blobs": self._blobs.get_stats(),
+            "partitions": len(self._partitions),
+        }
+
     def add_host(self, fqdn: str, osid: str, ipv4: str, ipv6: str) -> None:
         """
         Add host to the cache or update if it changes.
+        Update is written behind.
 
         :param fqdn: FQDN hostname
         :param osid: machine ID (systemd or automatically generated)
@@ -48,14 +84,25 @@ class JobStorage:
         :param ipv6: Primary IPv6 address, if any
         :return: None
         """
-        with orm.db_session(optimistic=False):
-            host = Host.get(osid=osid)
-            if host is None:
-                Host(fqdn=fqdn, osid=osid, ipv4=ipv4, ipv6=ipv6)
-            elif host.fqdn != fqdn or host.ipv4 != ipv4 or host.ipv6 != ipv6:
-                host.fqdn = fqdn
-                host.ipv4 = ipv4
-                host.ipv6 = ipv6
+        self._writer.submit(self._add_host, fqdn=fqdn, osid=osid, ipv4=ipv4, ipv6=ipv6)
+
+    def _add_host(self, fqdn: str, osid: str, ipv4: str, ipv6: str) -> None:
+        """
+        Add host to the cache or update if it changes (writer thread).
+
+        :param fqdn: FQDN hostname
+        :param osid: machine ID (systemd or automatically generated)
+        :param ipv4: Primary IPv4 address, if any
+        :param ipv6: Primary IPv6 address, if any
+        :return: None
+        """
+        host = Host.get(osid=osid)
+        if host is None:
+            Host(fqdn=fqdn, osid=osid, ipv4=ipv4, ipv6=ipv6)
+        elif host.fqdn != fqdn or host.ipv4 != ipv4 or host.ipv6 != ipv6:
+            host.fqdn = fqdn
+            host.ipv4 = ipv4
+            host.ipv6 = ipv6
 
     def get_host(self, fqdn: str = None, osid: str = None, ipv4: str = None, ipv6: str = None, noid: bool = True):
         """
@@ -68,6 +115,7 @@ class JobStorage:
         :param noid: Remove database's record host ID
         :return: None
         """
+        self._writer.flush()
         with orm.db_session(optimistic=False):
             host = None
             for argk, argv in [("fqdn", fqdn), ("osid", osid), ("ipv4", ipv4), ("ipv6", ipv6)]:
@@ -100,28 +148,78 @@ class JobStorage:
 
         if jid is None or not jidstore.is_jid(jid):
             jid = jidstore.create()
-        with orm.db_session(optimistic=False):
-            job = Job(jid=jid, query=query, created=datetime.datetime.now(tz=pytz.UTC), tag=tag,
-                      type=job_type, uri=uri, args=args)
-            for target in clientslist:
-                job.results.create(machineid=target.id)
+        machine_ids = [target.id for target in clientslist]
+        self._pending.queue(machine_ids)
+        try:
+            self._writer.call(self._new, jid=jid, query=query, machine_ids=machine_ids,
+                              uri=uri, args=args, job_type=job_type, tag=tag)
+        except Exception:
+            self._pending.release(machine_ids)
+            raise
         return jid
 
+    def _new(self, jid: str, query: str, machine_ids: typing.List[str], uri: str, args: str, job_type: str, tag: str) -> None:
+        """
+        Register a new job (writer thread).
+
+        :param jid: Job ID
+        :param query: Issued matcher expression during the job state or runner.
+        :param machine_ids: machine IDs of the targets
+        :param uri: URI of the state or function etc.
+        :param args: Arguments of the job (usually for the "runner")
+        :param job_type: one of the "runner", "state"
+        :param tag: Tag (label) of the job.
+        :return: OnCommit to add the results to the pending work index
+        """
+        job = Job(jid=jid, query=query, created=_db_time(), tag=tag,
+                  type=job_type, uri=uri, args=args)
+        Summary(jid=jid, targets=len(machine_ids))
+        orm.flush()
+
+        # Results are inserted in bulk within the same transaction, without building entities.
+        connection = database.get_connection()
+        for offset in range(0, len(machine_ids), self.BULK_CHUNK):
+            connection.executemany('INSERT INTO "Result" ("job", "machineid", "status", "src") VALUES (?, ?, ?, ?)',
+                                   [(job.id, machine_id, ResultDefault.R_NOT_SET, "")
+                                    for machine_id in machine_ids[offset:offset + self.BULK_CHUNK]])
+
+        return OnCommit(lambda: self._pending.add(machine_ids))
+
     def set_as_fired(self, jid: str, target: PDataContainer) -> None:
         """
         Mark job as "fired". Which means job is not necessary was picked up and accepted.
         But it means that the master fired it over the network.
+        Update is written behind.
 
         :param jid: Job ID
         :param target: client target
         :return: None
         """
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job if job.jid == jid):
-                job.status = JobDefaults.S_ISSUED
-                for result in job.results:
-                    if result.machineid == target.id:
-                        result.fired = datetime.datetime.now(tz=pytz.UTC)
+        self._writer.submit(self._set_as_fired, jid=jid, machine_id=target.id, fired=_db_time())
+
+    def _set_as_fired(self, jid: str, machine_id: str, fired: datetime.datetime):
+        """
+        Mark job as "fired" (writer thread).
+
+        :param jid: Job ID
+        :param machine_id: machine ID of the target
+        :param fired: when job has been fired
+        :return: callable to update the pending work index, once committed
+        """
+        on_commit = None
+        job = Job.get(jid=jid)
+        if job is not None:
+            job.status = JobDefaults.S_ISSUED
+            discarded = 0
+            for result in orm.select(result for result in Result if result.job == job and result.machineid == machine_id):
+                if result.fired is None:
+                    discarded += 1
+                result.fired = fired
+            if discarded:
+                Summary[jid].fired += discarded
+                on_commit = OnCommit(lambda: self._pending.discard(machine_id, discarded))
+
+        return on_commit
 
     def add_tasks(self, jid: str, *tasks: StateTask, target: PDataContainer = None, src: str = None) -> None:
         """
@@ -137,20 +235,34 @@ class JobStorage:
         if target is None:
             raise sugar.lib.exceptions.SugarJobStoreException("Hostname or machine ID is required")
 
-        with orm.db_session(optimistic=False):
-            job = Job.get(jid=jid)
-            for result in job.results.select(lambda result: result.machineid == target.id):
-                result.src = src
-                for task in tasks:
-                    _task = result.tasks.create(idn=task.idn)
-                    for call in task.calls:
-                        _task.calls.create(uri=call.uri, src=call.src)
-
-    def report_job(self, jid: str, target: PDataContainer, src: str, return_data: str,
+        self._writer.call(self._add_tasks, jid, *tasks, machine_id=target.id, src=self._blobs.put(src))
+
+    def _add_tasks(self, jid: str, *tasks: StateTask, machine_id: str = None, src: str = None) -> None:
+        """
+        Adds a completed tasks to te job per a target (writer thread).
+
+        :param jid: job id
+        :param tasks: list of tasks
+        :param machine_id: machine ID of the target
+        :param src: source of the compiled task on the machine
+        :return: None
+        """
+        job = Job.get(jid=jid)
+        summary = Summary[jid]
+        summary.tasks = max(summary.tasks, len(tasks))
+        for result in job.results.select(lambda result: result.machineid == machine_id):
+            result.src = src
+            for task in tasks:
+                _task = result.tasks.create(idn=task.idn)
+                for call in task.calls:
+                    _task.calls.create(uri=call.uri, src=call.src)
+
+    def report_job(self, jid: str, target: PDataContainer, src: str, return_data: str,  # pylint: disable=R0913
                    finished: str, uri: str = None, log_info: str = None,
-                   log_warn: str = None, log_err: str = None) -> None:
+                   log_warn: str = None, log_err: str = None, errcode: int = None) -> None:
         """
         Report compiled job source on the client.
+        Once all targets returned, job is finished.
 
         :param jid: Job id
         :param target: target machine
@@ -161,51 +273,132 @@ class JobStorage:
         :param log_warn: JSON data of the warning log
         :param log_err: JSON data of the error log
         :param uri: URI from the state. Otherwise None, which is a fallback of job.uri
+        :param errcode: error code of the returned result, if any
         :return: None
         """
         if src is not None or return_data is not None:
-            with orm.db_session(optimistic=False):
-                job = Job.get(jid=jid)
-                result = job.results.select(lambda result: result.machineid == target.id).first()
-                task = result.tasks.select(lambda task: task.idn == uri or job.uri).first()
-                if task is None:
-                    task = result.tasks.create(idn=uri or job.uri, finished=finished)
-                else:
-                    task.finished = finished
+            self._writer.submit(self._report_job, jid=jid, machine_id=target.id, src=self._blobs.put(src),
+                                return_data=self._blobs.put(return_data),
+                                finished=_db_time(finished) if finished else None, uri=uri,
+                                log_info=log_info, log_warn=log_warn, log_err=log_err,
+                                errcode=errcode)
+
+    def _report_job(self, jid: str, machine_id: str, src: str, return_data: str, finished: str, uri: str,  # pylint: disable=R0913
+                    log_info: str, log_warn: str, log_err: str, errcode: int) -> None:
+        """
+        Report compiled job source on the client (writer thread).
+
+        :param jid: Job id
+        :param machine_id: machine ID of the target
+        :param src: source of the job (YAML)
+        :param finished: when particular task has been finished
+        :param return_data: JSON data what module/task is returning
+        :param log_info: JSON data of the information log
+        :param log_warn: JSON data of the warning log
+        :param log_err: JSON data of the error log
+        :param uri: URI from the state. Otherwise None, which is a fallback of job.uri
+        :param errcode: error code of the returned result, if any
+        :return: None
+        """
+        job = Job.get(jid=jid)
+        if job is None:
+            self.log.warning("Job '{}' is not in the live database, report is dropped", jid)
+            return
+        task, returned = self._get_report_task(job, machine_id=machine_id, idn=uri or job.uri, finished=finished)
+
+        # Log
+        if log_info:
+            task.log_info = log_info
+        if log_warn:
+            task.log_warn = log_warn
+        if log_err:
+            task.log_err = log_err
+
+        # Source
+        if src is not None:
+            task.src = src
+
+        # Data
+        if return_data is not None:
+            task.return_data = return_data
+            if not returned:
+                self._on_returned(job, errcode=errcode, finished=finished)
+
+    def _get_report_task(self, job: Job, machine_id: str, idn: str, finished: datetime.datetime) -> tuple:
+        """
+        Get reported task of the result or create one (writer thread).
 
-                # Log
-                if log_info:
-                    task.log_info = log_info
-                if log_warn:
-                    task.log_warn = log_warn
-                if log_err:
-                    task.log_err = log_err
+        :param job: Job entity
+        :param machine_id: machine ID of the target
+        :param idn: identifier of the task
+        :param finished: when particular task has been finished
+        :return: tuple of the task entity and flag, if the result was returned before
+        """
+        result = job.results.select(lambda result: result.machineid == machine_id).first()
+        returned = result.tasks.select(lambda task: task.return_data != "").exists()
+        task = result.tasks.select(lambda task: task.idn == idn).first()
+        if task is None:
+            task = result.tasks.create(idn=idn, finished=finished)
+            summary = Summary[job.jid]
+            summary.tasks = max(summary.tasks, result.tasks.count())
+        else:
+            task.finished = finished
 
-                # Source
-                if src is not None:
-                    task.src = src
+        return task, returned
 
-                # Data
-                if return_data is not None:
-                    task.return_data = return_data
-                    job.status = JobDefaults.S_FINISHED
+    def _on_returned(self, job: Job, errcode: int, finished: datetime.datetime) -> None:
+        """
+        Update summary of the job on the first return of a result (writer thread).
+        Job is finished, once all results are returned.
+
+        :param job: Job entity
+        :param errcode: error code of the returned result
+        :param finished: when result has been finished
+        :return: None
+        """
+        summary = Summary[job.jid]
+        summary.returned += 1
+        if errcode not in (None, sugar.utils.exitcodes.EX_OK):
+            summary.failed += 1
+
+        if summary.returned >= summary.targets:
+            summary.finished = finished or _db_time()
+            job.finished = summary.finished
+            job.status = JobDefaults.S_FINISHED
+        else:
+            job.status = JobDefaults.S_IN_PROGRESS
 
     def report_job_finished(self, jid: str) -> None:
         """
-        Report job finished completely.
+        Report job finished completely, regardless of the returned results.
+        Update is written behind.
 
         :param jid: Job ID
         :return: None
         """
-        with orm.db_session(optimistic=False):
-            job = Job.get(jid=jid)
-            job.finished = datetime.datetime.now(tz=pytz.UTC)
+        self._writer.submit(self._report_job_finished, jid=jid, finished=_db_time())
+
+    def _report_job_finished(self, jid: str, finished: datetime.datetime) -> None:
+        """
+        Report job finished completely (writer thread).
+
+        :param jid: Job ID
+        :param finished: when job has been finished
+        :return: None
+        """
+        job = Job.get(jid=jid)
+        if job is None:
+            self.log.warning("Job '{}' is not in the live database, report is dropped", jid)
+            return
+        job.finished = finished
+        job.status = JobDefaults.S_FINISHED
+        Summary[jid].finished = finished
 
     def report_call(self, jid: str, target: PDataContainer, idn: str,
                     uri: str, errcode: int, output: str, finished: datetime) -> None:
         """
         Report job progress. Each time task is completed with any kind of result,
-        this should update current status of it.
+        this should update current status of it. Update is written behind.
 
         :param jid: Job ID
         :param idn: Identificator of the task
@@ -217,21 +410,61 @@ class JobStorage:
         :raises SugarJobStoreException: if 'output' parameter is not a JSON string
         :return: None
         """
-        with orm.db_session(optimistic=False):
-            job = Job.get(jid=jid)
-            job.status = JobDefaults.S_IN_PROGRESS
-            result = job.results.select(lambda result: result.machineid == target.id).first()
-            for task in result.tasks.select(lambda task: task.idn == idn):
-                for call in task.calls.select(lambda call: call.uri == uri):
-                    if not isinstance(output, str):
-                        raise sugar.lib.exceptions.SugarJobStoreException("output expected to be a JSON string")
-                    try:
-                        json.loads(output)
-                    except Exception as exc:
-                        raise sugar.lib.exceptions.SugarJobStoreException(exc)
-                    call.output = output
-                    call.errcode = errcode
-                    call.finished = finished
+        if not isinstance(output, str):
+            raise sugar.lib.exceptions.SugarJobStoreException("output expected to be a JSON string")
+        try:
+            json.loads(output)
+        except Exception as exc:
+            raise sugar.lib.exceptions.SugarJobStoreException(exc)
+
+        self._writer.submit(self._report_call, jid=jid, machine_id=target.id, idn=idn, uri=uri,
+                            errcode=errcode, output=self._blobs.put(output), finished=_db_time(finished) if finished else None)
+
+    def _report_call(self, jid: str, machine_id: str, idn: str,
+                     uri: str, errcode: int, output: str, finished: datetime) -> None:
+        """
+        Report job progress (writer thread).
+
+        :param jid: Job ID
+        :param machine_id: machine ID of the target
+        :param idn: Identificator of the task
+        :param uri: URI of the called function
+        :param errcode: return code of the performed function
+        :param output: output of the function
+        :param finished: date/time when call has been finished
+        :return: None
+        """
+        job = Job.get(jid=jid)
+        if job is None:
+            self.log.warning("Job '{}' is not in the live database, report is dropped", jid)
+            return
+        job.status = JobDefaults.S_IN_PROGRESS
+        result = job.results.select(lambda result: result.machineid == machine_id).first()
+        for task in result.tasks.select(lambda task: task.idn == idn):
+            for call in task.calls.select(lambda call: call.uri == uri):
+                if call.finished is None:
+                    Summary[jid].calls += 1
+                call.output = output
+                call.errcode = errcode
+                call.finished = finished
+
+    def _clone(self, job: Job) -> Serialisable:
+        """
+        Clone the job with all its results, tasks and calls, resolving the stored blobs.
+
+        :param job: Job entity
+        :return: Serialisable
+        """
+        job = job.clone()
+        for result in job.results:
+            result.src = self._blobs.get(result.src)
+            for task in result.tasks:
+                task.src = self._blobs.get(task.src)
+                task.return_data = self._blobs.get(task.return_data)
+                for call in task.calls:
+                    call.output = self._blobs.get(call.output)
+
+        return job
 
     def get_unpicked(self, target: PDataContainer = None) -> list:
         """
@@ -240,6 +473,7 @@ class JobStorage:
         :param target: client
         :return: list of unpicked jobs or an empty list
         """
+        self._writer.flush()
         jobs = []
         with orm.db_session(optimistic=False):
             if target is None or not target.id:
@@ -251,16 +485,25 @@ class JobStorage:
                                           for result in job.results
                                           if result.fired is None and result.machineid == target.id)
             for job in job_selector:
-                jobs.append(job.clone())
+                jobs.append(self._clone(job))
 
         return jobs
 
+    def has_pending(self, target: PDataContainer) -> bool:
+        """
+        Check if there are scheduled jobs for the target, without querying the database.
+
+        :param target: target client
+        :return: bool
+        """
+        return self._pending.has(target.id)
+
     def get_scheduled(self, target: PDataContainer, mark: bool = False) -> list:
         """
         Get scheduled jobs for the hostname.
 
         :param target: target client
-        :param mark: Mark all found scheduled jobs as fired.
+        :param mark: Mark all found scheduled jobs of the target as fired.
         :raises SugarJobStoreException: if no hostname has been specified.
         :return: list of jobs
         """
@@ -268,72 +511,78 @@ class JobStorage:
             raise sugar.lib.exceptions.SugarJobStoreException("No hostname specified")
 
         jobs = []
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job
-                                  for result in job.results if result.fired is None and result.machineid == target.id):
-                if mark:
-                    for result in job.results:
-                        if result.fired is None:
-                            result.fired = datetime.datetime.now(tz=pytz.UTC)
-                jobs.append(job.clone())
+        if not self._pending.has(target.id):
+            pass
+        elif mark:
+            jobs = self._writer.call(self._get_scheduled, machine_id=target.id, mark=True)
+        else:
+            stamp = self._pending.get_stamp(target.id)
+            self._writer.flush()
+            with orm.db_session(optimistic=False):
+                jobs = self._get_scheduled(machine_id=target.id, mark=False).result
+            self._pending.set(target.id, len(jobs), stamp=stamp)
 
         return jobs
 
+    def _get_scheduled(self, machine_id: str, mark: bool) -> OnCommit:
+        """
+        Get scheduled jobs for the machine and mark them as fired, if requested.
+        Marking is performed in the writer thread.
+
+        :param machine_id: machine ID of the target
+        :param mark: Mark all found scheduled jobs of the target as fired.
+        :return: OnCommit with the list of jobs
+        """
+        jobs = []
+        for job in orm.select(job for job in Job
+                              for result in job.results if result.fired is None and result.machineid == machine_id):
+            if mark:
+                for result in job.results:
+                    if result.fired is None and result.machineid == machine_id:
+                        result.fired = _db_time()
+            jobs.append(self._clone(job))
+
+        return OnCommit(lambda: self._pending.set(machine_id, 0), jobs)
+
     def get_done_stats(self, jid: str) -> JobStats:
         """
         Get status of done.
 
         :param jid: Job ID.
+        :raises SugarJobStoreException: if job is not found
         :return: stats object
         """
-        job = self.get_by_jid(jid)
-        tasks = 0
-        for result in job.results:
-            _tasks = len(result.tasks)
-            if _tasks > tasks:
-                tasks = _tasks
-        tasks = tasks * len(job.results)
-        stats = JobStats(jid=jid, tasks=tasks)
-        with orm.db_session(optimistic=False):
-            finished = orm.select(job for job in Job if job.jid == jid
-                                  for result in job.results
-                                  for task in result.tasks
-                                  for call in task.calls if call.finished is not None)
-            stats.finished = len(finished)
-        return stats
+        self._writer.flush()
+        sql = 'SELECT "targets", "fired", "returned", "failed", "tasks", "calls", "finished" FROM "Summary" WHERE "jid" = ?'
+        summary = self._readers.execute(sql, (jid,))
+        partition = self._partitions.get_by_jid(jid) if not summary else None
+        if partition is not None:
+            summary = partition.execute(sql, (jid,))
+        if not summary:
+            raise sugar.lib.exceptions.SugarJobStoreException("Job '{}' not found".format(jid))
+        targets, fired, returned, failed, tasks, calls, finished = summary[0]
+
+        return JobStats(jid=jid, tasks=tasks * targets, finished=calls, targets=targets, fired=fired,
+                        returned=returned, failed=failed, completed=_from_db_time(finished))
 
     def get_by_jid(self, jid: str, noid: bool = True) -> Job:
         """
-        Get a job by jid.
+        Get a job by jid with all its results and their hosts.
+        Stored payloads are decoded on the first access.
 
         :param jid: job id.
         :param noid: remove database record IDs
         :return: Job object.
         """
-        with orm.db_session(optimistic=False):
-            job = Job.get(jid=jid)
-            if job is not None:
-                job = job.clone()
-                if noid:
-                    del job.id
-                for result in job.results:
-                    host = self.get_host(osid=result.machineid)
-                    if host is not None:
-                        result.host = host
-                    del result.machineid
-                    if noid:
-                        del result.id
-                    for task in result.tasks:
-                        if task.return_data:
-                            task.return_data = json.loads(task.return_data)  # Convert string-stored in db JSON into data struct
-                        task.log_info = json.loads(task.log_info or "[]")
-                        task.log_warn = json.loads(task.log_warn or "[]")
-                        task.log_err = json.loads(task.log_err or "[]")
-                        if noid:
-                            del task.id
-                            for call in task.calls:
-                                del call.id
-            return job
+        self._writer.flush()
+        loader = JobLoader(blobs=self._blobs, hosts=self._readers)
+        job = next(iter(loader.load(self._readers, '"jid" = ?', (jid,), noid=noid)), None)
+        if job is None:
+            partition = self._partitions.get_by_jid(jid)
+            if partition is not None:
+                job = next(iter(loader.load(partition.readers, '"jid" = ?', (jid,), noid=noid)), None)
+
+        return job
 
     def get_later_then(self, dtm: datetime) -> list:
         """
@@ -342,67 +591,113 @@ class JobStorage:
         :param dtm: datetime threshold.
         :return: list of Job objects
         """
+        self._writer.flush()
         with orm.db_session(optimistic=False):
-            return [job.clone() for job in orm.select(job for job in Job if job.created > dtm)]
+            jobs = [self._clone(job) for job in orm.select(job for job in Job if job.created > dtm)]
+        day = self._get_local_day(dtm)
+        for partition in self._partitions:
+            if partition.day < day:
+                break
+            jobs.extend(partition.load_jobs('"created" > ?', (datetime2timestamp(_db_time(dtm)),), blobs=self._blobs))
+
+        return jobs
 
-    def get_not_finished(self) -> list:
+    def get_not_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
         """
         Get unfinished jobs.
 
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
         :return: list of unfinished jobs, where calls are not yet reported
         """
-        jobs = []
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job
-                                  for result in job.results
-                                  for task in result.tasks
-                                  for call in task.calls if call.finished is None):
-                jobs.append(job.clone())
-        return jobs
+        return self._get_headers(self._calls_exist('"c"."finished" IS NULL'), since=since, until=until, tag=tag)
 
-    def get_finished(self) -> list:
+    def get_finished(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
         """
         Get finished jobs.
 
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
         :return: list of finished jobs, where calls are reported already
         """
-        jobs = []
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job
-                                  for result in job.results
-                                  for task in result.tasks
-                                  for call in task.calls if call.finished is not None):
-                jobs.append(job.clone())
-        return jobs
+        return self._get_headers(self._calls_exist('"c"."finished" IS NOT NULL'), since=since, until=until, tag=tag)
 
-    def get_failed(self) -> list:
+    def get_failed(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
         """
         Get any job that has at least one failed call.
 
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
         :return: list of failed jobs
         """
-        jobs = []
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job
-                                  for result in job.results
-                                  for task in result.tasks
-                                  for call in task.calls if call.errcode != sugar.utils.exitcodes.EX_OK):
-                jobs.append(job.clone())
-        return jobs
+        return self._get_headers(self._calls_exist(self.FAILED_CALL), since=since, until=until, tag=tag)
 
-    def get_suceeded(self) -> list:
+    def get_suceeded(self, since: datetime.datetime = None, until: datetime.datetime = None, tag: str = None) -> list:
         """
         Get jobs that has no single failure inside.
 
+        :param since: created at or after. Default: any time.
+        :param until: created before. Default: any time.
+        :param tag: tag of the jobs. Default: any.
         :return: list of succeeded jobs
         """
+        return self._get_headers("{} AND NOT {}".format(self._calls_exist('"c"."errcode" = {}'.format(sugar.utils.exitcodes.EX_OK)),
+                                                        self._calls_exist(self.FAILED_CALL)),
+                                 since=since, until=until, tag=tag)
+
+    @staticmethod
+    def _calls_exist(condition: str) -> str:
+        """
+        Get SQL condition on the "Job" table, that the job has a call, matching the condition.
+
+        :param condition: condition on the "Call" table, aliased as "c"
+        :return: SQL condition
+        """
+        return ('EXISTS (SELECT 1 FROM "Result" "r" JOIN "Task" "t" ON "t"."job" = "r"."id" '
+                'JOIN "Call" "c" ON "c"."task" = "t"."id" WHERE "r"."job" = "j"."id" AND {})'.format(condition))
+
+    def _get_headers(self, where: str, since: datetime.datetime = None, until: datetime.datetime = None,
+                     tag: str = None) -> list:
+        """
+        Get job headers (job columns only, without results) of the live and sealed jobs, newest first.
+
+        :param where: SQL condition on the "Job" table, aliased as "j"
+        :param since: created at or after
+        :param until: created before
+        :param tag: tag of the jobs
+        :return: list of job objects
+        """
+        params = ()
+        if since is not None:
+            where += ' AND "j"."created" >= ?'
+            params += (datetime2timestamp(_db_time(since)),)
+        if until is not None:
+            where += ' AND "j"."created" < ?'
+            params += (datetime2timestamp(_db_time(until)),)
+        if tag is not None:
+            where += ' AND "j"."tag" = ?'
+            params += (tag,)
+        sql = 'SELECT {} FROM "Job" "j" WHERE {} ORDER BY "j"."created" DESC, "j"."jid" DESC'.format(
+            ", ".join('"j"."{}"'.format(field) for field in self.LISTING_FIELDS), where)
+
+        self._writer.flush()
+        sources = [self._readers.execute]
+        for partition in self._partitions:
+            if ((since is None or partition.day >= self._get_local_day(since))
+                    and (until is None or partition.day <= self._get_local_day(until))):
+                sources.append(partition.execute)
+
         jobs = []
-        with orm.db_session(optimistic=False):
-            for job in orm.select(job for job in Job
-                                  for result in job.results
-                                  for task in result.tasks
-                                  for call in task.calls if call.errcode == sugar.utils.exitcodes.EX_OK):
-                jobs.append(job.clone())
+        for row in heapq.merge(*[execute(sql, params) for execute in sources],
+                               key=lambda row: (row[1], row[0]), reverse=True):
+            job = Serialisable()
+            for field, value in zip(self.LISTING_FIELDS, row):
+                setattr(job, field, _from_db_time(value) if field in ("created", "finished") else value)
+            jobs.append(job)
+
         return jobs
 
     def get_by_tag(self, tag) -> typing.List[Job]:
@@ -412,8 +707,13 @@ class JobStorage:
         :param tag: Tag in the job, if job has been tagged.
         :return: Job object.
         """
+        self._writer.flush()
         with orm.db_session(optimistic=False):
-            return [job.clone() for job in orm.select(job for job in Job if job.tag == tag)]
+            jobs = [self._clone(job) for job in orm.select(job for job in Job if job.tag == tag)]
+        for partition in self._partitions:
+            jobs.extend(partition.load_jobs('"tag" = ?', (tag,), blobs=self._blobs))
+
+        return jobs
 
     def get_all(self, limit=25, offset=0) -> list:
         """
@@ -425,53 +725,115 @@ class JobStorage:
 
         :return: List of job objects.
         """
+        self._writer.flush()
         if limit is None:
             limit = 0
         if offset is None:
             offset = 0
         with orm.db_session(optimistic=False):
             if limit + offset:
-                result = [job.clone() for job in orm.select(
+                result = [self._clone(job) for job in orm.select(
                     job for job in Job).limit(limit, offset=offset)]
+                offset = max(0, offset - orm.count(job for job in Job))
             else:
-                result = [job.clone() for job in orm.select(job for job in Job)]
+                result = [self._clone(job) for job in orm.select(job for job in Job)]
+
+        # Sealed jobs follow the live ones
+        for partition in self._partitions:
+            if limit and len(result) >= limit:
+                break
+            if offset >= partition.count:
+                offset -= partition.count
+                continue
+            jobs = partition.load_jobs('"id" IN (SELECT "id" FROM "Job" ORDER BY "id" LIMIT ? OFFSET ?)',
+                                       (limit - len(result) if limit else -1, offset), blobs=self._blobs)
+            offset = 0
+            result.extend(jobs)
+
         return result
 
-    def get_all_overview(self, limit=25, offset=0) -> list:
+    def iter_jobs(self, fields: typing.Sequence[str] = None, cursor: tuple = None,
+                  limit: int = None) -> typing.Iterator[dict]:
         """
-        Get all existing jobs, without an actual results (count only).
-
-        :param limit: limit of amount of the returned objects.
-        :param offset: offset in the database.
-
-        :return: list of job entities
+        Stream listing of the jobs, newest first, without loading their results.
+
+        Only requested columns are selected. Jobs are read page by page
+        after the (created, jid) keyset cursor, so memory is constant
+        regardless of the history size. Each row has "created" and "jid",
+        which are the cursor of the next page. Live and sealed jobs are merged.
+
+        :param fields: columns of the job or summary counters. Default: all job columns.
+        :param cursor: (created, jid) of the last seen job. Default: start from the newest.
+        :param limit: max amount of jobs. Default: all.
+        :raises SugarJobStoreException: if field is unknown
+        :return: generator of dictionaries
         """
-        if limit is None:
-            limit = 0
-        if offset is None:
-            offset = 0
-        with orm.db_session(optimistic=False):
-            query = orm.select(job for job in Job)
-            if limit + offset:
-                query = query.limit(limit, offset=offset)
-            result = []
-            for job in query:
-                job = job.clone()
-                job.results = len(job.results)
-                result.append(job)
-        return result
+        fields = tuple(fields or self.LISTING_FIELDS)
+        unknown = set(fields) - set(self.LISTING_FIELDS + self.SUMMARY_FIELDS)
+        if unknown:
+            raise sugar.lib.exceptions.SugarJobStoreException("Unknown fields: {}".format(", ".join(sorted(unknown))))
+        fields = tuple(field for field in fields if field not in ("created", "jid"))
+        columns = ['"j"."created"', '"j"."jid"'] + ['"{}"."{}"'.format("s" if field in self.SUMMARY_FIELDS else "j", field)
+                                                    for field in fields]
+        sql = 'SELECT {} FROM "Job" "j"'.format(", ".join(columns))
+        if set(fields) & set(self.SUMMARY_FIELDS):
+            sql += ' LEFT JOIN "Summary" "s" ON "s"."jid" = "j"."jid"'
+        conversions = [_from_db_time if field in ("created", "finished") else None for field in ("created", "jid") + fields]
+
+        self._writer.flush()
+        sources = [self._readers.execute] + [partition.execute for partition in self._partitions]
+        rows = heapq.merge(*[self._iter_rows(execute, sql, ("created", "jid") + fields, conversions, cursor, limit)
+                             for execute in sources], key=lambda row: (row["created"], row["jid"]), reverse=True)
+        for row in itertools.islice(rows, limit):
+            yield row
+
+    def _iter_rows(self, execute: typing.Callable, sql: str, fields: tuple, conversions: list,
+                   cursor: typing.Optional[tuple], limit: typing.Optional[int]) -> typing.Iterator[dict]:
+        """
+        Read job listing of one database page by page.
+
+        :param execute: query function of the database
+        :param sql: query of the listing
+        :param fields: names of the selected columns
+        :param conversions: conversion function per column or None
+        :param cursor: (created, jid) of the last seen job
+        :param limit: max amount of jobs
+        :return: generator of dictionaries
+        """
+        while limit is None or limit > 0:
+            if cursor is None:
+                page = sql
+                params = ()
+            else:
+                created = datetime2timestamp(_db_time(cursor[0]))
+                page = sql + ' WHERE "j"."created" < ? OR ("j"."created" = ? AND "j"."jid" < ?)'
+                params = (created, created, cursor[1])
+            size = self.PAGE_SIZE if limit is None else min(limit, self.PAGE_SIZE)
+            rows = execute(page + ' ORDER BY "j"."created" DESC, "j"."jid" DESC LIMIT ?', params + (size,))
+            for row in rows:
+                yield {field: conv(value) if conv else value for field, conv, value in zip(fields, conversions, row)}
+            if len(rows) < size:
+                break
+            if limit is not None:
+                limit -= len(rows)
+            cursor = (_from_db_time(rows[-1][0]), rows[-1][1])
 
     def expire(self, dtm=None) -> None:
         """
         Swipe over jobs and remove those that already outdated.
+        Partitions of the days before are dropped whole.
 
         :param dtm: date/time threshold (default last five days)
         :raises SugarJobStoreException: if date/time is None
         :return: None
         """
         if dtm is not None:
-            with orm.db_session(optimistic=False):
-                orm.delete(job for job in Job if job.created < dtm)
+            day = self._get_local_day(dtm)
+            for partition in self._partitions:
+                if partition.day < day:
+                    self._partitions.drop(partition.day)
+            self._partitions.delete('"created" < ?', (datetime2timestamp(_db_time(dtm)),), days=[day])
+            self._writer.call(self._delete, lambda: orm.delete(job for job in Job if job.created < dtm))
         else:
             raise sugar.lib.exceptions.SugarJobStoreException("Date/time should not be None")
 
@@ -482,14 +844,27 @@ class JobStorage:
         :param cnt: count of jobs still be preserved (last)
         :return: None
         """
-        alive = 0
-        with orm.db_session(optimistic=False):
+        def delete():
+            alive = 0
             for job in orm.select(job for job in Job).order_by(orm.desc(Job.created)):
                 if alive < cnt:
                     alive += 1
                 else:
                     job.delete()
 
+        self._writer.flush()
+        alive = min(cnt, self._readers.execute('SELECT COUNT(*) FROM "Job"')[0][0])
+        for partition in self._partitions:
+            if alive >= cnt:
+                self._partitions.drop(partition.day)
+            elif alive + partition.count > cnt:
+                self._partitions.delete('"id" NOT IN (SELECT "id" FROM "Job" ORDER BY "created" DESC LIMIT ?)',
+                                        (cnt - alive,), days=[partition.day])
+                alive = cnt
+            else:
+                alive += partition.count
+        self._writer.call(self._delete, delete)
+
     def delete_by_jid(self, jid: str) -> None:
         """
         Delete a particular job by JID.
@@ -498,8 +873,8 @@ class JobStorage:
         :return: None
         """
         if jid is not None:
-            with orm.db_session(optimistic=False):
-                orm.delete(job for job in Job if job.jid == jid)
+            self._partitions.delete('"jid" = ?', (jid,), days=[get_day(jid)])
+            self._writer.call(self._delete, lambda: orm.delete(job for job in Job if job.jid == jid))
 
     def delete_by_tag(self, tag: str) -> None:
         """
@@ -509,83 +884,221 @@ class JobStorage:
         :return: None
         """
         if tag is not None:
-            with orm.db_session(optimistic=False):
-                orm.delete(job for job in Job if job.tag == tag)
+            self._partitions.delete('"tag" = ?', (tag,))
+            self._writer.call(self._delete, lambda: orm.delete(job for job in Job if job.tag == tag))
+
+    def _delete(self, delete: typing.Callable) -> OnCommit:
+        """
+        Delete jobs (writer thread).
+
+        :param delete: callable, performing deletion
+        :return: OnCommit to rebuild the pending work index and collect blobs
+        """
+        delete()
+        orm.flush()
+        database.get_connection().execute('DELETE FROM "Summary" WHERE "jid" NOT IN (SELECT "jid" FROM "Job")')
+        return OnCommit(self._on_deleted)
+
+    def _on_deleted(self) -> None:
+        """
+        Update in-memory index and remove blobs of the deleted jobs.
+
+        :return: None
+        """
+        self._rebuild_pending()
+        self._collect_blobs()
+
+    def _collect_blobs(self) -> int:
+        """
+        Remove blobs that are no longer referenced.
+
+        :return: amount of removed blobs
+        """
+        refs = []
+        for execute in [self._readers.execute] + [partition.execute for partition in self._partitions]:
+            refs.extend(ref for ref, in execute('SELECT "src" FROM "Result" WHERE "src" LIKE ? '
+                                                'UNION SELECT "src" FROM "Task" WHERE "src" LIKE ? '
+                                                'UNION SELECT "return_data" FROM "Task" WHERE "return_data" LIKE ? '
+                                                'UNION SELECT "output" FROM "Call" WHERE "output" LIKE ?',
+                                                (self._blobs.PREFIX + "%",) * 4))
+        return self._blobs.gc(refs)
+
+    @staticmethod
+    def _get_local_day(dtm: datetime.datetime) -> str:
+        """
+        Get local day (YYYYMMDD) of the date/time, the same as in the JIDs.
+        Naive date/time is UTC.
+
+        :param dtm: date/time
+        :return: day
+        """
+        if dtm.tzinfo is None:
+            dtm = pytz.UTC.localize(dtm)
+        return dtm.astimezone().strftime("%Y%m%d")
+
+    def seal(self, max_age: int = 0, today: datetime.date = None) -> int:
+        """
+        Move jobs of the past days from the live database into the day partitions.
+        Jobs are sealed once all their results are fired and returned. Jobs still
+        in progress stay live, so offline hosts get them on reconnect and late reports
+        are written, unless they are older than max_age days and are expired anyway.
+
+        :param max_age: days, after which jobs are sealed regardless. Zero means never.
+        :param today: current day. Default: today.
+        :return: amount of sealed jobs
+        """
+        today = today or datetime.date.today()
+        expired = (today - datetime.timedelta(days=max_age)).strftime("%Y%m%d") if max_age else ""
+        self._writer.flush()
+        jids = [jid for jid, in self._readers.execute(
+            'SELECT "j"."jid" FROM "Job" "j" JOIN "Summary" "s" ON "s"."jid" = "j"."jid" '
+            'WHERE SUBSTR("j"."jid", 1, 8) < ? AND (SUBSTR("j"."jid", 1, 8) < ? OR ("s"."returned" >= "s"."targets" '
+            'AND NOT EXISTS (SELECT 1 FROM "Result" "r" WHERE "r"."job" = "j"."id" AND "r"."fired" IS NULL))) '
+            'ORDER BY "j"."jid"', (today.strftime("%Y%m%d"), expired))]
+        for day, day_jids in itertools.groupby(jids, key=get_day):
+            day_jids = list(day_jids)
+            for offset in range(0, len(day_jids), self.SEAL_CHUNK):
+                chunk = day_jids[offset:offset + self.SEAL_CHUNK]
+                self._partitions.seal(day, chunk, self._db_path)
+                self._writer.call(self._drop_sealed, chunk)
+        if jids:
+            self.log.debug("Sealed {} jobs", len(jids))
+
+        return len(jids)
+
+    def _drop_sealed(self, jids: typing.List[str]) -> OnCommit:
+        """
+        Delete sealed jobs from the live database (writer thread).
+        Results, tasks and calls are deleted by the database cascade.
+
+        :param jids: job IDs
+        :return: OnCommit to rebuild the pending work index
+        """
+        orm.flush()
+        marks = ", ".join("?" * len(jids))
+        connection = database.get_connection()
+        connection.execute('DELETE FROM "Job" WHERE "jid" IN ({})'.format(marks), jids)
+        connection.execute('DELETE FROM "Summary" WHERE "jid" IN ({})'.format(marks), jids)
 
-    def export(self, jid, path) -> None:
+        return OnCommit(self._rebuild_pending)
+
+    def apply_retention(self, policy: RetentionPolicy) -> typing.List[str]:
+        """
+        Seal jobs of the past days and drop partitions, that are out of the retention policy.
+        Nothing is sealed without the policy.
+
+        :param policy: retention policy
+        :return: list of the dropped days
+        """
+        days = []
+        if policy:
+            self.seal(max_age=policy.max_age)
+            live_count = self._readers.execute('SELECT COUNT(*) FROM "Job"')[0][0]
+            live_size = sum(os.path.getsize(path) for path in glob.glob(self._db_path + "*"))
+            days = policy.select(list(self._partitions), live_count=live_count, live_size=live_size)
+            for day in days:
+                self._partitions.drop(day)
+            if days:
+                self._collect_blobs()
+
+        return days
+
+    def export(self, jid: str, path: str, compression: str = "gz", process: bool = False) -> str:
         """
         Export job to some tar archive.
 
+        Results are read page by page and written to the archive as they come,
+        so memory does not depend on the amount of the targets.
+
         :param jid: job id
         :param path: path on the server to dump all the job data into an archive.
-        :raises SugarJobStoreException: if an archive file already exists
-        :return: None
+        :param compression: None, "gz", "bz2" or "xz"
+        :param process: compress in a separate process
+        :raises SugarJobStoreException: if an archive file already exists or job is not found
+        :return: path to the archive
         """
-        # pylint: disable=R0914
-        os.makedirs(path, exist_ok=True)
-        path = "{}/sugar-job-{}.tar.gz".format(path, jid)
+        execute, job_id, info = self._get_export_job(jid)
+        path = archive.get_path(path, jid, compression)
+        with archive.ArchiveWriter(path, compression=compression, process=process) as writer:
+            writer.add("job-info.yaml", archive.get_job_info(jid, *info))
+            for host, files in self._iter_export_results(execute, job_id):
+                for name, body in files:
+                    writer.add("{}/{}".format(host, name), body)
 
-        # This should not happen, but still.
-        if os.path.exists(path):
-            raise sugar.lib.exceptions.SugarJobStoreException("File '{}' already exists".format(path))
+        return path
 
-        archive = tarfile.open(path, mode="w:gz")
-        data = []
-        with orm.db_session(optimistic=False):
-            job = Job.get(jid=jid)
-
-            job_data = ResultDict()
-            job_data["jid"] = job.jid
-            job_data["created"] = job.created
-            job_data["finished"] = job.finished
-            job_data["status"] = job.status
-            job_data["query"] = job.query
-            job_data["identifier"] = job.uri
-            job_data["tag"] = job.tag
-
-            data.append(("job-info.yaml", job_data, False))
-
-            for result in job.results:
-                result_data = ResultDict()
-                result_data["status"] = result.status
-                result_data["fired"] = result.fired
-                result_data["src"] = result.src
-                result_data["tasks"] = []
-                host = self.get_host(osid=result.machineid)
-                for task in result.tasks:
-                    task_data = ResultDict()
-                    task_data["identifier"] = task.idn
-                    task_data["finished"] = sugar.utils.timeutils.to_iso(task.finished)
-                    task_data["return_data"] = task.return_data
-                    task_data["src"] = task.src
-                    task_data["calls"] = []
-                    if task.return_data:
-                        data.append(("{}/{}-return.yaml".format(host.fqdn, task.idn), task.return_data, True))
-                    for call in task.calls:
-                        call_data = ResultDict()
-                        call_data["finished"] = call.finished
-                        call_data["URI"] = call.uri
-                        call_data["src"] = call.src
-                        call_data["errcode"] = call.errcode
-                        call_data["output"] = call.output
-                        task_data["calls"].append(call_data)
-                        if call.src:
-                            data.append(("{}/src-{}.{}.yaml".format(host.fqdn, task.idn, call.uri),
-                                         call.src, True))
-                    result_data["tasks"].append(task_data)
-
-                data.append(("{}/result.yaml".format(host.fqdn), result_data.to_dict(), False))
-                data.append(("{}/source.yaml".format(host.fqdn), result.src, True))
-
-        for d_name, d_content, as_is in data:
-            body = yaml.dump(d_content, default_flow_style=False) if not as_is else d_content
-            src = io.BytesIO()
-            src.write(body.encode("utf-8"))
-            src.seek(0)
-            info = tarfile.TarInfo(name=d_name)
-            info.size = len(body)
-            archive.addfile(info, src)
-        # pylint: enable=R0914
+    def _get_export_job(self, jid: str) -> tuple:
+        """
+        Find the job for the export in the live database, then in the partition of its day.
+
+        :param jid: job id
+        :raises SugarJobStoreException: if job is not found
+        :return: tuple of the query function of the database, where the job is, database ID of the job
+                 and (created, finished, status, query, uri, tag) of the job
+        """
+        self._writer.flush()
+        sql = 'SELECT "id", "created", "finished", "status", "query", "uri", "tag" FROM "Job" WHERE "jid" = ?'
+        execute = self._readers.execute
+        job = execute(sql, (jid,))
+        partition = self._partitions.get_by_jid(jid) if not job else None
+        if partition is not None:
+            execute = partition.execute
+            job = execute(sql, (jid,))
+        if not job:
+            raise sugar.lib.exceptions.SugarJobStoreException("Job '{}' not found".format(jid))
+        job_id, created, finished, *info = job[0]
+
+        return execute, job_id, (_from_db_time(created), _from_db_time(finished), *info)
+
+    def _iter_export_results(self, execute: typing.Callable, job_id: int) -> typing.Iterator[tuple]:
+        """
+        Walk results of the job for the export, page by page.
+
+        :param execute: query function of the database, where the job is
+        :param job_id: database ID of the job
+        :return: generator of (host name, list of (file name, content))
+        """
+        last_id = 0
+        while True:
+            results = execute(
+                'SELECT "r"."id", "r"."machineid", "r"."status", "r"."fired", "r"."src", "h"."fqdn" FROM "Result" "r" '
+                'LEFT JOIN "Host" "h" ON "h"."osid" = "r"."machineid" '
+                'WHERE "r"."job" = ? AND "r"."id" > ? ORDER BY "r"."id" LIMIT ?', (job_id, last_id, self.PAGE_SIZE))
+            if not results:
+                break
+            last_id = results[-1][0]
+
+            tasks = self._get_export_tasks(execute, [row[0] for row in results])
+            for result_id, machine_id, status, fired, src, fqdn in results:
+                yield fqdn or machine_id, archive.get_result_files(status, _from_db_time(fired), self._blobs.get(src) or "",
+                                                                   tasks.get(result_id, []))
+
+    def _get_export_tasks(self, execute: typing.Callable, result_ids: typing.List[int]) -> dict:
+        """
+        Get tasks with their calls of the results page for the export.
+
+        :param execute: query function of the database, where the job is
+        :param result_ids: database IDs of the results
+        :return: dictionary of result ID to the list of tasks
+        """
+        tasks = execute('SELECT "id", "job", "idn", "finished", "return_data", "src" FROM "Task" '
+                        'WHERE "job" IN ({}) ORDER BY "id"'.format(", ".join("?" * len(result_ids))), tuple(result_ids))
+        calls = {}
+        for offset in range(0, len(tasks), self.PAGE_SIZE):
+            page = tasks[offset:offset + self.PAGE_SIZE]
+            for task_id, *call in execute(
+                    'SELECT "task", "finished", "uri", "src", "errcode", "output" FROM "Call" '
+                    'WHERE "task" IN ({}) ORDER BY "id"'.format(", ".join("?" * len(page))), tuple(row[0] for row in page)):
+                calls.setdefault(task_id, []).append(call)
+
+        tasks_by_result = {}
+        for task_id, result_id, idn, finished, return_data, task_src in tasks:
+            tasks_by_result.setdefault(result_id, []).append(
+                (idn, _from_db_time(finished), self._blobs.get(return_data), self._blobs.get(task_src),
+                 [(_from_db_time(call_finished), call_uri, call_src, errcode, self._blobs.get(output))
+                  for call_finished, call_uri, call_src, errcode, output in calls.get(task_id, [])]))
+
+        return tasks_by_result
 
     def flush(self) -> None:
         """
@@ -593,6 +1106,13 @@ class JobStorage:
 
         :return: None
         """
+        self._writer.flush()
+        self._readers.close()
+        if self._blobs is not None:
+            shutil.rmtree(self._blobs.path, ignore_errors=True)
+        if self._partitions is not None:
+            for partition in self._partitions:
+                self._partitions.drop(partition.day)
         if self._db_path is not None:
             try:
                 os.unlink(self._db_path)
@@ -612,6 +1132,28 @@ class JobStorage:
         if database.provider is None:
             database.bind(provider="sqlite", filename=self._db_path, create_db=True)
             database.generate_mapping(create_tables=True)
+        self._writer.call(self._migrate)
+        self._readers = ReadOnlyPool(self._db_path)
+        self._blobs = BlobStore(os.path.join(os.path.dirname(self._db_path), "blobs"))
+        self._partitions = PartitionSet(os.path.join(os.path.dirname(self._db_path), "jobs.d"))
+        self._rebuild_pending()
+
+    def _migrate(self) -> int:
+        """
+        Migrate database schema (writer thread).
+
+        :return: schema version
+        """
+        return migrations.migrate(database.get_connection())
+
+    def _rebuild_pending(self) -> None:
+        """
+        Rebuild index of the pending work from the database.
+
+        :return: None
+        """
+        self._pending.rebuild(self._readers.execute(
+            'SELECT "machineid", COUNT(*) FROM "Result" WHERE "fired" IS NULL GROUP BY "machineid"'))
 
     def close(self) -> None:
         """
@@ -619,6 +1161,10 @@ class JobStorage:
 
         :return: None
         """
+        self.stop_retention()
+        self._writer.close()
+        self._readers.close()
+        self._partitions.close()
         database.disconnect()
         database.provider = None
         database.schema = None
@@ -0,0 +1,259 @@
+# coding: utf-8
+"""
+Single writer of the job store.
+
+All mutations of the job store are sent as requests to one writer
+thread, so the SQLite database is never written concurrently.
+Requests are applied in grouped transactions: a group is committed
+when it reaches a size threshold or on a short interval, whatever
+comes first. Synchronous requests (the caller waits for the result)
+are committed without waiting for the interval.
+"""
+import time
+import queue
+import threading
+import typing
+from concurrent.futures import Future
+
+from pony import orm
+
+from sugar.lib.logger.manager import get_logger
+from sugar.lib.metrics import Counter, Histogram
+
+
+class OnCommit:
+    """
+    Result of the mutation with a callback, called once the mutation is committed
+    (e.g. to update in-memory state).
+    """
+    def __init__(self, on_commit: typing.Callable, result: typing.Any = None):
+        """
+        Constructor.
+
+        :param on_commit: callable without arguments
+        :param result: result of the mutation
+        """
+        self.on_commit = on_commit
+        self.result = result
+
+
+class DatabaseWriter:
+    """
+    Single-writer actor of the database mutations.
+    """
+    FLUSH_INTERVAL = 0.05  # Seconds to collect mutations into a group
+    FLUSH_SIZE = 0x200     # Max mutations per group
+
+    def __init__(self, database: orm.Database, interval: float = FLUSH_INTERVAL, size: int = FLUSH_SIZE):
+        """
+        Constructor.
+
+        :param database: Pony database
+        :param interval: max time (seconds) to collect a group
+        :param size: max mutations in a group
+        """
+        self.log = get_logger(self)
+        self.database = database
+        self.interval = interval
+        self.size = size
+        self.__queue = queue.Queue()
+        self.__submitted = 0
+        self.__committed = 0
+        self.__cond = threading.Condition()
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+        self.latency = Histogram()
+        self.group_size = Histogram(buckets=(1, 2, 8, 32, 128, 512))
+        self.errors = Counter()
+
+    @property
+    def pending(self) -> int:
+        """
+        Amount of mutations, that are not yet committed.
+
+        :return: int
+        """
+        return self.__submitted - self.__committed
+
+    def get_stats(self) -> dict:
+        """
+        Get writer metrics.
+
+        :return: dictionary of the queue depth, transaction latency, group sizes and errors
+        """
+        return {
+            "depth": self.pending,
+            "latency": self.latency.to_dict(),
+            "group_size": self.group_size.to_dict(),
+            "errors": self.errors.value,
+        }
+
+    def submit(self, func: typing.Callable, *args, **kwargs) -> Future:
+        """
+        Queue mutation (write-behind).
+        Function is called in the writer thread within a database session.
+
+        :param func: mutation function
+        :param args: arguments
+        :param kwargs: keywords
+        :return: Future of the mutation result
+        """
+        return self._put(func, args, kwargs, wait=False)
+
+    def call(self, func: typing.Callable, *args, **kwargs) -> typing.Any:
+        """
+        Apply mutation and wait until it is committed.
+
+        :param func: mutation function
+        :param args: arguments
+        :param kwargs: keywords
+        :raises Exception: whatever mutation raised
+        :return: result of the mutation
+        """
+        if threading.current_thread() is self.__thread:
+            result = func(*args, **kwargs)
+            if isinstance(result, OnCommit):
+                result = result.result
+        else:
+            result = self._put(func, args, kwargs, wait=True).result()
+
+        return result
+
+    def _put(self, func: typing.Callable, args: tuple, kwargs: dict, wait: bool) -> Future:
+        """
+        Put request to the queue.
+
+        :param func: mutation function
+        :param args: arguments
+        :param kwargs: keywords
+        :param wait: caller waits for the result
+        :return: Future
+        """
+        future = Future()
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self._run, name="jobstore-writer", daemon=True)
+                self.__thread.start()
+            with self.__cond:
+                self.__submitted += 1
+            self.__queue.put((func, args, kwargs, future, wait))
+
+        return future
+
+    def flush(self) -> None:
+        """
+        Wait until all mutations, queued so far, are committed.
+
+        :return: None
+        """
+        if threading.current_thread() is self.__thread:
+            return
+        with self.__cond:
+            target = self.__submitted
+            while self.__committed < target:
+                self.__cond.wait()
+
+    def close(self) -> None:
+        """
+        Commit queued mutations and stop the writer thread.
+
+        :return: None
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                self.__queue.put(None)
+                self.__thread.join()
+                self.__thread = None
+
+    def _collect(self) -> tuple:
+        """
+        Collect a group of mutations.
+
+        :return: tuple of mutations list and stop flag
+        """
+        group = []
+        waiting = False
+        item = self.__queue.get()
+        deadline = time.time() + self.interval
+        while item is not None:
+            group.append(item)
+            waiting = waiting or item[-1]
+            if len(group) >= self.size:
+                break
+            try:
+                if waiting:
+                    item = self.__queue.get_nowait()
+                else:
+                    item = self.__queue.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                break
+        return group, item is None
+
+    def _run(self) -> None:
+        """
+        Writer loop.
+
+        :return: None
+        """
+        stop = False
+        while not stop:
+            group, stop = self._collect()
+            if group:
+                self._commit(group)
+        if self.database.provider is not None:
+            self.database.disconnect()  # Connection of the writer thread
+
+    def _apply(self, group: list) -> list:
+        """
+        Apply mutations.
+        If the group transaction fails, mutations are applied one by one,
+        so a single faulty mutation does not discard the whole group.
+
+        :param group: list of mutations
+        :return: list of (result, exception) per mutation
+        """
+        results = []
+        try:
+            with orm.db_session(optimistic=False):
+                for func, args, kwargs, _, _ in group:
+                    results.append((func(*args, **kwargs), None))
+        except Exception as exc:
+            self.log.debug("Group of {} mutations failed ({}), applying one by one", len(group), exc)
+            results = []
+            for func, args, kwargs, _, wait in group:
+                try:
+                    with orm.db_session(optimistic=False):
+                        result = func(*args, **kwargs)
+                    results.append((result, None))
+                except Exception as error:
+                    self.errors.inc()
+                    results.append((None, error))
+                    if not wait:
+                        self.log.error("Error writing to the job store in '{}': {}", func.__name__, error)
+        return results
+
+    def _commit(self, group: list) -> None:
+        """
+        Commit group of mutations and resolve their futures.
+
+        :param group: list of mutations
+        :return: None
+        """
+        started = time.time()
+        results = self._apply(group)
+        self.latency.observe(time.time() - started)
+        self.group_size.observe(len(group))
+
+        for (_, _, _, future, _), (result, exc) in zip(group, results):
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                if isinstance(result, OnCommit):
+                    result.on_commit()
+                    result = result.result
+                future.set_result(result)
+
+        with self.__cond:
+            self.__committed += len(group)
+            self.__cond.notify_all()
@@ -0,0 +1,224 @@
+# coding: utf-8
+"""
+Runtime metrics.
+
+Simple thread-safe counters, gauges and histograms
+to expose internal state of the components, and the
+periodic report of them to the log.
+"""
+import bisect
+import collections
+import json
+import threading
+import typing
+
+from twisted.internet import task
+
+from sugar.lib.logger.manager import get_logger
+
+
+class Counter:
+    """
+    Monotonic counter.
+    """
+    def __init__(self):
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        Increment counter.
+
+        :param amount: amount to add
+        :return: None
+        """
+        with self.__lock:
+            self.__value += amount
+
+    @property
+    def value(self) -> int:
+        """
+        Current value.
+
+        :return: int
+        """
+        return self.__value
+
+
+class Gauge:
+    """
+    Value that goes up and down.
+    """
+    def __init__(self):
+        self.__value = 0
+        self.__lock = threading.Lock()
+
+    def set(self, value) -> None:
+        """
+        Set current value.
+
+        :param value: value
+        :return: None
+        """
+        self.__value = value
+
+    def inc(self, amount=1) -> None:
+        """
+        Increase value.
+
+        :param amount: amount to add
+        :return: None
+        """
+        with self.__lock:
+            self.__value += amount
+
+    def dec(self, amount=1) -> None:
+        """
+        Decrease value.
+
+        :param amount: amount to subtract
+        :return: None
+        """
+        with self.__lock:
+            self.__value -= amount
+
+    @property
+    def value(self):
+        """
+        Current value.
+
+        :return: value
+        """
+        return self.__value
+
+
+class Histogram:
+    """
+    Histogram of observed values in cumulative buckets.
+    """
+    # Default buckets are for latencies in seconds
+    BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        """
+        Constructor.
+
+        :param buckets: upper bounds of the buckets, ascending
+        """
+        self.__bounds = tuple(buckets)
+        self.__counts = [0] * (len(self.__bounds) + 1)
+        self.__sum = 0
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def observe(self, value) -> None:
+        """
+        Observe a value.
+
+        :param value: value
+        :return: None
+        """
+        with self.__lock:
+            self.__counts[bisect.bisect_left(self.__bounds, value)] += 1
+            self.__sum += value
+            self.__count += 1
+
+    @property
+    def count(self) -> int:
+        """
+        Amount of observed values.
+
+        :return: int
+        """
+        return self.__count
+
+    def to_dict(self) -> dict:
+        """
+        Export histogram.
+
+        :return: dictionary of count, sum, mean and cumulative buckets
+        """
+        with self.__lock:
+            buckets = {}
+            total = 0
+            for bound, count in zip(self.__bounds + ("+Inf",), self.__counts):
+                total += count
+                buckets[bound] = total
+            return {
+                "count": self.__count,
+                "sum": self.__sum,
+                "mean": self.__sum / self.__count if self.__count else 0,
+                "buckets": buckets,
+            }
+
+
+class StatsReporter:
+    """
+    Periodic report of the component metrics to the log.
+    """
+    INTERVAL = 60  # Seconds
+
+    def __init__(self, interval: int = INTERVAL):
+        """
+        Constructor.
+
+        :param interval: seconds between the reports
+        """
+        self.log = get_logger(self)
+        self.interval = interval
+        self.__sources = collections.OrderedDict()
+        self.__loop = None
+
+    def add(self, name: str, source: typing.Callable[[], dict]) -> "StatsReporter":
+        """
+        Add source of the metrics.
+
+        :param name: name of the source in the report
+        :param source: callable, returning dictionary of the metrics, e.g. get_stats() method
+        :return: StatsReporter
+        """
+        self.__sources[name] = source
+        return self
+
+    def collect(self) -> dict:
+        """
+        Collect metrics of all sources. Failing source is reported by its error.
+
+        :return: dictionary of the source names to their metrics
+        """
+        stats = {}
+        for name, source in self.__sources.items():
+            try:
+                stats[name] = source()
+            except Exception as exc:
+                stats[name] = {"error": str(exc)}
+        return stats
+
+    def report(self) -> None:
+        """
+        Write metrics of all sources to the log.
+
+        :return: None
+        """
+        for name, stats in self.collect().items():
+            self.log.info("Stats of {}: {}", name, json.dumps(stats, default=str))
+
+    def start(self) -> None:
+        """
+        Start reporting. Should be called in the reactor thread.
+
+        :return: None
+        """
+        if self.__loop is None and self.__sources:
+            self.__loop = task.LoopingCall(self.report)
+            self.__loop.start(self.interval, now=False)
+
+    def stop(self) -> None:
+        """
+        Stop reporting.
+
+        :return: None
+        """
+        if self.__loop is not None and self.__loop.running:
+            self.__loop.stop()
+        self.__loop = None
@@ -2,8 +2,14 @@
 """
 Persistent Queue
 """
+import os
+import typing
 
 from sugar.lib.perq.fsqueue import FSQueue  # noqa
+from sugar.lib.perq.segqueue import SegmentedQueue  # noqa
+from sugar.lib.perq.memqueue import MemoryQueue  # noqa
+from sugar.lib.perq.lanes import LaneQueue  # noqa
+from sugar.lib.perq.durability import Durability  # noqa
 
 
 class QueueFactory:
@@ -11,11 +17,67 @@ class QueueFactory:
     Queue Factory
     """
     @staticmethod
-    def fs_queue(path) -> FSQueue:
+    def fs_queue(path, maxsize: int = FSQueue.MAX_SIZE, durability: str = Durability.STRICT):
         """
         Create FS queue object.
 
         :param path: xlog storage
-        :return: FSQueue instance
+        :param maxsize: max size of the queue
+        :param durability: durability mode: strict, batch or memory
+        :return: FSQueue instance, or MemoryQueue in memory mode
         """
-        return FSQueue(path=path)
+        Durability.validate(durability, disk=False)
+        if durability == Durability.MEMORY:
+            queue = MemoryQueue(maxsize=maxsize)
+        else:
+            queue = FSQueue(path=path, maxsize=maxsize, durability=durability)
+
+        return queue
+
+    @staticmethod
+    def seg_queue(path, maxsize: int = SegmentedQueue.MAX_SIZE,
+                  segment_size: int = SegmentedQueue.SEGMENT_SIZE, durability: str = Durability.STRICT):
+        """
+        Create segmented FS queue object.
+
+        :param path: segments storage
+        :param maxsize: max size of the queue
+        :param segment_size: size of the segment file to rotate
+        :param durability: durability mode: strict, batch or memory
+        :return: SegmentedQueue instance, or MemoryQueue in memory mode
+        """
+        Durability.validate(durability, disk=False)
+        if durability == Durability.MEMORY:
+            queue = MemoryQueue(maxsize=maxsize)
+        else:
+            queue = SegmentedQueue(path=path, maxsize=maxsize, segment_size=segment_size, durability=durability)
+
+        return queue
+
+    @staticmethod
+    def memory_queue(maxsize: int = MemoryQueue.MAX_SIZE) -> MemoryQueue:
+        """
+        Create memory queue object.
+
+        :param maxsize: max size of the queue
+        :return: MemoryQueue instance
+        """
+        return MemoryQueue(maxsize=maxsize)
+
+    @staticmethod
+    def lane_queue(path, lanes: typing.Sequence[typing.Tuple[str, int]], default: str = None,
+                   maxsize: int = FSQueue.MAX_SIZE, durability: str = Durability.STRICT) -> LaneQueue:
+        """
+        Create multi-lane FS queue object.
+        Every lane is an FS queue in the sub-directory of the path, named after the lane.
+
+        :param path: lanes storage
+        :param lanes: sequence of (name, weight) of the lanes
+        :param default: name of the lane for the puts without one. Default is the first lane.
+        :param maxsize: max size of every lane
+        :param durability: durability mode of the lanes: strict, batch or memory
+        :return: LaneQueue instance
+        """
+        return LaneQueue([(name, QueueFactory.fs_queue(None if path is None else os.path.join(path, name),
+                                                       maxsize=maxsize, durability=durability), weight)
+                          for name, weight in lanes], default=default)
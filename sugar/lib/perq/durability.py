@@ -0,0 +1,129 @@
+# coding: utf-8
+"""
+Durability of the persistent queues.
+
+- strict: every put is synced to the disk before it returns.
+- batch: puts are written to the disk, and synced together every
+  few milliseconds. Items, put during the last interval, may be lost
+  on a crash of the system (not of the process).
+- memory: nothing is written to the disk. Queue is shared between the
+  processes, forked after it was created. Everything is lost when the
+  processes are gone.
+"""
+import os
+import time
+import threading
+import typing
+
+from sugar.lib.metrics import Histogram
+
+
+class Durability:
+    """
+    Durability modes.
+    """
+    STRICT = "strict"
+    BATCH = "batch"
+    MEMORY = "memory"
+
+    @classmethod
+    def validate(cls, mode: str, disk: bool = True) -> None:
+        """
+        Raise ValueError if durability mode is unknown.
+
+        :param mode: durability mode
+        :param disk: mode of the disk queue
+        :raises ValueError: if mode is unknown or is not for the disk queue
+        :return: None
+        """
+        if mode not in ([cls.STRICT, cls.BATCH] if disk else [cls.STRICT, cls.BATCH, cls.MEMORY]):
+            raise ValueError("Unsupported queue durability: {}".format(mode))
+
+
+def sync_paths(paths: typing.Iterable[str], latency: Histogram = None) -> None:
+    """
+    Sync files or directories to the disk. Removed paths are skipped.
+
+    :param paths: paths to sync
+    :param latency: histogram to observe the fsync latency, if any
+    :return: None
+    """
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            started = time.time()
+            os.fsync(fd)
+            if latency is not None:
+                latency.observe(time.time() - started)
+        finally:
+            os.close(fd)
+
+
+class GroupSync:
+    """
+    Group fsync of the written files.
+
+    Written files are collected and synced together once in the interval,
+    in the background thread. Files, removed before that, are skipped.
+    """
+    INTERVAL = 0.05  # Seconds between the syncs
+
+    def __init__(self, interval: float = INTERVAL, latency: Histogram = None):
+        """
+        Constructor.
+
+        :param interval: seconds between the syncs
+        :param latency: histogram to observe the fsync latency, if any
+        """
+        self.interval = interval
+        self.latency = latency
+        self._pid = None
+        self._pending = set()
+        self._timer = None
+        self._mutex = None
+
+    def _reset(self) -> None:
+        """
+        Drop the state, inherited from the parent process.
+        Parent syncs its own writes.
+
+        :return: None
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = set()
+            self._timer = None
+            self._mutex = threading.Lock()
+
+    def add(self, paths: typing.Iterable[str]) -> None:
+        """
+        Schedule files to sync.
+
+        :param paths: paths to the written files
+        :return: None
+        """
+        self._reset()
+        with self._mutex:
+            self._pending.update(paths)
+            if self._timer is None and self._pending:
+                self._timer = threading.Timer(self.interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self) -> None:
+        """
+        Sync pending files now.
+
+        :return: None
+        """
+        self._reset()
+        with self._mutex:
+            pending, self._pending = self._pending, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        sync_paths(pending, latency=self.latency)
@@ -6,13 +6,18 @@ This queue implementation should not have any extra-delay
 when getting an item.
 """
 import os
+import re
 import time
 import errno
+import mmap
 import pickle
-import multiprocessing
 
 from sugar.lib.perq.queue import Queue
-from sugar.lib.perq.qexc import QueueEmpty, QueueFull
+from sugar.lib.perq.durability import Durability, GroupSync, sync_paths
+from sugar.lib.perq.notify import Notifier
+from sugar.lib.perq.qexc import QueueEmpty, QueueFull, QueueCorrupt
+from sugar.lib.perq.qstats import QueueStats
+from sugar.lib.perq import record
 import sugar.utils.files
 
 try:
@@ -25,24 +30,37 @@ class FSQueue(Queue):
     """
     File-system queue.
     """
-    # No fcntl here for locking, as it is Unix-only. :-(
-    F_LOCK = ".lock"  # Lock file
-    MAX_SIZE = 0xfff  # Default max size of the queue
-    POLL = 5          # Poll seconds
+    F_LOCK = ".lock"             # Lock file
+    D_QUARANTINE = ".quarantine"  # Directory of the corrupt frames
+    MAX_SIZE = 0xfff             # Default max size of the queue
+    POLL = 5                     # Poll seconds
 
-    def __init__(self, path, maxsize: int = MAX_SIZE, poll: int = POLL):
+    _FRAME = re.compile(r"^(\d+)\.xlog$")
+
+    def __init__(self, path, maxsize: int = MAX_SIZE, poll: int = POLL, durability: str = Durability.STRICT,
+                 sync_interval: float = GroupSync.INTERVAL):
+        Durability.validate(durability)
         self._queue_path = path
         self._max_size = maxsize
         self._xpad = len(str(self._max_size))
         self._serialiser = pickle
         self._mp_notify = None
+        self._notifier = None
         self._poll = poll
+        self.stats = QueueStats()
+        self._sync = GroupSync(sync_interval, latency=self.stats.fsync) if durability == Durability.BATCH else None
 
         try:
             os.makedirs(self._queue_path)
         except (OSError, IOError) as exc:
             if exc.errno != errno.EEXIST:
                 raise
+        self._flock = sugar.utils.files.FileLock(os.path.join(self._queue_path, self.F_LOCK))
+        self._lock()
+        try:
+            self._recover()
+        finally:
+            self._unlock()
 
     def use_msgpack(self, use=False) -> Queue:
         """
@@ -52,6 +70,7 @@ class FSQueue(Queue):
         and sometimes a bit faster loading.
         However, pickle is used by default to
         deal with the native Python objects.
+        Bytes are stored as they are in either case.
 
         :param use: boolean, used to turn on/off msgpack usage. Default is pickle.
         :return: Queue
@@ -61,37 +80,56 @@ class FSQueue(Queue):
 
     def use_notify(self, queue=None) -> Queue:
         """
-        Use queue notification between multi processes via "multiprocessing.Queue".
+        Use queue notification between multi processes.
 
-        Every time when put() is called, internal queue also
-        accepts an object, which indicates that disk has been changed.
-        At that moment get() will re-read the disc store.
+        By default, notifier on eventfd (or pipe) is created. Every time
+        when put() is called, notifier becomes readable and get() wakes up
+        immediately to re-read the disc store. Notifier is shared with
+        the processes, forked after this call, and its file descriptor
+        can be watched by the reactor (see "notifier" and NotifyReader).
 
         If notify is not used, then disk should be re-read
         in polling fashion, that might be not always suitable.
 
-        This configuration option also assumes that there is
-        shared queue and it is transferring messages to an end-point.
+        Passing "multiprocessing.Queue" keeps the older notification,
+        where the queue accepts an object per every put(). Passing
+        a notifier of another queue shares it, so one consumer is
+        woken up by either queue.
 
-        :param queue: commonly shared queue object. Usually multiprocessing.Queue (default)
+        :param queue: commonly shared multiprocessing.Queue object, or notifier to share. Default: new notifier.
         :return: Queue
         """
-        self._mp_notify = queue or multiprocessing.Queue()
+        if queue is None:
+            self._notifier = Notifier()
+        elif isinstance(queue, Notifier):
+            self._notifier = queue
+        else:
+            self._mp_notify = queue
         return self
 
+    @property
+    def notifier(self) -> Notifier:
+        """
+        Notifier of the queue, if notification is used.
+
+        :return: Notifier or None
+        """
+        return self._notifier
+
+    def get_stats(self) -> dict:
+        """
+        Get queue metrics.
+
+        :return: dictionary of the depth, rates, lock wait, fsync latency and payload sizes
+        """
+        return self.stats.to_dict(self.qsize())
+
     def _is_locked(self) -> bool:
         """
         Return True if Queue is locked.
         :return: boolean
         """
-        lock_path = os.path.join(self._queue_path, self.F_LOCK)
-        try:
-            with sugar.utils.files.fopen(lock_path, "rb") as flock:
-                locked = flock.read()
-        except Exception:
-            locked = None
-
-        return bool(locked)
+        return self._flock.holder() is not None
 
     def _lock(self) -> None:
         """
@@ -99,19 +137,9 @@ class FSQueue(Queue):
 
         :return: None
         """
-        lock_path = os.path.join(self._queue_path, self.F_LOCK)
-        while True:
-            try:
-                with sugar.utils.files.fopen(lock_path, "rb") as flock:
-                    flock.read()
-                time.sleep(0.1)
-            except Exception:
-                flock = sugar.utils.files.fopen(lock_path, "wb")
-                flock.write(str(os.getpid()).encode("ascii"))
-                flock.flush()
-                os.fsync(flock.fileno())
-                flock.close()
-                break
+        started = time.time()
+        self._flock.acquire()
+        self.stats.lock_wait.observe(time.time() - started)
 
     def _unlock(self) -> None:
         """
@@ -119,10 +147,7 @@ class FSQueue(Queue):
 
         :return: None
         """
-        try:
-            os.unlink(os.path.join(self._queue_path, self.F_LOCK))
-        except FileNotFoundError:
-            pass
+        self._flock.release()
 
     def empty(self) -> bool:
         """
@@ -144,42 +169,35 @@ class FSQueue(Queue):
         """
         Get an object in blocking mode.
 
-        :param force: When set to True, remove existing lock if any.
-        :raises Exception: re-raise any exception, if get() function failed.
+        :param force: When set to True, remove existing lock of a dead process, if any.
         :return: object
         """
-        try:
-            obj = self.__get(wait=True, force=force)
-        except Exception:
-            self._unlock()
-            raise
-
-        return obj
+        return self.__get(wait=True, force=force)
 
     def get_nowait(self, force=False):
         """
         Get an object in non-blocking mode.
 
-        :param force: When set to True, remove existing lock if any.
-        :raises Exception: re-raise any exception, if get() function failed.
+        :param force: When set to True, remove existing lock of a dead process, if any.
+        :raises QueueEmpty: if nothing is in the queue
         :return: object
         """
-        try:
-            obj = self.__get(force=force)
-        except Exception:
-            self._unlock()
-            raise
-
-        return obj
+        return self.__get(force=force)
 
     def __get(self, wait: bool = False, force: bool = False):
         if force:
-            self._unlock()
+            self._flock.break_stale()
 
-        self._lock()
         if wait:
             if self._mp_notify is not None:
                 self._mp_notify.get()
+            elif self._notifier is not None:
+                # Wake up on put. Disk is still checked every poll,
+                # in case something was put without the notification.
+                self._notifier.drain()
+                while not self._f_xlog():
+                    self._notifier.wait(self._poll)
+                    self._notifier.drain()
             else:
                 # Poll the disk
                 while True:
@@ -190,51 +208,113 @@ class FSQueue(Queue):
             if self._mp_notify is not None and not self._mp_notify.empty():
                 self._mp_notify.get_nowait()  # decrease counter
 
-        xlog = self._f_dealloc()
-        if xlog is None:
+        self._lock()
+        try:
+            objs = self._f_take(1)
+        finally:
             self._unlock()
+
+        if not objs:
             raise QueueEmpty("Queue is empty")
 
-        frame_log = os.path.join(self._queue_path, "{}.xlog".format(xlog))
-        h_frm = sugar.utils.files.fopen(frame_log, "rb")
-        obj = self._serialiser.load(h_frm)
-        h_frm.flush()
-        h_frm.close()
-        os.unlink(frame_log)
+        return objs[0]
 
-        self._unlock()
+    def _recover(self) -> None:
+        """
+        Check the queue after a crash. Should be called under the lock.
+        Temporary frames of the unfinished puts are removed and frames,
+        that fail the checksum, are moved to the quarantine. Other files
+        are left as they are.
 
-        return obj
+        :return: None
+        """
+        for fname in os.listdir(self._queue_path):
+            frame_log = os.path.join(self._queue_path, fname)
+            if fname.endswith(".temp"):
+                os.unlink(frame_log)
+                self.stats.orphans.inc()
+            elif self._FRAME.match(fname) and not self._f_check(frame_log):
+                self._f_quarantine(frame_log)
 
-    def _f_xlog(self) -> list:
+    def _f_take(self, maxitems: int) -> list:
         """
-        Return xlog files.
-        :return: list
+        Take objects from the oldest frames. Should be called under the lock.
+        Corrupt frames are moved to the quarantine and skipped.
+
+        :param maxitems: max amount of objects to take
+        :return: list of objects
         """
-        xlog = []
-        for fname in os.listdir(self._queue_path):
-            if fname == self.F_LOCK:
+        objs = []
+        for frame in sorted(self._f_xlog()):
+            if len(objs) >= maxitems:
+                break
+            frame_log = os.path.join(self._queue_path, "{}.xlog".format(str(frame).zfill(self._xpad)))
+            try:
+                objs.append(self._f_load(frame_log))
+            except QueueCorrupt:
+                self._f_quarantine(frame_log)
                 continue
-            xlog.append(int(fname.split(".")[0]))
+            os.unlink(frame_log)
+        self.stats.dequeued.inc(len(objs))
 
-        return xlog
+        return objs
+
+    def _f_check(self, frame_log: str) -> bool:
+        """
+        Check the frame is complete and its checksum matches.
+        Frames of the older version have no checksum and are not checked.
+
+        :param frame_log: path to the xlog frame
+        :return: bool
+        """
+        with sugar.utils.files.fopen(frame_log, "rb") as h_frm:
+            valid = bool(os.fstat(h_frm.fileno()).st_size)
+            if valid:
+                with mmap.mmap(h_frm.fileno(), 0, access=mmap.ACCESS_READ) as m_frm, memoryview(m_frm) as data:
+                    valid = record.verify(data) if record.is_record(data) else True
+
+        return valid
 
-    def _f_dealloc(self) -> str:
+    def _f_quarantine(self, frame_log: str) -> None:
         """
-        Deallocate xlog frame.
+        Move corrupt frame out of the queue.
 
-        :return: name of the previous xlog frame
+        :param frame_log: path to the xlog frame
+        :return: None
+        """
+        quarantine = os.path.join(self._queue_path, self.D_QUARANTINE)
+        os.makedirs(quarantine, exist_ok=True)
+        os.replace(frame_log, os.path.join(quarantine, "{}.{}".format(os.path.basename(frame_log), int(time.time() * 1000))))
+        self.stats.corrupt.inc()
+
+    def _f_load(self, frame_log: str):
+        """
+        Load an object from the xlog frame, mapped to the memory.
+
+        :param frame_log: path to the xlog frame
+        :raises QueueCorrupt: if the frame is corrupt
+        :return: object
         """
-        frn = self._f_xlog()
-        return str(min(frn)).zfill(self._xpad) if frn else None
+        with sugar.utils.files.fopen(frame_log, "rb") as h_frm:
+            if not os.fstat(h_frm.fileno()).st_size:
+                raise QueueCorrupt("Frame {} is empty".format(frame_log))
+            with mmap.mmap(h_frm.fileno(), 0, access=mmap.ACCESS_READ) as m_frm, memoryview(m_frm) as data:
+                return record.decode(data)
 
-    def _f_alloc(self) -> str:
+    def _f_xlog(self) -> list:
         """
-        Allocate next xlog frame.
+        Return numbers of the xlog frames.
+        Lock, temporary frames and any other files are skipped.
 
-        :return: name of the next xlog frame
+        :return: list
         """
-        return str(max(self._f_xlog() + [0]) + 1).zfill(self._xpad)
+        xlog = []
+        for fname in os.listdir(self._queue_path):
+            frame = self._FRAME.match(fname)
+            if frame is not None:
+                xlog.append(int(frame.group(1)))
+
+        return xlog
 
     def put(self, obj) -> None:
         """
@@ -269,19 +349,101 @@ class FSQueue(Queue):
             while self.full():
                 time.sleep(0.01)
 
-        frame = self._f_alloc()
-        xlog_path = os.path.join(self._queue_path, "{}.xlog".format(frame))
-        xlog_path_tmp = "{}.temp".format(xlog_path)
-        h_frm = sugar.utils.files.fopen(xlog_path_tmp, "wb")
-        h_frm.write(self._serialiser.dumps(obj))
-        h_frm.flush()
-        os.fsync(h_frm.fileno())
-        h_frm.close()
-        os.replace(xlog_path_tmp, xlog_path)
-        assert os.path.exists(xlog_path), "Error writing xlog {}".format(xlog_path)
+        self.__write([obj])
+
+    def put_many(self, objs: list) -> None:
+        """
+        Non-blocking put of several objects at once.
+        Frames are allocated once and all objects are written under one lock.
+        In strict mode, frames are synced after all of them are written,
+        and the directory is synced once after they are renamed.
+
+        :param objs: objects to put
+        :raises QueueFull: if not all objects fit into the queue. Nothing is put then.
+        :return: None
+        """
+        objs = list(objs)
+        if objs:
+            self.__write(objs)
+
+    def __write(self, objs: list) -> None:
+        """
+        Write objects to the FS.
+
+        :param objs: objects to write
+        :raises QueueFull: if not all objects fit into the queue
+        :return: None
+        """
+        self._lock()
+        try:
+            xlog = self._f_xlog()
+            if len(xlog) + len(objs) > self._max_size:
+                raise QueueFull("Queue is full")
+
+            frame = max(xlog + [0])
+            frames = []
+            for obj in objs:
+                frame += 1
+                xlog_path = os.path.join(self._queue_path, "{}.xlog".format(str(frame).zfill(self._xpad)))
+                xlog_path_tmp = "{}.temp".format(xlog_path)
+                data = record.encode(obj, self._serialiser)
+                self.stats.payload.observe(len(data))
+                with sugar.utils.files.fopen(xlog_path_tmp, "wb") as h_frm:
+                    h_frm.write(data)
+                frames.append((xlog_path_tmp, xlog_path))
+            if self._sync is None:
+                sync_paths([xlog_path_tmp for xlog_path_tmp, _ in frames], latency=self.stats.fsync)
+            for xlog_path_tmp, xlog_path in frames:
+                os.replace(xlog_path_tmp, xlog_path)
+            if self._sync is None:
+                sync_paths([self._queue_path], latency=self.stats.fsync)  # Renames
+        finally:
+            self._unlock()
+        self.stats.enqueued.inc(len(objs))
+
+        if self._sync is not None:
+            self._sync.add([xlog_path for _, xlog_path in frames])
 
         if self._mp_notify is not None:
-            self._mp_notify.put_nowait(True)
+            for _ in objs:
+                self._mp_notify.put_nowait(True)
+        if self._notifier is not None:
+            self._notifier.notify()
+
+    def get_many(self, maxitems: int, force: bool = False) -> list:
+        """
+        Non-blocking get of several objects at once.
+        Directory is read once and all objects are taken under one lock.
+
+        :param maxitems: max amount of objects to get
+        :param force: When set to True, remove existing lock of a dead process, if any.
+        :return: list of objects, empty if nothing is in the queue
+        """
+        if force:
+            self._flock.break_stale()
+
+        self._lock()
+        try:
+            objs = self._f_take(maxitems)
+        finally:
+            self._unlock()
+
+        if self._mp_notify is not None:
+            for _ in objs:
+                if self._mp_notify.empty():
+                    break
+                self._mp_notify.get_nowait()  # decrease counter
+
+        return objs
+
+    def flush(self) -> None:
+        """
+        Sync written items to the disk now.
+
+        :return: None
+        """
+        if self._sync is not None:
+            self._sync.sync()
 
     def qsize(self) -> int:
         """
@@ -293,8 +455,14 @@ class FSQueue(Queue):
 
     def pending(self) -> bool:
         """
-        Returns True if anything is in the notification layer.
+        Returns True if nothing is in the notification layer.
+        Without the counting notification, the store is checked.
 
         :return: bool
         """
-        return self._mp_notify.empty()
+        if self._mp_notify is not None:
+            pending = self._mp_notify.empty()
+        else:
+            pending = self.empty()
+
+        return pending
@@ -0,0 +1,294 @@
+# coding: utf-8
+"""
+Multi-lane queue.
+
+Several queues ("lanes") behind one queue interface. Producer chooses
+a lane per put, e.g. by priority or by the kind of the item. Consumer
+gets from all the lanes by smooth weighted round-robin: a lane with
+weight 4 gives four items per one item of a lane with weight 1, as long
+as both have any, and no lane is starved. Empty lanes do not take
+their share, so a single busy lane gets everything.
+
+Lanes share one notifier, so a consumer wakes up on put to any of them.
+"""
+import time
+import typing
+
+from sugar.lib.perq.queue import Queue
+from sugar.lib.perq.notify import Notifier
+from sugar.lib.perq.qexc import QueueEmpty
+
+
+class LaneQueue(Queue):
+    """
+    Queue of weighted lanes.
+    """
+    POLL = 5  # Poll seconds, if notification is not used
+
+    def __init__(self, lanes: typing.Sequence[typing.Tuple[str, Queue, int]], default: str = None, poll: int = POLL):
+        """
+        Constructor.
+
+        :param lanes: sequence of (name, queue, weight). Ties are given to the lanes in this order.
+        :param default: name of the lane for the puts without one. Default is the first lane.
+        :param poll: seconds to re-check the lanes in blocking get
+        :raises ValueError: if lanes are empty, duplicate, have no positive weight or default is unknown
+        """
+        if not lanes:
+            raise ValueError("Queue should have at least one lane")
+        self._lanes = []
+        self._queues = {}
+        self._weights = {}
+        for name, queue, weight in lanes:
+            if name in self._queues:
+                raise ValueError("Duplicate lane: {}".format(name))
+            if weight < 1:
+                raise ValueError("Weight of the lane '{}' should be positive".format(name))
+            self._lanes.append(name)
+            self._queues[name] = queue
+            self._weights[name] = weight
+        self._default = self._lanes[0] if default is None else default
+        if self._default not in self._queues:
+            raise ValueError("Unknown default lane: {}".format(self._default))
+        self._credits = dict.fromkeys(self._lanes, 0)
+        self._notifier = None
+        self._poll = poll
+
+    @property
+    def lanes(self) -> list:
+        """
+        Names of the lanes.
+
+        :return: list of names
+        """
+        return list(self._lanes)
+
+    def lane(self, name: str = None) -> Queue:
+        """
+        Queue of the lane.
+
+        :param name: name of the lane. Default lane if None.
+        :raises KeyError: if lane is unknown
+        :return: Queue
+        """
+        name = self._default if name is None else name
+        if name not in self._queues:
+            raise KeyError("Unknown lane: {}".format(name))
+        return self._queues[name]
+
+    def use_msgpack(self, use=False) -> Queue:
+        """
+        Set use msgpack instead of pickle in all lanes.
+
+        :param use: boolean, used to turn on/off msgpack usage. Default is pickle.
+        :return: Queue
+        """
+        for name in self._lanes:
+            self._queues[name].use_msgpack(use)
+        return self
+
+    def use_notify(self, queue=None) -> Queue:
+        """
+        Use one notifier for all lanes.
+
+        :param queue: notifier to share. Default: new notifier.
+        :raises ValueError: if anything but notifier is passed
+        :return: Queue
+        """
+        if queue is not None and not isinstance(queue, Notifier):
+            raise ValueError("Lanes can share only the notifier")
+        self._notifier = queue or Notifier()
+        for name in self._lanes:
+            self._queues[name].use_notify(self._notifier)
+        return self
+
+    @property
+    def notifier(self) -> Notifier:
+        """
+        Notifier of the lanes, if notification is used.
+
+        :return: Notifier or None
+        """
+        return self._notifier
+
+    def depths(self) -> dict:
+        """
+        Amount of items in every lane.
+
+        :return: dictionary of lane names to their sizes
+        """
+        return {name: self._queues[name].qsize() for name in self._lanes}
+
+    def get_stats(self) -> dict:
+        """
+        Get metrics of all lanes.
+
+        :return: dictionary of the total depth and metrics of every lane
+        """
+        lanes = {name: self._queues[name].get_stats() for name in self._lanes}
+        return {
+            "depth": sum(stats["depth"] for stats in lanes.values()),
+            "lanes": lanes,
+        }
+
+    def pending(self) -> bool:
+        """
+        Returns True if nothing is pending in any lane.
+
+        :return: bool
+        """
+        return all(self._queues[name].pending() for name in self._lanes)
+
+    def empty(self) -> bool:
+        """
+        Returns True if all lanes are empty.
+
+        :return: bool
+        """
+        return all(self._queues[name].empty() for name in self._lanes)
+
+    def full(self, lane: str = None) -> bool:
+        """
+        Returns True if the lane is full.
+
+        :param lane: name of the lane. Default lane if None.
+        :return: bool
+        """
+        return self.lane(lane).full()
+
+    def get(self, force=False):
+        """
+        Get an object in blocking mode.
+
+        :param force: When set to True, remove existing locks of a dead process, if any.
+        :return: object
+        """
+        while True:
+            objs = self.get_many(1, force=force)
+            if objs:
+                return objs[0]
+            force = False
+            if self._notifier is not None:
+                self._notifier.wait(self._poll)
+                self._notifier.drain()
+            else:
+                time.sleep(self._poll)
+
+    def get_nowait(self, force=False):
+        """
+        Get an object in non-blocking mode.
+
+        :param force: When set to True, remove existing locks of a dead process, if any.
+        :raises QueueEmpty: if all lanes are empty
+        :return: object
+        """
+        objs = self.get_many(1, force=force)
+        if not objs:
+            raise QueueEmpty("Queue is empty")
+        return objs[0]
+
+    def get_many(self, maxitems: int, force: bool = False) -> list:
+        """
+        Non-blocking get of several objects from the lanes, by their weights.
+
+        Shares of the lanes are scheduled first, then every lane is read
+        at once for its share. Share of a lane, that has not enough items,
+        is given to the other lanes.
+
+        :param maxitems: max amount of objects to get
+        :param force: When set to True, remove existing locks of a dead process, if any.
+        :return: list of objects, empty if all lanes are empty
+        """
+        objs = []
+        active = list(self._lanes)
+        while active and len(objs) < maxitems:
+            shares = self._schedule(active, maxitems - len(objs))
+            for name in list(active):
+                if not shares.get(name):
+                    continue
+                items = self._queues[name].get_many(shares[name], force=force)
+                if len(items) < shares[name]:
+                    active.remove(name)
+                    self._credits[name] = 0  # Idle lane does not save up
+                objs.extend(items)
+            force = False
+
+        return objs
+
+    def _schedule(self, active: list, amount: int) -> dict:
+        """
+        Schedule shares of the lanes by smooth weighted round-robin.
+        Credits are kept between the calls, so small batches are fair too.
+
+        :param active: names of the lanes to schedule
+        :param amount: amount of items to schedule
+        :return: dictionary of lane names to their shares
+        """
+        total = sum(self._weights[name] for name in active)
+        shares = {}
+        for _ in range(amount):
+            for name in active:
+                self._credits[name] += self._weights[name]
+            name = max(active, key=self._credits.get)
+            self._credits[name] -= total
+            shares[name] = shares.get(name, 0) + 1
+
+        return shares
+
+    def put(self, obj, lane: str = None) -> None:
+        """
+        Blocking put.
+
+        :param obj: object to put
+        :param lane: name of the lane. Default lane if None.
+        :return: None
+        """
+        self.lane(lane).put(obj)
+
+    def put_nowait(self, obj, lane: str = None) -> None:
+        """
+        Non-blocking put.
+
+        :param obj: object to put
+        :param lane: name of the lane. Default lane if None.
+        :return: None
+        """
+        self.lane(lane).put_nowait(obj)
+
+    def put_many(self, objs: list, lane: str = None) -> None:
+        """
+        Put several objects at once to one lane.
+
+        :param objs: objects to put
+        :param lane: name of the lane. Default lane if None.
+        :return: None
+        """
+        self.lane(lane).put_many(objs)
+
+    def flush(self) -> None:
+        """
+        Sync written items of all lanes to the disk now.
+
+        :return: None
+        """
+        for name in self._lanes:
+            self._queues[name].flush()
+
+    def qsize(self) -> int:
+        """
+        Return amount of items in all lanes.
+
+        :return: int
+        """
+        return sum(self.depths().values())
+
+    def close(self) -> None:
+        """
+        Close lanes, that need closing.
+
+        :return: None
+        """
+        for name in self._lanes:
+            close = getattr(self._queues[name], "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,196 @@
+# coding: utf-8
+"""
+Memory queue.
+
+Queue without the disk storage, for the data which is not worth
+keeping over restarts. It has the same interface as the disk queues
+and is shared with the processes, forked after it was created.
+"""
+import multiprocessing
+
+from sugar.lib.perq.queue import Queue
+from sugar.lib.perq.notify import Notifier
+from sugar.lib.perq.qexc import QueueEmpty, QueueFull
+from sugar.lib.perq.qstats import QueueStats
+
+
+class MemoryQueue(Queue):
+    """
+    Process-shared memory queue.
+
+    Items are transferred by "multiprocessing.Queue". Amount of the
+    items is counted by a semaphore, which is released only after the
+    item is put, so once the semaphore is taken, the item is there.
+    """
+    MAX_SIZE = 0xfff  # Default max size of the queue
+
+    def __init__(self, maxsize: int = MAX_SIZE):
+        self._max_size = maxsize
+        self._queue = multiprocessing.Queue()
+        self._items = multiprocessing.Semaphore(0)
+        self._size = multiprocessing.Value("i", 0)
+        self._notifier = None
+        self.stats = QueueStats()
+
+    def use_msgpack(self, use=False) -> Queue:  # pylint: disable=W0613
+        """
+        Objects are always pickled. Kept for the compatibility with the disk queues.
+
+        :param use: not used
+        :return: Queue
+        """
+        return self
+
+    def use_notify(self, queue=None) -> Queue:
+        """
+        Getting is always notified. Notifier, if passed, is notified
+        on every put too, e.g. when it is shared with the disk queues.
+
+        :param queue: notifier to share. Anything else is not used.
+        :return: Queue
+        """
+        if isinstance(queue, Notifier):
+            self._notifier = queue
+        return self
+
+    @property
+    def notifier(self) -> Notifier:
+        """
+        Shared notifier, if any.
+
+        :return: Notifier or None
+        """
+        return self._notifier
+
+    def get_stats(self) -> dict:
+        """
+        Get queue metrics. Nothing is locked, synced or serialised here,
+        so only the depth and the rates are counted.
+
+        :return: dictionary of the depth and the rates
+        """
+        return self.stats.to_dict(self.qsize())
+
+    def empty(self) -> bool:
+        """
+        Returns True if queue is empty.
+
+        :return: True if Queue is empty
+        """
+        return bool(not self.qsize())
+
+    def full(self) -> bool:
+        """
+        Returns True if queue is full.
+
+        :return: True if queue is full.
+        """
+        return bool(self.qsize() >= self._max_size)
+
+    def get(self, force=False):  # pylint: disable=W0613
+        """
+        Get an object in blocking mode.
+
+        :param force: not used, as there is no lock on the disk
+        :return: object
+        """
+        self._items.acquire()
+        return self.__take()
+
+    def get_nowait(self, force=False):  # pylint: disable=W0613
+        """
+        Get an object in non-blocking mode.
+
+        :param force: not used, as there is no lock on the disk
+        :raises QueueEmpty: if nothing is in the queue
+        :return: object
+        """
+        if not self._items.acquire(False):
+            raise QueueEmpty("Queue is empty")
+        return self.__take()
+
+    def get_many(self, maxitems: int, force: bool = False) -> list:  # pylint: disable=W0613
+        """
+        Non-blocking get of several objects at once.
+
+        :param maxitems: max amount of objects to get
+        :param force: not used, as there is no lock on the disk
+        :return: list of objects, empty if nothing is in the queue
+        """
+        objs = []
+        while len(objs) < maxitems and self._items.acquire(False):
+            objs.append(self.__take())
+        return objs
+
+    def __take(self):
+        """
+        Take an object, which is already counted.
+
+        :return: object
+        """
+        obj = self._queue.get()
+        with self._size.get_lock():
+            self._size.value -= 1
+        self.stats.dequeued.inc()
+        return obj
+
+    def put(self, obj) -> None:
+        """
+        Blocking put.
+
+        :param obj: object to put
+        :return: None
+        """
+        self.put_many([obj])
+
+    def put_nowait(self, obj) -> None:
+        """
+        Non-blocking put.
+
+        :param obj: object to put
+        :return: None
+        """
+        self.put_many([obj])
+
+    def put_many(self, objs: list) -> None:
+        """
+        Put several objects at once.
+
+        :param objs: objects to put
+        :raises QueueFull: if not all objects fit into the queue. Nothing is put then.
+        :return: None
+        """
+        objs = list(objs)
+        with self._size.get_lock():
+            if self._size.value + len(objs) > self._max_size:
+                raise QueueFull("Queue is full")
+            self._size.value += len(objs)
+        for obj in objs:
+            self._queue.put(obj)
+            self._items.release()
+        self.stats.enqueued.inc(len(objs))
+        if self._notifier is not None:
+            self._notifier.notify()
+
+    def flush(self) -> None:
+        """
+        Nothing to sync.
+
+        :return: None
+        """
+
+    def qsize(self) -> int:
+        """
+        Return queue size.
+
+        :return: int, size of the Queue
+        """
+        return self._size.value
+
+    def pending(self) -> bool:
+        """
+        Returns True if nothing is pending, the same way as the notification layer of the disk queues.
+
+        :return: bool
+        """
+        return self.empty()
@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Notification of the queue consumers.
+
+Notifier is a file descriptor, which becomes readable when anything
+was put into the queue: eventfd where available, otherwise a pipe.
+It is created before the fork and shared with the child processes,
+so a consumer sleeps in select() or in the reactor and wakes
+immediately on put, without polling the disk.
+
+Notification only tells that the queue has changed. Consumer drains
+the notifier first and then takes everything there is in the queue,
+so no put is missed even if notifications were merged.
+"""
+import os
+import select
+import typing
+
+from zope.interface import implementer
+from twisted.internet.interfaces import IReadDescriptor
+
+
+class Notifier:
+    """
+    Cross-process notifier on eventfd or pipe.
+    """
+    def __init__(self):
+        self._eventfd = hasattr(os, "eventfd")
+        if self._eventfd:
+            self._rfd = self._wfd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)  # pylint: disable=E1101
+        else:
+            self._rfd, self._wfd = os.pipe()
+            os.set_blocking(self._rfd, False)
+            os.set_blocking(self._wfd, False)
+
+    def fileno(self) -> int:
+        """
+        File descriptor, readable when notified.
+
+        :return: file descriptor
+        """
+        return self._rfd
+
+    def notify(self) -> None:
+        """
+        Wake the consumers.
+
+        :return: None
+        """
+        try:
+            if self._eventfd:
+                os.eventfd_write(self._wfd, 1)  # pylint: disable=E1101
+            else:
+                os.write(self._wfd, b"\0")
+        except BlockingIOError:
+            pass  # Pipe is full: consumers are notified already
+
+    def drain(self) -> int:
+        """
+        Reset the notifier.
+
+        :return: amount of notifications since the last drain
+        """
+        count = 0
+        try:
+            if self._eventfd:
+                count = os.eventfd_read(self._rfd)  # pylint: disable=E1101
+            else:
+                while True:
+                    data = os.read(self._rfd, 0x1000)
+                    if not data:
+                        break
+                    count += len(data)
+        except BlockingIOError:
+            pass
+
+        return count
+
+    def wait(self, timeout: typing.Optional[float] = None) -> bool:
+        """
+        Wait for a notification.
+
+        :param timeout: seconds to wait. None waits forever.
+        :return: True if notified
+        """
+        readable, _, _ = select.select([self._rfd], [], [], timeout)
+        return bool(readable)
+
+    def close(self) -> None:
+        """
+        Close the notifier.
+
+        :return: None
+        """
+        for fd in {self._rfd, self._wfd}:
+            os.close(fd)
+
+
+@implementer(IReadDescriptor)
+class NotifyReader:
+    """
+    Reactor reader of the queue notifications.
+
+    Usage:
+
+        reactor.addReader(NotifyReader(queue.notifier, on_put))
+    """
+    def __init__(self, notifier: Notifier, callback: typing.Callable):
+        """
+        Constructor.
+
+        :param notifier: notifier of the queue
+        :param callback: callable, called in the reactor thread after the queue has changed
+        """
+        self.notifier = notifier
+        self.callback = callback
+
+    def fileno(self) -> int:
+        """
+        File descriptor of the notifier.
+
+        :return: file descriptor
+        """
+        return self.notifier.fileno()
+
+    def doRead(self) -> None:  # pylint: disable=C0103
+        """
+        Notifier is readable: drain it and call back.
+
+        :return: None
+        """
+        self.notifier.drain()
+        self.callback()
+
+    def connectionLost(self, reason) -> None:  # pylint: disable=C0103,W0613
+        """
+        Reader is removed from the reactor.
+
+        :param reason: failure
+        :return: None
+        """
+
+    def logPrefix(self) -> str:  # pylint: disable=C0103
+        """
+        Prefix of the reactor log messages.
+
+        :return: str
+        """
+        return self.__class__.__name__
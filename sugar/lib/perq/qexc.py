@@ -14,3 +14,9 @@ class QueueFull(Exception):
     """
     Queue is full
     """
+
+
+class QueueCorrupt(Exception):
+    """
+    Queue item is corrupt
+    """
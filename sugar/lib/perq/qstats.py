@@ -0,0 +1,67 @@
+# coding: utf-8
+"""
+Metrics of the persistent queues.
+
+Counters and histograms are collected by the current process: producer
+sees the puts and consumer sees the gets. Depth is read from the store,
+so it is the same in every process.
+"""
+import time
+import threading
+
+from sugar.lib.metrics import Counter, Histogram
+
+
+class QueueStats:
+    """
+    Queue metrics.
+    """
+    PAYLOAD_BUCKETS = (0x40, 0x100, 0x400, 0x1000, 0x4000, 0x10000, 0x100000)  # Bytes
+
+    def __init__(self):
+        self.enqueued = Counter()
+        self.dequeued = Counter()
+        self.corrupt = Counter()    # Items, moved to the quarantine
+        self.orphans = Counter()    # Removed leftovers of the unfinished puts
+        self.lock_wait = Histogram()
+        self.fsync = Histogram()
+        self.payload = Histogram(buckets=self.PAYLOAD_BUCKETS)
+        self.__mark = (time.time(), 0, 0)
+        self.__lock = threading.Lock()
+
+    def get_rates(self) -> tuple:
+        """
+        Get enqueue and dequeue rates since the previous call.
+
+        :return: tuple of items per second put and taken
+        """
+        now, enqueued, dequeued = time.time(), self.enqueued.value, self.dequeued.value
+        with self.__lock:
+            (then, p_enqueued, p_dequeued), self.__mark = self.__mark, (now, enqueued, dequeued)
+        elapsed = now - then
+        rates = 0, 0
+        if elapsed > 0:
+            rates = (enqueued - p_enqueued) / elapsed, (dequeued - p_dequeued) / elapsed
+
+        return rates
+
+    def to_dict(self, depth: int) -> dict:
+        """
+        Export metrics.
+
+        :param depth: amount of items in the queue
+        :return: dictionary of the depth, counters, rates and histograms
+        """
+        enqueue_rate, dequeue_rate = self.get_rates()
+        return {
+            "depth": depth,
+            "enqueued": self.enqueued.value,
+            "dequeued": self.dequeued.value,
+            "enqueue_rate": enqueue_rate,
+            "dequeue_rate": dequeue_rate,
+            "corrupt": self.corrupt.value,
+            "orphans": self.orphans.value,
+            "lock_wait": self.lock_wait.to_dict(),
+            "fsync": self.fsync.to_dict(),
+            "payload": self.payload.to_dict(),
+        }
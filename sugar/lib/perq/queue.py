@@ -13,7 +13,7 @@ class Queue(abc.ABC):
     @abc.abstractmethod
     def pending(self) -> bool:
         """
-        Returns True if anything is in the notification layer.
+        Returns True if nothing is in the notification layer.
 
         :return: bool
         """
@@ -70,6 +70,33 @@ class Queue(abc.ABC):
         :return: None
         """
 
+    @abc.abstractmethod
+    def get_many(self, maxitems: int, force: bool):
+        """
+        Non-blocking get of several objects at once.
+
+        :param maxitems: max amount of objects to get
+        :param force: force lock removal
+        :return: list of objects, empty if nothing is in the queue
+        """
+
+    @abc.abstractmethod
+    def put_many(self, objs: list) -> None:
+        """
+        Non-blocking put of several objects at once.
+
+        :param objs: objects to put
+        :return: None
+        """
+
+    @abc.abstractmethod
+    def flush(self) -> None:
+        """
+        Sync written objects to the storage now.
+
+        :return: None
+        """
+
     @abc.abstractmethod
     def qsize(self) -> int:
         """
@@ -0,0 +1,145 @@
+# coding: utf-8
+"""
+Record format of the queue items.
+
+    magic (2 bytes) | codec (1 byte) | crc32 (4 bytes) | length (4 bytes) | payload
+
+Payload is stored once: bytes are stored as they are, other objects
+are serialised with pickle or msgpack. Records are decoded from the
+memoryview of the mapped file, so payload is not copied before it
+is deserialised.
+"""
+import zlib
+import pickle
+import struct
+import typing
+
+from sugar.lib.perq.qexc import QueueCorrupt
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b"\xa5\x51"
+HEADER = struct.Struct("!2sBII")
+
+CODEC_RAW = 0
+CODEC_PICKLE = 1
+CODEC_MSGPACK = 2
+
+
+def encode(obj, serialiser=pickle) -> bytes:
+    """
+    Encode object to the record.
+
+    :param obj: object
+    :param serialiser: pickle or msgpack, for the objects other than bytes.
+                       Objects, which msgpack cannot serialise, are pickled.
+    :return: record
+    """
+    if isinstance(obj, bytes):
+        codec, payload = CODEC_RAW, obj
+    else:
+        codec, payload = CODEC_PICKLE, None
+        if msgpack is not None and serialiser is msgpack:
+            try:
+                codec, payload = CODEC_MSGPACK, msgpack.packb(obj, use_bin_type=True)
+            except TypeError:
+                codec = CODEC_PICKLE  # Not a msgpack type inside
+        if codec == CODEC_PICKLE:
+            payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return HEADER.pack(MAGIC, codec, zlib.crc32(payload), len(payload)) + payload
+
+
+def is_record(data: typing.Union[bytes, memoryview]) -> bool:
+    """
+    Check if data starts with the record header.
+
+    :param data: data
+    :return: bool
+    """
+    return len(data) >= HEADER.size and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def get_size(header: typing.Union[bytes, memoryview]) -> int:
+    """
+    Get size of the whole record from its header.
+
+    :param header: at least header of the record
+    :raises QueueCorrupt: if there is no record header
+    :return: size in bytes
+    """
+    if not is_record(header):
+        raise QueueCorrupt("Record header not found")
+    return HEADER.size + HEADER.unpack_from(header)[3]
+
+
+def verify(data: typing.Union[bytes, memoryview]) -> bool:
+    """
+    Verify the record is complete and its checksum matches.
+
+    :param data: record
+    :return: bool
+    """
+    valid = is_record(data)
+    if valid:
+        _, _, crc, length = HEADER.unpack_from(data)
+        valid = len(data) >= HEADER.size + length
+        if valid:
+            with memoryview(data)[HEADER.size:HEADER.size + length] as payload:
+                valid = zlib.crc32(payload) == crc
+
+    return valid
+
+
+def decode(data: typing.Union[bytes, memoryview], legacy=pickle):
+    """
+    Decode record to the object.
+
+    Data without the record header is an item of the older FSQueue
+    and is loaded as a whole.
+
+    :param data: record
+    :param legacy: loader of the data without the record header
+    :raises QueueCorrupt: if record is incomplete or checksum does not match
+    :return: object
+    """
+    if is_record(data):
+        obj = _decode_record(data)
+    elif len(data):
+        obj = legacy.loads(data)
+    else:
+        raise QueueCorrupt("Record is empty")
+
+    return obj
+
+
+def _decode_record(data: typing.Union[bytes, memoryview]):
+    """
+    Decode record with the header to the object.
+
+    :param data: record
+    :raises QueueCorrupt: if record is incomplete or checksum does not match
+    :return: object
+    """
+    _, codec, crc, length = HEADER.unpack_from(data)
+    if len(data) < HEADER.size + length:
+        raise QueueCorrupt("Record is incomplete: {} of {} bytes".format(len(data) - HEADER.size, length))
+
+    with memoryview(data)[HEADER.size:HEADER.size + length] as payload:
+        if zlib.crc32(payload) != crc:
+            raise QueueCorrupt("Record checksum mismatch")
+        if codec == CODEC_RAW:
+            obj = bytes(payload)
+        elif codec == CODEC_MSGPACK:
+            if msgpack is None:
+                raise QueueCorrupt("Record is encoded with msgpack, which is not installed")
+            obj = msgpack.unpackb(payload, raw=False)
+        elif codec == CODEC_PICKLE:
+            obj = pickle.loads(payload)
+        else:
+            raise QueueCorrupt("Unknown record codec: {}".format(codec))
+
+    return obj
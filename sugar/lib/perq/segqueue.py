@@ -0,0 +1,592 @@
+# coding: utf-8
+"""
+Segmented file-system queue.
+
+Items are appended as records (see "record" module) to segment files.
+A small index file keeps the head (next record to get), the tail
+(next record to put) and the amount of items, so put, get and qsize
+do not list the directory. When the tail segment is full, a next one
+is started. Consumed segments are removed.
+
+Layout of the queue directory:
+
+    index               head segment, head offset, tail segment, tail offset, count
+    0000000000000000    segment: [header][payload][header][payload]...
+    0000000000000001
+    ...
+"""
+import os
+import mmap
+import time
+import errno
+import pickle
+import struct
+
+from sugar.lib.perq.queue import Queue
+from sugar.lib.perq.durability import Durability, GroupSync
+from sugar.lib.perq.notify import Notifier
+from sugar.lib.perq.qexc import QueueEmpty, QueueFull, QueueCorrupt
+from sugar.lib.perq.qstats import QueueStats
+from sugar.lib.perq import record
+import sugar.utils.files
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class SegmentedQueue(Queue):
+    """
+    Segmented append-only file-system queue.
+    """
+    F_LOCK = ".lock"           # Lock file
+    F_INDEX = "index"          # Head/tail index file
+    F_SEGMENT = "{:016x}"      # Segment file
+    D_QUARANTINE = ".quarantine"  # Directory of the corrupt records
+    MAX_SIZE = 0xfff           # Default max size of the queue
+    SEGMENT_SIZE = 0x400000    # Default size of the segment to rotate (4 MiB)
+    POLL = 5                   # Poll seconds
+
+    _INDEX = struct.Struct("!QQQQQ")
+
+    def __init__(self, path, maxsize: int = MAX_SIZE, poll: int = POLL, segment_size: int = SEGMENT_SIZE,
+                 durability: str = Durability.STRICT, sync_interval: float = GroupSync.INTERVAL):
+        Durability.validate(durability)
+        self._queue_path = path
+        self._max_size = maxsize
+        self._segment_size = segment_size
+        self._serialiser = pickle
+        self._mp_notify = None
+        self._notifier = None
+        self._poll = poll
+        self.stats = QueueStats()
+        self._sync = GroupSync(sync_interval, latency=self.stats.fsync) if durability == Durability.BATCH else None
+        self._segments = {}
+        self._maps = {}
+
+        try:
+            os.makedirs(self._queue_path)
+        except (OSError, IOError) as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+        self._flock = sugar.utils.files.FileLock(os.path.join(self._queue_path, self.F_LOCK))
+        self._index = os.open(os.path.join(self._queue_path, self.F_INDEX), os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock()
+        try:
+            self._recover()
+        finally:
+            self._unlock()
+
+    def use_msgpack(self, use=False) -> Queue:
+        """
+        Set use msgpack instead of pickle.
+
+        :param use: boolean, used to turn on/off msgpack usage. Default is pickle.
+        :return: Queue
+        """
+        self._serialiser = msgpack if msgpack is not None and use else pickle
+        return self
+
+    def use_notify(self, queue=None) -> Queue:
+        """
+        Use queue notification between multi processes.
+        See FSQueue.use_notify for the details.
+
+        :param queue: commonly shared multiprocessing.Queue object, or notifier to share. Default: new notifier.
+        :return: Queue
+        """
+        if queue is None:
+            self._notifier = Notifier()
+        elif isinstance(queue, Notifier):
+            self._notifier = queue
+        else:
+            self._mp_notify = queue
+        return self
+
+    @property
+    def notifier(self) -> Notifier:
+        """
+        Notifier of the queue, if notification is used.
+
+        :return: Notifier or None
+        """
+        return self._notifier
+
+    def get_stats(self) -> dict:
+        """
+        Get queue metrics.
+
+        :return: dictionary of the depth, rates, lock wait, fsync latency and payload sizes
+        """
+        return self.stats.to_dict(self.qsize())
+
+    def _lock(self) -> None:
+        """
+        Lock mutex of the FS
+
+        :return: None
+        """
+        started = time.time()
+        self._flock.acquire()
+        self.stats.lock_wait.observe(time.time() - started)
+
+    def _unlock(self) -> None:
+        """
+        Unlock mutex of the FS.
+
+        :return: None
+        """
+        self._flock.release()
+
+    def _read_index(self) -> list:
+        """
+        Read index of the queue.
+
+        :return: list of head segment, head offset, tail segment, tail offset and count
+        """
+        data = os.pread(self._index, self._INDEX.size, 0)
+        return list(self._INDEX.unpack(data)) if len(data) == self._INDEX.size else [0, 0, 0, 0, 0]
+
+    def _write_index(self, index: list) -> None:
+        """
+        Write index of the queue. Index is smaller than a disk sector,
+        so it is written at once.
+
+        :param index: head segment, head offset, tail segment, tail offset and count
+        :return: None
+        """
+        os.pwrite(self._index, self._INDEX.pack(*index), 0)
+
+    def _segment(self, number: int) -> int:
+        """
+        Get descriptor of the segment file.
+
+        :param number: number of the segment
+        :return: file descriptor
+        """
+        fd = self._segments.get(number)
+        if fd is None:
+            fd = self._segments[number] = os.open(os.path.join(self._queue_path, self.F_SEGMENT.format(number)),
+                                                  os.O_RDWR | os.O_CREAT, 0o600)
+        return fd
+
+    def _map(self, number: int, end: int) -> mmap.mmap:
+        """
+        Map the segment to the memory for reading.
+        Segment is mapped again, if it has grown since.
+
+        :param number: number of the segment
+        :param end: offset, which should be mapped
+        :return: mmap
+        """
+        m_seg = self._maps.get(number)
+        if m_seg is None or len(m_seg) < end:
+            self._unmap(number)
+            m_seg = self._maps[number] = mmap.mmap(self._segment(number), 0, access=mmap.ACCESS_READ)
+        return m_seg
+
+    def _unmap(self, number: int) -> None:
+        """
+        Unmap the segment.
+
+        :param number: number of the segment
+        :return: None
+        """
+        m_seg = self._maps.pop(number, None)
+        if m_seg is not None:
+            m_seg.close()
+
+    def _drop_segment(self, number: int) -> None:
+        """
+        Close and remove consumed segment.
+
+        :param number: number of the segment
+        :return: None
+        """
+        self._unmap(number)
+        fd = self._segments.pop(number, None)
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.unlink(os.path.join(self._queue_path, self.F_SEGMENT.format(number)))
+        except FileNotFoundError:
+            pass
+
+    def _recover(self) -> None:
+        """
+        Bring index in sync with the segments after a crash.
+
+        Records are verified from the head on, and the queue ends at the
+        last valid record. Records, written after the index, are taken
+        into the queue. If the index points past the real data (it is not
+        synced before the segments in the batch mode), the queue is cut to
+        what is on the disk. Incomplete or corrupt record and everything
+        after it are truncated, and segments outside of the head and the
+        tail are removed.
+
+        :return: None
+        """
+        index = self._read_index()
+        head, offset, tail, _, _ = index
+        offset = min(offset, os.fstat(self._segment(head)).st_size)
+        head_offset, count, number = offset, 0, head
+        while True:
+            fd = self._segment(number)
+            size = os.fstat(fd).st_size
+            offset, records = self._scan(fd, offset, size)
+            count += records
+            if offset < size:
+                os.ftruncate(fd, offset)
+            if offset < size or number >= tail or not os.path.exists(
+                    os.path.join(self._queue_path, self.F_SEGMENT.format(number + 1))):
+                break
+            if number != head:
+                os.close(self._segments.pop(number))  # Complete segment is not read until it is the head
+            number, offset = number + 1, 0
+
+        recovered = [head, head_offset, number, offset, count]
+        if recovered != index:
+            self._write_index(recovered)
+
+        for fname in os.listdir(self._queue_path):
+            try:
+                segment = int(fname, 16)
+            except ValueError:
+                continue
+            if segment < head or segment > number:  # Consumed, written after the index or cut off
+                self._drop_segment(segment)
+
+    @staticmethod
+    def _scan(fd: int, offset: int, size: int) -> tuple:
+        """
+        Find the end of the valid records in the segment.
+
+        :param fd: file descriptor of the segment
+        :param offset: offset of the first record
+        :param size: size of the segment
+        :return: tuple of the offset after the last valid record and amount of the records
+        """
+        records = 0
+        while offset + record.HEADER.size <= size:
+            try:
+                length = record.get_size(os.pread(fd, record.HEADER.size, offset))
+            except QueueCorrupt:
+                break
+            if offset + length > size or not record.verify(os.pread(fd, length, offset)):
+                break
+            offset += length
+            records += 1
+
+        return offset, records
+
+    def empty(self) -> bool:
+        """
+        Returns True if queue is empty.
+
+        :return: True if Queue is empty
+        """
+        return bool(not self.qsize())
+
+    def full(self) -> bool:
+        """
+        Returns True if queue is full.
+
+        :return: True if queue is full.
+        """
+        return bool(self.qsize() >= self._max_size)
+
+    def get(self, force=False):
+        """
+        Get an object in blocking mode.
+
+        :param force: When set to True, remove existing lock of a dead process, if any.
+        :return: object
+        """
+        return self.__get(wait=True, force=force)
+
+    def get_nowait(self, force=False):
+        """
+        Get an object in non-blocking mode.
+
+        :param force: When set to True, remove existing lock of a dead process, if any.
+        :return: object
+        """
+        return self.__get(force=force)
+
+    def __get(self, wait: bool = False, force: bool = False):
+        if force:
+            self._flock.break_stale()
+
+        if wait:
+            if self._mp_notify is not None:
+                self._mp_notify.get()
+            elif self._notifier is not None:
+                # Wake up on put. Disk is still checked every poll,
+                # in case something was put without the notification.
+                self._notifier.drain()
+                while self.empty():
+                    self._notifier.wait(self._poll)
+                    self._notifier.drain()
+            else:
+                # Poll the index
+                while self.empty():
+                    time.sleep(self._poll)
+        else:
+            if self._mp_notify is not None and not self._mp_notify.empty():
+                self._mp_notify.get_nowait()  # decrease counter
+
+        self._lock()
+        try:
+            data = self._pop(1)
+        finally:
+            self._unlock()
+
+        if not data:
+            raise QueueEmpty("Queue is empty")
+
+        return data[0]
+
+    def get_many(self, maxitems: int, force: bool = False) -> list:
+        """
+        Non-blocking get of several objects at once.
+        Index is read and written once for all the objects.
+
+        :param maxitems: max amount of objects to get
+        :param force: When set to True, remove existing lock of a dead process, if any.
+        :return: list of objects, empty if nothing is in the queue
+        """
+        if force:
+            self._flock.break_stale()
+
+        self._lock()
+        try:
+            data = self._pop(maxitems)
+        finally:
+            self._unlock()
+
+        if self._mp_notify is not None:
+            for _ in data:
+                if self._mp_notify.empty():
+                    break
+                self._mp_notify.get_nowait()  # decrease counter
+
+        return data
+
+    def _pop(self, maxitems: int) -> list:
+        """
+        Take objects from the head. Records are decoded from the mapped segment.
+        Complete records, that fail the checksum, are copied to the quarantine and skipped.
+
+        :param maxitems: max amount of objects
+        :raises QueueCorrupt: if a record header is corrupt, so the next record cannot be found
+        :return: objects
+        """
+        index = self._read_index()
+        head, offset, tail, _, count = index
+        data = []
+        taken = 0
+        while len(data) < maxitems and taken < count:
+            head, offset = self._advance(head, offset, tail)
+            m_seg = self._map(head, offset + record.HEADER.size)
+            end = offset + record.get_size(m_seg[offset:offset + record.HEADER.size])
+            m_seg = self._map(head, end)
+            with memoryview(m_seg)[offset:end] as view:
+                try:
+                    data.append(record.decode(view))
+                except QueueCorrupt:
+                    if len(view) < end - offset:
+                        raise
+                    self._quarantine(view, head, offset)
+            offset = end
+            taken += 1
+        if taken:
+            head, offset = self._advance(head, offset, tail)
+            index[0], index[1], index[4] = head, offset, count - taken
+            self._write_index(index)
+        self.stats.dequeued.inc(len(data))
+
+        return data
+
+    def _quarantine(self, data: memoryview, number: int, offset: int) -> None:
+        """
+        Copy corrupt record out of the queue.
+
+        :param data: record
+        :param number: number of the segment
+        :param offset: offset of the record in the segment
+        :return: None
+        """
+        quarantine = os.path.join(self._queue_path, self.D_QUARANTINE)
+        os.makedirs(quarantine, exist_ok=True)
+        with sugar.utils.files.fopen(os.path.join(quarantine, "{}-{:x}".format(self.F_SEGMENT.format(number), offset)),
+                                     "wb") as h_rec:
+            h_rec.write(data)
+        self.stats.corrupt.inc()
+
+    def _advance(self, head: int, offset: int, tail: int) -> tuple:
+        """
+        Move the head to the next segment, if the head segment is consumed.
+        The tail segment is never consumed, as it is still written.
+
+        :param head: number of the head segment
+        :param offset: offset of the head
+        :param tail: number of the tail segment
+        :return: head segment and offset
+        """
+        if head != tail and offset >= os.fstat(self._segment(head)).st_size:
+            self._drop_segment(head)
+            head, offset = head + 1, 0
+        return head, offset
+
+    def put(self, obj) -> None:
+        """
+        Blocking put.
+
+        :param obj: object to put
+        :return: None
+        """
+        self.__put(obj)
+
+    def put_nowait(self, obj) -> None:
+        """
+        Non-blocking put.
+
+        :param obj: object to put
+        :return: None
+        """
+        self.__put(obj)
+
+    def __put(self, obj) -> None:
+        """
+        Append an object to the tail segment.
+
+        :param obj: Object to put.
+        :raises QueueFull: if queue reached its max size
+        :return: None
+        """
+        self.__write([obj])
+
+    def put_many(self, objs: list) -> None:
+        """
+        Non-blocking put of several objects at once.
+        Objects are appended with one write and one fsync per segment.
+
+        :param objs: objects to put
+        :raises QueueFull: if not all objects fit into the queue. Nothing is put then.
+        :return: None
+        """
+        objs = list(objs)
+        if objs:
+            self.__write(objs)
+
+    def __write(self, objs: list) -> None:
+        """
+        Append objects to the tail segment, rotating it when full.
+
+        :param objs: objects to append
+        :raises QueueFull: if not all objects fit into the queue
+        :return: None
+        """
+        records = []
+        for obj in objs:
+            records.append(record.encode(obj, self._serialiser))
+            self.stats.payload.observe(len(records[-1]))
+
+        self._lock()
+        try:
+            index = self._read_index()
+            _, _, tail, offset, count = index
+            if count + len(records) > self._max_size:
+                raise QueueFull("Queue is full")
+
+            chunk = []
+            for item in records:
+                if offset and offset + len(item) > self._segment_size:
+                    self._append(tail, offset, chunk)
+                    self._unmap(tail)  # Complete segment is opened again, once it is the head
+                    if tail in self._segments:
+                        os.close(self._segments.pop(tail))
+                    tail, offset, chunk = tail + 1, 0, []
+                chunk.append(item)
+                offset += len(item)
+            self._append(tail, offset, chunk)
+            index[2], index[3], index[4] = tail, offset, count + len(records)
+            self._write_index(index)
+        finally:
+            self._unlock()
+        self.stats.enqueued.inc(len(records))
+
+        if self._mp_notify is not None:
+            for _ in objs:
+                self._mp_notify.put_nowait(True)
+        if self._notifier is not None:
+            self._notifier.notify()
+
+    def _append(self, number: int, end: int, records: list) -> None:
+        """
+        Write records to the segment and sync it, or schedule the sync.
+
+        :param number: number of the segment
+        :param end: offset of the segment after the records
+        :param records: records
+        :return: None
+        """
+        if records:
+            data = b"".join(records)
+            fd = self._segment(number)
+            os.pwrite(fd, data, end - len(data))
+            if self._sync is None:
+                started = time.time()
+                os.fsync(fd)
+                self.stats.fsync.observe(time.time() - started)
+            else:
+                self._sync.add([os.path.join(self._queue_path, self.F_SEGMENT.format(number))])
+
+    def qsize(self) -> int:
+        """
+        Return queue size.
+
+        :return: int, size of the Queue
+        """
+        return self._read_index()[4]
+
+    def pending(self) -> bool:
+        """
+        Returns True if nothing is in the notification layer.
+        Without the counting notification, the store is checked.
+
+        :return: bool
+        """
+        if self._mp_notify is not None:
+            pending = self._mp_notify.empty()
+        else:
+            pending = self.empty()
+
+        return pending
+
+    def flush(self) -> None:
+        """
+        Sync written items to the disk now.
+
+        :return: None
+        """
+        if self._sync is not None:
+            self._sync.sync()
+
+    def close(self) -> None:
+        """
+        Sync and close index and segment files.
+
+        :return: None
+        """
+        self.flush()
+        for number in list(self._maps):
+            self._unmap(number)
+        for fd in self._segments.values():
+            os.close(fd)
+        self._segments.clear()
+        if self._index is not None:
+            os.close(self._index)
+            self._index = None
@@ -5,12 +5,10 @@ Testing peewee
 from __future__ import absolute_import, unicode_literals, print_function
 
 import os
-import time
 
 from pony import orm
 
 from sugar.lib.pki import Crypto
-from sugar.lib import six
 from sugar.utils.cli import get_current_component
 import sugar.utils.files
 import sugar.utils.stringutils
@@ -100,8 +98,7 @@ class KeyStore(object):
         if self.__component != 'local':
             self.__root_path = os.path.join(path, self.__component)
             self.__keys_path = sugar.utils.files.mk_dirs(os.path.join(self.__root_path, 'keys'))
-        self.__lock_file_path = os.path.join(self.__root_path, self.LOCKFILE)
-        self.__is_locked = False
+        self.__lock = sugar.utils.files.FileLock(os.path.join(self.__root_path, self.LOCKFILE))
         KeyDB.get_instance(self.__root_path)
 
     def _lock_transation(self, timeout=30):
@@ -111,58 +108,26 @@ class KeyStore(object):
         Should be more than enough even on [N]ot [F]ile [S]ystem.
 
         :param timeout: default 30
+        :raises SugarKeyStoreException: if the lock was not acquired in time
         :return: bool
         """
-        while timeout > 0:
-            if os.path.exists(self.__lock_file_path):
-                if os.path.getctime(self.__lock_file_path) + timeout < time.time():
-                    break
-                time.sleep(0.5)
-                timeout -= 0.5
-            else:
-                break
-
-        with sugar.utils.files.fopen(self.__lock_file_path, 'wb') as fh_lck:
-            fh_lck.write(sugar.utils.stringutils.to_bytes(six.text_type(os.getpid())))
-            self.__is_locked = True
-
-        return self.__is_locked
+        try:
+            return self.__lock.acquire(timeout=timeout)
+        except sugar.lib.exceptions.SugarFileLockException as exc:
+            raise sugar.lib.exceptions.SugarKeyStoreException(exc)
 
-    def _unlock_transaction(self, timeout=30, force=False):
+    def _unlock_transaction(self, timeout=30, force=False):  # pylint: disable=W0613
         """
         Unlock the FS.
-        Timeout 30 seconds by default.
+        Lock of a crashed process is released by the kernel,
+        so timeout and force are kept for compatibility only.
 
         :param timeout: default 30.
         :param force: bool, default False
         :return: bool
         """
-        try:
-            with sugar.utils.files.fopen(self.__lock_file_path, 'r') as fh_lck:
-                lock_pid = int(fh_lck.read().strip())
-                if os.getpid() == lock_pid:
-                    lock_pid = None
-        except Exception:
-            lock_pid = None
-
-        try:
-            if os.path.getctime(self.__lock_file_path) + timeout < time.time() or force:
-                lock_pid = None
-        except Exception:
-            lock_pid = None
-
-        if lock_pid is None:
-            sugar.utils.files.remove(self.__lock_file_path)
-        elif lock_pid != os.getpid() and os.path.exists(self.__lock_file_path):
-            while timeout > 0:
-                if os.path.exists(self.__lock_file_path):
-                    time.sleep(0.5)
-                    timeout -= 0.5
-                else:
-                    sugar.utils.files.remove(self.__lock_file_path)
-                    self.__is_locked = False
-
-        return not self.__is_locked
+        self.__lock.release()
+        return not self.__lock.locked
 
     @staticmethod
     def __clone_rs(dbr):
@@ -265,11 +230,15 @@ class KeyStore(object):
         """
         self._lock_transation()
         filename = "{}.pem".format(os.path.join(self.__keys_path, machine_id))
-        with open(filename, "wb") as rsa_pem_h:
-            pubkey_pem = sugar.utils.stringutils.to_bytes(pubkey_pem)
-            rsa_pem_h.write(pubkey_pem)
-            StoredKey(hostname=hostname, fingerprint=Crypto.get_finterprint(pubkey_pem),
-                      machine_id=machine_id, filename=filename, status=self.STATUS_CANDIDATE)
+        try:
+            with open(filename, "wb") as rsa_pem_h:
+                pubkey_pem = sugar.utils.stringutils.to_bytes(pubkey_pem)
+                rsa_pem_h.write(pubkey_pem)
+                StoredKey(hostname=hostname, fingerprint=Crypto.get_finterprint(pubkey_pem),
+                          machine_id=machine_id, filename=filename, status=self.STATUS_CANDIDATE)
+        except Exception:
+            self._unlock_transaction()
+            raise
         self.__commit()
 
     @orm.db_session
@@ -282,14 +251,16 @@ class KeyStore(object):
         :return: None
         """
         self._lock_transation()
-        key = StoredKey.get(fingerprint=fingerprint)
-        if key is not None:
-            if os.path.exists(key.filename):
-                os.remove(key.filename)
-                orm.delete(k for k in StoredKey if k.fingerprint == fingerprint)
-            else:
-                raise OSError("File '{}' not found".format(key.filename))
-        self._unlock_transaction()
+        try:
+            key = StoredKey.get(fingerprint=fingerprint)
+            if key is not None:
+                if os.path.exists(key.filename):
+                    os.remove(key.filename)
+                    orm.delete(k for k in StoredKey if k.fingerprint == fingerprint)
+                else:
+                    raise OSError("File '{}' not found".format(key.filename))
+        finally:
+            self._unlock_transaction()
 
     @orm.db_session
     def reject(self, fingerprint, hostname=None) -> str:
@@ -302,15 +273,17 @@ class KeyStore(object):
         :return: rejected status
         """
         self._lock_transation()
-        params = {}
-        if hostname:
-            params['hostname'] = hostname
-        params['fingerprint'] = fingerprint
-        key = StoredKey.get(**params)
-        if key is not None:
-            key.status = self.STATUS_REJECTED
-            orm.commit()
-        self._unlock_transaction()
+        try:
+            params = {}
+            if hostname:
+                params['hostname'] = hostname
+            params['fingerprint'] = fingerprint
+            key = StoredKey.get(**params)
+            if key is not None:
+                key.status = self.STATUS_REJECTED
+                orm.commit()
+        finally:
+            self._unlock_transaction()
         return self.STATUS_REJECTED
 
     @orm.db_session
@@ -322,11 +295,13 @@ class KeyStore(object):
         :return: denied status
         """
         self._lock_transation()
-        key = StoredKey.get(fingerprint=fingerprint)
-        if key is not None:
-            key.status = self.STATUS_DENIED
-            orm.commit()
-        self._unlock_transaction()
+        try:
+            key = StoredKey.get(fingerprint=fingerprint)
+            if key is not None:
+                key.status = self.STATUS_DENIED
+                orm.commit()
+        finally:
+            self._unlock_transaction()
         return self.STATUS_DENIED
 
     @orm.db_session
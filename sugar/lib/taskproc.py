@@ -2,34 +2,85 @@
 """
 Task processing daemon.
 """
-import time
+import os
+
 from twisted.internet import reactor, threads
-from twisted.internet import task as twisted_task
 import twisted.internet.error
 
 from sugar.lib.compat import yaml
 from sugar.lib.logger.manager import get_logger
 from sugar.lib.compiler.objtask import FunctionObject
-from sugar.lib.perq import QueueFactory
-from sugar.lib.perq.qexc import QueueEmpty
-from sugar.transport import RunnerModulesMsgFactory, ObjectGate
+from sugar.lib.perq import QueueFactory, Durability, FSQueue
+from sugar.lib.perq.notify import Notifier, NotifyReader
+from sugar.transport import RunnerModulesMsgFactory, ServerMsgFactory, ObjectGate
 
 
 class TaskProcessor:
     """
     Concurrent task processor.
+
+    Tasks are queued in lanes: high, normal and low. Lane is chosen by
+    the priority, that is set by the master. Tasks of the normal priority
+    are queued by their kind: runners to the normal lane, long state runs
+    to the low one. Only as many tasks are taken as there are free workers,
+    and lanes are read by their weights, so a quick call does not wait
+    behind the whole backlog of state runs.
     """
-    XLOG_PATH = "/var/cache/sugar/client/tasks"
+    XLOG_PATH = "/var/cache/sugar/client/lanes"
+    XLOG_LEGACY_PATH = "/var/cache/sugar/client/tasks"  # Single task queue of the older versions
     XRET_PATH = "/var/cache/sugar/client/responses"
+    BATCH_SIZE = 0x40  # Max items taken from the queue at once
+    CONCURRENCY = 10   # Max tasks running at once
+
+    LANE_HIGH = "high"
+    LANE_NORMAL = "normal"
+    LANE_LOW = "low"
+    LANES = ((LANE_HIGH, 4), (LANE_NORMAL, 2), (LANE_LOW, 1))  # Lanes and their weights
 
     def __init__(self, loader):
         self.t_counter = 0
         self.log = get_logger(self)
         self.loader = loader
-        self._queue = QueueFactory.fs_queue(self.XLOG_PATH).use_notify()
-        self._ret_queue = QueueFactory.fs_queue(self.XRET_PATH).use_notify()
+        self._queue = QueueFactory.lane_queue(self.XLOG_PATH, lanes=self.LANES,
+                                              default=self.LANE_NORMAL).use_msgpack(True).use_notify()
+        self._ret_queue = QueueFactory.fs_queue(self.XRET_PATH, durability=Durability.BATCH).use_notify()
         self._d_stop = False
         self._task_looper_marker = True
+        self._adopt_legacy()
+
+    def _adopt_legacy(self) -> None:
+        """
+        Move tasks, left in the single queue by the older version, to the lanes.
+
+        :return: None
+        """
+        if not os.path.isdir(self.XLOG_LEGACY_PATH):
+            return
+
+        legacy = FSQueue(self.XLOG_LEGACY_PATH)
+        tasks = legacy.get_many(legacy.qsize(), force=True)
+        for task in tasks:
+            self.schedule_task(task if isinstance(task, FunctionObject) else FunctionObject.from_dict(task))
+        if tasks:
+            self.log.info("Moved {} tasks of the older version to the lanes", len(tasks))
+
+    def get_lane(self, task: FunctionObject) -> str:
+        """
+        Choose lane of the task.
+
+        :param task: FunctionObject
+        :return: name of the lane
+        """
+        if task.priority == ServerMsgFactory.PRIORITY_HIGH:
+            lane = self.LANE_HIGH
+        elif task.priority == ServerMsgFactory.PRIORITY_LOW:
+            lane = self.LANE_LOW
+        elif task.type == FunctionObject.TYPE_RUNNER:
+            lane = self.LANE_NORMAL
+        else:
+            lane = self.LANE_LOW
+
+        return lane
 
     def on_task(self, task: FunctionObject) -> (str, dict):
         """
@@ -77,7 +128,24 @@ class TaskProcessor:
         """
         jid, response = result
         self.log.debug("Task return: {}. JID: {}", response.return_data, jid)
+        self._on_task_done()
+
+    def on_task_failure(self, failure) -> None:
+        """
+        Log the task, that failed to run.
+
+        :param failure: Failure of the task
+        :return: None
+        """
+        self.log.error("Task failed: {}", failure.getErrorMessage())
+        self._on_task_done()
 
+    def _on_task_done(self) -> None:
+        """
+        Release the worker of the finished task and take the next one.
+
+        :return: None
+        """
         # Decrease tasks counter
         if self.t_counter:
             self.t_counter -= 1
@@ -87,6 +155,8 @@ class TaskProcessor:
         # from the outside. Otherwise this process will keep running.
         if self._d_stop:
             self.deferred_stop()
+        else:
+            self.next_task()
 
     def deferred_stop(self) -> None:
         """
@@ -107,31 +177,24 @@ class TaskProcessor:
 
     def next_task(self) -> None:
         """
-        Cycle the next task.
+        Run the queued tasks on the free workers.
+        The rest stays queued until the running tasks are finished.
 
         :return: None
         """
-        task = None
-        while task is None:
-            try:
-                task = self._queue.get(force=self._task_looper_marker)  # If any old lock still there
-                self._task_looper_marker = False
-            except QueueEmpty:
-                self.log.debug("Skipping concurrent notification: task already taken")
-                time.sleep(1)
-
-        self.log.info("Processing task")
-        threads.deferToThread(self.on_task, task).addCallback(self.on_task_result)
-        self.t_counter += 1
-
-        while True:
-            try:
-                task = self._queue.get_nowait()
-                threads.deferToThread(self.on_task, task).addCallback(self.on_task_result)
-                self.t_counter += 1
-            except QueueEmpty:
+        while self.t_counter < self.CONCURRENCY:
+            tasks = self._queue.get_many(min(self.BATCH_SIZE, self.CONCURRENCY - self.t_counter),
+                                         force=self._task_looper_marker)  # If any old lock still there
+            self._task_looper_marker = False
+            if not tasks:
                 self.log.debug("No more tasks")
                 break
+            self.log.info("Processing {} tasks", len(tasks))
+            for task in tasks:
+                if not isinstance(task, FunctionObject):  # Queued as a dictionary, unless left by an older version
+                    task = FunctionObject.from_dict(task)
+                threads.deferToThread(self.on_task, task).addCallbacks(self.on_task_result, self.on_task_failure)
+                self.t_counter += 1
 
     def schedule_task(self, task) -> None:
         """
@@ -140,16 +203,39 @@ class TaskProcessor:
         :param task: Task to schedule
         :return: None
         """
-        self._queue.put(task)
+        self._queue.put(task.to_dict(), lane=self.get_lane(task))
+
+    def get_responses(self, force: bool) -> list:
+        """
+        Get pending responses.
+
+        :param force: force or not the first get (removes disk lock)
+        :return: list of response payloads
+        """
+        return self._ret_queue.get_many(self.BATCH_SIZE, force=force)
+
+    def get_stats(self) -> dict:
+        """
+        Get task processor metrics.
+        Depths are read from the disk, so they are the same in any process.
+        Other metrics are of the current process only.
+
+        :return: dictionary of the task lanes depths and metrics of the task and response queues
+        """
+        return {
+            "lanes": self._queue.depths(),
+            "tasks": self._queue.get_stats(),
+            "responses": self._ret_queue.get_stats(),
+        }
 
-    def get_response(self, force: bool):
+    @property
+    def response_notifier(self) -> Notifier:
         """
-        Get response.
+        Notifier of the responses queue.
 
-        :param force or not the first get (removes disk lock)
-        :return: A response payload
+        :return: Notifier
         """
-        return self._ret_queue.get_nowait(force=force) if not self._ret_queue.pending() else None
+        return self._ret_queue.notifier
 
     def run(self) -> None:
         """
@@ -158,6 +244,8 @@ class TaskProcessor:
         :return: None
         """
         self.log.info("Task processor start")
-        twisted_task.LoopingCall(self.next_task).start(0.1)
+        reactor.suggestThreadPoolSize(self.CONCURRENCY)
+        reactor.addReader(NotifyReader(self._queue.notifier, self.next_task))
+        reactor.callWhenRunning(self.next_task)  # Tasks, left from the previous run
         reactor.run()
         self.log.info("Processor stopped")
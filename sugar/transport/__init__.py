@@ -143,6 +143,9 @@ class ConsoleMsgFactory(_MessageFactory):
         And('args'): [],
 
         And('offline'): bool,
+        Optional('watch'): bool,
+        Optional('timeout'): int,
+        Optional('priority'): int,
 
         Optional('jid'): str,
     })
@@ -166,6 +169,9 @@ class ConsoleMsgFactory(_MessageFactory):
         obj.args = []
         obj.jid = jid
         obj.offline = False
+        obj.watch = False
+        obj.timeout = 0
+        obj.priority = ServerMsgFactory.PRIORITY_NORMAL
 
         cls.validate(obj)
 
@@ -249,6 +255,8 @@ class ServerMsgFactory(_MessageFactory):
     # kind
     TASK_RESPONSE = 1
     CONSOLE_RESPONSE = 2
+    CONSOLE_JOB_RETURN = 3                       # Result of one host of the watched job
+    CONSOLE_JOB_PROGRESS = 4                     # Progress of the watched job (done/total/failed)
 
     KIND_HANDSHAKE_PKEY_RESP = 0xfa              # Public key response
     KIND_HANDSHAKE_TKEN_RESP = 0xfb              # Signed token response
@@ -257,6 +265,11 @@ class ServerMsgFactory(_MessageFactory):
 
     KIND_OPR_REQ = 0xa1                          # Operational request
 
+    # priority of the task
+    PRIORITY_LOW = 1                             # Queued behind everything else on the client
+    PRIORITY_NORMAL = 2                          # Client queues it by the kind of the job
+    PRIORITY_HIGH = 3                            # Queued ahead of everything else on the client
+
     scheme = Schema({
         Optional('.'): None,  # Marker
         And('component'): int,
@@ -264,6 +277,7 @@ class ServerMsgFactory(_MessageFactory):
         And('user'): str,
         And('uid'): int,
         Optional('jid'): str,
+        Optional('priority'): int,
         And('ret'): {
             Optional('.'): None,  # Marker
             And('errcode'): int,
@@ -297,12 +311,13 @@ class ServerMsgFactory(_MessageFactory):
         obj.kind = cls.TASK_RESPONSE
         return obj
 
-    def create(self, jid="", kind=KIND_OPR_REQ):
+    def create(self, jid="", kind=KIND_OPR_REQ, priority=PRIORITY_NORMAL):
         """
         Create arbitrary message.
 
         :param kind: int
         :param jid: Job ID
+        :param priority: priority of the task
         :return: Serialisable
         """
         obj = Serialisable()
@@ -311,6 +326,7 @@ class ServerMsgFactory(_MessageFactory):
         obj.user = getpass.getuser()
         obj.uid = os.getuid()
         obj.jid = jid
+        obj.priority = priority
         obj.ret.errcode = exitcodes.EX_OK
         obj.ret.message = ''
         obj.ret.function = {}
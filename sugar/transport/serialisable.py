@@ -66,6 +66,8 @@ class ObjectGate(object):
         """
         if data is None:
             data = {self.OBJ_CNT: None}
+        if isinstance(ref, LazySerialisable):
+            ref.resolve()
 
         for attr_name, attr in ref.__dict__.items():
             if isinstance(attr, Serialisable):
@@ -95,6 +97,8 @@ class ObjectGate(object):
         """
         if data is None:
             data = {}
+        if isinstance(ref, LazySerialisable):
+            ref.resolve()
 
         for attr_name, attr in ref.__dict__.items():
             if isinstance(attr, (list, tuple)):
@@ -144,4 +148,67 @@ class Serialisable:
 
     def __getattr__(self, item):
         return self.__dict__.setdefault(item, Serialisable())
+
+
+class LazySerialisable(Serialisable):
+    """
+    Serialisable container with the attributes, computed on the first access.
+    """
+    __slots__ = ("_lazy",)
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        super().__init__()
+        self._lazy = {}
+
+    def set_lazy(self, name: str, func, *args) -> None:
+        """
+        Set attribute, that is computed on the first access.
+
+        :param name: name of the attribute
+        :param func: callable, computing the value
+        :param args: arguments of the callable
+        :return: None
+        """
+        self.__dict__.pop(name, None)
+        self._lazy[name] = (func, args)
+
+    def __getattr__(self, item):
+        if item == "_lazy":
+            raise AttributeError(item)
+        lazy = self._lazy.pop(item, None)
+        if lazy is not None:
+            func, args = lazy
+            value = self.__dict__.setdefault(item, func(*args))
+        else:
+            value = super().__getattr__(item)
+        return value
+
+    def __setattr__(self, key, value):
+        if key != "_lazy":
+            self._lazy.pop(key, None)
+        super().__setattr__(key, value)
+
+    def __delattr__(self, item):
+        if self._lazy.pop(item, None) is None:
+            super().__delattr__(item)
+
+    def __getstate__(self):
+        return self.resolve().__dict__
+
+    def __setstate__(self, state):
+        self._lazy = {}
+        self.__dict__.update(state)
+
+    def resolve(self) -> "LazySerialisable":
+        """
+        Compute all the attributes, that are not accessed yet.
+
+        :return: itself
+        """
+        for name in list(self._lazy):
+            getattr(self, name)
+        return self
 # pylint: enable=R0902
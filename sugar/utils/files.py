@@ -14,7 +14,9 @@ import shutil
 import stat
 import tempfile
 import time
+import threading
 import contextlib
+import typing
 
 from sugar.lib import six
 import sugar.utils.platform
@@ -456,6 +458,236 @@ def f_lock_open(*args, **kwargs):
                 fcntl.flock(f_handle.fileno(), fcntl.LOCK_UN)
 
 
+def pid_exists(pid: int) -> bool:
+    """
+    Check if process with the PID is alive.
+
+    :param pid: process ID
+    :return: bool
+    """
+    alive = pid > 0
+    if alive:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            alive = False
+        except PermissionError:
+            pass  # Alive, but owned by someone else
+
+    return alive
+
+
+class FileLock(object):
+    """
+    Inter-process lock on a file.
+
+    Lock is taken with "fcntl.flock" on the lock file, which is never
+    removed. Kernel releases the lock, if the holder process died,
+    so a lock is never stale. Without a timeout, waiters block in the
+    kernel until the lock is released. With a timeout, the lock is
+    re-tried with the growing poll, until it is taken or time is out.
+
+    Where "fcntl" is not available, lock file is created exclusively
+    and holds PID of the owner. Lock of a dead process is broken.
+
+    Lock is held by the process, and threads of the process are
+    serialised too. Only the thread, that acquired the lock, can
+    release it. Lock is re-opened after the fork, so parent
+    and child do not share it.
+    """
+    POLL = 0.001      # Initial poll seconds, while waiting with a timeout
+    POLL_MAX = 0.05   # Max poll seconds
+
+    def __init__(self, path: str, timeout: float = None):
+        """
+        Constructor.
+
+        :param path: path to the lock file
+        :param timeout: default seconds to wait for the lock. None waits forever.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+        self._pid = None
+        self._mutex = None
+        self._locked = False
+        self._owner = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def _reset(self) -> None:
+        """
+        Drop the state, inherited from the parent process.
+
+        :return: None
+        """
+        if self._pid != os.getpid():
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = None
+            self._pid = os.getpid()
+            self._mutex = threading.Lock()
+            self._locked = False
+            self._owner = None
+
+    @property
+    def locked(self) -> bool:
+        """
+        Lock is held by this process.
+
+        :return: bool
+        """
+        return self._locked and self._pid == os.getpid()
+
+    def acquire(self, timeout: float = -1) -> bool:
+        """
+        Acquire the lock.
+
+        :param timeout: seconds to wait. Default is the timeout of the lock. None waits forever.
+        :raises SugarFileLockException: if lock was not acquired in time
+        :return: True
+        """
+        self._reset()
+        timeout = self.timeout if timeout == -1 else timeout
+        started = time.time()
+        if not self._mutex.acquire(timeout=-1 if timeout is None else timeout):
+            raise sugar.lib.exceptions.SugarFileLockException(
+                "Timeout of {} seconds exceeded waiting for lock {}".format(timeout, self.path), time_start=started)
+        try:
+            if is_fcntl_available(check_sunos=True):
+                self._flock(timeout, started)
+            else:
+                self._exclusive(timeout, started)
+        except Exception:
+            self._mutex.release()
+            raise
+        self._locked = True
+        self._owner = threading.get_ident()
+
+        return True
+
+    def _wait(self, attempt, timeout: float, started: float) -> None:
+        """
+        Repeat an attempt to lock with the growing poll, until it succeeds.
+
+        :param attempt: callable, returning True if the lock was taken
+        :param timeout: seconds to wait. None waits forever.
+        :param started: time of the start
+        :raises SugarFileLockException: if lock was not acquired in time
+        :return: None
+        """
+        poll = self.POLL
+        while not attempt():
+            if timeout is not None and time.time() - started >= timeout:
+                raise sugar.lib.exceptions.SugarFileLockException(
+                    "Timeout of {} seconds exceeded waiting for lock {} held by PID {}".format(
+                        timeout, self.path, self.holder()), time_start=started)
+            time.sleep(poll)
+            poll = min(poll * 2, self.POLL_MAX)
+
+    def _flock(self, timeout: float, started: float) -> None:
+        """
+        Lock with fcntl.
+
+        :param timeout: seconds to wait. None waits forever.
+        :param started: time of the start
+        :return: None
+        """
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if HAS_FCNTL:
+                fcntl.fcntl(self._fd, fcntl.F_SETFD, fcntl.fcntl(self._fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+        if timeout is None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            def attempt():
+                locked = True
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    locked = False
+                return locked
+            self._wait(attempt, timeout, started)
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, str(self._pid).encode("ascii"), 0)
+
+    def _exclusive(self, timeout: float, started: float) -> None:
+        """
+        Lock with the exclusively created file.
+
+        :param timeout: seconds to wait. None waits forever.
+        :param started: time of the start
+        :return: None
+        """
+        def attempt():
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                self.break_stale()
+                fd = None
+            if fd is not None:
+                os.write(fd, str(self._pid).encode("ascii"))
+                os.close(fd)
+            return fd is not None
+        self._wait(attempt, timeout, started)
+
+    def release(self) -> None:
+        """
+        Release the lock. Lock, which is not held by the current thread, is left as is.
+
+        :return: None
+        """
+        if not self.locked or self._owner != threading.get_ident():
+            return
+        self._locked = False
+        self._owner = None
+        try:
+            if self._fd is not None:
+                os.ftruncate(self._fd, 0)
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                remove(self.path)
+        finally:
+            self._mutex.release()
+
+    def holder(self) -> typing.Optional[int]:
+        """
+        Get PID of the process, holding the lock.
+
+        :return: PID or None, if lock is free
+        """
+        try:
+            with open(self.path, "rb") as h_lck:
+                pid = int(h_lck.read().strip() or 0)
+        except (OSError, ValueError):
+            pid = 0
+
+        return pid if pid_exists(pid) else None
+
+    def break_stale(self) -> bool:
+        """
+        Remove lock of the process, which is no longer alive.
+        Locks with fcntl are never stale.
+
+        :return: True if lock was broken
+        """
+        stale = not is_fcntl_available(check_sunos=True) and self.holder() is None
+        if stale:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            log.debug("Stale lock {} removed", self.path)
+
+        return stale
+
+
 #
 # UNUSED @@@
 #
@@ -0,0 +1,29 @@
+# coding: utf-8
+"""
+Benchmarks.
+
+These are not running by default. To run them:
+
+    SUGAR_BENCHMARK=1 python -m pytest -s tests/benchmarks
+"""
+import os
+import pytest
+
+benchmark = pytest.mark.skipif(not os.environ.get("SUGAR_BENCHMARK"),  # pylint: disable=C0103
+                               reason="Benchmarks are enabled by SUGAR_BENCHMARK=1")
+
+
+def report(title: str, header: list, rows: list) -> None:
+    """
+    Print benchmark results table.
+
+    :param title: title of the benchmark
+    :param header: column names
+    :param rows: list of rows
+    :return: None
+    """
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    print()
+    print(title)
+    for row in [header] + rows:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Benchmark of the job store backends.
+
+Results of many targets are ingested into the SQLite and the
+append-only log backends, then the job is loaded and the store
+is reopened (the log backend replays the log on start).
+"""
+import json
+import time
+import shutil
+import datetime
+import tempfile
+
+import pytz
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from tests.benchmarks import benchmark, report
+
+TARGETS = [1000, 10000]
+
+
+@benchmark
+class TestJobStoreBackendsBenchmark:
+    """
+    Job store backends benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self._path = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_backends(self):
+        """
+        Measure ingestion of the results, loading the job and reopening the store.
+
+        :return:
+        """
+        from sugar.lib.jobstore import BACKENDS
+
+        rows = []
+        for backend in sorted(BACKENDS):
+            for count in TARGETS:
+                path = "{}/{}-{}".format(self._path, backend, count)
+                store = BACKENDS[backend](get_config(), path=path)
+                clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(count)]
+                for target in clientslist:
+                    store.add_host(fqdn=target.host, osid=target.id, ipv4="127.0.0.1", ipv6="::1")
+                jid = store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER)
+
+                started = time.time()
+                for target in clientslist:
+                    store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"host": target.host}),
+                                     finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+                stats = store.get_done_stats(jid)  # Waits for the written behind results
+                ingested = time.time() - started
+                assert stats.returned == count
+
+                started = time.time()
+                store.get_by_jid(jid)
+                loaded = time.time() - started
+                store.close()
+
+                started = time.time()
+                store = BACKENDS[backend](get_config(), path=path)
+                opened = time.time() - started
+                store.close()
+
+                rows.append([backend, count, "{:.0f}".format(count / ingested), "{:.3f}".format(loaded),
+                             "{:.3f}".format(opened)])
+
+        report("Job store backends", ["backend", "targets", "results/s", "load seconds", "open seconds"], rows)
@@ -0,0 +1,73 @@
+# coding: utf-8
+"""
+Benchmark of the job export against amount of targets.
+
+Peak memory of the exporting process (Python allocations)
+and time are measured with compression in the same process
+and in a separate one.
+"""
+import json
+import time
+import shutil
+import datetime
+import tempfile
+import tracemalloc
+
+import pytz
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from tests.benchmarks import benchmark, report
+
+TARGETS = [1000, 10000]
+
+
+@benchmark
+class TestJobStoreExportBenchmark:
+    """
+    Job export benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        self._path = tempfile.mkdtemp()
+        self.store = JobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.store.close()
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_export(self):
+        """
+        Measure job export memory and time.
+
+        :return:
+        """
+        rows = []
+        for count in TARGETS:
+            clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(count)]
+            for target in clientslist:
+                self.store.add_host(fqdn=target.host, osid=target.id, ipv4="127.0.0.1", ipv6="::1")
+            jid = self.store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER)
+            for target in clientslist:
+                self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"host": target.host}),
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+
+            for process in [False, True]:
+                tracemalloc.start()
+                started = time.time()
+                self.store.export(jid, path="{}/export-{}".format(self._path, process), process=process)
+                elapsed = time.time() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                rows.append([count, "process" if process else "inline", "{:.2f}".format(elapsed),
+                             "{:.1f}".format(peak / 0x100000)])
+
+        report("Job export", ["targets", "compression", "seconds", "peak MiB"], rows)
@@ -0,0 +1,107 @@
+# coding: utf-8
+"""
+Benchmark of the jobs database indexes on a million results.
+
+Queries of the job storage are timed on the migrated database
+and again after the indexes of the migrations are dropped.
+"""
+import time
+import random
+import shutil
+import sqlite3
+import datetime
+import tempfile
+
+import pytz
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from sugar.lib.jobstore import migrations
+from tests.benchmarks import benchmark, report
+
+JOBS = 1000
+TARGETS = 1000
+REPEAT = 100
+
+QUERIES = [
+    ("job by JID", 'SELECT * FROM "Job" WHERE "jid" = ?', lambda jobs, machines: (random.choice(jobs),)),
+    ("scheduled for machine", 'SELECT DISTINCT "job" FROM "Result" WHERE "machineid" = ? AND "fired" IS NULL',
+     lambda jobs, machines: (random.choice(machines),)),
+    ("result of machine", 'SELECT "id" FROM "Result" WHERE "job" = ? AND "machineid" = ?',
+     lambda jobs, machines: (random.randint(1, JOBS), random.choice(machines))),
+    ("jobs by tag", 'SELECT "id" FROM "Job" WHERE "tag" = ?', lambda jobs, machines: ("tag-{}".format(random.randint(0, 9)),)),
+    ("expired jobs", 'SELECT "id" FROM "Job" WHERE "created" < ?',
+     lambda jobs, machines: (datetime.datetime(2000, 1, 1, tzinfo=pytz.UTC),)),
+]
+
+
+def _measure(db_path: str, jobs: list, machines: list) -> list:
+    """
+    Measure queries.
+
+    :param db_path: path to the database
+    :param jobs: JIDs
+    :param machines: machine IDs
+    :return: list of milliseconds per query
+    """
+    connection = sqlite3.connect(db_path)
+    timings = []
+    for _, sql, params in QUERIES:
+        started = time.time()
+        for _ in range(REPEAT):
+            connection.execute(sql, params(jobs, machines)).fetchall()
+        timings.append((time.time() - started) * 1000 / REPEAT)
+    connection.close()
+
+    return timings
+
+
+@benchmark
+class TestJobStoreIndexesBenchmark:
+    """
+    Jobs database indexes benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        self._path = tempfile.mkdtemp()
+        self.store = JobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.store.close()
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_indexes(self):
+        """
+        Measure queries with and without indexes.
+
+        :return:
+        """
+        clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(TARGETS)]
+        jobs = [self.store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER,
+                               tag="tag-{}".format(idx % 10)) for idx in range(JOBS)]
+        db_path = self.store._db_path  # pylint: disable=W0212
+        self.store.close()
+
+        connection = sqlite3.connect(db_path)
+        connection.execute('UPDATE "Result" SET "fired" = ? WHERE "job" < ?', (datetime.datetime.now(tz=pytz.UTC), JOBS - 10))
+        connection.commit()
+        indexed = _measure(db_path, jobs, [target.id for target in clientslist])
+
+        for name, _ in migrations.V1_INDEXES + migrations.V3_INDEXES + [("unq_job__jid", None), ("idx_job__jid", None)]:
+            connection.execute('DROP INDEX IF EXISTS "{}"'.format(name))
+        connection.commit()
+        connection.close()
+        plain = _measure(db_path, jobs, [target.id for target in clientslist])
+        self.store = type(self.store)(get_config(), path=self._path)
+
+        report("Queries on {} results (ms per query)".format(JOBS * TARGETS), ["query", "no indexes", "indexed"],
+               [[name, "{:.3f}".format(before), "{:.3f}".format(after)]
+                for (name, _, _), before, after in zip(QUERIES, plain, indexed)])
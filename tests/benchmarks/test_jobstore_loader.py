@@ -0,0 +1,78 @@
+# coding: utf-8
+"""
+Benchmark of loading a complete job against amount of targets.
+
+Job is loaded with its results, tasks, calls and hosts. Time is
+measured for the load itself and for decoding all the payloads
+afterwards, along with the amount of executed queries.
+"""
+import json
+import time
+import shutil
+import datetime
+import tempfile
+
+import pytz
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from sugar.transport.serialisable import ObjectGate
+from tests.benchmarks import benchmark, report
+
+TARGETS = [100, 1000, 10000]
+
+
+@benchmark
+class TestJobStoreLoaderBenchmark:
+    """
+    Job loader benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        self._path = tempfile.mkdtemp()
+        self.store = JobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.store.close()
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_get_by_jid(self):
+        """
+        Measure loading a job by JID.
+
+        :return:
+        """
+        rows = []
+        for count in TARGETS:
+            clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(count)]
+            for target in clientslist:
+                self.store.add_host(fqdn=target.host, osid=target.id, ipv4="127.0.0.1", ipv6="::1")
+            jid = self.store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER)
+            for target in clientslist:
+                self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"host": target.host}),
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+            self.store._writer.flush()  # pylint: disable=W0212
+
+            queries = []
+            with self.store._readers.connection() as connection:  # pylint: disable=W0212
+                connection.set_trace_callback(queries.append)
+            started = time.time()
+            job = self.store.get_by_jid(jid)
+            loaded = time.time() - started
+            with self.store._readers.connection() as connection:  # pylint: disable=W0212
+                connection.set_trace_callback(None)
+            started = time.time()
+            ObjectGate(job).to_dict()
+            decoded = time.time() - started
+            rows.append([count, len([sql for sql in queries if sql.startswith("SELECT")]),
+                         "{:.3f}".format(loaded), "{:.3f}".format(decoded)])
+
+        report("Loading a job by JID", ["targets", "queries", "load seconds", "decode seconds"], rows)
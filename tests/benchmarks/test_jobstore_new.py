@@ -0,0 +1,85 @@
+# coding: utf-8
+"""
+Benchmark of the job registration against amount of targets.
+
+Bulk registration of JobStorage.new is compared to creating
+one ORM entity per target.
+"""
+import time
+import shutil
+import datetime
+import tempfile
+
+import pytz
+from pony import orm
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from sugar.utils.jid import jidstore
+from tests.benchmarks import benchmark, report
+
+TARGETS = [100, 1000, 5000, 20000]
+
+
+def _new_per_entity(clientslist: list) -> str:
+    """
+    Register job, creating an entity per target.
+
+    :param clientslist: targets
+    :return: jid
+    """
+    from sugar.lib.jobstore.entities import Job
+
+    jid = jidstore.create()
+    with orm.db_session(optimistic=False):
+        job = Job(jid=jid, query="*", created=datetime.datetime.now(tz=pytz.UTC), tag=None,
+                  type=JobTypes.RUNNER, uri="test.ping", args="")
+        for target in clientslist:
+            job.results.create(machineid=target.id)
+    return jid
+
+
+@benchmark
+class TestJobStoreNewBenchmark:
+    """
+    Job registration benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        self._path = tempfile.mkdtemp()
+        self.store = JobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.store.close()
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def test_new(self):
+        """
+        Measure job registration time.
+
+        :return:
+        """
+        rows = []
+        for count in TARGETS:
+            clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(count)]
+
+            started = time.time()
+            _new_per_entity(clientslist)
+            entities = time.time() - started
+
+            started = time.time()
+            jid = self.store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER)
+            bulk = time.time() - started
+
+            assert len(self.store.get_by_jid(jid).results) == count
+            rows.append([count, "{:.3f}".format(entities), "{:.3f}".format(bulk), "{:.1f}x".format(entities / bulk)])
+
+        report("Job registration (seconds)", ["targets", "per entity", "bulk", "speedup"], rows)
@@ -0,0 +1,82 @@
+# coding: utf-8
+"""
+Benchmark of the jobs history retention.
+
+Removing a day of the history by deleting its jobs from the live
+database is compared to dropping the sealed partition of the day.
+"""
+import time
+import shutil
+import datetime
+import tempfile
+
+from sugar.config import get_config
+from sugar.components.server.pdatastore import PDataContainer
+from sugar.lib.jobstore.const import JobTypes
+from tests.benchmarks import benchmark, report
+
+DAYS = 4
+JOBS = 50       # Per day
+TARGETS = 1000
+
+
+@benchmark
+class TestJobStoreRetentionBenchmark:
+    """
+    Jobs history retention benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self._path = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def _fill(self, path: str):
+        """
+        Create job store with the history of the past days.
+
+        :param path: path of the job store
+        :return: JobStorage
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        store = JobStorage(get_config(), path=path)
+        clientslist = [PDataContainer(id="{:032x}".format(idx), host="host-{}.lan".format(idx)) for idx in range(TARGETS)]
+        for day in range(1, DAYS + 1):
+            for idx in range(JOBS):
+                jid = "202001{:02d}12{:04d}000000_1".format(day, idx)
+                store.new(query="*", clientslist=clientslist, uri="test.ping", args="", job_type=JobTypes.RUNNER,
+                          tag="day-{}".format(day), jid=jid)
+                store.report_job_finished(jid)
+        return store
+
+    def test_retention(self):
+        """
+        Measure removing a day of the history.
+
+        :return:
+        """
+        store = self._fill("{}/live".format(self._path))
+        started = time.time()
+        store.delete_by_tag("day-1")
+        deleted = time.time() - started
+        store.close()
+
+        store = self._fill("{}/partitioned".format(self._path))
+        started = time.time()
+        store.seal(max_age=1, today=datetime.date(2020, 1, DAYS + 2))  # Jobs are not returned, so sealed as expired
+        sealed = time.time() - started
+        started = time.time()
+        store._partitions.drop("20200101")  # pylint: disable=W0212
+        dropped = time.time() - started
+        store.close()
+
+        report("Removing a day of {} jobs by {} targets (seconds)".format(JOBS, TARGETS),
+               ["live delete", "partition drop", "sealing {} days (background)".format(DAYS)],
+               [["{:.3f}".format(deleted), "{:.4f}".format(dropped), "{:.3f}".format(sealed)]])
@@ -0,0 +1,218 @@
+# coding: utf-8
+"""
+Benchmark of the persistent queues.
+
+File per item queue is compared to the segmented queue
+at the different queue lengths.
+"""
+import time
+import shutil
+import tempfile
+import pickle
+import multiprocessing
+
+from sugar.lib.perq import FSQueue, SegmentedQueue, QueueFactory, Durability
+from sugar.lib.perq import record
+from sugar.lib.compiler.objtask import FunctionObject
+from tests.benchmarks import benchmark, report
+
+LENGTHS = [128, 1024, 4096]
+BATCH = 64
+HANDOFFS = 50
+WORKERS = 10
+
+
+def _produce(queue) -> None:
+    """
+    Put timestamps into the queue from another process.
+
+    :param queue: queue
+    :return: None
+    """
+    for _ in range(HANDOFFS):
+        time.sleep(0.01)
+        queue.put(time.time())
+
+
+@benchmark
+class TestPersistentQueueBenchmark:
+    """
+    Persistent queues benchmark.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self._path = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def _measure(self, queue, length: int) -> tuple:
+        """
+        Fill the queue and drain it.
+
+        :param queue: queue
+        :param length: amount of items
+        :return: put and get items per second
+        """
+        payload = {"uri": "system.test.ping", "args": [], "kwargs": {"text": "x" * 0x100}}
+        started = time.time()
+        for _ in range(length):
+            queue.put_nowait(payload)
+        put = length / (time.time() - started)
+        started = time.time()
+        for _ in range(length):
+            queue.get_nowait()
+        get = length / (time.time() - started)
+        return put, get
+
+    def test_put_get(self):
+        """
+        Measure put and get throughput.
+
+        :return:
+        """
+        rows = []
+        for length in LENGTHS:
+            fs_put, fs_get = self._measure(FSQueue(tempfile.mkdtemp(dir=self._path), maxsize=length), length)
+            seg_put, seg_get = self._measure(SegmentedQueue(tempfile.mkdtemp(dir=self._path), maxsize=length), length)
+            rows.append([length, "{:.0f}".format(fs_put), "{:.0f}".format(fs_get),
+                         "{:.0f}".format(seg_put), "{:.0f}".format(seg_get)])
+
+        report("Persistent queue throughput (items/s)",
+               ["length", "FSQueue put", "FSQueue get", "segmented put", "segmented get"], rows)
+
+    def _measure_batch(self, queue, length: int) -> tuple:
+        """
+        Fill the queue and drain it in batches.
+
+        :param queue: queue
+        :param length: amount of items
+        :return: put and get items per second
+        """
+        payload = {"uri": "system.test.ping", "args": [], "kwargs": {"text": "x" * 0x100}}
+        started = time.time()
+        for _ in range(0, length, BATCH):
+            queue.put_many([payload] * BATCH)
+        put = length / (time.time() - started)
+        started = time.time()
+        while queue.get_many(BATCH):
+            pass
+        get = length / (time.time() - started)
+        return put, get
+
+    def test_batch(self):
+        """
+        Measure put_many and get_many throughput.
+
+        :return:
+        """
+        rows = []
+        for length in LENGTHS:
+            for name, queue_class in [("FSQueue", FSQueue), ("segmented", SegmentedQueue)]:
+                put, get = self._measure(queue_class(tempfile.mkdtemp(dir=self._path), maxsize=length), length)
+                put_many, get_many = self._measure_batch(queue_class(tempfile.mkdtemp(dir=self._path), maxsize=length), length)
+                rows.append([length, name, "{:.0f}".format(put), "{:.0f}".format(put_many),
+                             "{:.0f}".format(get), "{:.0f}".format(get_many)])
+
+        report("Persistent queue batches of {} (items/s)".format(BATCH),
+               ["length", "queue", "put", "put_many", "get", "get_many"], rows)
+
+    def test_durability(self):
+        """
+        Measure throughput per durability mode.
+
+        :return:
+        """
+        length = LENGTHS[1]
+        rows = []
+        for durability in [Durability.STRICT, Durability.BATCH, Durability.MEMORY]:
+            for name, factory in [("FSQueue", QueueFactory.fs_queue), ("segmented", QueueFactory.seg_queue)]:
+                put, get = self._measure(factory(tempfile.mkdtemp(dir=self._path), maxsize=length,
+                                                 durability=durability), length)
+                rows.append([durability, name, "{:.0f}".format(put), "{:.0f}".format(get)])
+
+        report("Persistent queue throughput of {} items per durability (items/s)".format(length),
+               ["durability", "queue", "put", "get"], rows)
+
+    def test_handoff(self):
+        """
+        Measure latency of the hand-off between the processes.
+
+        :return:
+        """
+        rows = []
+        for name, setup in [("poll 20ms", lambda queue: queue),
+                            ("multiprocessing.Queue", lambda queue: queue.use_notify(multiprocessing.Queue())),
+                            ("notifier", lambda queue: queue.use_notify())]:
+            queue = setup(SegmentedQueue(tempfile.mkdtemp(dir=self._path), poll=0.02))
+            proc = multiprocessing.Process(target=_produce, args=(queue,))
+            proc.start()
+            latencies = sorted(-queue.get() + time.time() for _ in range(HANDOFFS))
+            proc.join()
+            rows.append([name, "{:.2f}".format(latencies[len(latencies) // 2] * 1000),
+                         "{:.2f}".format(latencies[-1] * 1000)])
+
+        report("Persistent queue hand-off between processes (ms)", ["notification", "median", "max"], rows)
+
+    def test_lanes(self):
+        """
+        Measure how long a quick task waits behind the backlog of the slow ones.
+
+        :return:
+        """
+        rows = []
+        for length in LENGTHS:
+            row = [length]
+            for queue, slow, quick in [
+                    (FSQueue(tempfile.mkdtemp(dir=self._path), maxsize=length + 1), {}, {}),
+                    (QueueFactory.lane_queue(tempfile.mkdtemp(dir=self._path), lanes=(("normal", 2), ("low", 1)),
+                                             maxsize=length + 1), {"lane": "low"}, {"lane": "normal"})]:
+                queue.put_many(["slow"] * length, **slow)
+                queue.put("quick", **quick)
+                started, ahead = time.time(), 0
+                for obj in iter(lambda: queue.get_many(WORKERS), []):  # pylint: disable=W0640
+                    if "quick" in obj:
+                        ahead += obj.index("quick")
+                        break
+                    ahead += len(obj)
+                row.extend([ahead, "{:.2f}".format((time.time() - started) * 1000)])
+            rows.append(row)
+
+        report("Quick task behind the slow ones, taken by {} workers".format(WORKERS),
+               ["backlog", "FIFO ahead", "FIFO ms", "lanes ahead", "lanes ms"], rows)
+
+    def test_payloads(self):
+        """
+        Measure encoding and decoding of the client queue payloads.
+
+        :return:
+        """
+        import msgpack
+
+        task = FunctionObject()
+        task.module, task.function, task.args, task.kwargs, task.jid = "system.test", "ping", [], {"text": "x" * 0x40}, "1"
+        response = pickle.dumps({".": None, "uri": "system.test.ping", "return_data": {"text": "x" * 0x1000}})
+        rows = []
+        for name, obj, encode, decode in [
+                ("task, pickled object", task, pickle.dumps, pickle.loads),
+                ("task, msgpack record", task.to_dict(), lambda obj: record.encode(obj, msgpack),
+                 lambda data: FunctionObject.from_dict(record.decode(memoryview(data)))),
+                ("response, pickled bytes", response, pickle.dumps, pickle.loads),
+                ("response, raw record", response, record.encode, lambda data: record.decode(memoryview(data)))]:
+            started = time.time()
+            for _ in range(LENGTHS[-1] * 10):
+                data = encode(obj)
+            encoded = time.time() - started
+            started = time.time()
+            for _ in range(LENGTHS[-1] * 10):
+                decode(data)
+            decoded = time.time() - started
+            rows.append([name, len(data), "{:.0f}".format(LENGTHS[-1] * 10 / encoded),
+                         "{:.0f}".format(LENGTHS[-1] * 10 / decoded)])
+
+        report("Client queue payloads (items/s)", ["payload", "bytes", "encode", "decode"], rows)
@@ -0,0 +1,300 @@
+# coding: utf-8
+"""
+Benchmark of the multi-process Master listener.
+
+Master is started the same way as "sugar master" does: primary process
+starts the workers registry and re-executes itself per secondary worker.
+Workers are sharing loopback port via SO_REUSEPORT, decode job returns
+by the Master protocol and its router, publish peer membership to the
+registry and route returns with their job store reports to the primary
+worker, which counts them. Job store drops the reports, TLS is not used.
+"""
+import os
+import sys
+import time
+import base64
+import socket
+import struct
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+if __name__ == "__main__":  # Worker process, started by the benchmark or by the pool
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from tests.benchmarks import benchmark, report
+
+CLIENTS = 8          # Client processes
+CONNECTIONS = 50     # Connections per client process
+MESSAGES = 2000      # Messages per client process
+RETURN_DATA = {"output": "x" * 0x400, "changes": list(range(0x40))}
+
+
+class _PeerRegistry:
+    """
+    Peers of the worker, published to the workers registry.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.peers = {}
+
+    def register(self, machine_id: str, peer) -> None:
+        self.peers[machine_id] = peer
+        if self.workers is not None:
+            self.workers.publish(machine_id)
+
+    def unregister(self, machine_id: str, timestamp: float) -> None:
+        if self.peers.pop(machine_id, None) is not None and self.workers is not None:
+            self.workers.withdraw(machine_id)
+
+    def get_hostname(self, machine_id: str) -> str:
+        return machine_id
+
+
+class _JobStore:
+    """
+    Job store, that drops everything.
+    """
+    def report_job(self, **kwargs) -> None:
+        pass
+
+
+def _get_core(workers, expected: int, path: str):
+    """
+    Server core of the benchmark: returns are routed by the real Master code and counted by the primary worker.
+
+    :param workers: WorkerHandle or None
+    :param expected: amount of returns to count
+    :param path: directory of the benchmark
+    :return: core
+    """
+    from types import SimpleNamespace
+    from sugar.components.server.core import ServerCore
+
+    class Core:
+        on_job_return = ServerCore.__class_ref__.on_job_return
+
+        def __init__(self):
+            self.config = SimpleNamespace(cache=SimpleNamespace(path=path))
+            self.peer_registry = _PeerRegistry(workers)
+            self.jobstore = _JobStore()
+            self.returned = 0
+
+        def push_job_return(self, *args) -> None:
+            self.returned += 1
+            if self.returned == expected:
+                open(os.path.join(path, "done"), "w").close()
+
+        def remove_client_protocol(self, proto, timestamp: float) -> None:
+            self.peer_registry.unregister(proto.get_machine_id(), timestamp)
+
+    return Core()
+
+
+def _master(args: list) -> None:
+    """
+    Master process, primary or secondary worker.
+
+    :param args: command line
+    :return: None
+    """
+    from unittest.mock import patch
+    from twisted.internet import reactor
+    from twisted.internet.threads import deferToThread
+    from sugar.components.server.workers import WorkerPool, WorkerHandle, RoutedJobStore, listen_sharded
+
+    parser = argparse.ArgumentParser()
+    for name in ["port", "workers", "expected"]:
+        parser.add_argument(name, type=int)
+    parser.add_argument("path")
+    parser.add_argument("--worker", type=int, default=None)
+    args = parser.parse_args(args)
+
+    pool = workers = None
+    if args.worker is not None:
+        workers = WorkerHandle.connect(args.worker)
+    elif args.workers > 1:
+        pool = WorkerPool(args.workers, args.path)
+        workers = pool.start()
+
+    core = _get_core(workers, args.expected, args.path)
+    if args.worker is not None:
+        core.jobstore = RoutedJobStore(workers)
+    with patch("sugar.components.server.protocols.get_server_core", return_value=core):
+        from sugar.components.server.protocols import SugarServerFactory, SugarServerProtocol
+        factory = SugarServerFactory("ws://127.0.0.1:{}".format(args.port))
+        factory.protocol = SugarServerProtocol
+    if workers is not None:
+        deferToThread(workers.channel_loop, core)
+        reactor.addSystemEventTrigger("before", "shutdown", workers.stop)
+    if pool is not None:
+        reactor.addSystemEventTrigger("before", "shutdown", pool.stop)
+
+    listen_sharded(factory, port=args.port, interface="127.0.0.1")
+    index = args.worker or 0
+    reactor.callWhenRunning(lambda: open(os.path.join(args.path, "ready-{}".format(index)), "w").close())
+    reactor.run()
+
+
+def _get_frame(machine_id: str) -> bytes:
+    """
+    Get masked WebSocket frame of the job return.
+
+    :param machine_id: machine ID of the client
+    :return: bytes
+    """
+    from sugar.transport import ObjectGate, RunnerModulesMsgFactory
+    from sugar.transport.serialisable import Serialisable
+
+    msg = Serialisable()
+    msg.component = RunnerModulesMsgFactory.COMPONENT
+    msg.jid = "20200101120000000000_1"
+    msg.machine_id = machine_id
+    msg.uri = "system.test.ping"
+    msg.src = ""
+    msg.errcode = 0
+    msg.errmsg = ""
+    msg.finished = "2020-01-01T12:00:00.000000+00:00"
+    msg.return_data = RETURN_DATA
+    msg.infos, msg.warnings, msg.errors = [], [], []
+    payload = ObjectGate(msg).pack(True)
+
+    if len(payload) < 0x7e:
+        header = struct.pack("!BB", 0x82, 0x80 | len(payload))
+    elif len(payload) < 0x10000:
+        header = struct.pack("!BBH", 0x82, 0x80 | 0x7e, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x82, 0x80 | 0x7f, len(payload))
+    return header + b"\x00" * 4 + payload  # Zero mask keeps the payload as is
+
+
+def _connect(port: int) -> socket.socket:
+    """
+    Open WebSocket connection.
+
+    :param port: port to connect
+    :return: socket
+    """
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall("GET / HTTP/1.1\r\nHost: 127.0.0.1:{}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 "Sec-WebSocket-Key: {}\r\nSec-WebSocket-Version: 13\r\n\r\n".format(
+                     port, base64.b64encode(os.urandom(0x10)).decode()).encode())
+    response = b""
+    while b"\r\n\r\n" not in response:
+        chunk = sock.recv(0x1000)
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        response += chunk
+    assert response.startswith(b"HTTP/1.1 101"), response
+
+    return sock
+
+
+def _client(idx: int, port: int, results, finished) -> None:
+    """
+    Client process: open connections, then send job returns over them.
+
+    :param idx: index of the client process
+    :param port: port to connect
+    :param results: queue for the timings
+    :param finished: event, set when all returns are counted
+    :return: None
+    """
+    frames = [_get_frame("{}-{}".format(idx, conn)) for conn in range(CONNECTIONS)]
+
+    start = time.time()
+    connections = [_connect(port) for _ in range(CONNECTIONS)]
+    connected = time.time() - start
+
+    started = time.time()
+    for msg_idx in range(MESSAGES):
+        conn = msg_idx % CONNECTIONS
+        connections[conn].sendall(frames[conn])
+    results.put((connected, started))
+
+    finished.wait()
+    for sock in connections:
+        sock.close()
+
+
+def _free_port() -> int:
+    """
+    Get free loopback port.
+
+    :return: port number
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_file(path: str, timeout: float = 120) -> float:
+    """
+    Wait for the file to appear.
+
+    :param path: path of the file
+    :param timeout: seconds
+    :return: time, when the file is found
+    """
+    limit = time.time() + timeout
+    while not os.path.exists(path):
+        assert time.time() < limit, "Timed out waiting for {}".format(path)
+        time.sleep(0.005)
+    return time.time()
+
+
+@benchmark
+class TestServerWorkersBenchmark:
+    """
+    Connection and message throughput against worker count.
+    """
+    def test_workers_scaling(self):
+        """
+        Measure throughput for 1, 2, 4... workers up to the amount of CPUs.
+
+        :return:
+        """
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+        rows = []
+        workers = 1
+        while workers <= max(multiprocessing.cpu_count(), 1):
+            port = _free_port()
+            path = tempfile.mkdtemp()
+            master = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(port), str(workers),
+                                       str(CLIENTS * MESSAGES), path], env=env)
+            try:
+                for index in range(workers):
+                    _wait_file(os.path.join(path, "ready-{}".format(index)))
+
+                results = multiprocessing.Queue()
+                finished = multiprocessing.Event()
+                clients = [multiprocessing.Process(target=_client, args=(idx, port, results, finished))
+                           for idx in range(CLIENTS)]
+                start = time.time()
+                for client in clients:
+                    client.start()
+                timings = [results.get() for _ in clients]
+                done = _wait_file(os.path.join(path, "done"))
+                finished.set()
+                for client in clients:
+                    client.join()
+            finally:
+                master.terminate()
+                master.wait()
+
+            connected = max(timing[0] for timing in timings)
+            messaged = done - min(timing[1] for timing in timings)
+            rows.append((workers, int(CLIENTS * CONNECTIONS / connected), int(CLIENTS * MESSAGES / messaged),
+                         round(done - start, 2)))
+            workers *= 2
+
+        report("Master workers (loopback, {} client processes)".format(CLIENTS),
+               ["workers", "connections/s", "messages/s", "elapsed, s"], rows)
+
+
+if __name__ == "__main__":
+    _master(sys.argv[1:])
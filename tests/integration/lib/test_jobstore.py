@@ -10,6 +10,8 @@ import datetime
 import time
 import tarfile
 import hashlib
+import sqlite3
+import threading
 
 import pytest
 
@@ -20,6 +22,12 @@ from sugar.config import get_config
 from tests.integration.fixtures import get_barestates_root
 from sugar.components.server.pdatastore import PDataContainer
 from sugar.lib.jobstore.const import JobTypes
+from sugar.lib.jobstore.writer import DatabaseWriter, OnCommit
+from sugar.lib.jobstore import migrations
+from sugar.lib.jobstore.partitions import RetentionPolicy
+from sugar.utils.db import database
+from sugar.transport.serialisable import ObjectGate
+from sugar.lib.compat import yaml
 
 
 @pytest.fixture
@@ -39,28 +47,26 @@ def targets_list():
 
 class TestBasicJobStore:
     """
-    Basic Job Store test suite (e.g. db works at all).
+    Basic Job Store test suite (e.g. db works at all), shared by all the backends.
     """
-    def setup_method(self):
+
+    @pytest.fixture(autouse=True, params=["sqlite", "log"])
+    def backend(self, request):
         """
-        Perform setup before every test method.
-        :return:
+        Run every test against every backend of the job store.
+
+        :param request: backend name
+        :return: job store
         """
-        from sugar.lib.jobstore import JobStorage
+        from sugar.lib.jobstore import BACKENDS
 
+        self.storage = BACKENDS[request.param]
         self._path = "/tmp/jobstore"
-        self.store = JobStorage(get_config(), path=self._path)
-
-    def teardown_method(self):
-        """
-        Perform teardown after every test method.
-        :return:
-        """
+        self.store = self.storage(get_config(), path=self._path)
+        yield self.store
         self.store.close()
         if os.path.exists(self._path):
             shutil.rmtree(self._path)
-        del self.store
-        del self._path
 
     def test_register_job(self, targets_list):
         """
@@ -332,6 +338,34 @@ class TestBasicJobStore:
             succeed.pop(succeed.index(job.jid))
         assert not succeed
 
+    def test_status_headers(self, get_barestates_root, targets_list):
+        """
+        Status queries return every job once, as a header, filtered by time and tag.
+
+        :param get_barestates_root:
+        :return:
+        """
+        uri = "job_store.test_jobstore_register_job"
+        state = StateCompiler(get_barestates_root).compile(uri)
+        jids = []
+        for tag in ["first", "second"]:
+            jid = self.store.new(query=":a", clientslist=targets_list, uri=uri, args="", job_type=JobTypes.RUNNER, tag=tag)
+            for target in targets_list:
+                self.store.add_tasks(jid, *state.tasklist, target=target, src=state.to_yaml())
+                for task in state.tasklist:
+                    for call in task.calls:
+                        self.store.report_call(jid=jid, idn=task.idn, uri=call.uri, target=target, errcode=1,
+                                               output="{}", finished=datetime.datetime.now(tz=pytz.UTC))
+            jids.append(jid)
+
+        failed = self.store.get_failed()
+        assert [job.jid for job in failed] == list(reversed(jids))
+        assert failed[0].tag == "second" and not failed[0].__dict__.get("results")
+        assert [job.jid for job in self.store.get_finished(tag="first")] == [jids[0]]
+        assert not self.store.get_suceeded()
+        assert not self.store.get_failed(since=datetime.datetime.now(tz=pytz.UTC))
+        assert len(self.store.get_failed(until=datetime.datetime.now(tz=pytz.UTC))) == 2
+
     def test_get_tagged_jobs(self, get_barestates_root, targets_list):
         """
         Test get all tagged jobs
@@ -372,6 +406,35 @@ class TestBasicJobStore:
         assert len(self.store.get_all(limit=None, offset=0)) == 100
         assert len(self.store.get_all(limit=25, offset=0)) == 25
 
+    def test_iter_jobs(self, targets_list):
+        """
+        Test streaming job listing with the keyset cursor.
+
+        :return:
+        """
+        jids = [self.store.new(query=":a", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+                for _ in range(10)]
+        self.store.PAGE_SIZE = 3
+
+        rows = list(self.store.iter_jobs(fields=["status", "targets"]))
+        assert [row["jid"] for row in rows] == list(reversed(jids))
+        assert set(rows[0]) == {"jid", "created", "status", "targets"}
+        assert rows[0]["targets"] == len(targets_list)
+        assert rows[0]["created"].tzinfo is not None
+
+        page = list(self.store.iter_jobs(limit=4))
+        assert [row["jid"] for row in page] == list(reversed(jids))[:4]
+        page = list(self.store.iter_jobs(cursor=(page[-1]["created"], page[-1]["jid"]), limit=4))
+        assert [row["jid"] for row in page] == list(reversed(jids))[4:8]
+
+        overview = self.store.get_all_overview(limit=5, offset=8)
+        assert [job.jid for job in overview] == list(reversed(jids))[8:]
+        assert overview[0].results == len(targets_list)
+
+        with pytest.raises(sugar.lib.exceptions.SugarJobStoreException) as exc:
+            list(self.store.iter_jobs(fields=["results"]))
+        assert "Unknown fields: results" in str(exc)
+
     def test_expire_jobs(self, targets_list):
         """
         Test expire jobs.
@@ -428,6 +491,32 @@ class TestBasicJobStore:
             for f_gen in ["source", "result"]:
                 assert os.path.exists("{}{}/{}.yaml".format(arch_extracted_path, target.host, f_gen))
 
+    @pytest.mark.parametrize("compression,process", [(None, False), ("gz", True), ("xz", False)])
+    def test_export_streaming(self, targets_list, compression, process):
+        """
+        Test export with the compression in a separate process, paging through results
+        and multi-byte content.
+
+        :return:
+        """
+        for target in targets_list:
+            self.store.add_host(fqdn=target.host, osid=target.id, ipv4="127.0.0.1", ipv6="::1")
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        for target in targets_list:
+            self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"text": "Grüße, 世界"}),
+                                  finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        self.store.PAGE_SIZE = 1
+
+        archpath = self.store.export(jid, path=self._path, compression=compression, process=process)
+        assert archpath.endswith(".tar" if compression is None else ".tar." + compression)
+        with tarfile.open(archpath) as tar:
+            for target in targets_list:
+                member = tar.extractfile("{}/some.uri-return.yaml".format(target.host))
+                assert json.loads(member.read().decode("utf-8")) == {"text": "Grüße, 世界"}
+                result = yaml.safe_load(tar.extractfile("{}/result.yaml".format(target.host)).read().decode("utf-8"))
+                assert [task["identifier"] for task in result["tasks"]] == ["some.uri"]
+            assert "job-info.yaml" in tar.getnames()
+
     def test_report_job_result(self, get_barestates_root, targets_list):
         """
         Test job reporting.
@@ -528,6 +617,65 @@ class TestBasicJobStore:
         assert len(self.store.get_scheduled(targets_list[0], mark=True)) == 1
         assert len(self.store.get_scheduled(targets_list[0])) == 0
 
+    def test_pending_index(self, targets_list):
+        """
+        Pending work index follows fired results and is rebuilt on startup.
+
+        :return:
+        """
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        assert self.store.has_pending(targets_list[0])
+        assert self.store.has_pending(targets_list[1])
+
+        self.store.set_as_fired(jid, target=targets_list[0])
+        assert not self.store.get_scheduled(targets_list[0])
+        assert not self.store.has_pending(targets_list[0])
+
+        self.store.close()
+        self.store = self.storage(get_config(), path=self._path)
+        assert not self.store.has_pending(targets_list[0])
+        assert self.store.has_pending(targets_list[1])
+        assert len(self.store.get_scheduled(targets_list[1], mark=True)) == 1
+        assert not self.store.has_pending(targets_list[1])
+
+        self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        self.store.delete_by_jid(jid)
+        assert self.store.has_pending(targets_list[0])
+        assert len(self.store.get_scheduled(targets_list[0])) == 1
+
+    def test_summary(self, targets_list):
+        """
+        Job summary follows fired and returned results.
+        Job is finished only when all results are returned.
+
+        :return:
+        """
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        stats = self.store.get_done_stats(jid)
+        assert (stats.targets, stats.fired, stats.returned, stats.failed) == (2, 0, 0, 0)
+        assert not stats.done
+
+        for target in targets_list:
+            self.store.set_as_fired(jid, target=target)
+        self.store.report_job(jid=jid, target=targets_list[0], src="", return_data=json.dumps({"ret": 0}),
+                              finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        stats = self.store.get_done_stats(jid)
+        assert (stats.targets, stats.fired, stats.returned, stats.failed) == (2, 2, 1, 0)
+        assert not stats.done
+        assert self.store.get_by_jid(jid).finished is None
+
+        # Repeated return of the same target is not counted
+        for errcode in [0, 1]:
+            self.store.report_job(jid=jid, target=targets_list[errcode], src="", return_data=json.dumps({"ret": errcode}),
+                                  finished=datetime.datetime.now(tz=pytz.UTC), errcode=errcode)
+        stats = self.store.get_done_stats(jid)
+        assert (stats.targets, stats.fired, stats.returned, stats.failed) == (2, 2, 2, 1)
+        assert stats.done
+        assert stats.completed.tzinfo is not None
+        job = self.store.get_by_jid(jid)
+        assert job.finished is not None
+        assert job.status == "Finished"
+
     def test_get_scheduled_no_hostname(self, targets_list):
         """
         Raise an exception if hostname is not specified.
@@ -588,3 +736,556 @@ class TestBasicJobStore:
         host = self.store.get_host(fqdn="gorilla.domain.lan")
         assert host.fqdn == "gorilla.domain.lan"
         assert host.ipv4 == "10.190.1.1"
+
+
+class TestSQLiteJobStore:
+    """
+    SQLite job store test suite: schema, connections, blobs and partitions.
+    """
+    def setup_method(self):
+        """
+        Perform setup before every test method.
+        :return:
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        self._path = "/tmp/jobstore"
+        self.store = JobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Perform teardown after every test method.
+        :return:
+        """
+        self.store.close()
+        if os.path.exists(self._path):
+            shutil.rmtree(self._path)
+        del self.store
+        del self._path
+
+    def test_pending_interleaved(self, targets_list):
+        """
+        Job, registered while fired jobs of the same host are being committed,
+        stays pending.
+
+        :return:
+        """
+        target = targets_list[0]
+        first = self.store.new(query="*", clientslist=[target], uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        writer = self.store._writer  # pylint: disable=W0212
+        gate = threading.Event()
+        writer.submit(gate.wait)
+
+        def wait_pending(count: int):
+            while writer.pending < count:
+                time.sleep(0.001)
+
+        scheduled = []
+        picker = threading.Thread(target=lambda: scheduled.extend(self.store.get_scheduled(target, mark=True)))
+        picker.start()
+        wait_pending(2)
+        registrar = threading.Thread(target=lambda: scheduled.append(self.store.new(
+            query="*", clientslist=[target], uri="some.uri", args="", job_type=JobTypes.RUNNER)))
+        registrar.start()
+        wait_pending(3)
+        gate.set()
+        picker.join()
+        registrar.join()
+
+        second = scheduled.pop()
+        assert [job.jid for job in scheduled] == [first]
+        assert self.store.has_pending(target)
+        assert [job.jid for job in self.store.get_scheduled(target)] == [second]
+
+    def test_read_only_connections(self, targets_list):
+        """
+        Database is in WAL mode and raw readers cannot write.
+
+        :return:
+        """
+        self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        readers = self.store._readers  # pylint: disable=W0212
+        assert readers.execute("PRAGMA journal_mode") == [("wal",)]
+        assert readers.execute('SELECT COUNT(*) FROM "Result"') == [(2,)]
+        with pytest.raises(sqlite3.OperationalError):
+            readers.execute('DELETE FROM "Result"')
+
+    def test_migrate_existing(self, targets_list):
+        """
+        Existing database without indexes is migrated in place.
+
+        :return:
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        db_path = self.store._db_path  # pylint: disable=W0212
+        self.store.close()
+
+        connection = sqlite3.connect(db_path)
+        for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+            connection.execute('DROP INDEX "{}"'.format(name))
+        connection.execute("PRAGMA user_version = 0")
+        connection.commit()
+        connection.close()
+
+        self.store = JobStorage(get_config(), path=self._path)
+        connection = sqlite3.connect(db_path)
+        assert self.store.get_by_jid(jid).jid == jid
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == len(migrations.MIGRATIONS)
+        plan = connection.execute('EXPLAIN QUERY PLAN SELECT * FROM "Job" WHERE "jid" = ?', (jid,)).fetchall()
+        assert "unq_job__jid" in str(plan)
+        plan = connection.execute('EXPLAIN QUERY PLAN SELECT * FROM "Result" WHERE "machineid" = ? AND "fired" IS NULL',
+                                  (targets_list[0].id,)).fetchall()
+        assert "idx_result__machineid_fired" in str(plan)
+        connection.close()
+
+    def test_migrate_summary(self, targets_list):
+        """
+        Summary of the existing jobs is backfilled by the migration.
+
+        :return:
+        """
+        from sugar.lib.jobstore import JobStorage
+
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        self.store.set_as_fired(jid, target=targets_list[0])
+        self.store.report_job(jid=jid, target=targets_list[0], src="", return_data=json.dumps({"ret": 0}),
+                              finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        stats = self.store.get_done_stats(jid)
+        db_path = self.store._db_path  # pylint: disable=W0212
+        self.store.close()
+
+        connection = sqlite3.connect(db_path)
+        connection.execute('DELETE FROM "Summary"')
+        connection.execute("PRAGMA user_version = 1")
+        connection.commit()
+        connection.close()
+
+        self.store = JobStorage(get_config(), path=self._path)
+        migrated = self.store.get_done_stats(jid)
+        assert vars(migrated) == vars(stats)
+
+    def test_report_tasks_by_uri(self, targets_list):
+        """
+        Reports of the different tasks of the same machine are kept apart.
+
+        :return:
+        """
+        jid = self.store.new(query="*", clientslist=targets_list[:1], uri="some.uri", args="", job_type=JobTypes.STATE)
+        for uri in ["some.first", "some.second", "some.first"]:
+            self.store.report_job(jid=jid, target=targets_list[0], src="", return_data=json.dumps({"uri": uri}),
+                                  finished=datetime.datetime.now(tz=pytz.UTC), uri=uri, errcode=0)
+        tasks = self.store.get_by_jid(jid).results[0].tasks
+        assert [(task.idn, task.return_data) for task in tasks] == [("some.first", {"uri": "some.first"}),
+                                                                    ("some.second", {"uri": "some.second"})]
+        assert self.store.get_done_stats(jid).tasks == 2
+
+    def test_blobs(self, targets_list):
+        """
+        Large outputs are stored once as blobs, resolved on read
+        and collected once their jobs are deleted.
+
+        :return:
+        """
+        self.store._blobs.threshold = 0x10  # pylint: disable=W0212
+        return_data = json.dumps({"data": "x" * 0x100})
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        for target in targets_list:
+            self.store.report_job(jid=jid, target=target, src="", return_data=return_data,
+                                  finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        self.store._writer.flush()  # pylint: disable=W0212
+        assert self.store.get_stats()["blobs"] == {"stored": 1, "deduplicated": 1}
+
+        refs = sqlite3.connect(self.store._db_path).execute('SELECT DISTINCT "return_data" FROM "Task"').fetchall()
+        assert len(refs) == 1 and refs[0][0].startswith("blob:")
+        for result in self.store.get_by_jid(jid).results:
+            assert result.tasks[0].return_data == json.loads(return_data)
+
+        blobs_path = self.store._blobs.path  # pylint: disable=W0212
+        assert sum(len(files) for _, _, files in os.walk(blobs_path)) == 1
+        self.store._blobs.GRACE = 0  # pylint: disable=W0212
+        self.store.delete_by_jid(jid)
+        assert sum(len(files) for _, _, files in os.walk(blobs_path)) == 0
+
+    def test_blobs_getters(self, targets_list):
+        """
+        Payloads, stored as blobs, are resolved by every getter of the live and the sealed jobs.
+
+        :return:
+        """
+        self.store._blobs.threshold = 0x10  # pylint: disable=W0212
+        return_data = json.dumps({"data": "x" * 0x100})
+        src = "src: {}".format("y" * 0x100)
+        sealed = "20200101120000000000_1"
+        for jid in [sealed, None]:
+            jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER,
+                                 tag="blobs", jid=jid)
+            targets = targets_list if jid == sealed else targets_list[:1]  # Live job is pending on the second target
+            for target in targets:
+                self.store.set_as_fired(jid, target)
+                self.store.report_job(jid=jid, target=target, src=src, return_data=return_data,
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        self.store._writer.flush()  # pylint: disable=W0212
+
+        def get_tasks(jobs: list) -> list:
+            return [task for job in jobs for result in job.results for task in result.tasks]
+
+        pending = targets_list[1]
+        getters = {
+            "unpicked": lambda: self.store.get_unpicked(target=pending),
+            "scheduled": lambda: self.store.get_scheduled(pending),
+            "later_then": lambda: self.store.get_later_then(datetime.datetime(2019, 12, 31)),
+            "by_tag": lambda: self.store.get_by_tag("blobs"),
+            "all": lambda: self.store.get_all(limit=None),
+        }
+        for name, getter in getters.items():
+            tasks = get_tasks(getter())
+            assert tasks, name
+            assert {(task.return_data, task.src) for task in tasks} == {(return_data, src)}, name
+
+        assert self.store.seal(today=datetime.date(2020, 1, 4)) == 1
+        for name in ["later_then", "by_tag", "all"]:
+            tasks = get_tasks(getters[name]())
+            assert len(tasks) == 3, name
+            assert {(task.return_data, task.src) for task in tasks} == {(return_data, src)}, name
+
+    def test_get_by_jid_loader(self, targets_list):
+        """
+        Job is loaded with the hosts in a fixed amount of queries
+        and its payloads are decoded on the first access.
+
+        :return:
+        """
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        for target in targets_list:
+            self.store.add_host(fqdn=target.host, osid=target.id, ipv4="127.0.0.1", ipv6="::1")
+            self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"host": target.host}),
+                                  finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        self.store._writer.flush()  # pylint: disable=W0212
+
+        queries = []
+        with self.store._readers.connection() as connection:  # pylint: disable=W0212
+            connection.set_trace_callback(queries.append)
+        job = self.store.get_by_jid(jid)
+        with self.store._readers.connection() as connection:  # pylint: disable=W0212
+            connection.set_trace_callback(None)
+        assert len([sql for sql in queries if sql.startswith("SELECT")]) == 5
+
+        assert {result.host.fqdn for result in job.results} == {target.host for target in targets_list}
+        task = job.results[0].tasks[0]
+        assert "return_data" not in task.__dict__
+        assert task.return_data == {"host": job.results[0].host.fqdn}
+        assert "return_data" in task.__dict__
+
+        data = ObjectGate(job).to_dict()
+        assert {result["tasks"][0]["return_data"]["host"] for result in data["results"]} == {
+            target.host for target in targets_list}
+        assert data["results"][0]["tasks"][0]["log_info"] == []
+        assert "id" not in data and "machineid" not in data["results"][0]
+
+    def test_partitions(self, targets_list):
+        """
+        Finished jobs of the past days are sealed into the day partitions
+        and still found by the reads.
+
+        :return:
+        """
+        jids = ["20200101120000000000_1", "20200101130000000000_1", "20200102120000000000_1"]
+        for jid in jids:
+            self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER,
+                           tag="old", jid=jid)
+            for target in targets_list:
+                self.store.set_as_fired(jid, target)
+                self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"jid": jid}),
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        unfinished = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER,
+                                    jid="20200103120000000000_1")
+        live = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+
+        assert self.store.seal(today=datetime.date(2020, 1, 4)) == 3
+        assert [partition.day for partition in self.store._partitions] == ["20200102", "20200101"]  # pylint: disable=W0212
+        assert sqlite3.connect(self.store._db_path).execute('SELECT COUNT(*) FROM "Job"').fetchone()[0] == 2
+
+        job = self.store.get_by_jid(jids[0])
+        assert job.jid == jids[0]
+        assert [result.tasks[0].return_data for result in job.results] == [{"jid": jids[0]}] * len(targets_list)
+        assert self.store.get_done_stats(jids[0]).done
+        assert {job.jid for job in self.store.get_by_tag("old")} == set(jids)
+        assert [row["jid"] for row in self.store.iter_jobs(fields=["status"])] == [live, unfinished] + list(reversed(jids))
+        assert len(self.store.get_all(limit=4, offset=1)) == 4
+        assert self.store.export(jids[2], path=self._path)
+
+        self.store.delete_by_jid(jids[2])
+        assert self.store.get_by_jid(jids[2]) is None
+        assert [partition.day for partition in self.store._partitions] == ["20200101"]  # pylint: disable=W0212
+
+        # Unfinished jobs are sealed only once expired
+        assert self.store.seal(today=datetime.date(2020, 1, 10)) == 0
+        assert self.store.seal(max_age=2, today=datetime.date(2020, 1, 5)) == 0
+        assert self.store.seal(max_age=2, today=datetime.date(2020, 1, 6)) == 1
+        assert self.store.get_by_jid(unfinished).jid == unfinished
+
+    def test_seal_in_progress(self, targets_list):
+        """
+        Job of the past days, that is not returned by all its targets, stays live:
+        offline target still gets it and late report is not dropped.
+
+        :return:
+        """
+        jid = "20200101120000000000_1"
+        returned, offline = targets_list
+        self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER, jid=jid)
+        self.store.set_as_fired(jid, returned)
+        self.store.report_job(jid=jid, target=returned, src="", return_data=json.dumps({}),
+                              finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+
+        assert self.store.apply_retention(RetentionPolicy()) == []
+        assert self.store.apply_retention(RetentionPolicy(max_count=10)) == []
+        assert self.store.seal(today=datetime.date(2020, 1, 10)) == 0
+        assert self.store.has_pending(offline)
+        assert [job.jid for job in self.store.get_scheduled(offline, mark=True)] == [jid]
+
+        # Fired, but not returned yet
+        assert self.store.seal(today=datetime.date(2020, 1, 10)) == 0
+        self.store.report_job(jid=jid, target=offline, src="", return_data=json.dumps({}),
+                              finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        stats = self.store.get_done_stats(jid)
+        assert (stats.returned, stats.targets) == (2, 2)
+
+        assert self.store.seal(today=datetime.date(2020, 1, 10)) == 1
+        assert self.store.get_done_stats(jid).done
+
+    def test_retention(self, targets_list):
+        """
+        Retention drops whole partitions from the oldest.
+
+        :return:
+        """
+        for day in range(1, 6):
+            jid = "202001{:02d}120000000000_1".format(day)
+            self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER, jid=jid)
+            for target in targets_list:
+                self.store.set_as_fired(jid, target)
+                self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({}),
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+
+        policy = RetentionPolicy(max_count=3)
+        assert self.store.apply_retention(policy) == ["20200102", "20200101"]
+        assert len(self.store.get_all(limit=None)) == 3
+
+        policy = RetentionPolicy(max_age=1)
+        assert policy.select(list(self.store._partitions), today=datetime.date(2020, 1, 5)) == [  # pylint: disable=W0212
+            "20200103"]
+
+        # Partitions of the days before are dropped whole
+        self.store.expire(datetime.datetime(2020, 1, 4, 12, 0).astimezone())
+        assert [partition.day for partition in self.store._partitions] == ["20200105", "20200104"]  # pylint: disable=W0212
+
+
+class TestLogJobStore:
+    """
+    Append-only log job store test suite: replay and compaction.
+    """
+    def setup_method(self):
+        """
+        Perform setup before every test method.
+        :return:
+        """
+        from sugar.lib.jobstore import LogJobStorage
+
+        self._path = "/tmp/jobstore"
+        self.store = LogJobStorage(get_config(), path=self._path)
+
+    def teardown_method(self):
+        """
+        Perform teardown after every test method.
+        :return:
+        """
+        self.store.close()
+        if os.path.exists(self._path):
+            shutil.rmtree(self._path)
+
+    def _reopen(self):
+        """
+        Reopen the job store, replaying the log.
+
+        :return: None
+        """
+        from sugar.lib.jobstore import LogJobStorage
+
+        self.store.close()
+        self.store = LogJobStorage(get_config(), path=self._path)
+
+    def test_replay(self, get_barestates_root, targets_list):
+        """
+        Indexes are rebuilt from the log and an incomplete record at the end is cut off.
+
+        :return:
+        """
+        uri = "job_store.test_jobstore_register_job"
+        jid = self.store.new(query="*", clientslist=targets_list, uri=uri, args="", job_type=JobTypes.RUNNER)
+        self.store.set_as_fired(jid, target=targets_list[0])
+        state = StateCompiler(get_barestates_root).compile(uri)
+        self.store.add_tasks(jid, *state.tasklist, target=targets_list[0], src=state.to_yaml())
+        task = state.tasklist[0]
+        self.store.report_call(jid=jid, target=targets_list[0], idn=task.idn, uri=task.calls[0].uri, errcode=1,
+                               output=json.dumps({}), finished=datetime.datetime.now(tz=pytz.UTC))
+        self.store.report_job(jid=jid, target=targets_list[0], src="", return_data=json.dumps({"ret": 0}),
+                              finished=datetime.datetime.now(tz=pytz.UTC), errcode=1)
+        stats = vars(self.store.get_done_stats(jid))
+        log_path = self.store._log_path  # pylint: disable=W0212
+
+        self._reopen()
+        assert vars(self.store.get_done_stats(jid)) == stats
+        assert [job.jid for job in self.store.get_failed()] == [jid]
+        assert not self.store.has_pending(targets_list[0])
+        assert self.store.has_pending(targets_list[1])
+
+        size = os.path.getsize(log_path)
+        with open(log_path, "ab") as log_fh:
+            log_fh.write(b'["delete","' + jid.encode())
+        self._reopen()
+        assert os.path.getsize(log_path) == size
+        assert [task.return_data for task in self.store.get_by_jid(jid).results[0].tasks if task.return_data] == [{"ret": 0}]
+
+    def test_compaction(self, targets_list):
+        """
+        Log is rewritten without the deleted jobs, once they take most of it.
+
+        :return:
+        """
+        self.store.COMPACT_MIN = 0x400
+        kept = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER, tag="kept")
+        for _ in range(10):
+            jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER,
+                                 tag="deleted")
+            for target in targets_list:
+                self.store.report_job(jid=jid, target=target, src="", return_data=json.dumps({"data": "x" * 0x40}),
+                                      finished=datetime.datetime.now(tz=pytz.UTC), errcode=0)
+        size = self.store.get_stats()["log"]["size"]
+        self.store.delete_by_tag("deleted")
+        stats = self.store.get_stats()["log"]
+        assert stats["garbage"] == 0
+        assert stats["size"] < size / 4
+
+        self._reopen()
+        assert [job.jid for job in self.store.get_all()] == [kept]
+
+    def test_finished_job(self, targets_list):
+        """
+        Job, finished without the reports of the targets, is read from the log.
+
+        :return:
+        """
+        jid = self.store.new(query="*", clientslist=targets_list, uri="some.uri", args="", job_type=JobTypes.RUNNER)
+        self.store.report_job_finished(jid)
+
+        self._reopen()
+        job = self.store.get_by_jid(jid)
+        assert job.finished is not None
+        assert len(job.results) == len(targets_list)
+
+    def test_single_process(self):
+        """
+        Log is not opened, while another process holds it.
+
+        :return:
+        """
+        from sugar.lib.jobstore import LogJobStorage
+
+        with pytest.raises(sugar.lib.exceptions.SugarJobStoreException) as exc:
+            LogJobStorage(get_config(), path=self._path)
+        assert "opened by another process" in str(exc.value)
+
+        self._reopen()
+        assert not self.store.get_all()
+
+
+class TestDatabaseWriter:
+    """
+    Single writer of the job store test suite.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self.writer = DatabaseWriter(database, interval=0.01, size=3)
+        self.applied = []
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.writer.close()
+
+    def _mutation(self, value):
+        """
+        Test mutation.
+
+        :param value: value to apply
+        :return: value
+        """
+        assert threading.current_thread().name == "jobstore-writer"
+        self.applied.append(value)
+        return value
+
+    def test_flush(self):
+        """
+        Flush waits for all queued mutations in order.
+
+        :return:
+        """
+        for value in range(10):
+            self.writer.submit(self._mutation, value)
+        self.writer.flush()
+        assert self.applied == list(range(10))
+        assert not self.writer.pending
+        assert self.writer.get_stats()["group_size"]["count"] >= 4
+
+    def test_call(self):
+        """
+        Synchronous call returns result of the mutation or raises its exception.
+
+        :return:
+        """
+        def fail():
+            raise sugar.lib.exceptions.SugarJobStoreException("Faulty mutation")
+
+        self.writer.submit(self._mutation, 1)
+        assert self.writer.call(self._mutation, 2) == 2
+        with pytest.raises(sugar.lib.exceptions.SugarJobStoreException) as exc:
+            self.writer.call(fail)
+        assert "Faulty mutation" in str(exc)
+        assert self.writer.get_stats()["errors"] == 1
+
+    def test_on_commit(self):
+        """
+        Faulty mutation does not discard the rest of the group.
+        Callback of the mutation is called only after commit.
+
+        :return:
+        """
+        committed = []
+
+        def mutation(value):
+            self.applied.append(value)
+            if value is None:
+                raise ValueError("Faulty mutation")
+            return OnCommit(lambda: committed.append(value))
+
+        for value in [1, None, 2]:
+            self.writer.submit(mutation, value)
+        self.writer.flush()
+        assert committed == [1, 2]
+
+    def test_close(self):
+        """
+        Close commits queued mutations.
+
+        :return:
+        """
+        for value in range(5):
+            self.writer.submit(self._mutation, value)
+        self.writer.close()
+        assert self.applied == list(range(5))
@@ -3,15 +3,32 @@
 Test Persistent Queue object.
 """
 import os
+import time
+import pickle
 import tempfile
 import shutil
 import pytest
-from sugar.lib.perq import FSQueue
-from sugar.lib.perq.qexc import QueueEmpty, QueueFull
+from sugar.lib.perq import FSQueue, SegmentedQueue, MemoryQueue, LaneQueue, QueueFactory, Durability
+from sugar.lib.perq.qexc import QueueEmpty, QueueFull, QueueCorrupt
+from sugar.lib.perq import record
+from sugar.lib.compiler.objtask import FunctionObject
+from sugar.lib.perq.notify import Notifier, NotifyReader
 from mock import MagicMock, patch
 import multiprocessing
 
 
+def _put_later(queue, objs: list) -> None:
+    """
+    Put objects in another process after a while.
+
+    :param queue: queue
+    :param objs: objects to put
+    :return: None
+    """
+    time.sleep(0.2)
+    queue.put_many(objs)
+
+
 class TestFSQueue:
     """
     Persistent FS Queue test suite class.
@@ -50,6 +67,14 @@ class TestFSQueue:
         except (IOError, OSError) as err:
             print("Error removing current method temporary data:", err)
 
+    def _get_frames(self) -> list:
+        """
+        Get names of the xlog frames in the queue.
+
+        :return: list
+        """
+        return sorted(fname for fname in os.listdir(self._current_tree) if fname.endswith(".xlog"))
+
     def test_add(self):
         """
         Add an object to the queue.
@@ -229,12 +254,12 @@ class TestFSQueue:
         """
         fsq = FSQueue(self._current_tree, maxsize=10)
 
-        assert fsq._f_alloc() == "01"
         fsq.put(1)
-        assert fsq._f_alloc() == "02"
+        assert self._get_frames() == ["01.xlog"]
         fsq.put(2)
-        assert fsq._f_alloc() == "03"
+        assert self._get_frames() == ["01.xlog", "02.xlog"]
         fsq.put(3)
+        assert self._get_frames() == ["01.xlog", "02.xlog", "03.xlog"]
 
     def test_fdealloc(self):
         """
@@ -248,10 +273,671 @@ class TestFSQueue:
         fsq.put(2)
         fsq.put(3)
 
-        assert fsq._f_dealloc() == "01"
+        assert self._get_frames()[0] == "01.xlog"
         fsq.get_nowait()
-        assert fsq._f_dealloc() == "02"
+        assert self._get_frames()[0] == "02.xlog"
         fsq.get_nowait()
-        assert fsq._f_dealloc() == "03"
+        assert self._get_frames()[0] == "03.xlog"
         fsq.get_nowait()
-        assert fsq._f_dealloc() is None
+        assert self._get_frames() == []
+
+    def test_put_get_many(self):
+        """
+        Put and get several objects at once.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree, maxsize=5)
+        fsq.put("one")
+        fsq.put_many(["two", "three", "four"])
+        assert fsq.qsize() == 4
+
+        with pytest.raises(QueueFull):
+            fsq.put_many(["five", "six"])
+        assert fsq.qsize() == 4
+
+        assert fsq.get_many(3) == ["one", "two", "three"]
+        assert fsq.get_many(3) == ["four"]
+        assert fsq.get_many(3) == []
+
+    def test_batch_durability(self):
+        """
+        Items are synced together in the batch durability mode.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree, durability=Durability.BATCH, sync_interval=60)
+        with patch("os.fsync", MagicMock()) as fsync:
+            fsq.put_many(["one", "two"])
+            fsq.put("three")
+            assert not fsync.called
+            fsq.flush()
+            assert fsync.call_count == 3
+        assert fsq.get_many(3) == ["one", "two", "three"]
+
+    def test_strict_durability(self):
+        """
+        Items are synced after all of them are written, and the directory once after they are renamed.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree)
+        synced = []
+        with patch("sugar.lib.perq.fsqueue.sync_paths", lambda paths, latency: synced.append(list(paths))):
+            fsq.put_many(["one", "two", "three"])
+        assert [len(paths) for paths in synced] == [3, 1]
+        assert all(path.endswith(".temp") for path in synced[0])
+        assert synced[1] == [self._current_tree]
+        assert fsq.get_many(3) == ["one", "two", "three"]
+
+    def test_notifier(self):
+        """
+        Blocking get wakes up on put from another process.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree, poll=60).use_notify()
+        assert fsq.notifier is not None
+        proc = multiprocessing.Process(target=_put_later, args=(fsq, ["one", "two"]))
+        proc.start()
+        started = time.time()
+        assert fsq.get() == "one"
+        assert time.time() - started < 10
+        proc.join()
+        assert fsq.get_nowait() == "two"
+
+    def test_records(self):
+        """
+        Bytes are stored once, tasks are stored with msgpack, frames of the older version are read.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree).use_msgpack(True)
+        task = FunctionObject()
+        task.module, task.function, task.args, task.kwargs, task.jid = "system.test", "ping", [1], {"text": "hi"}, "123"
+        fsq.put(b"response")
+        fsq.put(task.to_dict())
+        frames = sorted(fname for fname in os.listdir(self._current_tree) if fname.endswith(".xlog"))
+        assert os.path.getsize(os.path.join(self._current_tree, frames[0])) == record.HEADER.size + len(b"response")
+
+        with open(os.path.join(self._current_tree, "0009.xlog"), "wb") as h_frm:
+            h_frm.write(pickle.dumps("legacy"))
+
+        assert fsq.get_nowait() == b"response"
+        restored = FunctionObject.from_dict(fsq.get_nowait())
+        assert (restored.uri, restored.args, restored.kwargs, restored.jid) == ("system.test.ping", [1], {"text": "hi"}, "123")
+        assert fsq.get_nowait() == "legacy"
+
+    def test_recover(self):
+        """
+        Startup pass removes frames of the unfinished puts and quarantines corrupt frames.
+        Stray files are ignored.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree)
+        fsq.put_many(["one", "two", "three"])
+        frames = sorted(fname for fname in os.listdir(self._current_tree) if fname.endswith(".xlog"))
+        with open(os.path.join(self._current_tree, frames[1]), "r+b") as h_frm:
+            h_frm.seek(-1, os.SEEK_END)
+            h_frm.write(b"X")
+        open(os.path.join(self._current_tree, "0004.xlog"), "wb").close()
+        open(os.path.join(self._current_tree, "0005.xlog.temp"), "wb").close()
+        open(os.path.join(self._current_tree, "README"), "w").close()
+
+        fsq = FSQueue(self._current_tree)
+        assert fsq.qsize() == 2
+        assert sorted(os.listdir(os.path.join(self._current_tree, FSQueue.D_QUARANTINE)))[0].startswith(frames[1])
+        assert not os.path.exists(os.path.join(self._current_tree, "0005.xlog.temp"))
+        assert os.path.exists(os.path.join(self._current_tree, "README"))
+        stats = fsq.get_stats()
+        assert (stats["corrupt"], stats["orphans"]) == (2, 1)
+        assert fsq.get_many(5) == ["one", "three"]
+
+    def test_corrupt_get(self):
+        """
+        Frame, corrupted while queued, is quarantined and skipped on get.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree)
+        fsq.put_many(["one", "two"])
+        frame = min(fname for fname in os.listdir(self._current_tree) if fname.endswith(".xlog"))
+        with open(os.path.join(self._current_tree, frame), "r+b") as h_frm:
+            h_frm.seek(-1, os.SEEK_END)
+            h_frm.write(b"X")
+
+        assert fsq.get_nowait() == "two"
+        assert fsq.empty()
+        assert fsq.get_stats()["corrupt"] == 1
+
+    def test_stats(self):
+        """
+        Queue metrics are collected.
+
+        :return:
+        """
+        fsq = FSQueue(self._current_tree)
+        fsq.put_many([b"x" * 0x80, b"y"])
+        fsq.put(b"z" * 0x2000)
+        assert fsq.get_many(2) == [b"x" * 0x80, b"y"]
+
+        stats = fsq.get_stats()
+        assert (stats["depth"], stats["enqueued"], stats["dequeued"]) == (1, 3, 2)
+        assert stats["enqueue_rate"] > 0 and stats["dequeue_rate"] > 0
+        assert stats["fsync"]["count"] == 3 + 2  # Frames and the directory per write
+        assert stats["lock_wait"]["count"] >= 4
+        assert stats["payload"]["count"] == 3
+        assert stats["payload"]["buckets"][0x40] == 1
+        assert stats["payload"]["buckets"][0x100] == 2
+        assert stats["payload"]["buckets"]["+Inf"] == 3
+        assert fsq.get_stats()["enqueue_rate"] == 0
+
+
+class TestSegmentedQueue:
+    """
+    Segmented FS Queue test suite class.
+    """
+    root_path = None
+    _current_tree = None
+
+    def setup_class(self):
+        """
+        Setting up test suite session.
+        """
+        self.root_path = os.path.join(os.path.dirname(__file__), "segq")
+        os.makedirs(self.root_path)
+
+    def teardown_class(self):
+        """
+        Tearing down test suite session.
+        """
+        try:
+            shutil.rmtree(self.root_path)
+        except (IOError, OSError) as err:
+            print("Error removing test suite temporary data:", err)
+
+    def setup_method(self):
+        """
+        Setup method
+        """
+        self._current_tree = tempfile.mkdtemp(dir=self.root_path)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        try:
+            shutil.rmtree(self._current_tree)
+        except (IOError, OSError) as err:
+            print("Error removing current method temporary data:", err)
+
+    def _segments(self) -> list:
+        """
+        Get segment files of the current queue.
+
+        :return: list
+        """
+        return sorted(fname for fname in os.listdir(self._current_tree)
+                      if fname not in ["index", ".lock", SegmentedQueue.D_QUARANTINE])
+
+    def test_ordering(self):
+        """
+        Get objects in the order.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree)
+        sq.put("one")
+        assert sq.get() == "one"
+        for obj in ["two", "three", "four"]:
+            sq.put(obj)
+        assert sq.qsize() == 3
+        assert sq.get() == "two"
+        sq.put("five")
+        assert [sq.get_nowait() for _ in range(3)] == ["three", "four", "five"]
+        assert sq.empty()
+
+        with pytest.raises(QueueEmpty) as exc:
+            sq.get_nowait()
+        assert "Queue is empty" in str(exc)
+
+    @patch("time.sleep", MagicMock(side_effect=Exception("Polling")))
+    def test_empty_get(self):
+        """
+        Get an object from the queue if there is nothing.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree)
+        with pytest.raises(Exception) as exc:
+            sq.get()
+        assert "Polling" in str(exc)
+
+    def test_notify(self):
+        """
+        Test notification.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree).use_notify(multiprocessing.Queue())
+        sq._mp_notify.get = MagicMock(side_effect=Exception("Notified"))
+        with pytest.raises(Exception) as exc:
+            sq.get()
+
+        assert "Notified" in str(exc)
+
+    def test_full_empty(self):
+        """
+        Test queue is full or empty.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, maxsize=3)
+        for obj in ["one", "two", "three"]:
+            sq.put(obj)
+        assert sq.full()
+
+        with pytest.raises(QueueFull) as exc:
+            sq.put("one")
+        assert "Queue is full" in str(exc)
+
+        sq.get_nowait()
+        sq.put("four")
+        assert [sq.get_nowait() for _ in range(3)] == ["two", "three", "four"]
+        assert sq.empty()
+
+    def test_rotation(self):
+        """
+        Segments are rotated when full and removed when consumed.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, segment_size=0x10)
+        for idx in range(10):
+            sq.put(idx)
+        assert len(self._segments()) > 2
+        assert sq.qsize() == 10
+
+        assert [sq.get_nowait() for _ in range(9)] == list(range(9))
+        assert len(self._segments()) == 1
+        sq.put(10)
+        assert [sq.get_nowait() for _ in range(2)] == [9, 10]
+        assert sq.empty()
+
+    def test_producer_segments(self):
+        """
+        Producer does not keep segments, it filled, so consumed segments are freed.
+
+        :return:
+        """
+        producer = SegmentedQueue(self._current_tree, segment_size=200)
+        consumer = SegmentedQueue(self._current_tree, segment_size=200)
+        for _ in range(50):
+            producer.put("x" * 50)
+            assert consumer.get_nowait() == "x" * 50
+        assert len(producer._segments) <= 1
+        assert len(self._segments()) == 1
+
+    def test_reopen(self):
+        """
+        Queue is picked up from the disk by another instance.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, segment_size=0x10)
+        for idx in range(10):
+            sq.put(idx)
+        assert sq.get_nowait() == 0
+        sq.close()
+
+        sq = SegmentedQueue(self._current_tree, segment_size=0x10)
+        assert sq.qsize() == 9
+        assert [sq.get_nowait() for _ in range(9)] == list(range(1, 10))
+
+    def test_recover(self):
+        """
+        Records written after the index are recovered, incomplete record is truncated.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree)
+        sq.put("one")
+        index = sq._read_index()
+        sq.put("two")
+        sq._write_index(index)  # Crash before the index is updated
+        sq.close()
+        with open(os.path.join(self._current_tree, "0000000000000000"), "ab") as segment:
+            segment.write(b"\x00\x00\x01\x00partial")
+
+        sq = SegmentedQueue(self._current_tree)
+        assert sq.qsize() == 2
+        sq.put("three")
+        assert [sq.get_nowait() for _ in range(3)] == ["one", "two", "three"]
+
+    def test_recover_lost_tail(self):
+        """
+        Index, pointing past the data lost in a system crash, is cut to the data on the disk.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, durability=Durability.BATCH)
+        sq.put_many(["one", "two", "three"])
+        sq.close()
+        size = len(record.encode("one"))
+        with open(os.path.join(self._current_tree, "0000000000000000"), "r+b") as segment:
+            segment.truncate(size + 3)
+
+        sq = SegmentedQueue(self._current_tree)
+        assert sq.qsize() == 1
+        assert os.path.getsize(os.path.join(self._current_tree, "0000000000000000")) == size
+        sq.put("four")
+        assert sq.get_many(5) == ["one", "four"]
+        assert sq.empty()
+
+    def test_corrupt_get(self):
+        """
+        Record with the checksum mismatch is quarantined and skipped on get.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree)
+        sq.put_many(["one", "two", "three"])
+        size = len(record.encode("one"))
+        with open(os.path.join(self._current_tree, "0000000000000000"), "r+b") as segment:
+            segment.seek(size * 2 - 1)
+            segment.write(b"X")
+
+        assert sq.get_many(3) == ["one", "three"]
+        assert sq.empty()
+        assert os.listdir(os.path.join(self._current_tree, SegmentedQueue.D_QUARANTINE)) == ["0000000000000000-{:x}".format(size)]
+        stats = sq.get_stats()
+        assert (stats["depth"], stats["dequeued"], stats["corrupt"]) == (0, 2, 1)
+
+    def test_put_get_many(self):
+        """
+        Put and get several objects at once, across the segments.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, maxsize=20, segment_size=0x10)
+        sq.put(0)
+        sq.put_many(range(1, 10))
+        assert sq.qsize() == 10
+        assert len(self._segments()) == 10
+
+        with pytest.raises(QueueFull):
+            sq.put_many(range(11))
+        assert sq.qsize() == 10
+
+        assert sq.get_many(4) == [0, 1, 2, 3]
+        assert sq.get_nowait() == 4
+        assert sq.get_many(10) == [5, 6, 7, 8, 9]
+        assert sq.get_many(10) == []
+        assert len(self._segments()) == 1
+
+    def test_batch_durability(self):
+        """
+        Segments are synced together in the batch durability mode.
+
+        :return:
+        """
+        sq = SegmentedQueue(self._current_tree, durability=Durability.BATCH, sync_interval=0.01)
+        with patch("os.fsync", MagicMock()) as fsync:
+            sq.put("one")
+            sq.put("two")
+            assert not fsync.called
+            time.sleep(0.2)
+            assert fsync.call_count == 1
+        assert sq.get_many(2) == ["one", "two"]
+
+    def test_factory(self):
+        """
+        Durability is selected by the factory.
+
+        :return:
+        """
+        assert isinstance(QueueFactory.seg_queue(self._current_tree, durability=Durability.BATCH), SegmentedQueue)
+        assert isinstance(QueueFactory.seg_queue(self._current_tree, durability=Durability.MEMORY), MemoryQueue)
+        assert isinstance(QueueFactory.fs_queue(self._current_tree, durability=Durability.MEMORY), MemoryQueue)
+        with pytest.raises(ValueError):
+            QueueFactory.fs_queue(self._current_tree, durability="fast")
+
+
+def _consume(queue, out) -> None:
+    """
+    Consume the queue in another process.
+
+    :param queue: queue
+    :param out: queue for the consumed objects
+    :return: None
+    """
+    out.put([queue.get(), queue.get()])
+
+
+class TestMemoryQueue:
+    """
+    Memory Queue test suite class.
+    """
+    def test_ordering(self):
+        """
+        Get objects in the order.
+
+        :return:
+        """
+        mq = MemoryQueue(maxsize=3)
+        with pytest.raises(QueueEmpty) as exc:
+            mq.get_nowait()
+        assert "Queue is empty" in str(exc)
+
+        mq.put("one")
+        mq.put_many(["two", "three"])
+        assert mq.full()
+        with pytest.raises(QueueFull):
+            mq.put("four")
+
+        assert mq.get_nowait() == "one"
+        assert mq.get_many(5) == ["two", "three"]
+        assert mq.get_many(5) == []
+        assert mq.empty()
+        assert mq.pending()
+
+    def test_processes(self):
+        """
+        Queue is shared with the forked process.
+
+        :return:
+        """
+        mq = MemoryQueue()
+        out = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_consume, args=(mq, out))
+        proc.start()
+        mq.put("one")
+        mq.put("two")
+        assert out.get(timeout=10) == ["one", "two"]
+        proc.join()
+        assert mq.qsize() == 0
+
+
+class TestLaneQueue:
+    """
+    Multi-lane queue test suite class.
+    """
+    LANES = (("high", 4), ("normal", 2), ("low", 1))
+
+    def setup_method(self):
+        """
+        Setup method
+        """
+        self._current_tree = tempfile.mkdtemp()
+        self.lq = QueueFactory.lane_queue(self._current_tree, lanes=self.LANES, default="normal")
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        shutil.rmtree(self._current_tree, ignore_errors=True)
+
+    def _fill(self, amount: int) -> None:
+        """
+        Put items, named after the lane, to every lane.
+
+        :param amount: amount of items per lane
+        :return: None
+        """
+        for lane in self.lq.lanes:
+            self.lq.put_many([lane] * amount, lane=lane)
+
+    def test_weighted(self):
+        """
+        Lanes are read by their weights.
+
+        :return:
+        """
+        self._fill(10)
+        assert self.lq.depths() == {"high": 10, "normal": 10, "low": 10}
+        for _ in range(2):
+            assert self.lq.get_many(7) == ["high"] * 4 + ["normal"] * 2 + ["low"]
+        assert self.lq.depths() == {"high": 2, "normal": 6, "low": 8}
+        assert sorted(os.listdir(self._current_tree)) == ["high", "low", "normal"]
+
+    def test_small_batches(self):
+        """
+        Lanes are read by their weights, even one by one.
+
+        :return:
+        """
+        self._fill(10)
+        objs = [self.lq.get_nowait() for _ in range(14)]
+        assert objs.count("high") == 8
+        assert objs.count("normal") == 4
+        assert objs.count("low") == 2
+
+    def test_idle_lanes(self):
+        """
+        Share of the empty lanes is given to the busy ones.
+
+        :return:
+        """
+        self.lq.put_many(["low"] * 5, lane="low")
+        self.lq.put_many(["high"] * 2, lane="high")
+        assert self.lq.get_many(10) == ["high"] * 2 + ["low"] * 5
+        assert self.lq.empty()
+        assert self.lq.get_many(10) == []
+        with pytest.raises(QueueEmpty):
+            self.lq.get_nowait()
+
+    def test_lanes(self):
+        """
+        Puts without the lane go to the default lane. Lanes are validated.
+
+        :return:
+        """
+        self.lq.put("one")
+        assert self.lq.depths()["normal"] == 1
+        assert self.lq.qsize() == 1
+        with pytest.raises(KeyError):
+            self.lq.put("two", lane="urgent")
+        for lanes in [[], [("one", MemoryQueue(), 1), ("one", MemoryQueue(), 1)], [("one", MemoryQueue(), 0)]]:
+            with pytest.raises(ValueError):
+                LaneQueue(lanes)
+        with pytest.raises(ValueError):
+            LaneQueue([("one", MemoryQueue(), 1)], default="two")
+
+    def test_notify(self):
+        """
+        Lanes share the notifier: blocking get wakes up on put to any lane.
+
+        :return:
+        """
+        self.lq.use_notify()
+        lq = LaneQueue([("memory", MemoryQueue(), 1), ("disk", self.lq.lane("low"), 1)]).use_notify(self.lq.notifier)
+        proc = multiprocessing.Process(target=_put_later, args=(self.lq, ["woken"]))
+        proc.start()
+        started = time.time()
+        assert self.lq.get() == "woken"
+        assert time.time() - started < LaneQueue.POLL
+        proc.join()
+
+        lq.put("memory")
+        assert self.lq.notifier.wait(0)
+        assert lq.get() == "memory"
+
+
+class TestNotifier:
+    """
+    Queue notifier test suite class.
+    """
+    def test_notify(self):
+        """
+        Notifier is readable until drained.
+
+        :return:
+        """
+        notifier = Notifier()
+        assert not notifier.wait(0)
+        notifier.notify()
+        notifier.notify()
+        assert notifier.wait(0)
+        assert notifier.drain() == 2
+        assert not notifier.wait(0)
+        assert notifier.drain() == 0
+        notifier.close()
+
+    def test_reader(self):
+        """
+        Reactor reader drains the notifier and calls back.
+
+        :return:
+        """
+        notifier = Notifier()
+        callback = MagicMock()
+        reader = NotifyReader(notifier, callback)
+        assert reader.fileno() == notifier.fileno()
+        notifier.notify()
+        reader.doRead()
+        assert callback.called
+        assert not notifier.wait(0)
+        notifier.close()
+
+
+class TestRecord:
+    """
+    Queue record format test suite class.
+    """
+    def test_codecs(self):
+        """
+        Objects are encoded by their type and the serialiser.
+
+        :return:
+        """
+        import msgpack
+
+        for obj, serialiser, codec in [(b"raw", pickle, record.CODEC_RAW),
+                                       ({"uri": "test.ping"}, pickle, record.CODEC_PICKLE),
+                                       ({"uri": "test.ping"}, msgpack, record.CODEC_MSGPACK),
+                                       (FunctionObject(), msgpack, record.CODEC_PICKLE)]:
+            data = record.encode(obj, serialiser)
+            assert record.HEADER.unpack_from(data)[1] == codec
+            assert record.get_size(data) == len(data)
+            assert record.verify(data)
+            assert type(record.decode(memoryview(data))) == type(obj)
+
+    def test_corrupt(self):
+        """
+        Corrupt records are detected.
+
+        :return:
+        """
+        data = bytearray(record.encode("payload"))
+        assert not record.verify(data[:-1])
+        with pytest.raises(QueueCorrupt):
+            record.decode(data[:-1])
+
+        data[-2] ^= 0xff
+        assert not record.verify(data)
+        with pytest.raises(QueueCorrupt):
+            record.decode(data)
+
+        with pytest.raises(QueueCorrupt):
+            record.get_size(b"garbage data")
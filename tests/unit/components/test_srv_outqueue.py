@@ -0,0 +1,162 @@
+# coding: utf-8
+"""
+Outbound queue of the peer test.
+"""
+import os
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from twisted.internet import defer
+
+from sugar.components.server.outqueue import OutboundQueue
+
+
+class TestOutboundQueue:
+    """
+    Outbound queue with backpressure test suite.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self.spool_path = tempfile.mkdtemp()
+        self.written = []
+        self.overflow = MagicMock()
+        self.threads = patch("sugar.components.server.outqueue.threads.deferToThread", defer.maybeDeferred)
+        self.threads.start()
+        self.queue = OutboundQueue(lambda payload, **kwargs: self.written.append(payload),
+                                   spool_path=self.spool_path, high=30, low=20, on_overflow=self.overflow)
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        self.threads.stop()
+        shutil.rmtree(self.spool_path, ignore_errors=True)
+
+    def test_write_through(self):
+        """
+        Messages are written immediately if peer is not congested.
+
+        :return:
+        """
+        self.queue.put(b"one", isBinary=True)
+        self.queue.put(b"two", isBinary=True)
+        assert self.written == [b"one", b"two"]
+        assert self.queue.depth["messages"] == 0
+
+    def test_deferred_and_spilled(self):
+        """
+        Messages are deferred when paused, spilled beyond high watermark and written in order on resume.
+
+        :return:
+        """
+        self.queue.pauseProducing()
+        messages = [str(idx).zfill(10).encode() for idx in range(10)]
+        for msg in messages:
+            self.queue.put(msg, isBinary=True)
+
+        assert not self.written
+        depth = self.queue.depth
+        assert depth["messages"] == 10
+        assert depth["bytes"] == 30
+        assert depth["spooled"] == 7
+        assert depth["paused"]
+
+        self.queue.resumeProducing()
+        assert self.written == messages
+        assert self.queue.depth == {"messages": 0, "bytes": 0, "spooled": 0, "paused": False}
+
+    def test_stop_removes_spool(self):
+        """
+        Spool is removed when connection is gone.
+
+        :return:
+        """
+        self.queue.pauseProducing()
+        for idx in range(10):
+            self.queue.put(str(idx).zfill(10).encode(), isBinary=True)
+        assert os.listdir(self.spool_path)
+        self.queue.stopProducing()
+        assert not os.listdir(self.spool_path)
+        assert self.queue.depth["messages"] == 0
+
+    def test_spill_in_order(self):
+        """
+        Messages, put while the spool is being written, are kept in order.
+
+        :return:
+        """
+        writes = []
+        with patch("sugar.components.server.outqueue.threads.deferToThread",
+                   lambda func, *args: writes.append((func, args, defer.Deferred())) or writes[-1][2]):
+            self.queue.pauseProducing()
+            messages = [str(idx).zfill(10).encode() for idx in range(10)]
+            for msg in messages[:5]:
+                self.queue.put(msg, isBinary=True)
+            assert len(writes) == 1
+            self.queue.resumeProducing()
+            assert self.written == messages[:3]
+
+            for msg in messages[5:]:
+                self.queue.put(msg, isBinary=True)
+            assert self.queue.depth["spooled"] == 7
+            while writes:
+                func, args, done = writes.pop(0)
+                done.callback(func(*args))
+            assert self.written == messages
+            assert self.queue.depth["messages"] == 0
+
+    def test_unspill_in_thread(self):
+        """
+        Spilled messages are read from the spool by a thread, not by the reactor.
+
+        :return:
+        """
+        self.queue.pauseProducing()
+        messages = [str(idx).zfill(10).encode() for idx in range(10)]
+        for msg in messages:
+            self.queue.put(msg, isBinary=True)
+
+        reads = []
+        with patch("sugar.components.server.outqueue.threads.deferToThread",
+                   lambda func, *args: reads.append((func, args, defer.Deferred())) or reads[-1][2]):
+            self.queue.resumeProducing()
+            assert self.written == messages[:3]
+            assert [func.__name__ for func, _, _ in reads] == ["_read_spool"]
+            while reads:
+                func, args, done = reads.pop(0)
+                done.callback(func(*args))
+                assert len(reads) <= 1
+        assert self.written == messages
+        assert self.queue.depth == {"messages": 0, "bytes": 0, "spooled": 0, "paused": False}
+
+    def test_spool_overflow(self):
+        """
+        Queue is dropped and owner is told, when the spool is full.
+
+        :return:
+        """
+        self.queue.SPOOL_SIZE = 5
+        self.queue.pauseProducing()
+        for idx in range(10):
+            self.queue.put(str(idx).zfill(10).encode(), isBinary=True)
+        self.overflow.assert_called_once_with("spool is full (5 messages)")
+        assert self.queue.depth["messages"] == 0
+        assert not os.listdir(self.spool_path)
+
+        self.queue.resumeProducing()
+        self.queue.put(b"one", isBinary=True)
+        assert not self.written
+
+    def test_remove_stale(self):
+        """
+        Spools of the previous run are removed.
+
+        :return:
+        """
+        os.makedirs(os.path.join(self.spool_path, OutboundQueue.SPOOL_PREFIX + "stale"))
+        os.makedirs(os.path.join(self.spool_path, "other"))
+        OutboundQueue.remove_stale(self.spool_path)
+        assert os.listdir(self.spool_path) == ["other"]
@@ -0,0 +1,147 @@
+# coding: utf-8
+"""
+Router of the inbound messages test.
+"""
+from unittest.mock import patch
+
+from twisted.internet import defer
+
+from sugar.components.server.router import MessageRouter
+from sugar.lib.metrics import Histogram
+from sugar.transport import ObjectGate, ClientMsgFactory, RunnerModulesMsgFactory
+from sugar.transport.serialisable import Serialisable
+
+
+def _msg(component: int, kind: int = None) -> bytes:
+    """
+    Create packed message.
+
+    :param component: component
+    :param kind: kind or None if message has no kind
+    :return: bytes
+    """
+    msg = Serialisable()
+    msg.component = component
+    msg.machine_id = "cafe"
+    if kind is not None:
+        msg.kind = kind
+    return ObjectGate(msg).pack(True)
+
+
+class TestMessageRouter:
+    """
+    Message router test suite.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self.handled = []
+        self.decoded = []
+        self.router = MessageRouter(inline_size=0x100, on_decode=lambda proto, msg: self.decoded.append(msg))
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_TRAITS,
+                             lambda proto, msg: self.handled.append(("traits", msg)), name="traits")
+        self.router.register(RunnerModulesMsgFactory.COMPONENT, MessageRouter.ANY,
+                             lambda proto, msg: self.handled.append(("return", msg)), name="return")
+
+    def test_route_by_kind(self):
+        """
+        Message is routed by its component and kind.
+
+        :return:
+        """
+        assert self.router.dispatch(None, _msg(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_TRAITS), True) is None
+        assert [name for name, _ in self.handled] == ["traits"]
+        assert len(self.decoded) == 1
+        assert self.router.get_stats()["traits"]["inline"] == 1
+
+    def test_route_any_kind(self):
+        """
+        Message without a kind is routed to the handler of the component.
+
+        :return:
+        """
+        self.router.dispatch(None, _msg(RunnerModulesMsgFactory.COMPONENT), True)
+        assert [name for name, _ in self.handled] == ["return"]
+        assert "kind" not in self.handled[0][1].__dict__
+
+    def test_unknown_message(self):
+        """
+        Unknown message is not handled and counted.
+
+        :return:
+        """
+        self.router.dispatch(None, _msg(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_OPR_RESP), True)
+        assert not self.handled
+        assert self.router.get_stats()["unknown"] == 1
+
+    def test_large_frame_deferred(self):
+        """
+        Large frame is decoded in a thread and handled in the reactor thread.
+
+        :return:
+        """
+        deferred = []
+        with patch("sugar.components.server.router.threads.deferToThread",
+                   lambda func, *args: deferred.append((func, args, defer.Deferred())) or deferred[-1][2]):
+            msg = Serialisable()
+            msg.component = RunnerModulesMsgFactory.COMPONENT
+            msg.machine_id = "cafe"
+            msg.return_data = {"data": "x" * 0x1000}
+            result = self.router.dispatch(None, ObjectGate(msg).pack(True), True)
+        assert not self.handled
+        assert len(deferred) == 1
+
+        func, args, done = deferred[0]
+        decoded = func(*args)
+        assert not self.handled and not self.decoded
+        done.callback(decoded)
+        assert result is done
+        assert self.handled[0][1].return_data == {"data": "x" * 0x1000}
+        assert len(self.decoded) == 1
+        stats = self.router.get_stats()["return"]
+        assert stats["deferred"] == 1
+        assert stats["inline"] == 0
+        assert stats["latency"]["count"] == 1
+
+    def test_undecodable_frame(self):
+        """
+        Frame, that cannot be decoded, is not handled and counted.
+
+        :return:
+        """
+        assert self.router.dispatch(None, b"garbage", True) is None
+        assert not self.handled and not self.decoded
+        assert self.router.get_stats()["unknown"] == 1
+
+    def test_handler_error(self):
+        """
+        Handler error is counted and does not propagate.
+
+        :return:
+        """
+        def fail(proto, msg):
+            raise ValueError("failure")
+
+        self.router.register(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_TRAITS, fail, name="traits")
+        self.router.dispatch(None, _msg(ClientMsgFactory.COMPONENT, ClientMsgFactory.KIND_TRAITS), True)
+        assert self.router.get_stats()["traits"]["errors"] == 1
+
+
+class TestHistogram:
+    """
+    Metrics histogram test suite.
+    """
+    def test_cumulative_buckets(self):
+        """
+        Buckets are cumulative.
+
+        :return:
+        """
+        histogram = Histogram(buckets=(1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        data = histogram.to_dict()
+        assert data["count"] == 4
+        assert data["buckets"] == {1: 2, 10: 3, "+Inf": 4}
+        assert data["sum"] == 56.5
@@ -0,0 +1,125 @@
+# coding: utf-8
+"""
+Job subscriptions of the consoles test.
+"""
+from mock import MagicMock, patch
+from twisted.internet.task import Clock
+
+from sugar.components.server.core import ServerCore
+from sugar.components.server.subscriptions import JobSubscriptions
+from sugar.transport import ServerMsgFactory, ObjectGate
+
+
+def get_messages(proto) -> list:
+    """
+    Get messages, sent to the console protocol mock.
+
+    :param proto: MagicMock of the protocol
+    :return: list of Serialisable
+    """
+    return [ObjectGate().load(call[0][0], binary=True) for call in proto.sendMessage.call_args_list]
+
+
+class TestJobSubscriptions:
+    """
+    Job subscriptions test suite.
+    """
+    def test_returns_and_progress(self):
+        """
+        Each return is pushed, progress is coalesced and final progress is immediate.
+
+        :return:
+        """
+        clock = Clock()
+        proto = MagicMock()
+        with patch("sugar.components.server.subscriptions.reactor", clock):
+            subs = JobSubscriptions()
+            subs.subscribe("jid", proto, total=3)
+            subs.on_return("jid", "mid-1", "one", "test.ping", 0, "", {"pong": True})
+            subs.on_return("jid", "mid-2", "two", "test.ping", 1, "boom", {})
+            kinds = [msg.kind for msg in get_messages(proto)]
+            assert kinds == [ServerMsgFactory.CONSOLE_JOB_RETURN] * 2
+
+            clock.advance(JobSubscriptions.PROGRESS_INTERVAL)
+            progress = get_messages(proto)[-1]
+            assert progress.kind == ServerMsgFactory.CONSOLE_JOB_PROGRESS
+            assert progress.internal == {"done": 2, "total": 3, "failed": 1, "finished": False, "expired": False}
+
+            subs.on_return("jid", "mid-3", "three", "test.ping", 0, "", {})
+            progress = get_messages(proto)[-1]
+            assert progress.internal["finished"]
+            assert not subs.is_subscribed("jid")
+            assert not clock.getDelayedCalls()
+
+    def test_unsubscribe(self):
+        """
+        Subscription is dropped when last console is gone.
+
+        :return:
+        """
+        clock = Clock()
+        proto = MagicMock()
+        with patch("sugar.components.server.subscriptions.reactor", clock):
+            subs = JobSubscriptions()
+            subs.subscribe("jid", proto, total=2)
+            subs.on_return("jid", "mid-1", "one", "test.ping", 0, "", {})
+            subs.unsubscribe(proto)
+            assert not subs.is_subscribed("jid")
+            assert not clock.getDelayedCalls()
+            subs.on_return("jid", "mid-2", "two", "test.ping", 0, "", {})
+            assert proto.sendMessage.call_count == 1
+
+    def test_timeout(self):
+        """
+        Watch is finished with the final progress, if not all machines returned in time.
+
+        :return:
+        """
+        clock = Clock()
+        proto = MagicMock()
+        with patch("sugar.components.server.subscriptions.reactor", clock):
+            subs = JobSubscriptions()
+            subs.subscribe("jid", proto, total=2, timeout=30)
+            subs.on_return("jid", "mid-1", "one", "test.ping", 0, "", {})
+            clock.advance(30)
+            progress = get_messages(proto)[-1]
+            assert progress.kind == ServerMsgFactory.CONSOLE_JOB_PROGRESS
+            assert progress.internal == {"done": 1, "total": 2, "failed": 0, "finished": True, "expired": True}
+            assert not subs.is_subscribed("jid")
+            assert not clock.getDelayedCalls()
+
+    def test_nothing_to_wait(self):
+        """
+        Watch of the job, fired to no machine (e.g. all are offline), is finished at once.
+
+        :return:
+        """
+        clock = Clock()
+        proto = MagicMock()
+        with patch("sugar.components.server.subscriptions.reactor", clock):
+            subs = JobSubscriptions()
+            subs.subscribe("jid", proto, total=0, timeout=30)
+            assert [msg.internal["finished"] for msg in get_messages(proto)] == [True]
+            assert not subs.is_subscribed("jid")
+            assert not clock.getDelayedCalls()
+
+    def test_return_from_thread(self):
+        """
+        Return, decoded in a thread, is pushed in the reactor thread.
+
+        :return:
+        """
+        core = MagicMock()
+        core.peer_registry.workers = None
+        msg = MagicMock(jid="jid", machine_id="mid-1", uri="test.ping", errcode=0, errmsg="", return_data={})
+        with patch("sugar.components.server.core.isInIOThread", MagicMock(return_value=False)), \
+                patch("sugar.components.server.core.reactor") as reactor:
+            ServerCore.__class_ref__.on_job_return(core, msg)
+            reactor.callFromThread.assert_called_once_with(core.push_job_return, "jid", "mid-1", "test.ping", 0, "", {})
+            assert not core.push_job_return.called
+
+            core.peer_registry.workers = MagicMock(primary=False, EVT_RETURN="return")
+            ServerCore.__class_ref__.on_job_return(core, msg)
+            reactor.callFromThread.assert_called_with(core.peer_registry.workers.route, 0, "return",
+                                                      "jid", "mid-1", "test.ping", 0, "", {})
+            assert not core.peer_registry.workers.route.called
@@ -0,0 +1,92 @@
+# coding: utf-8
+"""
+Master workers registry test.
+"""
+import os
+import tempfile
+import binascii
+import pytest
+from mock import MagicMock, patch
+
+from sugar.components.server.workers import WorkerRegistryManager, WorkerHandle, RoutedJobStore
+from sugar.components.server.pdatastore import PDataContainer
+
+
+@pytest.fixture
+def registry():
+    """
+    Start shared registry of the workers.
+
+    :return: primary and secondary worker handles
+    """
+    address = os.path.join(tempfile.mkdtemp(), "workers.sock")
+    manager = WorkerRegistryManager(address=address, authkey=b"sugar")
+    manager.start()
+    env = {WorkerHandle.ENV_ADDRESS: address, WorkerHandle.ENV_AUTHKEY: binascii.hexlify(b"sugar").decode()}
+    with patch.dict(os.environ, env):
+        yield WorkerHandle(0, manager), WorkerHandle.connect(1)
+    manager.shutdown()
+
+
+class TestWorkersRegistry:
+    """
+    Shared registry of the Master workers.
+    """
+    def test_membership(self, registry):
+        """
+        Peer membership is visible to all workers.
+
+        :return:
+        """
+        primary, secondary = registry
+        secondary.publish("f00")
+        assert primary.owner("f00") == 1
+        assert list(primary.online()) == ["f00"]
+        assert primary.owner("bar") is None
+
+    def test_withdraw_reconnected(self, registry):
+        """
+        Peer is not withdrawn by the worker that no longer owns it.
+
+        :return:
+        """
+        primary, secondary = registry
+        secondary.publish("f00")
+        primary.publish("f00")
+        secondary.withdraw("f00")
+        assert primary.owner("f00") == 0
+        primary.withdraw("f00")
+        assert primary.owner("f00") is None
+
+    def test_route(self, registry):
+        """
+        Routed events are fired by the owning worker.
+
+        :return:
+        """
+        primary, secondary = registry
+        core = MagicMock()
+        primary.route(1, WorkerHandle.EVT_FIRE, "jid", "test.ping", [[], {}], "f00", "foo.lan")
+        secondary.stop()
+        secondary.channel_loop(core)
+        core.fire_routed_event.assert_called_once_with("jid", "test.ping", [[], {}], "f00", "foo.lan")
+
+    def test_route_store(self, registry):
+        """
+        Job store updates of the secondary worker are applied by the primary worker.
+
+        :return:
+        """
+        primary, secondary = registry
+        core = MagicMock()
+        jobstore = RoutedJobStore(secondary)
+        jobstore.set_as_fired(jid="jid", target=PDataContainer(id="f00", host="foo.lan"))
+        jobstore.report_job(jid="jid", target=PDataContainer(id="f00", host="foo.lan"), src="", return_data="{}",
+                            finished=None, errcode=0)
+        secondary.route(0, WorkerHandle.EVT_STORE, "flush", {})
+        primary.stop()
+        primary.channel_loop(core)
+
+        assert core.jobstore.set_as_fired.call_args[1]["target"].id == "f00"
+        assert core.jobstore.report_job.call_args[1]["errcode"] == 0
+        core.jobstore.flush.assert_not_called()
@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+Task processor unit tests.
+"""
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from sugar.lib.compiler.objtask import FunctionObject
+from sugar.lib.perq import FSQueue
+from sugar.lib.taskproc import TaskProcessor
+from sugar.transport import ServerMsgFactory
+
+
+def _task(jid: str, ftype: int = FunctionObject.TYPE_RUNNER, priority: int = None) -> FunctionObject:
+    """
+    Create task.
+
+    :param jid: job ID
+    :param ftype: type of the function
+    :param priority: priority of the task
+    :return: FunctionObject
+    """
+    task = FunctionObject()
+    task.module, task.function = "system.test", "ping"
+    task.args, task.kwargs = [], {}
+    task.type = ftype
+    task.jid = jid
+    task.priority = priority
+    return task
+
+
+@pytest.fixture
+def processor_class(tmpdir):
+    """
+    Task processor, that keeps its queues in the temporary directory.
+
+    :param tmpdir: temporary directory
+    :return: TaskProcessor subclass
+    """
+    class Processor(TaskProcessor):
+        XLOG_PATH = os.path.join(str(tmpdir), "lanes")
+        XLOG_LEGACY_PATH = os.path.join(str(tmpdir), "tasks")
+        XRET_PATH = os.path.join(str(tmpdir), "responses")
+        CONCURRENCY = 2
+
+    return Processor
+
+
+class TestTaskProcessor:
+    """
+    Task processor test suite.
+    """
+    @pytest.mark.parametrize("ftype,priority,lane", [
+        (FunctionObject.TYPE_RUNNER, ServerMsgFactory.PRIORITY_HIGH, TaskProcessor.LANE_HIGH),
+        (FunctionObject.TYPE_STATE, ServerMsgFactory.PRIORITY_HIGH, TaskProcessor.LANE_HIGH),
+        (FunctionObject.TYPE_RUNNER, ServerMsgFactory.PRIORITY_LOW, TaskProcessor.LANE_LOW),
+        (FunctionObject.TYPE_RUNNER, ServerMsgFactory.PRIORITY_NORMAL, TaskProcessor.LANE_NORMAL),
+        (FunctionObject.TYPE_RUNNER, None, TaskProcessor.LANE_NORMAL),
+        (FunctionObject.TYPE_STATE, ServerMsgFactory.PRIORITY_NORMAL, TaskProcessor.LANE_LOW),
+        (FunctionObject.TYPE_CUSTOM, None, TaskProcessor.LANE_LOW),
+    ])
+    def test_get_lane(self, processor_class, ftype, priority, lane):
+        """
+        Lane is chosen by the priority, then by the type of the task.
+
+        :return: None
+        """
+        processor = processor_class(MagicMock())
+        assert processor.get_lane(_task("1", ftype, priority)) == lane
+
+        processor.schedule_task(_task("1", ftype, priority))
+        assert processor.get_stats()["lanes"][lane] == 1
+
+    def test_concurrency_released(self, processor_class):
+        """
+        Only as many tasks are run as there are free workers.
+        Worker is released on success and on failure of the task.
+
+        :return: None
+        """
+        processor = processor_class(MagicMock())
+        for jid in "123":
+            processor.schedule_task(_task(jid))
+
+        running = []
+        with patch("sugar.lib.taskproc.threads.deferToThread",
+                   side_effect=lambda func, task: running.append((task.jid, defer.Deferred())) or running[-1][1]):
+            processor.next_task()
+            assert [jid for jid, _ in running] == ["1", "2"]
+            assert processor.t_counter == 2
+
+            running[0][1].callback(("1", MagicMock()))
+            assert [jid for jid, _ in running] == ["1", "2", "3"]
+            assert processor.t_counter == 2
+
+            running[1][1].errback(Failure(Exception("Task failed")))
+            assert processor.t_counter == 1
+
+            running[2][1].callback(("3", MagicMock()))
+            assert processor.t_counter == 0
+            assert len(running) == 3
+
+    def test_adopt_legacy(self, processor_class):
+        """
+        Tasks, pickled to the single queue by the older version, are moved to the lanes.
+
+        :return: None
+        """
+        legacy = FSQueue(processor_class.XLOG_LEGACY_PATH)
+        legacy.put(_task("1", FunctionObject.TYPE_RUNNER))
+        legacy.put(_task("2", FunctionObject.TYPE_STATE))
+        legacy.put(_task("3", FunctionObject.TYPE_RUNNER).to_dict())
+
+        processor = processor_class(MagicMock())
+        assert legacy.qsize() == 0
+        assert processor.get_stats()["lanes"] == {TaskProcessor.LANE_HIGH: 0, TaskProcessor.LANE_NORMAL: 2,
+                                                  TaskProcessor.LANE_LOW: 1}
+
+        processor.CONCURRENCY = 3
+        with patch("sugar.lib.taskproc.threads.deferToThread", side_effect=lambda *args: defer.Deferred()) as run:
+            processor.next_task()
+            tasks = [call[0][1] for call in run.call_args_list]
+        assert sorted(task.jid for task in tasks) == ["1", "2", "3"]
+        assert all(isinstance(task, FunctionObject) for task in tasks)
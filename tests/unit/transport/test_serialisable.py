@@ -5,7 +5,7 @@ Test serialisable
 from __future__ import absolute_import, unicode_literals, print_function
 
 import pytest
-from sugar.transport.serialisable import Serialisable, ObjectGate
+from sugar.transport.serialisable import Serialisable, LazySerialisable, ObjectGate
 
 
 @pytest.fixture
@@ -54,3 +54,20 @@ class TestSerialise(object):
         s.here.something = {'user': 'data', 'int': 123}
 
         assert ObjectGate(s).pack() == obj_structure
+
+    def test_lazy(self):
+        """
+        Test lazy attributes are computed once on access and on dumping.
+
+        :return:
+        """
+        calls = []
+        s = LazySerialisable()
+        s.set_lazy('foo', lambda value: calls.append(value) or value * 2, 21)
+        assert 'foo' not in s.__dict__
+        assert s.foo == 42
+        assert s.foo == 42
+        assert calls == [21]
+
+        s.set_lazy('bar', str.upper, 'blah')
+        assert ObjectGate(s).pack() == {'.': None, 'foo': 42, 'bar': 'BLAH'}
@@ -0,0 +1,148 @@
+# coding: utf-8
+"""
+Test file utils.
+"""
+import os
+import time
+import shutil
+import threading
+import tempfile
+import multiprocessing
+
+import pytest
+from mock import patch
+
+from sugar.lib.exceptions import SugarFileLockException
+from sugar.utils.files import FileLock
+
+
+def _hold(path: str, ready, release) -> None:
+    """
+    Hold the lock in another process.
+
+    :param path: path to the lock file
+    :param ready: event, set when the lock is taken
+    :param release: event to release the lock
+    :return: None
+    """
+    lock = FileLock(path)
+    lock.acquire()
+    ready.set()
+    release.wait(10)
+    lock.release()
+
+
+class TestFileLock:
+    """
+    Inter-process file lock.
+    """
+    def setup_method(self):
+        """
+        Setup method.
+        """
+        self._path = tempfile.mkdtemp()
+        self._lock_path = os.path.join(self._path, ".lock")
+
+    def teardown_method(self):
+        """
+        Teardown method.
+        """
+        shutil.rmtree(self._path, ignore_errors=True)
+
+    def _holder(self):
+        """
+        Start process, holding the lock.
+
+        :return: process and event to release the lock
+        """
+        ready, release = multiprocessing.Event(), multiprocessing.Event()
+        proc = multiprocessing.Process(target=_hold, args=(self._lock_path, ready, release))
+        proc.start()
+        assert ready.wait(10)
+        return proc, release
+
+    def test_acquire_release(self):
+        """
+        Lock is taken and released, lock file keeps PID of the holder.
+
+        :return:
+        """
+        lock = FileLock(self._lock_path)
+        with lock:
+            assert lock.locked
+            assert lock.holder() == os.getpid()
+        assert not lock.locked
+        assert lock.holder() is None
+        lock.release()  # Not held: nothing happens
+
+    def test_other_thread_release(self):
+        """
+        Lock is not released by the thread, which does not hold it.
+
+        :return:
+        """
+        lock = FileLock(self._lock_path)
+        lock.acquire()
+        releaser = threading.Thread(target=lock.release)
+        releaser.start()
+        releaser.join()
+        assert lock.locked
+        assert not lock._mutex.acquire(False)
+        lock.release()
+        assert not lock.locked
+
+    def test_timeout(self):
+        """
+        Lock, held by another process, is not acquired in time.
+
+        :return:
+        """
+        proc, release = self._holder()
+        try:
+            lock = FileLock(self._lock_path, timeout=0.1)
+            assert lock.holder() == proc.pid
+            started = time.time()
+            with pytest.raises(SugarFileLockException) as exc:
+                lock.acquire()
+            assert time.time() - started < 1
+            assert str(proc.pid) in str(exc.value)
+        finally:
+            release.set()
+            proc.join()
+
+        assert lock.acquire()
+        lock.release()
+
+    def test_dead_holder(self):
+        """
+        Lock of the killed process is released.
+
+        :return:
+        """
+        proc, _ = self._holder()
+        proc.kill()
+        proc.join()
+
+        lock = FileLock(self._lock_path, timeout=1)
+        assert lock.holder() is None
+        assert lock.acquire()
+        lock.release()
+
+    @patch("sugar.utils.files.is_fcntl_available", lambda **kwargs: False)
+    def test_stale_exclusive(self):
+        """
+        Without fcntl, lock file of the dead process is broken.
+
+        :return:
+        """
+        proc = multiprocessing.Process(target=lambda: None)
+        proc.start()
+        proc.join()
+        with open(self._lock_path, "w") as h_lck:
+            h_lck.write(str(proc.pid))
+
+        lock = FileLock(self._lock_path, timeout=1)
+        assert lock.acquire()
+        assert lock.holder() == os.getpid()
+        lock.release()
+        assert not os.path.exists(self._lock_path)